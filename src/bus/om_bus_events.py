@@ -23,3 +23,4 @@ class OMBusEvents(object):
     METRICS_INTERVAL_CHANGE = 'METRICS_INTERVAL_CHANGE'
     CLIENT_DISCOVERY = 'CLIENT_DISCOVERY'
     CONNECTIVITY = 'CONNECTIVITY'
+    CONFIG_CHANGE = 'CONFIG_CHANGE'
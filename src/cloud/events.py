@@ -60,6 +60,8 @@ class EventSender(object):
         if Config.get_entry('cloud_enabled', False) is False:
             return
         if event.type == GatewayEvent.Types.CONFIG_CHANGE:
+            if event.data.get('type') == 'settings':
+                return  # The settings are pushed by the Cloud
             if event.data.get('type') == 'input':
                 self._event_enabled_cache = {}
         if self._should_send_event(event):
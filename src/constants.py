@@ -69,6 +69,11 @@ def get_metrics_database_file():
     return os.path.join(OPENMOTICS_PREFIX, 'etc/metrics.db')
 
 
+def get_metrics_queue_dir():
+    """ Get the directory where the metrics that still need to be send to the Cloud are queued. """
+    return os.path.join(OPENMOTICS_PREFIX, 'etc/metrics_queue')
+
+
 def get_pulse_counter_database_file():
     """ Get the filename of the pulse counter database file. This file is in sqlite format. """
     return os.path.join(OPENMOTICS_PREFIX, 'etc/pulse.db')
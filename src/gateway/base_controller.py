@@ -20,17 +20,19 @@ from __future__ import absolute_import
 import logging
 import time
 
+from peewee import chunked
+
 from gateway.daemon_thread import DaemonThread
 from gateway.events import GatewayEvent
 from gateway.hal.master_controller import MasterController
 from gateway.hal.master_event import MasterEvent
-from gateway.models import BaseModel
+from gateway.models import BaseModel, Database
 from gateway.pubsub import PubSub
 from ioc import INJECTED, Inject
 from serial_utils import CommunicationTimedOutException
 
 if False:  # MYPY
-    from typing import Optional, Callable, Type, List
+    from typing import Optional, Callable, Dict, Type, List, Tuple
     from gateway.maintenance_controller import MaintenanceController
 
 logger = logging.getLogger("openmotics")
@@ -46,6 +48,7 @@ class SyncStructure(object):
 class BaseController(object):
 
     SYNC_STRUCTURES = None  # type: Optional[List[SyncStructure]]
+    SYNC_BATCH_SIZE = 100
 
     @Inject
     def __init__(self, master_controller, maintenance_controller=INJECTED, pubsub=INJECTED, sync_interval=900):
@@ -57,6 +60,7 @@ class BaseController(object):
         self._sync_orm_interval = sync_interval
         self._sync_dirty = True  # Always sync after restart.
         self._sync_running = False
+        self._sync_fingerprints = {}  # type: Dict[str, Tuple[int, ...]]
 
         self._pubsub.subscribe_master_events(PubSub.MasterTopics.EEPROM, self._handle_master_event)
         self._pubsub.subscribe_master_events(PubSub.MasterTopics.MODULE, self._handle_master_event)
@@ -112,11 +116,13 @@ class BaseController(object):
                     for dto in getattr(self._master_controller, 'load_{0}s'.format(name))():
                         if skip is not None and skip(dto):
                             continue
-                        id_ = dto.id
-                        ids.append(id_)
-                        if not orm_model.select().where(orm_model.number == id_).exists():
-                            orm_model.create(number=id_)
-                    orm_model.delete().where(orm_model.number.not_in(ids)).execute()
+                        ids.append(dto.id)
+                    fingerprint = tuple(sorted(ids))
+                    if self._sync_fingerprints.get(name) == fingerprint:
+                        logger.info('ORM sync ({0}): unchanged'.format(orm_model.__name__))
+                    else:
+                        self._sync_numbers(orm_model, fingerprint)
+                        self._sync_fingerprints[name] = fingerprint
 
                     duration = time.time() - start
                     logger.info('ORM sync ({0}): completed after {1:.1f}s'.format(orm_model.__name__, duration))
@@ -133,3 +139,21 @@ class BaseController(object):
         finally:
             self._sync_running = False
         return True
+
+    @staticmethod
+    def _sync_numbers(orm_model, numbers):
+        # type: (Type[BaseModel], Tuple[int, ...]) -> None
+        """ Makes sure there is exactly one row per number, with a single query for the existing rows and a single transaction """
+        existing_numbers = set(number for (number,) in orm_model.select(orm_model.number).tuples())
+        missing_numbers = [number for number in numbers if number not in existing_numbers]
+        stale_numbers = existing_numbers - set(numbers)
+        if not missing_numbers and not stale_numbers:
+            return
+        with orm_model._meta.database.atomic():
+            for batch in chunked(missing_numbers, BaseController.SYNC_BATCH_SIZE):
+                orm_model.insert_many([{'number': number} for number in batch]).execute()
+            if stale_numbers:
+                orm_model.delete().where(orm_model.number.not_in(numbers)).execute()
+        if missing_numbers:
+            Database.incr_metrics(orm_model.__name__.lower(), len(missing_numbers))  # Bulk inserts don't signal post_save
+            Database.set_dirty()
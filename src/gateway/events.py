@@ -30,6 +30,8 @@ class GatewayEvent(object):
     Data formats:
     * CONFIG_CHANGE
       {'type': str}  # Resource type, output, input, ...
+      {'type': 'settings',       # Settings (see Config), changed by another process
+       'settings': List[str]}  # Optional, changed settings
 
     * OUTPUT_CHANGE
       {'id': int,                     # Output ID
@@ -28,6 +28,7 @@ import sqlite3
 import subprocess
 import tempfile
 import threading
+import time
 import warnings
 
 from six.moves.configparser import ConfigParser
@@ -73,6 +74,12 @@ def check_basic_action(ret_dict):
 class GatewayApi(object):
     """ The GatewayApi combines master_api functions into high level functions. """
 
+    REALTIME_POWER = 'realtime_power'
+    TOTAL_ENERGY = 'total_energy'
+    REALTIME_P1 = 'realtime_p1'
+    POWER_SNAPSHOT_SECTIONS = [REALTIME_POWER, TOTAL_ENERGY, REALTIME_P1]
+    POWER_SNAPSHOT_MAX_AGE = 2.0  # The age (in seconds) until which a power snapshot is shared
+
     @Inject
     def __init__(self,
                  master_controller=INJECTED, power_store=INJECTED, power_communicator=INJECTED,
@@ -86,6 +93,9 @@ class GatewayApi(object):
         self.__power_controller = power_controller
         self.__message_client = message_client
         self.__observer = observer
+        self.__power_lock = threading.Lock()
+        self.__power_snapshot = {}  # type: Dict[str,Any]
+        self.__power_timestamps = {}  # type: Dict[str,float]
 
     def set_plugin_controller(self, plugin_controller):
         """ Set the plugin controller. """
@@ -697,81 +707,184 @@ class GatewayApi(object):
 
         return dict()
 
+    def get_power_snapshot(self, sections=None):
+        # type: (Optional[List[str]]) -> Dict[str,Any]
+        """
+        Get a consistent snapshot of the power modules. It contains the 'timestamp' of the end of the
+        poll cycle and the requested sections: 'realtime_power', 'total_energy' and/or 'realtime_p1'
+        (default all).
+
+        All requested sections are read in a single poll cycle. The sections are shared with every
+        consumer while they're not older than POWER_SNAPSHOT_MAX_AGE, and consumers that ask for a
+        snapshot during a poll cycle wait for that cycle instead of polling the modules themselves.
+        The snapshot should be considered read-only.
+        """
+        sections = sections or GatewayApi.POWER_SNAPSHOT_SECTIONS
+        with self.__power_lock:
+            # Stamped at the end of a cycle, so waiters can use the cycle they waited for
+            limit = time.time() - GatewayApi.POWER_SNAPSHOT_MAX_AGE
+            if any(self.__power_timestamps.get(section, 0) < limit for section in sections):
+                # Merged, so consumers of other sections keep sharing their cycle
+                self.__power_snapshot.update(self.__poll_power_modules(sections))
+                timestamp = time.time()
+                for section in sections:
+                    self.__power_timestamps[section] = timestamp
+            snapshot = {'timestamp': min(self.__power_timestamps[section] for section in sections)}
+            for section in sections:
+                snapshot[section] = self.__power_snapshot[section]
+            return snapshot
+
+    def __poll_power_modules(self, sections):
+        # type: (List[str]) -> Dict[str,Any]
+        """
+        Runs a poll cycle. The modules are polled one after the other, reading everything that is
+        required for the requested sections. Values that are used by more than one section (e.g. the
+        P1 port statuses) are only read once per cycle.
+        """
+        snapshot = {}  # type: Dict[str,Any]
+        realtime_power = {}  # type: Dict[str,List[RealtimePower]]
+        total_energy = {}  # type: Dict[str,List[List[Optional[int]]]]
+        realtime_p1 = []  # type: List[Dict[str,Any]]
+        if GatewayApi.REALTIME_POWER in sections:
+            snapshot[GatewayApi.REALTIME_POWER] = realtime_power
+        if GatewayApi.TOTAL_ENERGY in sections:
+            snapshot[GatewayApi.TOTAL_ENERGY] = total_energy
+        if GatewayApi.REALTIME_P1 in sections:
+            snapshot[GatewayApi.REALTIME_P1] = realtime_p1
+        if self.__power_store is None:
+            return snapshot
+
+        modules = self.__power_store.get_power_modules()
+        plan = []
+        if self.__power_controller is not None:
+            if GatewayApi.REALTIME_POWER in sections:
+                plan.append((GatewayApi.REALTIME_POWER, self.__read_realtime_power))
+            if GatewayApi.TOTAL_ENERGY in sections:
+                plan.append((GatewayApi.TOTAL_ENERGY, self.__read_total_energy))
+        if self.__p1_controller is not None and GatewayApi.REALTIME_P1 in sections:
+            plan.append((GatewayApi.REALTIME_P1, self.__read_realtime_p1))
+
+        for module_id in sorted(modules.keys()):
+            values = {}  # type: Dict[Tuple[str,Any],Any]
+
+            def _read(controller, method, **kwargs):
+                key = (method, tuple(sorted(kwargs.items())))
+                if key not in values:
+                    values[key] = getattr(controller, method)(modules[module_id], **kwargs)
+                return values[key]
+
+            for section, reader in plan:
+                try:
+                    if section == GatewayApi.REALTIME_P1:
+                        realtime_p1 += reader(module_id, modules[module_id], _read)
+                    else:
+                        output = reader(module_id, modules[module_id], _read)
+                        if output is not None:
+                            snapshot[section][str(module_id)] = output
+                except CommunicationTimedOutException as ex:
+                    logger.error('Communication timeout while fetching {0} from {1}: {2}'.format(section.replace('_', ' '), module_id, ex))
+                except Exception as ex:
+                    logger.exception('Got exception while fetching {0} from {1}: {2}'.format(section.replace('_', ' '), module_id, ex))
+        return snapshot
+
+    def __read_realtime_power(self, module_id, module, read):
+        # type: (int, Dict[str,Any], Any) -> List[RealtimePower]
+        version = module['version']
+        num_ports = power_api.NUM_PORTS[version]
+
+        volt = [0.0] * num_ports  # TODO: Initialse to None is supported upstream
+        freq = [0.0] * num_ports
+        current = [0.0] * num_ports
+        power = [0.0] * num_ports
+        if version in [power_api.POWER_MODULE, power_api.ENERGY_MODULE]:
+            if version == power_api.POWER_MODULE:
+                raw_volt = read(self.__power_controller, 'get_module_voltage')
+                raw_freq = read(self.__power_controller, 'get_module_frequency')
+
+                volt = [raw_volt[0]] * num_ports
+                freq = [raw_freq[0]] * num_ports
+            else:
+                volt = list(read(self.__power_controller, 'get_module_voltage'))
+                freq = list(read(self.__power_controller, 'get_module_frequency'))
+
+            current = list(read(self.__power_controller, 'get_module_current'))
+            power = list(read(self.__power_controller, 'get_module_power'))
+        elif version == power_api.P1_CONCENTRATOR:
+            statuses = list(read(self.__p1_controller, 'get_module_status'))
+            voltages = list(read(self.__p1_controller, 'get_module_voltage'))
+            currents = list(read(self.__p1_controller, 'get_module_current'))
+            delivered_power = list(read(self.__p1_controller, 'get_module_delivered_power'))
+            received_power = list(read(self.__p1_controller, 'get_module_received_power'))
+            for port, status in enumerate(statuses):
+                try:
+                    if status:
+                        volt[port] = voltages[port]['phase1'] or 0.0
+                        power[port] = ((delivered_power[port] or 0.0) - (received_power[port] or 0.0)) * 1000
+                        current[port] = sum(x for x in currents[port].values() if x is not None)
+                except ValueError:
+                    pass
+        else:
+            raise ValueError('Unknown power api version')
+
+        out = []
+        for i in range(num_ports):
+            out.append(RealtimePower(voltage=convert_nan(volt[i], default=0.0),
+                                     frequency=convert_nan(freq[i], default=0.0),
+                                     current=convert_nan(current[i], default=0.0),
+                                     power=convert_nan(power[i], default=0.0)))
+        return out
+
+    def __read_total_energy(self, module_id, module, read):
+        # type: (int, Dict[str,Any], Any) -> List[List[Optional[int]]]
+        version = module['version']
+        num_ports = power_api.NUM_PORTS[version]
+
+        day = [None] * num_ports  # type: List[Optional[int]]
+        night = [None] * num_ports  # type: List[Optional[int]]
+        if version in [power_api.ENERGY_MODULE, power_api.POWER_MODULE]:
+            day = [convert_nan(entry, default=None)
+                   for entry in read(self.__power_controller, 'get_module_day_energy')]
+            night = [convert_nan(entry, default=None)
+                     for entry in read(self.__power_controller, 'get_module_night_energy')]
+        elif version == power_api.P1_CONCENTRATOR:
+            statuses = read(self.__p1_controller, 'get_module_status')
+            days = read(self.__p1_controller, 'get_module_day_energy')
+            nights = read(self.__p1_controller, 'get_module_night_energy')
+            for port, status in enumerate(statuses):
+                try:
+                    if status:
+                        day[port] = int((days[port] or 0.0) * 1000)
+                        night[port] = int((nights[port] or 0.0) * 1000)
+                except ValueError:
+                    pass
+        else:
+            raise ValueError('Unknown power api version')
+
+        out = []
+        for i in range(num_ports):
+            out.append([day[i], night[i]])
+        return out
+
+    def __read_realtime_p1(self, module_id, module, read):
+        # type: (int, Dict[str,Any], Any) -> List[Dict[str,Any]]
+        if module['version'] != power_api.P1_CONCENTRATOR:
+            return []
+        return self.__p1_controller.get_module_realtime(module_id, module,
+                                                        lambda method, **kwargs: read(self.__p1_controller, method, **kwargs))
+
     def get_realtime_power(self):
         # type: () -> Dict[str,List[RealtimePower]]
         """
         Get the realtime power measurement values.
         """
-        output = {}
-        if self.__power_store is None or self.__power_controller is None:
-            return output
+        return self.get_power_snapshot([GatewayApi.REALTIME_POWER])[GatewayApi.REALTIME_POWER]
 
-        modules = self.__power_store.get_power_modules()
-        for module_id in sorted(modules.keys()):
-            try:
-                version = modules[module_id]['version']
-                num_ports = power_api.NUM_PORTS[version]
-
-                volt = [0.0] * num_ports  # TODO: Initialse to None is supported upstream
-                freq = [0.0] * num_ports
-                current = [0.0] * num_ports
-                power = [0.0] * num_ports
-                if version in [power_api.POWER_MODULE, power_api.ENERGY_MODULE]:
-                    if version == power_api.POWER_MODULE:
-                        raw_volt = self.__power_controller.get_module_voltage(modules[module_id])
-                        raw_freq = self.__power_controller.get_module_frequency(modules[module_id])
-
-                        volt = [raw_volt[0]] * num_ports
-                        freq = [raw_freq[0]] * num_ports
-                    else:
-                        volt = list(self.__power_controller.get_module_voltage(modules[module_id]))
-                        freq = list(self.__power_controller.get_module_frequency(modules[module_id]))
-
-                    current = list(self.__power_controller.get_module_current(modules[module_id]))
-                    power = list(self.__power_controller.get_module_power(modules[module_id]))
-                elif version == power_api.P1_CONCENTRATOR:
-                    statuses = list(self.__p1_controller.get_module_status(modules[module_id]))
-                    voltages = list(self.__p1_controller.get_module_voltage(modules[module_id]))
-                    currents = list(self.__p1_controller.get_module_current(modules[module_id]))
-                    delivered_power = list(self.__p1_controller.get_module_delivered_power(modules[module_id]))
-                    received_power = list(self.__p1_controller.get_module_received_power(modules[module_id]))
-                    for port, status in enumerate(statuses):
-                        try:
-                            if status:
-                                volt[port] = voltages[port]['phase1'] or 0.0
-                                power[port] = ((delivered_power[port] or 0.0) - (received_power[port] or 0.0)) * 1000
-                                current[port] = sum(x for x in currents[port].values() if x is not None)
-                        except ValueError:
-                            pass
-                else:
-                    raise ValueError('Unknown power api version')
-
-                out = []
-                for i in range(num_ports):
-                    out.append(RealtimePower(voltage=convert_nan(volt[i], default=0.0),
-                                             frequency=convert_nan(freq[i], default=0.0),
-                                             current=convert_nan(current[i], default=0.0),
-                                             power=convert_nan(power[i], default=0.0)))
-
-                output[str(module_id)] = out
-            except CommunicationTimedOutException as ex:
-                logger.error('Communication timeout while fetching realtime power from {0}: {1}'.format(module_id, ex))
-            except Exception as ex:
-                logger.exception('Got exception while fetching realtime power from {0}: {1}'.format(module_id, ex))
-
-        return output
-
-    # TODO: rework get_realtime_power or call this there.
     def get_realtime_p1(self):
         # type: () -> List[Dict[str,Any]]
         """
         Get the realtime p1 measurement values.
         """
-        if self.__power_store is None or self.__p1_controller is None:
-            return []
-
-        modules = self.__power_store.get_power_modules()
-        return self.__p1_controller.get_realtime(modules)
+        return self.get_power_snapshot([GatewayApi.REALTIME_P1])[GatewayApi.REALTIME_P1]
 
     def get_total_energy(self):
         # type: () -> Dict[str,List[List[Optional[int]]]]
@@ -779,48 +892,7 @@ class GatewayApi(object):
 
         :returns: dict with the module id as key and the following array as value: [day, night].
         """
-        output = {}
-        if self.__power_controller is None:
-            return output
-
-        modules = self.__power_store.get_power_modules()
-        for module_id in sorted(modules.keys()):
-            try:
-                version = modules[module_id]['version']
-                num_ports = power_api.NUM_PORTS[version]
-
-                day = [None] * num_ports  # type: List[Optional[int]]
-                night = [None] * num_ports  # type: List[Optional[int]]
-                if version in [power_api.ENERGY_MODULE, power_api.POWER_MODULE]:
-                    day = [convert_nan(entry, default=None)
-                           for entry in self.__power_controller.get_module_day_energy(modules[module_id])]
-                    night = [convert_nan(entry, default=None)
-                             for entry in self.__power_controller.get_module_night_energy(modules[module_id])]
-                elif version == power_api.P1_CONCENTRATOR:
-                    statuses = self.__p1_controller.get_module_status(modules[module_id])
-                    days = self.__p1_controller.get_module_day_energy(modules[module_id])
-                    nights = self.__p1_controller.get_module_night_energy(modules[module_id])
-                    for port, status in enumerate(statuses):
-                        try:
-                            if status:
-                                day[port] = int((days[port] or 0.0) * 1000)
-                                night[port] = int((nights[port] or 0.0) * 1000)
-                        except ValueError:
-                            pass
-                else:
-                    raise ValueError('Unknown power api version')
-
-                out = []
-                for i in range(num_ports):
-                    out.append([day[i], night[i]])
-
-                output[str(module_id)] = out
-            except CommunicationTimedOutException as ex:
-                logger.error('Communication timeout while fetching total energy from {0}: {1}'.format(module_id, ex))
-            except Exception as ex:
-                logger.exception('Got exception while fetching total energy from {0}: {1}'.format(module_id, ex))
-
-        return output
+        return self.get_power_snapshot([GatewayApi.TOTAL_ENERGY])[GatewayApi.TOTAL_ENERGY]
 
     def start_power_address_mode(self):
         """ Start the address mode on the power modules.
@@ -388,14 +388,17 @@ class MasterCoreController(MasterController):
 
     def load_inputs(self):  # type: () -> List[InputDTO]
         inputs = []
-        for i in self._enumerate_io_modules('input'):
+        input_ids = self._enumerate_io_modules('input')
+        self._memory_file.prefetch(InputConfiguration.get_addresses(input_ids))
+        for i in input_ids:
             inputs.append(self.load_input(i))
         return inputs
 
     def save_inputs(self, inputs):  # type: (List[Tuple[InputDTO, List[str]]]) -> None
-        for input_dto, fields in inputs:
-            input_ = InputMapper.dto_to_orm(input_dto, fields)
-            input_.save()  # TODO: Batch saving - postpone eeprom activate if relevant for the Core
+        with self._memory_file.transaction():
+            for input_dto, fields in inputs:
+                input_ = InputMapper.dto_to_orm(input_dto, fields)
+                input_.save()
 
     def _refresh_input_states(self):
         # type: () -> bool
@@ -447,17 +450,20 @@ class MasterCoreController(MasterController):
 
     def load_outputs(self):  # type: () -> List[OutputDTO]
         outputs = []
-        for i in self._enumerate_io_modules('output'):
+        output_ids = self._enumerate_io_modules('output')
+        self._memory_file.prefetch(OutputConfiguration.get_addresses(output_ids))
+        for i in output_ids:
             outputs.append(self.load_output(i))
         return outputs
 
     def save_outputs(self, outputs):  # type: (List[Tuple[OutputDTO, List[str]]]) -> None
-        for output_dto, fields in outputs:
-            output = OutputMapper.dto_to_orm(output_dto, fields)
-            if output.is_shutter:
-                # Shutter outputs cannot be changed
-                continue
-            output.save()  # TODO: Batch saving - postpone eeprom activate if relevant for the Core
+        with self._memory_file.transaction():
+            for output_dto, fields in outputs:
+                output = OutputMapper.dto_to_orm(output_dto, fields)
+                if output.is_shutter:
+                    # Shutter outputs cannot be changed
+                    continue
+                output.save()
 
     def load_output_status(self):
         # type: () -> List[Dict[str,Any]]
@@ -505,36 +511,37 @@ class MasterCoreController(MasterController):
         # implementation, a Shutter will map 1-to-1 to the Outputs with the same ID. This means we only need
         # to emulate such a Shutter module foreach Output module.
         shutters = []
-        for shutter_id in self._enumerate_io_modules('output', amount_per_module=4):
+        shutter_ids = self._enumerate_io_modules('output', amount_per_module=4)
+        self._memory_file.prefetch(ShutterConfiguration.get_addresses(shutter_ids))
+        for shutter_id in shutter_ids:
             shutters.append(self.load_shutter(shutter_id))
         return shutters
 
     def save_shutters(self, shutters):  # type: (List[Tuple[ShutterDTO, List[str]]]) -> None
-        # TODO: Batch saving - postpone eeprom activate if relevant for the Core
-        # TODO: Atomic saving
-        for shutter_dto, fields in shutters:
-            # Validate whether output module exists
-            output_module = OutputConfiguration(shutter_dto.id * 2).module
-            # Configure shutter
-            shutter = ShutterMapper.dto_to_orm(shutter_dto, fields)
-            if shutter.timer_down not in [0, 65535] and shutter.timer_up not in [0, 65535]:
-                # Shutter is "configured"
-                shutter.outputs.output_0 = shutter.id * 2
-                output_set = shutter.output_set
-                self._output_shutter_map[shutter.outputs.output_0] = shutter.id
-                self._output_shutter_map[shutter.outputs.output_1] = shutter.id
-                is_configured = True
-            else:
-                output_set = shutter.output_set  # Previous outputs need to be restored
-                self._output_shutter_map.pop(shutter.outputs.output_0, None)
-                self._output_shutter_map.pop(shutter.outputs.output_1, None)
-                shutter.outputs.output_0 = 255 * 2
-                is_configured = False
-            shutter.save()
-            # Mark related Outputs as "occupied by shutter"
-            setattr(output_module.shutter_config, 'are_{0}_outputs'.format(output_set), not is_configured)
-            setattr(output_module.shutter_config, 'set_{0}_direction'.format(shutter.output_set), shutter_dto.up_down_config == 1)
-            output_module.save()
+        with self._memory_file.transaction():
+            for shutter_dto, fields in shutters:
+                # Validate whether output module exists
+                output_module = OutputConfiguration(shutter_dto.id * 2).module
+                # Configure shutter
+                shutter = ShutterMapper.dto_to_orm(shutter_dto, fields)
+                if shutter.timer_down not in [0, 65535] and shutter.timer_up not in [0, 65535]:
+                    # Shutter is "configured"
+                    shutter.outputs.output_0 = shutter.id * 2
+                    output_set = shutter.output_set
+                    self._output_shutter_map[shutter.outputs.output_0] = shutter.id
+                    self._output_shutter_map[shutter.outputs.output_1] = shutter.id
+                    is_configured = True
+                else:
+                    output_set = shutter.output_set  # Previous outputs need to be restored
+                    self._output_shutter_map.pop(shutter.outputs.output_0, None)
+                    self._output_shutter_map.pop(shutter.outputs.output_1, None)
+                    shutter.outputs.output_0 = 255 * 2
+                    is_configured = False
+                shutter.save()
+                # Mark related Outputs as "occupied by shutter"
+                setattr(output_module.shutter_config, 'are_{0}_outputs'.format(output_set), not is_configured)
+                setattr(output_module.shutter_config, 'set_{0}_direction'.format(shutter.output_set), shutter_dto.up_down_config == 1)
+                output_module.save()
 
     def _refresh_shutter_states(self):
         status_data = {x['device_nr']: x for x in self.load_output_status()}
@@ -647,14 +654,17 @@ class MasterCoreController(MasterController):
 
     def load_sensors(self):  # type: () -> List[SensorDTO]
         sensors = []
-        for i in self._enumerate_io_modules('sensor'):
+        sensor_ids = self._enumerate_io_modules('sensor')
+        self._memory_file.prefetch(SensorConfiguration.get_addresses(sensor_ids))
+        for i in sensor_ids:
             sensors.append(self.load_sensor(i))
         return sensors
 
     def save_sensors(self, sensors):  # type: (List[Tuple[SensorDTO, List[str]]]) -> None
-        for sensor_dto, fields in sensors:
-            sensor = SensorMapper.dto_to_orm(sensor_dto, fields)
-            sensor.save()  # TODO: Batch saving - postpone eeprom activate if relevant for the Core
+        with self._memory_file.transaction():
+            for sensor_dto, fields in sensors:
+                sensor = SensorMapper.dto_to_orm(sensor_dto, fields)
+                sensor.save()
 
     def _refresh_sensor_states(self):
         amount_sensor_modules = self._master_communicator.do_command(CoreAPI.general_configuration_number_of_modules(), {})['sensor']
@@ -721,9 +731,10 @@ class MasterCoreController(MasterController):
                 for o in GroupActionController.load_group_actions()]
 
     def save_group_actions(self, group_actions):  # type: (List[Tuple[GroupActionDTO, List[str]]]) -> None
-        for group_action_dto, fields in group_actions:
-            group_action = GroupActionMapper.dto_to_orm(group_action_dto, fields)
-            GroupActionController.save_group_action(group_action, fields)
+        with self._memory_file.transaction():
+            for group_action_dto, fields in group_actions:
+                group_action = GroupActionMapper.dto_to_orm(group_action_dto, fields)
+                GroupActionController.save_group_action(group_action, fields)
 
     # Module management
 
@@ -1021,6 +1032,8 @@ class MasterCoreController(MasterController):
     def get_backup(self):
         data = bytearray()
         pages, page_length = MemoryFile.SIZES[MemoryTypes.EEPROM]
+        self._memory_file.prefetch([MemoryAddress(memory_type=MemoryTypes.EEPROM, page=page, offset=0, length=page_length)
+                                    for page in range(pages)])
         for page in range(pages):
             page_address = MemoryAddress(memory_type=MemoryTypes.EEPROM, page=page, offset=0, length=page_length)
             data += self._memory_file.read([page_address])[page_address]
@@ -123,6 +123,8 @@ def factory_reset(master_controller=INJECTED):
     for f in constants.get_all_database_files():
         if os.path.exists(f):
             os.remove(f)
+    if os.path.exists(constants.get_metrics_queue_dir()):
+        shutil.rmtree(constants.get_metrics_queue_dir())
 
     # Delete plugins
     logger.info('Removing plugins...')
@@ -223,6 +225,7 @@ def setup_target_platform(target_platform, message_client_name):
     # Metrics Controller
     Injectable.value(metrics_db=constants.get_metrics_database_file())
     Injectable.value(metrics_db_lock=metrics_lock)
+    Injectable.value(metrics_queue_dir=constants.get_metrics_queue_dir())
 
     # Energy Controller
     try:
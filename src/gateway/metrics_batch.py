@@ -0,0 +1,146 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compact representation of a batch of metrics
+"""
+
+from __future__ import absolute_import
+
+if False:  # MYPY
+    from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class MetricBatch(object):
+    """
+    A batch of metrics with the same source, type, timestamp, tag names and value names, e.g. the
+    metrics of a single collector run. Every series (a unique combination of tag values) is stored once,
+    and the values of every metric are stored in the order of the value names. The metric dicts that
+    are used by the plugins and the WebSockets
+    > {"source": "OpenMotics",
+    >  "type": "energy",
+    >  "timestamp": 1497677091,
+    >  "tags": {"device": "OpenMotics energy ID1", "id": "E7.3"},
+    >  "values": {"power": 1234}}
+    are only created when they are requested.
+    """
+
+    __slots__ = ['source', 'type', 'timestamp', 'tag_names', 'value_names', 'series', 'rows', 'values',
+                 '_series_ids', '_identifiers', '_metrics']
+
+    def __init__(self, source, metric_type, timestamp, tag_names, value_names):
+        # type: (str, str, float, Tuple[str, ...], Tuple[str, ...]) -> None
+        self.source = source
+        self.type = metric_type
+        self.timestamp = timestamp
+        self.tag_names = tag_names
+        self.value_names = value_names
+        self.series = []  # type: List[Tuple[Any, ...]]  # The tag values per series
+        self.rows = []  # type: List[int]  # The series of every metric
+        self.values = []  # type: List[Tuple[Any, ...]]  # The values of every metric
+        self._series_ids = {}  # type: Dict[Tuple[Any, ...], int]
+        self._identifiers = {}  # type: Dict[Tuple[Tuple[str, ...], int], str]
+        self._metrics = None  # type: Optional[List[Dict[str, Any]]]
+
+    @staticmethod
+    def get_schema(tags, values):
+        # type: (Dict[str, Any], Dict[str, Any]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]
+        """ Returns the tag names and the value names of a metric, which are shared by all metrics in a batch """
+        return tuple(tags), tuple(values)
+
+    @staticmethod
+    def from_metric(metric):
+        # type: (Dict[str, Any]) -> MetricBatch
+        """ Creates a batch containing a single metric dict """
+        tags, values = metric['tags'], metric['values']
+        tag_names, value_names = MetricBatch.get_schema(tags, values)
+        batch = MetricBatch(metric['source'], metric['type'], metric['timestamp'], tag_names, value_names)
+        batch.add(tags, values)
+        return batch
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.rows)
+
+    def add(self, tags, values):
+        # type: (Dict[str, Any], Dict[str, Any]) -> None
+        """ Adds a metric, which should have the tag names and value names (see get_schema) of the batch """
+        key = tuple(tags.values())
+        try:
+            series_id = self._series_ids.get(key)
+            if series_id is None:
+                series_id = len(self.series)
+                self._series_ids[key] = series_id
+                self.series.append(key)
+        except TypeError:  # Unhashable tag values (e.g. from a plugin) are not shared
+            series_id = len(self.series)
+            self.series.append(key)
+        self.rows.append(series_id)
+        self.values.append(tuple(values.values()))
+        self._metrics = None
+
+    def get_tags(self, row):
+        # type: (int) -> Dict[str, Any]
+        return dict(zip(self.tag_names, self.series[self.rows[row]]))
+
+    def get_values(self, row):
+        # type: (int) -> Dict[str, Any]
+        return dict(zip(self.value_names, self.values[row]))
+
+    def iter_values(self, name):
+        # type: (str) -> Iterator[Tuple[int, Any]]
+        """ Yields the row and value of every metric, for the given value name """
+        if name not in self.value_names:
+            return
+        index = self.value_names.index(name)
+        for row, values in enumerate(self.values):
+            yield row, values[index]
+
+    def set_value(self, row, name, value):
+        # type: (int, str, Any) -> None
+        index = self.value_names.index(name)
+        values = self.values[row]
+        self.values[row] = values[:index] + (value,) + values[index + 1:]
+        self._metrics = None
+
+    def get_identifier(self, row, tag_names):
+        # type: (int, Tuple[str, ...]) -> str
+        """ Returns the identifier ('tag=value|...' for the given, sorted, tag names) of the series of a metric """
+        key = (tag_names, self.rows[row])
+        identifier = self._identifiers.get(key)
+        if identifier is None:
+            tags = self.get_tags(row)
+            identifier = '|'.join(['{0}={1}'.format(tag, tags[tag]) for tag in tag_names])
+            self._identifiers[key] = identifier
+        return identifier
+
+    def get_metric(self, row):
+        # type: (int) -> Dict[str, Any]
+        """ Returns a metric as (legacy) dict """
+        if self._metrics is not None:
+            return self._metrics[row]
+        return {'source': self.source,
+                'type': self.type,
+                'timestamp': self.timestamp,
+                'tags': self.get_tags(row),
+                'values': self.get_values(row)}
+
+    def to_metrics(self):
+        # type: () -> List[Dict[str, Any]]
+        """ Returns all metrics as (legacy) dicts. These dicts are cached, and should not be modified """
+        metrics = self._metrics
+        if metrics is None:
+            metrics = [self.get_metric(row) for row in range(len(self.rows))]
+            self._metrics = metrics
+        return metrics
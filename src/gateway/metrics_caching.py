@@ -24,12 +24,23 @@ import ujson as json
 from random import randint
 from ioc import Injectable, Inject, INJECTED, Singleton
 
+if False:  # MYPY
+    from typing import Dict, List, Set, Tuple
+
 logger = logging.getLogger("openmotics")
 
 
 @Injectable.named('metrics_cache_controller')
 @Singleton
 class MetricsCacheController(object):
+    """
+    The counter states are kept in memory, and are written to the database in a single transaction
+    every FLUSH_INTERVAL seconds (write-behind). When the service crashes, only the progress since
+    the last flush is lost, and since the counter increments are calculated against the last raw
+    value, it is recovered when the next value is processed (unless the raw counter was reset in between).
+    """
+
+    FLUSH_INTERVAL = 30
 
     @Inject
     def __init__(self, metrics_db=INJECTED, metrics_db_lock=INJECTED):
@@ -46,6 +57,12 @@ class MetricsCacheController(object):
                                            isolation_level=None)
         self._cursor = self._connection.cursor()
         self._check_tables()
+        self._source_ids = {}  # type: Dict[Tuple[str,str,str],int]
+        self._counters = {}  # type: Dict[Tuple[int,str],List[float]]
+        self._persisted_counters = set()  # type: Set[Tuple[int,str]]
+        self._dirty_counters = set()  # type: Set[Tuple[int,str]]
+        self._last_flush = time.time()
+        self._load_counters()
 
     def _execute(self, *args, **kwargs):
         with self._lock:
@@ -65,24 +82,71 @@ class MetricsCacheController(object):
         self._execute("CREATE TABLE IF NOT EXISTS counter_sources (id INTEGER PRIMARY KEY, source TEXT, type TEXT, identifier TEXT);")
         self._execute("CREATE TABLE IF NOT EXISTS counters (id INTEGER PRIMARY KEY, source_id INTEGER , name TEXT, last_value REAL, counter REAL, timestamp INTEGER);")
         self._execute("CREATE TABLE IF NOT EXISTS counters_buffer (id INTEGER PRIMARY KEY, source_id INTEGER, counters TEXT, timestamp INTEGER);")
+        self._execute("PRAGMA journal_mode=WAL;")  # A flush doesn't block readers, and is atomic and durable on commit
+        self._execute("PRAGMA synchronous=NORMAL;")
+
+    def _load_counters(self):
+        with self._lock:
+            for source_id, source, mtype, identifier in self._execute_unlocked("SELECT id, source, type, identifier FROM counter_sources;").fetchall():
+                self._source_ids[(source, mtype, identifier)] = source_id
+            for source_id, name, last_value, counter, timestamp in self._execute_unlocked("SELECT source_id, name, last_value, counter, timestamp FROM counters;").fetchall():
+                self._counters[(source_id, name)] = [last_value, counter, timestamp]
+                self._persisted_counters.add((source_id, name))
 
     def process_counter(self, source, mtype, tags, name, value, timestamp):
         with self._lock:
             identifier = json.dumps(tags, sort_keys=True)
-            id = self._get_counter_id(source, mtype, identifier)
-            data = self._execute_unlocked("SELECT last_value, counter FROM counters WHERE source_id=? AND name=?;", (id, name))
-            for entry in data:
-                last_value, counter = entry
-                if last_value == value:
-                    return counter
-                if last_value < value:
-                    counter += (value - last_value)
-                else:
-                    counter += value
-                self._execute_unlocked("UPDATE counters SET last_value=?, counter=?, timestamp=? WHERE source_id=? AND name=?;", (value, counter, timestamp, id, name))
-                return counter
-            self._execute_unlocked("INSERT INTO counters (source_id, name, last_value, counter, timestamp) VALUES (?, ?, ?, ?, ?);", (id, name, value, value, timestamp))
-            return value
+            key = (self._get_counter_id(source, mtype, identifier), name)
+            state = self._counters.get(key)
+            if state is None:
+                self._counters[key] = [value, value, timestamp]
+                self._dirty_counters.add(key)
+                counter = value
+            else:
+                last_value, counter, _ = state
+                if last_value != value:
+                    if last_value < value:
+                        counter += (value - last_value)
+                    else:
+                        counter += value
+                    state[:] = [value, counter, timestamp]
+                    self._dirty_counters.add(key)
+            if time.time() - self._last_flush > MetricsCacheController.FLUSH_INTERVAL:
+                self._flush_unlocked()
+            return counter
+
+    def flush(self):
+        """ Writes all changed counters to the database """
+        with self._lock:
+            self._flush_unlocked()
+
+    def _flush_unlocked(self):
+        self._last_flush = time.time()
+        if not self._dirty_counters:
+            return
+        inserts, updates = [], []
+        for key in self._dirty_counters:
+            last_value, counter, timestamp = self._counters[key]
+            if key in self._persisted_counters:
+                updates.append((last_value, counter, timestamp, key[0], key[1]))
+            else:
+                inserts.append((key[0], key[1], last_value, counter, timestamp))
+        try:
+            self._execute_unlocked("BEGIN;")
+            if inserts:
+                self._cursor.executemany("INSERT INTO counters (source_id, name, last_value, counter, timestamp) VALUES (?, ?, ?, ?, ?);", inserts)
+            if updates:
+                self._cursor.executemany("UPDATE counters SET last_value=?, counter=?, timestamp=? WHERE source_id=? AND name=?;", updates)
+            self._execute_unlocked("COMMIT;")
+        except sqlite3.Error as ex:
+            logger.error('Could not flush {0} counter(s): {1}'.format(len(inserts) + len(updates), ex))
+            try:
+                self._execute_unlocked("ROLLBACK;")
+            except sqlite3.Error:
+                pass  # The transaction was already rolled back
+            return  # The counters stay dirty, and will be flushed on the next try
+        self._persisted_counters.update(self._dirty_counters)
+        self._dirty_counters.clear()
 
     def buffer_counter(self, source, mtype, tags, counters, timestamp):
         with self._lock:
@@ -115,12 +179,19 @@ class MetricsCacheController(object):
             return self._execute_unlocked("SELECT changes();").fetchone()[0]
 
     def _get_counter_id(self, source, mtype, identifier):
+        source_id = self._source_ids.get((source, mtype, identifier))
+        if source_id is not None:
+            return source_id
         data = self._execute_unlocked("SELECT id FROM counter_sources WHERE source=? AND type=? AND identifier=?;", (source, mtype, identifier)).fetchone()
         if data is not None:
-            return data[0]
-        result = self._execute_unlocked("INSERT INTO counter_sources (source, type, identifier) VALUES (?, ?, ?);", (source, mtype, identifier))
-        return result.lastrowid
+            source_id = data[0]
+        else:
+            result = self._execute_unlocked("INSERT INTO counter_sources (source, type, identifier) VALUES (?, ?, ?);", (source, mtype, identifier))
+            source_id = result.lastrowid
+        self._source_ids[(source, mtype, identifier)] = source_id
+        return source_id
 
     def close(self):
-        """ Close the database connection. """
+        """ Flush the counters and close the database connection. """
+        self.flush()
         self._connection.close()
@@ -20,14 +20,15 @@ from __future__ import absolute_import
 
 import logging
 import time
-from collections import deque
-from threading import Event
+from collections import OrderedDict, deque
+from threading import local
 
 import six
 
-from gateway.daemon_thread import BaseThread
 from gateway.events import GatewayEvent
 from gateway.hal.master_controller import CommunicationFailure
+from gateway.metrics_batch import MetricBatch
+from gateway.metrics_scheduler import MetricsScheduler
 from gateway.models import Database
 from ioc import INJECTED, Inject, Injectable, Singleton
 from platform_utils import Hardware
@@ -41,6 +42,7 @@ if False:  # MYPY
     from gateway.thermostat.thermostat_controller import ThermostatController
     from gateway.pulse_counter_controller import PulseCounterController
     from gateway.gateway_api import GatewayApi
+    from gateway.pubsub import PubSub
     from gateway.dto import InputDTO, SensorDTO, OutputDTO, PulseCounterDTO
 
 logger = logging.getLogger("openmotics")
@@ -70,10 +72,9 @@ class MetricsCollector(object):
 
     @Inject
     def __init__(self, gateway_api=INJECTED, pulse_counter_controller=INJECTED, thermostat_controller=INJECTED,
-                 output_controller=INJECTED, input_controller=INJECTED, sensor_controller=INJECTED):
+                 output_controller=INJECTED, input_controller=INJECTED, sensor_controller=INJECTED, pubsub=INJECTED):
         self._start = time.time()
         self._last_service_uptime = 0
-        self._stopped = True
         self._metrics_controller = None
         self._plugin_controller = None
         self._environment_inputs = {}  # type: Dict[int, InputDTO]
@@ -92,36 +93,33 @@ class MetricsCollector(object):
         self._plugin_intervals = {metric_type: [] for metric_type in self._min_intervals}  # type: Dict[str, List[Any]]
         self._websocket_intervals = {metric_type: {} for metric_type in self._min_intervals}  # type: Dict[str, Dict[Any, Any]]
         self._cloud_intervals = {metric_type: 900 for metric_type in self._min_intervals}
-        self._sleepers = {metric_type: {'event': Event(),
-                                        'start': 0,
-                                        'end': 0} for metric_type in self._min_intervals}  # type: Dict[str,Dict[str,Any]]
+        self._scheduler = MetricsScheduler()
 
         self._gateway_api = gateway_api  # type: GatewayApi
         self._thermostat_controller = thermostat_controller  # type: ThermostatController
         self._pulse_counter_controller = pulse_counter_controller  # type: PulseCounterController
         self._output_controller = output_controller  # type: OutputController
+        self._pubsub = pubsub  # type: PubSub
         self._input_controller = input_controller  # type: InputController
         self._sensor_controller = sensor_controller  # type: SensorController
         self._metrics_queue = deque()  # type: deque
+        self._run = local()  # The batches of the collector run of the current thread
 
     def start(self):
         self._start = time.time()
-        self._stopped = False
-        MetricsCollector._start_thread(self._load_environment_configurations, 'load_configuration', 900)
-        MetricsCollector._start_thread(self._run_system, 'system')
-        MetricsCollector._start_thread(self._run_outputs, 'output')
-        MetricsCollector._start_thread(self._run_sensors, 'sensor')
-        MetricsCollector._start_thread(self._run_thermostats, 'thermostat')
-        MetricsCollector._start_thread(self._run_errors, 'error')
-        MetricsCollector._start_thread(self._run_pulsecounters, 'counter')
-        MetricsCollector._start_thread(self._run_power_openmotics, 'energy')
-        MetricsCollector._start_thread(self._run_power_openmotics_analytics, 'energy_analytics')
-        thread = BaseThread(target=self._sleep_manager, name='metricsleep')
-        thread.daemon = True
-        thread.start()
+        self._schedule(self._load_environment_configurations, 'load_configuration', 900)
+        self._schedule(self._run_system, 'system')
+        self._schedule(self._run_outputs, 'output')
+        self._schedule(self._run_sensors, 'sensor')
+        self._schedule(self._run_thermostats, 'thermostat')
+        self._schedule(self._run_errors, 'error')
+        self._schedule(self._run_pulsecounters, 'counter')
+        self._schedule(self._run_power_metrics, 'energy')
+        self._schedule(self._run_power_openmotics_analytics, 'energy_analytics')
+        self._scheduler.start()
 
     def stop(self):
-        self._stopped = True
+        self._scheduler.stop()
 
     def collect_metrics(self):
         # Yield all metrics in the Queue
@@ -185,49 +183,42 @@ class MetricsCollector(object):
         values = {'service_uptime': service_uptime},
         tags = {'name': 'gateway'}
         timestamp = 12346789
-        """
-        self._metrics_queue.appendleft({'source': 'OpenMotics',
-                                        'type': metric_type,
-                                        'timestamp': timestamp,
-                                        'tags': tags,
-                                        'values': values})
 
-    def maybe_wake_earlier(self, metric_type, duration):
-        if metric_type in self._sleepers:
-            current_end = self._sleepers[metric_type]['end']
-            new_end = self._sleepers[metric_type]['start'] + duration
-            self._sleepers[metric_type]['end'] = min(current_end, new_end)
+        During a collector run, the metrics are added to the batches of that run. These are
+        only queued when the run is finished.
+        """
+        tag_names, value_names = MetricBatch.get_schema(tags, values)
+        batches = getattr(self._run, 'batches', None)  # type: Optional[Dict[Tuple[Any,...],MetricBatch]]
+        if batches is None:
+            batch = MetricBatch('OpenMotics', metric_type, timestamp, tag_names, value_names)
+            batch.add(tags, values)
+            self._metrics_queue.appendleft(batch)
+            return
+        key = (metric_type, timestamp, tag_names, value_names)
+        batch = batches.get(key)
+        if batch is None:
+            batch = MetricBatch('OpenMotics', metric_type, timestamp, tag_names, value_names)
+            batches[key] = batch
+        batch.add(tags, values)
 
-    def _sleep_manager(self):
-        while True:
-            for sleep_data in self._sleepers.values():
-                if not sleep_data['event'].is_set() and sleep_data['end'] < time.time():
-                    sleep_data['event'].set()
-            time.sleep(0.1)
+    def _collect(self, workload, metric_type):
+        """ Runs a collector, and queues the batches it produced """
+        self._run.batches = OrderedDict()
+        try:
+            workload(metric_type)
+        finally:
+            batches = self._run.batches
+            self._run.batches = None
+            for batch in batches.values():
+                self._metrics_queue.appendleft(batch)
 
-    @staticmethod
-    def _start_thread(workload, name, interval=None):
-        args = [name]
-        if interval is not None:
-            args.append(interval)
-        thread = BaseThread(name='metric{0}'.format(name), target=workload, args=args)
-        thread.daemon = True
-        thread.start()
-        return thread
+    def maybe_wake_earlier(self, metric_type, duration):
+        self._scheduler.set_interval(metric_type, duration)
 
-    def _pause(self, start, metric_type, interval=None):
+    def _schedule(self, workload, name, interval=None):
         if interval is None:
-            interval = self.intervals[metric_type]
-        if metric_type in self._sleepers:
-            sleep_data = self._sleepers[metric_type]
-            sleep_data['start'] = start
-            sleep_data['end'] = start + interval
-            sleep_data['event'].clear()
-            sleep_data['event'].wait()
-        else:
-            elapsed = time.time() - start
-            sleep = max(0.1, interval - elapsed)
-            time.sleep(sleep)
+            interval = self.intervals[name]
+        self._scheduler.add(name, lambda: self._collect(workload, name), interval)
 
     def process_observer_event(self, event):
         # type: (GatewayEvent) -> None
@@ -294,368 +285,358 @@ class MetricsCollector(object):
             logger.exception('Error processing input: {0}'.format(ex))
 
     def _run_system(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            now = time.time()
-            plugin_system_metrics = {}
-            try:
-                values = {}
-                with open('/proc/uptime', 'r') as f:
-                    system_uptime = float(f.readline().split()[0])
-                service_uptime = time.time() - self._start
-                if service_uptime > self._last_service_uptime + 3600:
-                    self._start = time.time()
-                    service_uptime = 0
-                self._last_service_uptime = service_uptime
-
-                values['service_uptime'] = float(service_uptime)
-                values['system_uptime'] = float(system_uptime)
-
-                try:
-                    # On some older environments `psutil` doesn't work properly.
-                    # Since these metrics are not critical they can be skipped
-                    import psutil
-                    collect_psutil_metrics = True
-                except ImportError:
-                    psutil = None
-                    collect_psutil_metrics = False
+        now = time.time()
+        plugin_system_metrics = {}
+        try:
+            values = {}
+            with open('/proc/uptime', 'r') as f:
+                system_uptime = float(f.readline().split()[0])
+            service_uptime = time.time() - self._start
+            if service_uptime > self._last_service_uptime + 3600:
+                self._start = time.time()
+                service_uptime = 0
+            self._last_service_uptime = service_uptime
 
-                if collect_psutil_metrics:
-                    try:
-                        values['cpu_percent'] = float(psutil.cpu_percent())
-                        cpu_load = [x / psutil.cpu_count() * 100 for x in psutil.getloadavg()]
-                        values['cpu_load_1'] = float(cpu_load[0])
-                        values['cpu_load_5'] = float(cpu_load[1])
-                        values['cpu_load_15'] = float(cpu_load[2])
-                    except Exception as ex:
-                        logger.error('Error loading cpu metrics: {0}'.format(ex))
+            values['service_uptime'] = float(service_uptime)
+            values['system_uptime'] = float(system_uptime)
 
-                    try:
-                        memory = dict(psutil.virtual_memory()._asdict())
-                        for reading in ['available', 'used', 'percent', 'free', 'inactive', 'shared', 'active', 'total']:
-                            try:
-                                key = 'memory_{0}'.format(reading)
-                                value = memory[reading]
-                                values[key] = int(value) if reading != 'percent' else float(value)
-                            except Exception as ex:
-                                logger.error('error loading memory metric: {0}'.format(ex))
-                    except Exception as ex:
-                        logger.error('Error loading memory metrics: {0}'.format(ex))
+            try:
+                # On some older environments `psutil` doesn't work properly.
+                # Since these metrics are not critical they can be skipped
+                import psutil
+                collect_psutil_metrics = True
+            except ImportError:
+                psutil = None
+                collect_psutil_metrics = False
 
-                    try:
-                        disk = dict(psutil.disk_usage('/')._asdict())
-                        for reading in ['total', 'used', 'percent', 'free']:
-                            try:
-                                key = 'disk_{0}'.format(reading)
-                                value = disk[reading]
-                                values[key] = int(value) if reading != 'percent' else float(value)
-                            except Exception as ex:
-                                logger.error('Error loading disk metric: {0}'.format(ex))
+            if collect_psutil_metrics:
+                try:
+                    values['cpu_percent'] = float(psutil.cpu_percent())
+                    cpu_load = [x / psutil.cpu_count() * 100 for x in psutil.getloadavg()]
+                    values['cpu_load_1'] = float(cpu_load[0])
+                    values['cpu_load_5'] = float(cpu_load[1])
+                    values['cpu_load_15'] = float(cpu_load[2])
+                except Exception as ex:
+                    logger.error('Error loading cpu metrics: {0}'.format(ex))
 
-                        disk_io = dict(psutil.disk_io_counters()._asdict())
-                        for reading in ['read_count', 'write_count', 'read_bytes', 'write_bytes']:
-                            try:
-                                key = 'disk_{0}'.format(reading)
-                                value = disk_io[reading]
-                                values[key] = int(value)
-                            except Exception as ex:
-                                logger.error('Error loading disk io metric: {0}'.format(ex))
-                    except Exception as ex:
-                        logger.error('Error loading disk metrics: {0}'.format(ex))
+                try:
+                    memory = dict(psutil.virtual_memory()._asdict())
+                    for reading in ['available', 'used', 'percent', 'free', 'inactive', 'shared', 'active', 'total']:
+                        try:
+                            key = 'memory_{0}'.format(reading)
+                            value = memory[reading]
+                            values[key] = int(value) if reading != 'percent' else float(value)
+                        except Exception as ex:
+                            logger.error('error loading memory metric: {0}'.format(ex))
+                except Exception as ex:
+                    logger.error('Error loading memory metrics: {0}'.format(ex))
 
-                    try:
-                        network = dict(psutil.net_io_counters()._asdict())
-                        for reading in ['bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv']:
-                            try:
-                                key = 'net_{0}'.format(reading)
-                                value = network[reading]
-                                values[key] = int(value)
-                            except Exception as ex:
-                                logger.error('Error loading network metric: {0}'.format(ex))
-                    except Exception as ex:
-                        logger.error('Error loading network metrics: {0}'.format(ex))
+                try:
+                    disk = dict(psutil.disk_usage('/')._asdict())
+                    for reading in ['total', 'used', 'percent', 'free']:
+                        try:
+                            key = 'disk_{0}'.format(reading)
+                            value = disk[reading]
+                            values[key] = int(value) if reading != 'percent' else float(value)
+                        except Exception as ex:
+                            logger.error('Error loading disk metric: {0}'.format(ex))
 
-                    try:
-                        import openmotics_service
-                        import watchdog
-                        import vpn_service
-                        from plugin_runtime import runtime
-                        openmotics_service_filename = openmotics_service.__file__.split('/')[-1].replace('.pyc', '.py')
-                        watchdog_filename = watchdog.__file__.split('/')[-1].replace('.pyc', '.py')
-                        vpn_service_filename = vpn_service.__file__.split('/')[-1].replace('.pyc', '.py')
-                        runtime_filename = runtime.__file__.split('/')[-1].replace('.pyc', '.py')
-                        num_file_descriptors = {'fds_total': 0, 'fds_service_vpn': 0, 'fds_service_api': 0, 'fds_service_watchdog': 0,
-                                                'ofs_total': 0, 'ofs_service_vpn': 0, 'ofs_service_api': 0, 'ofs_service_watchdog': 0}
-                        for proc in psutil.process_iter():
-                            try:
-                                proc_data = proc.as_dict(attrs=['num_fds', 'cmdline', 'open_files'])
-                                nfds = int(proc_data['num_fds'])
-                                nofs = len(proc_data['open_files'])
-                                cmd_line = proc_data['cmdline']
-                                cmd_line_length = len(cmd_line)
-                                num_file_descriptors['fds_total'] += nfds
-                                num_file_descriptors['ofs_total'] += nofs
-                                if cmd_line_length < 2:
-                                    continue
-                                if vpn_service_filename in cmd_line[1]:
-                                    num_file_descriptors['fds_service_vpn'] = nfds
-                                    num_file_descriptors['ofs_service_vpn'] = nofs
-                                elif openmotics_service_filename in cmd_line[1]:
-                                    num_file_descriptors['fds_service_api'] = nfds
-                                    num_file_descriptors['ofs_service_api'] = nofs
-                                elif watchdog_filename in cmd_line[1]:
-                                    num_file_descriptors['fds_service_watchdog'] = nfds
-                                    num_file_descriptors['ofs_service_watchdog'] = nofs
-                                elif cmd_line_length == 4 and runtime_filename in cmd_line[1]:
-                                    plugin_name = cmd_line[-1].split('/')[-1]
-                                    plugin_system_metrics[plugin_name] = {'fds_total': nfds,
-                                                                          'ofs_total': nofs}
-                            except psutil.AccessDenied:
-                                pass
-                        values.update(num_file_descriptors)
-                    except Exception as ex:
-                        logger.error('Error loading pid/fd metrics: {0}'.format(ex))
+                    disk_io = dict(psutil.disk_io_counters()._asdict())
+                    for reading in ['read_count', 'write_count', 'read_bytes', 'write_bytes']:
+                        try:
+                            key = 'disk_{0}'.format(reading)
+                            value = disk_io[reading]
+                            values[key] = int(value)
+                        except Exception as ex:
+                            logger.error('Error loading disk io metric: {0}'.format(ex))
+                except Exception as ex:
+                    logger.error('Error loading disk metrics: {0}'.format(ex))
 
                 try:
-                    for key, val in Hardware.read_mmc_ext_csd().items():
-                        values['disk_{}'.format(key)] = val
+                    network = dict(psutil.net_io_counters()._asdict())
+                    for reading in ['bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv']:
+                        try:
+                            key = 'net_{0}'.format(reading)
+                            value = network[reading]
+                            values[key] = int(value)
+                        except Exception as ex:
+                            logger.error('Error loading network metric: {0}'.format(ex))
                 except Exception as ex:
-                    logger.error('Error loading disk eMMC metrics: {0}'.format(ex))
+                    logger.error('Error loading network metrics: {0}'.format(ex))
 
-                # get database metrics
                 try:
-                    for model, counter in six.iteritems(Database.get_metrics()):
+                    import openmotics_service
+                    import watchdog
+                    import vpn_service
+                    from plugin_runtime import runtime
+                    openmotics_service_filename = openmotics_service.__file__.split('/')[-1].replace('.pyc', '.py')
+                    watchdog_filename = watchdog.__file__.split('/')[-1].replace('.pyc', '.py')
+                    vpn_service_filename = vpn_service.__file__.split('/')[-1].replace('.pyc', '.py')
+                    runtime_filename = runtime.__file__.split('/')[-1].replace('.pyc', '.py')
+                    num_file_descriptors = {'fds_total': 0, 'fds_service_vpn': 0, 'fds_service_api': 0, 'fds_service_watchdog': 0,
+                                            'ofs_total': 0, 'ofs_service_vpn': 0, 'ofs_service_api': 0, 'ofs_service_watchdog': 0}
+                    for proc in psutil.process_iter():
                         try:
-                            key = 'db_{0}'.format(model)
-                            values[key] = int(counter)
-                        except Exception as ex:
-                            logger.error('Error loading database metric: {0}'.format(ex))
+                            proc_data = proc.as_dict(attrs=['num_fds', 'cmdline', 'open_files'])
+                            nfds = int(proc_data['num_fds'])
+                            nofs = len(proc_data['open_files'])
+                            cmd_line = proc_data['cmdline']
+                            cmd_line_length = len(cmd_line)
+                            num_file_descriptors['fds_total'] += nfds
+                            num_file_descriptors['ofs_total'] += nofs
+                            if cmd_line_length < 2:
+                                continue
+                            if vpn_service_filename in cmd_line[1]:
+                                num_file_descriptors['fds_service_vpn'] = nfds
+                                num_file_descriptors['ofs_service_vpn'] = nofs
+                            elif openmotics_service_filename in cmd_line[1]:
+                                num_file_descriptors['fds_service_api'] = nfds
+                                num_file_descriptors['ofs_service_api'] = nofs
+                            elif watchdog_filename in cmd_line[1]:
+                                num_file_descriptors['fds_service_watchdog'] = nfds
+                                num_file_descriptors['ofs_service_watchdog'] = nofs
+                            elif cmd_line_length == 4 and runtime_filename in cmd_line[1]:
+                                plugin_name = cmd_line[-1].split('/')[-1]
+                                plugin_system_metrics[plugin_name] = {'fds_total': nfds,
+                                                                      'ofs_total': nofs}
+                        except psutil.AccessDenied:
+                            pass
+                    values.update(num_file_descriptors)
                 except Exception as ex:
-                    logger.error('Error loading database metrics: {0}'.format(ex))
+                    logger.error('Error loading pid/fd metrics: {0}'.format(ex))
+
+            try:
+                for key, val in Hardware.read_mmc_ext_csd().items():
+                    values['disk_{}'.format(key)] = val
+            except Exception as ex:
+                logger.error('Error loading disk eMMC metrics: {0}'.format(ex))
+
+            # get database metrics
+            try:
+                for model, counter in six.iteritems(Database.get_metrics()):
+                    try:
+                        key = 'db_{0}'.format(model)
+                        values[key] = int(counter)
+                    except Exception as ex:
+                        logger.error('Error loading database metric: {0}'.format(ex))
+            except Exception as ex:
+                logger.error('Error loading database metrics: {0}'.format(ex))
 
+            self._enqueue_metrics(metric_type=metric_type,
+                                  values=values,
+                                  tags={'name': 'gateway',
+                                        'section': 'main'},
+                                  timestamp=now)
+        except Exception as ex:
+            logger.exception('Error sending system data: {0}'.format(ex))
+        if self._metrics_controller is not None:
+            try:
                 self._enqueue_metrics(metric_type=metric_type,
-                                      values=values,
                                       tags={'name': 'gateway',
-                                            'section': 'main'},
+                                            'section': 'plugins'},
+                                      values={'queue_length': len(self._metrics_controller.metrics_queue_plugins)},
                                       timestamp=now)
-            except Exception as ex:
-                logger.exception('Error sending system data: {0}'.format(ex))
-            if self._metrics_controller is not None:
-                try:
+                self._enqueue_metrics(metric_type=metric_type,
+                                      tags={'name': 'gateway',
+                                            'section': 'openmotics'},
+                                      values={'queue_length': len(self._metrics_controller.metrics_queue_openmotics)},
+                                      timestamp=now)
+                self._enqueue_metrics(metric_type=metric_type,
+                                      tags={'name': 'gateway',
+                                            'section': 'cloud'},
+                                      values={'cloud_queue_length': self._metrics_controller.cloud_stats['queue'],
+                                              'cloud_buffer_length': self._metrics_controller.cloud_stats['buffer'],
+                                              'cloud_time_ago_send': self._metrics_controller.cloud_stats['time_ago_send'],
+                                              'cloud_time_ago_try': self._metrics_controller.cloud_stats['time_ago_try'],
+                                              'cloud_queue_bytes': self._metrics_controller.cloud_stats['queue_bytes'],
+                                              'cloud_queue_dropped': self._metrics_controller.cloud_stats['dropped'],
+                                              'cloud_upload_throughput': self._metrics_controller.cloud_stats['upload_throughput']},
+                                      timestamp=now)
+                assert self._plugin_controller
+                for plugin in self._plugin_controller.get_plugins():
+                    event_statistics = plugin.get_event_statistics()
+                    plugin_values = {'queue_length': plugin.get_queue_length(),
+                                     'events_coalesced': event_statistics['coalesced'],
+                                     'events_dropped': event_statistics['dropped']}
+                    if plugin.name in plugin_system_metrics:
+                        plugin_values.update(plugin_system_metrics[plugin.name])
                     self._enqueue_metrics(metric_type=metric_type,
                                           tags={'name': 'gateway',
-                                                'section': 'plugins'},
-                                          values={'queue_length': len(self._metrics_controller.metrics_queue_plugins)},
+                                                'section': plugin.name},
+                                          values=plugin_values,
                                           timestamp=now)
+                for key in set(self._metrics_controller.inbound_rates.keys()) | set(self._metrics_controller.outbound_rates.keys()):
                     self._enqueue_metrics(metric_type=metric_type,
                                           tags={'name': 'gateway',
-                                                'section': 'openmotics'},
-                                          values={'queue_length': len(self._metrics_controller.metrics_queue_openmotics)},
+                                                'section': key},
+                                          values={'metrics_in': self._metrics_controller.inbound_rates.get(key, 0),
+                                                  'metrics_out': self._metrics_controller.outbound_rates.get(key, 0)},
                                           timestamp=now)
+                collector_statistics = self._scheduler.get_statistics()
+                for mtype in self.intervals:
+                    interval_values = {'metric_interval': self.intervals[mtype]}
+                    if mtype in collector_statistics:
+                        interval_values.update({'collector_run_time': collector_statistics[mtype]['run_time'],
+                                                'collector_lateness': collector_statistics[mtype]['lateness']})
                     self._enqueue_metrics(metric_type=metric_type,
                                           tags={'name': 'gateway',
-                                                'section': 'cloud'},
-                                          values={'cloud_queue_length': self._metrics_controller.cloud_stats['queue'],
-                                                  'cloud_buffer_length': self._metrics_controller.cloud_stats['buffer'],
-                                                  'cloud_time_ago_send': self._metrics_controller.cloud_stats['time_ago_send'],
-                                                  'cloud_time_ago_try': self._metrics_controller.cloud_stats['time_ago_try']},
+                                                'section': mtype},
+                                          values=interval_values,
                                           timestamp=now)
-                    assert self._plugin_controller
-                    for plugin in self._plugin_controller.get_plugins():
-                        plugin_values = {'queue_length': plugin.get_queue_length()}
-                        if plugin.name in plugin_system_metrics:
-                            plugin_values.update(plugin_system_metrics[plugin.name])
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              tags={'name': 'gateway',
-                                                    'section': plugin.name},
-                                              values=plugin_values,
-                                              timestamp=now)
-                    for key in set(self._metrics_controller.inbound_rates.keys()) | set(self._metrics_controller.outbound_rates.keys()):
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              tags={'name': 'gateway',
-                                                    'section': key},
-                                              values={'metrics_in': self._metrics_controller.inbound_rates.get(key, 0),
-                                                      'metrics_out': self._metrics_controller.outbound_rates.get(key, 0)},
-                                              timestamp=now)
-                    for mtype in self.intervals:
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              tags={'name': 'gateway',
-                                                    'section': mtype},
-                                              values={'metric_interval': self.intervals[mtype]},
-                                              timestamp=now)
-                except Exception as ex:
-                    logger.error('Could not collect metric metrics: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+                for topic, topic_statistics in self._pubsub.get_statistics().items():
+                    self._enqueue_metrics(metric_type=metric_type,
+                                          tags={'name': 'gateway',
+                                                'section': 'pubsub.{0}'.format(topic)},
+                                          values={'pubsub_queue_length': topic_statistics['queue_length'],
+                                                  'pubsub_max_queue_length': topic_statistics['max_queue_length'],
+                                                  'pubsub_latency': topic_statistics['latency'],
+                                                  'pubsub_max_latency': topic_statistics['max_latency']},
+                                          timestamp=now)
+                thermostat_statistics = self._thermostat_controller.get_statistics()
+                if thermostat_statistics:
+                    self._enqueue_metrics(metric_type=metric_type,
+                                          tags={'name': 'gateway',
+                                                'section': 'thermostats'},
+                                          values={'thermostat_tick_duration': thermostat_statistics['tick_duration'],
+                                                  'thermostat_max_tick_duration': thermostat_statistics['max_tick_duration'],
+                                                  'thermostat_refresh_duration': thermostat_statistics['refresh_duration']},
+                                          timestamp=now)
+            except Exception as ex:
+                logger.error('Could not collect metric metrics: {0}'.format(ex))
 
     def _run_outputs(self, metric_type):
         # type: (str) -> None
-        while not self._stopped:
-            start = time.time()
-            try:
-                result = self._output_controller.get_output_statuses()
-                for output_state_dto in result:
-                    if output_state_dto.id not in self._environment_outputs:
-                        continue
-                    output_dto, output_status = self._environment_outputs[output_state_dto.id]
-                    output_status.update({'status': output_state_dto.status,
-                                          'dimmer': output_state_dto.dimmer})
-            except CommunicationFailure as ex:
-                logger.info('Error getting output status: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error getting output status: {0}'.format(ex))
-            self._process_outputs(list(self._environment_outputs.keys()), metric_type)
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        try:
+            result = self._output_controller.get_output_statuses()
+            for output_state_dto in result:
+                if output_state_dto.id not in self._environment_outputs:
+                    continue
+                output_dto, output_status = self._environment_outputs[output_state_dto.id]
+                output_status.update({'status': output_state_dto.status,
+                                      'dimmer': output_state_dto.dimmer})
+        except CommunicationFailure as ex:
+            logger.info('Error getting output status: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error getting output status: {0}'.format(ex))
+        self._process_outputs(list(self._environment_outputs.keys()), metric_type)
 
     def _run_sensors(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                temperatures = self._gateway_api.get_sensors_temperature_status()
-                humidities = self._gateway_api.get_sensors_humidity_status()
-                brightnesses = self._gateway_api.get_sensors_brightness_status()
-                for sensor_id, sensor_dto in self._environment_sensors.items():
-                    name = sensor_dto.name
-                    # TODO: Add a flag to the ORM to store this "in use" metadata
-                    if name == '' or name == 'NOT_IN_USE':
-                        continue
-                    tags = {'id': sensor_id,
-                            'name': name}
-                    values = {}
-                    if temperatures[sensor_id] is not None:
-                        values['temp'] = temperatures[sensor_id]
-                    if humidities[sensor_id] is not None:
-                        values['hum'] = humidities[sensor_id]
-                    if brightnesses[sensor_id] is not None:
-                        values['bright'] = brightnesses[sensor_id]
-                    if len(values) == 0:
-                        continue
-                    self._enqueue_metrics(metric_type=metric_type,
-                                          values=values,
-                                          tags=tags,
-                                          timestamp=now)
-            except CommunicationFailure as ex:
-                logger.info('Error getting sensor status: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error getting sensor status: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        try:
+            now = time.time()
+            temperatures = self._gateway_api.get_sensors_temperature_status()
+            humidities = self._gateway_api.get_sensors_humidity_status()
+            brightnesses = self._gateway_api.get_sensors_brightness_status()
+            for sensor_id, sensor_dto in self._environment_sensors.items():
+                name = sensor_dto.name
+                # TODO: Add a flag to the ORM to store this "in use" metadata
+                if name == '' or name == 'NOT_IN_USE':
+                    continue
+                tags = {'id': sensor_id,
+                        'name': name}
+                values = {}
+                if temperatures[sensor_id] is not None:
+                    values['temp'] = temperatures[sensor_id]
+                if humidities[sensor_id] is not None:
+                    values['hum'] = humidities[sensor_id]
+                if brightnesses[sensor_id] is not None:
+                    values['bright'] = brightnesses[sensor_id]
+                if len(values) == 0:
+                    continue
+                self._enqueue_metrics(metric_type=metric_type,
+                                      values=values,
+                                      tags=tags,
+                                      timestamp=now)
+        except CommunicationFailure as ex:
+            logger.info('Error getting sensor status: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error getting sensor status: {0}'.format(ex))
 
     def _run_thermostats(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                thermostats = self._thermostat_controller.get_thermostat_status()
+        try:
+            now = time.time()
+            thermostats = self._thermostat_controller.get_thermostat_status()
+            self._enqueue_metrics(metric_type=metric_type,
+                                  values={'on': thermostats.on,
+                                          'cooling': thermostats.cooling},
+                                  tags={'id': 'G.0',
+                                        'name': 'Global configuration'},
+                                  timestamp=now)
+            for thermostat in thermostats.statusses:
+                values = {'setpoint': int(thermostat.setpoint),
+                          'output0': float(thermostat.output_0_level),
+                          'output1': float(thermostat.output_1_level),
+                          'mode': int(thermostat.mode),
+                          'type': 'tbs' if thermostat.sensor_id == 240 else 'normal',
+                          'automatic': thermostat.automatic,
+                          'current_setpoint': thermostat.setpoint_temperature}
+                if thermostat.outside_temperature is not None:
+                    values['outside'] = thermostat.outside_temperature
+                if thermostat.sensor_id != 240 and thermostat.actual_temperature is not None:
+                    values['temperature'] = thermostat.actual_temperature
                 self._enqueue_metrics(metric_type=metric_type,
-                                      values={'on': thermostats.on,
-                                              'cooling': thermostats.cooling},
-                                      tags={'id': 'G.0',
-                                            'name': 'Global configuration'},
+                                      values=values,
+                                      tags={'id': '{0}.{1}'.format('C' if thermostats.cooling is True else 'H',
+                                                                   thermostat.id),
+                                            'name': thermostat.name},
                                       timestamp=now)
-                for thermostat in thermostats.statusses:
-                    values = {'setpoint': int(thermostat.setpoint),
-                              'output0': float(thermostat.output_0_level),
-                              'output1': float(thermostat.output_1_level),
-                              'mode': int(thermostat.mode),
-                              'type': 'tbs' if thermostat.sensor_id == 240 else 'normal',
-                              'automatic': thermostat.automatic,
-                              'current_setpoint': thermostat.setpoint_temperature}
-                    if thermostat.outside_temperature is not None:
-                        values['outside'] = thermostat.outside_temperature
-                    if thermostat.sensor_id != 240 and thermostat.actual_temperature is not None:
-                        values['temperature'] = thermostat.actual_temperature
-                    self._enqueue_metrics(metric_type=metric_type,
-                                          values=values,
-                                          tags={'id': '{0}.{1}'.format('C' if thermostats.cooling is True else 'H',
-                                                                       thermostat.id),
-                                                'name': thermostat.name},
-                                          timestamp=now)
-            except CommunicationFailure as ex:
-                logger.error('Error getting thermostat status: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error getting thermostat status: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        except CommunicationFailure as ex:
+            logger.error('Error getting thermostat status: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error getting thermostat status: {0}'.format(ex))
 
     def _run_errors(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                errors = self._gateway_api.master_error_list()
-                for error in errors:
-                    om_module = error[0]
-                    count = error[1]
-                    types = {'i': 'Input',
-                             'I': 'Input',
-                             't': 'Temperature',
-                             'T': 'Temperature',
-                             'o': 'Output',
-                             'O': 'Output',
-                             'd': 'Dimmer',
-                             'D': 'Dimmer',
-                             'R': 'Shutter',
-                             'C': 'CAN',
-                             'L': 'OLED'}
-                    self._enqueue_metrics(metric_type=metric_type,
-                                          values={'value': int(count)},
-                                          tags={'type': types[om_module[0]],
-                                                'id': om_module,
-                                                'name': '{0} {1}'.format(types[om_module[0]], om_module)},
-                                          timestamp=now)
-            except CommunicationFailure as ex:
-                logger.error('Error getting module errors: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error getting module errors: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
-
-    def _run_pulsecounters(self, metric_type):
-        while not self._stopped:
-            start = time.time()
+        try:
             now = time.time()
-            counters_data = {}
-            try:
-                for counter_id, counter_dto in self._environment_pulse_counters.items():
-                    counters_data[counter_id] = {'name': counter_dto.name,
-                                                 'input': counter_dto.input_id}
-                values = self._pulse_counter_controller.get_values()
-                for counter_id in counters_data:
-                    if counter_id in values:
-                        counters_data[counter_id]['count'] = values[counter_id]
-                for counter_id in counters_data:
-                    counter = counters_data[counter_id]
-                    if counter['name'] != '' and counter['count'] is not None:
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              values={'value': int(counter['count'])},
-                                              tags={'name': counter['name'],
-                                                    'input': counter['input'],
-                                                    'id': 'P{0}'.format(counter_id)},
-                                              timestamp=now)
-            except CommunicationFailure as ex:
-                logger.error('Error getting pulse counter status: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error getting pulse counter status: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+            errors = self._gateway_api.master_error_list()
+            for error in errors:
+                om_module = error[0]
+                count = error[1]
+                types = {'i': 'Input',
+                         'I': 'Input',
+                         't': 'Temperature',
+                         'T': 'Temperature',
+                         'o': 'Output',
+                         'O': 'Output',
+                         'd': 'Dimmer',
+                         'D': 'Dimmer',
+                         'R': 'Shutter',
+                         'C': 'CAN',
+                         'L': 'OLED'}
+                self._enqueue_metrics(metric_type=metric_type,
+                                      values={'value': int(count)},
+                                      tags={'type': types[om_module[0]],
+                                            'id': om_module,
+                                            'name': '{0} {1}'.format(types[om_module[0]], om_module)},
+                                      timestamp=now)
+        except CommunicationFailure as ex:
+            logger.error('Error getting module errors: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error getting module errors: {0}'.format(ex))
 
-    def _run_power_openmotics(self, metric_type):
-        # type: (str) -> None
-        while not self._stopped:
-            start = time.time()
-            self._run_power_metrics(metric_type)
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+    def _run_pulsecounters(self, metric_type):
+        now = time.time()
+        counters_data = {}
+        try:
+            for counter_id, counter_dto in self._environment_pulse_counters.items():
+                counters_data[counter_id] = {'name': counter_dto.name,
+                                             'input': counter_dto.input_id}
+            values = self._pulse_counter_controller.get_values()
+            for counter_id in counters_data:
+                if counter_id in values:
+                    counters_data[counter_id]['count'] = values[counter_id]
+            for counter_id in counters_data:
+                counter = counters_data[counter_id]
+                if counter['name'] != '' and counter['count'] is not None:
+                    self._enqueue_metrics(metric_type=metric_type,
+                                          values={'value': int(counter['count'])},
+                                          tags={'name': counter['name'],
+                                                'input': counter['input'],
+                                                'id': 'P{0}'.format(counter_id)},
+                                          timestamp=now)
+        except CommunicationFailure as ex:
+            logger.error('Error getting pulse counter status: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error getting pulse counter status: {0}'.format(ex))
 
     def _run_power_metrics(self, metric_type):
         # type: (str) -> None
@@ -666,6 +647,15 @@ class MetricsCollector(object):
         now = time.time()
         mapping = {}
         power_data = {}
+        snapshot = {}  # type: Dict[str,Any]
+        try:
+            # A single poll cycle, shared with the other consumers of the power modules
+            snapshot = self._gateway_api.get_power_snapshot()
+            now = snapshot.get('timestamp', now)
+        except CommunicationFailure as ex:
+            logger.error('Error polling power modules: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error polling power modules: {0}'.format(ex))
         try:
             for power_module in self._gateway_api.get_power_modules():
                 device_id = '{0}.{{0}}'.format(power_module['address'])
@@ -677,7 +667,7 @@ class MetricsCollector(object):
         except Exception as ex:
             logger.exception('Error getting power modules: {0}'.format(ex))
         try:
-            realtime_power_data = self._gateway_api.get_realtime_power()
+            realtime_power_data = snapshot.get('realtime_power', {})
             for module_id, device_id in mapping.items():
                 if module_id in realtime_power_data:
                     for index, realtime_power in enumerate(realtime_power_data[module_id]):
@@ -692,7 +682,7 @@ class MetricsCollector(object):
         except Exception as ex:
             logger.exception('Error getting realtime power: {0}'.format(ex))
         try:
-            for realtime_p1 in self._gateway_api.get_realtime_p1():
+            for realtime_p1 in snapshot.get('realtime_p1', []):
                 electricity_p1 = realtime_p1.get('electricity', {})
                 if electricity_p1.get('ean'):
                     values = {'electricity_consumption_tariff1': convert_kwh(electricity_p1['consumption_tariff1']),
@@ -730,7 +720,7 @@ class MetricsCollector(object):
         except Exception as ex:
             logger.exception('Error getting realtime power: {0}'.format(ex))
         try:
-            total_energy = self._gateway_api.get_total_energy()
+            total_energy = snapshot.get('total_energy', {})
             for module_id, device_id in mapping.items():
                 if module_id in total_energy:
                     for index, entry in enumerate(total_energy[module_id]):
@@ -762,132 +752,122 @@ class MetricsCollector(object):
                 logger.exception('Error processing OpenMotics power device {0}: {1}'.format(device_id, ex))
 
     def _run_power_openmotics_analytics(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                result = self._gateway_api.get_power_modules()
-                for power_module in result:
-                    device_id = '{0}.{{0}}'.format(power_module['address'])
-                    if power_module['version'] != power_api.ENERGY_MODULE:
+        try:
+            now = time.time()
+            result = self._gateway_api.get_power_modules()
+            for power_module in result:
+                device_id = '{0}.{{0}}'.format(power_module['address'])
+                if power_module['version'] != power_api.ENERGY_MODULE:
+                    continue
+                result = self._gateway_api.get_energy_time(power_module['id'])
+                abort = False
+                for i in range(12):
+                    if abort is True:
+                        break
+                    name = power_module['input{0}'.format(i)]
+                    if name == '':
                         continue
-                    result = self._gateway_api.get_energy_time(power_module['id'])
-                    abort = False
-                    for i in range(12):
-                        if abort is True:
-                            break
-                        name = power_module['input{0}'.format(i)]
-                        if name == '':
-                            continue
-                        timestamp = now
-                        length = min(len(result[str(i)]['current']), len(result[str(i)]['voltage']))
-                        for j in range(length):
-                            self._enqueue_metrics(metric_type=metric_type,
-                                                  values={'current': result[str(i)]['current'][j],
-                                                          'voltage': result[str(i)]['voltage'][j]},
-                                                  tags={'id': device_id.format(i),
-                                                        'name': name,
-                                                        'type': 'time'},
-                                                  timestamp=timestamp)
-                            timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
-                    result = self._gateway_api.get_energy_frequency(power_module['id'])
-                    abort = False
-                    for i in range(12):
-                        if abort is True:
-                            break
-                        name = power_module['input{0}'.format(i)]
-                        if name == '':
-                            continue
-                        timestamp = now
-                        length = min(len(result[str(i)]['current'][0]), len(result[str(i)]['voltage'][0]))
-                        for j in range(length):
-                            self._enqueue_metrics(metric_type=metric_type,
-                                                  values={'current_harmonics': result[str(i)]['current'][0][j],
-                                                          'current_phase': result[str(i)]['current'][1][j],
-                                                          'voltage_harmonics': result[str(i)]['voltage'][0][j],
-                                                          'voltage_phase': result[str(i)]['voltage'][1][j]},
-                                                  tags={'id': device_id.format(i),
-                                                        'name': name,
-                                                        'type': 'frequency'},
-                                                  timestamp=timestamp)
-                            timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
-            except CommunicationFailure as ex:
-                logger.error('Error getting power analytics: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error getting power analytics: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
-
-    def _load_environment_configurations(self, name, interval):  # type: (str, int) -> None
-        while not self._stopped:
-            start = time.time()
-            # Inputs
-            try:
-                inputs = self._input_controller.load_inputs()
-                ids = []
-                for input_dto in inputs:
-                    input_id = input_dto.id
-                    ids.append(input_id)
-                    self._environment_inputs[input_id] = input_dto
-                for input_id in self._environment_inputs.keys():
-                    if input_id not in ids:
-                        del self._environment_inputs[input_id]
-            except CommunicationFailure as ex:
-                logger.error('Error while loading input configurations: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error while loading input configurations: {0}'.format(ex))
-            # Outputs
-            try:
-                outputs = self._output_controller.load_outputs()
-                ids = []
-                for output_dto in outputs:
-                    if output_dto.module_type not in ['o', 'O', 'd', 'D']:
+                    timestamp = now
+                    length = min(len(result[str(i)]['current']), len(result[str(i)]['voltage']))
+                    for j in range(length):
+                        self._enqueue_metrics(metric_type=metric_type,
+                                              values={'current': result[str(i)]['current'][j],
+                                                      'voltage': result[str(i)]['voltage'][j]},
+                                              tags={'id': device_id.format(i),
+                                                    'name': name,
+                                                    'type': 'time'},
+                                              timestamp=timestamp)
+                        timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
+                result = self._gateway_api.get_energy_frequency(power_module['id'])
+                abort = False
+                for i in range(12):
+                    if abort is True:
+                        break
+                    name = power_module['input{0}'.format(i)]
+                    if name == '':
                         continue
-                    output_id = output_dto.id
-                    ids.append(output_id)
-                    # TODO: Don't cache the status here, but ask it to the OutputController when relevant
-                    self._environment_outputs[output_id] = (output_dto, {})
-                for output_id in self._environment_outputs.keys():
-                    if output_id not in ids:
-                        del self._environment_outputs[output_id]
-            except CommunicationFailure as ex:
-                logger.error('Error while loading output configurations: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error while loading output configurations: {0}'.format(ex))
-            # Sensors
-            try:
-                sensors = self._sensor_controller.load_sensors()
-                ids = []
-                for sensor_dto in sensors:
-                    sensor_id = sensor_dto.id
-                    ids.append(sensor_id)
-                    self._environment_sensors[sensor_id] = sensor_dto
-                for sensor_id in self._environment_sensors.keys():
-                    if sensor_id not in ids:
-                        del self._environment_sensors[sensor_id]
-            except CommunicationFailure as ex:
-                logger.error('Error while loading sensor configurations: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error while loading sensor configurations: {0}'.format(ex))
-            # Pulse counters
-            try:
-                pulse_counters = self._pulse_counter_controller.load_pulse_counters()
-                ids = []
-                for pulse_counter_dto in pulse_counters:
-                    pulse_counter_id = pulse_counter_dto.id
-                    ids.append(pulse_counter_id)
-                    self._environment_pulse_counters[pulse_counter_id] = pulse_counter_dto
-                for pulse_counter_id in self._environment_pulse_counters.keys():
-                    if pulse_counter_id not in ids:
-                        del self._environment_pulse_counters[pulse_counter_id]
-            except CommunicationFailure as ex:
-                logger.error('Error while loading pulse counter configurations: {}'.format(ex))
-            except Exception as ex:
-                logger.exception('Error while loading pulse counter configurations: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, name, interval)
+                    timestamp = now
+                    length = min(len(result[str(i)]['current'][0]), len(result[str(i)]['voltage'][0]))
+                    for j in range(length):
+                        self._enqueue_metrics(metric_type=metric_type,
+                                              values={'current_harmonics': result[str(i)]['current'][0][j],
+                                                      'current_phase': result[str(i)]['current'][1][j],
+                                                      'voltage_harmonics': result[str(i)]['voltage'][0][j],
+                                                      'voltage_phase': result[str(i)]['voltage'][1][j]},
+                                              tags={'id': device_id.format(i),
+                                                    'name': name,
+                                                    'type': 'frequency'},
+                                              timestamp=timestamp)
+                        timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
+        except CommunicationFailure as ex:
+            logger.error('Error getting power analytics: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error getting power analytics: {0}'.format(ex))
+
+    def _load_environment_configurations(self, name):  # type: (str) -> None
+        # Inputs
+        try:
+            inputs = self._input_controller.load_inputs()
+            ids = []
+            for input_dto in inputs:
+                input_id = input_dto.id
+                ids.append(input_id)
+                self._environment_inputs[input_id] = input_dto
+            for input_id in self._environment_inputs.keys():
+                if input_id not in ids:
+                    del self._environment_inputs[input_id]
+        except CommunicationFailure as ex:
+            logger.error('Error while loading input configurations: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error while loading input configurations: {0}'.format(ex))
+        # Outputs
+        try:
+            outputs = self._output_controller.load_outputs()
+            ids = []
+            for output_dto in outputs:
+                if output_dto.module_type not in ['o', 'O', 'd', 'D']:
+                    continue
+                output_id = output_dto.id
+                ids.append(output_id)
+                # TODO: Don't cache the status here, but ask it to the OutputController when relevant
+                self._environment_outputs[output_id] = (output_dto, {})
+            for output_id in self._environment_outputs.keys():
+                if output_id not in ids:
+                    del self._environment_outputs[output_id]
+        except CommunicationFailure as ex:
+            logger.error('Error while loading output configurations: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error while loading output configurations: {0}'.format(ex))
+        # Sensors
+        try:
+            sensors = self._sensor_controller.load_sensors()
+            ids = []
+            for sensor_dto in sensors:
+                sensor_id = sensor_dto.id
+                ids.append(sensor_id)
+                self._environment_sensors[sensor_id] = sensor_dto
+            for sensor_id in self._environment_sensors.keys():
+                if sensor_id not in ids:
+                    del self._environment_sensors[sensor_id]
+        except CommunicationFailure as ex:
+            logger.error('Error while loading sensor configurations: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error while loading sensor configurations: {0}'.format(ex))
+        # Pulse counters
+        try:
+            pulse_counters = self._pulse_counter_controller.load_pulse_counters()
+            ids = []
+            for pulse_counter_dto in pulse_counters:
+                pulse_counter_id = pulse_counter_dto.id
+                ids.append(pulse_counter_id)
+                self._environment_pulse_counters[pulse_counter_id] = pulse_counter_dto
+            for pulse_counter_id in self._environment_pulse_counters.keys():
+                if pulse_counter_id not in ids:
+                    del self._environment_pulse_counters[pulse_counter_id]
+        except CommunicationFailure as ex:
+            logger.error('Error while loading pulse counter configurations: {}'.format(ex))
+        except Exception as ex:
+            logger.exception('Error while loading pulse counter configurations: {0}'.format(ex))
 
     def get_definitions(self):
         """
@@ -1067,12 +1047,56 @@ class MetricsCollector(object):
                           'description': 'Metrics queue length',
                           'type': 'gauge',
                           'unit': ''},
+                         {'name': 'events_coalesced',
+                          'description': 'Plugin state updates replaced by a newer state before delivery',
+                          'type': 'counter',
+                          'unit': ''},
+                         {'name': 'events_dropped',
+                          'description': 'Plugin events dropped because the queue was full',
+                          'type': 'counter',
+                          'unit': ''},
                          {'name': 'metric_interval',
                           'description': 'Interval on which OM metrics are collected',
                           'type': 'gauge',
                           'unit': 'seconds'},
+                         {'name': 'collector_run_time',
+                          'description': 'Duration of the last collection of OM metrics',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
+                         {'name': 'collector_lateness',
+                          'description': 'Delay between the scheduled and the actual start of the last collection of OM metrics',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
+                         {'name': 'pubsub_queue_length',
+                          'description': 'Events of a topic waiting to be delivered to its subscribers',
+                          'type': 'gauge',
+                          'unit': ''},
+                         {'name': 'pubsub_max_queue_length',
+                          'description': 'Maximum amount of events of a topic waiting to be delivered to a subscriber',
+                          'type': 'gauge',
+                          'unit': ''},
+                         {'name': 'pubsub_latency',
+                          'description': 'Delay between the publication and the delivery of the last event of a topic',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
+                         {'name': 'pubsub_max_latency',
+                          'description': 'Maximum delay between the publication and the delivery of an event of a topic',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
+                         {'name': 'thermostat_tick_duration',
+                          'description': 'Duration of the last PID loop tick over all thermostats',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
+                         {'name': 'thermostat_max_tick_duration',
+                          'description': 'Maximum duration of a PID loop tick over all thermostats',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
+                         {'name': 'thermostat_refresh_duration',
+                          'description': 'Duration of the last refresh of the thermostat configuration',
+                          'type': 'gauge',
+                          'unit': 'seconds'},
                          {'name': 'cloud_queue_length',
-                          'description': 'Length of the memory queue of metrics to be send to the Cloud',
+                          'description': 'Length of the on-disk queue of metrics to be send to the Cloud',
                           'type': 'gauge',
                           'unit': ''},
                          {'name': 'cloud_buffer_length',
@@ -1086,7 +1110,19 @@ class MetricsCollector(object):
                          {'name': 'cloud_time_ago_try',
                           'description': 'Time passed since the last try sending metrics to the Cloud',
                           'type': 'gauge',
-                          'unit': 'seconds'}] + db_definitions},
+                          'unit': 'seconds'},
+                         {'name': 'cloud_queue_bytes',
+                          'description': 'Size of the on-disk queue of metrics to be send to the Cloud',
+                          'type': 'gauge',
+                          'unit': 'bytes'},
+                         {'name': 'cloud_queue_dropped',
+                          'description': 'Metrics dropped because the Cloud queue was full',
+                          'type': 'counter',
+                          'unit': ''},
+                         {'name': 'cloud_upload_throughput',
+                          'description': 'Throughput of the last (compressed) upload of metrics to the Cloud',
+                          'type': 'gauge',
+                          'unit': 'bytes/s'}] + db_definitions},
             # inputs / events
             {'type': 'event',
              'tags': ['type', 'id', 'name'],
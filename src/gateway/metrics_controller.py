@@ -20,19 +20,23 @@ from __future__ import absolute_import
 import logging
 import re
 import time
-from collections import deque
+import zlib
+from collections import OrderedDict, deque
 
 import requests
 import ujson as json
+from six.moves.urllib.parse import urlencode
 
 from bus.om_bus_events import OMBusEvents
 from gateway.daemon_thread import DaemonThread, DaemonThreadWait
+from gateway.metrics_batch import MetricBatch
+from gateway.metrics_queue import MetricsQueue
 from gateway.models import Config
 from ioc import INJECTED, Inject, Injectable, Singleton
 import six
 
 if False:  # MYPY
-    from typing import Any, Dict, Optional, List
+    from typing import Any, Dict, Optional, List, Set, Tuple
     from plugins.base import PluginController
     from gateway.metrics_collector import MetricsCollector
     from gateway.metrics_caching import MetricsCacheController
@@ -50,11 +54,20 @@ class MetricsDistributeFailed(Exception):
 class MetricsController(object):
     """
     The Metrics Controller collects all metrics and pushses them to all subscribers
+
+    Metrics for the Cloud are appended to a persistent queue by the receiver, and are uploaded
+    by a separate thread in gzip compressed batches of at most CLOUD_BATCH_SIZE (uncompressed) bytes.
+
+    The metrics are passed to the receivers as MetricBatch instances. The metric dicts are only
+    created for metrics that are sent to the Cloud, the plugins or the WebSockets.
     """
 
+    CLOUD_BATCH_SIZE = 256 * 1024
+    PLUGIN_BATCH_SIZE = 250
+
     @Inject
-    def __init__(self, plugin_controller=INJECTED, metrics_collector=INJECTED, metrics_cache_controller=INJECTED, gateway_uuid=INJECTED):
-        # type: (PluginController, MetricsCollector, MetricsCacheController, str) -> None
+    def __init__(self, plugin_controller=INJECTED, metrics_collector=INJECTED, metrics_cache_controller=INJECTED, gateway_uuid=INJECTED, metrics_queue_dir=INJECTED):
+        # type: (PluginController, MetricsCollector, MetricsCacheController, str, str) -> None
         self._plugin_controller = plugin_controller
         self._metrics_collector = metrics_collector
         self._metrics_cache_controller = metrics_cache_controller
@@ -62,6 +75,7 @@ class MetricsController(object):
         self._buffer_counters = {}  # type: Dict
         self.definitions = {}  # type: Dict
         self._definition_filters = {'source': {}, 'metric_type': {}}  # type: Dict
+        self.definitions_version = 0  # Increased when the definitions (and thus the filter results) change
         self._metrics_cache = {}  # type: Dict
         self._collector_plugins = None  # type: Optional[DaemonThread]
         self._collector_openmotics = None  # type: Optional[DaemonThread]
@@ -74,19 +88,29 @@ class MetricsController(object):
         self.outbound_rates = {'total': 0}
         self._openmotics_receivers = []  # type: List
         self._cloud_cache = {}  # type: Dict
-        self._cloud_queue = []  # type: List
+        self._cloud_filter = {}  # type: Dict[Tuple[str, str], bool]  # Cleared when the settings change
+        self._cloud_queue = MetricsQueue(metrics_queue_dir)
         self._cloud_buffer = []  # type: List
         self._cloud_buffer_length = 0
         self._load_cloud_buffer()
         self._cloud_last_send = time.time()
         self._cloud_last_try = time.time()
         self._cloud_retry_interval = None  # type: Optional[int]
+        self._cloud_session = requests.Session()
+        self._cloud_compression = True
+        self._cloud_upload_requested = False
+        self._cloud_uploader = None  # type: Optional[DaemonThread]
         self._gateway_uuid = gateway_uuid
         self._throttled_down = False
-        self.cloud_stats = {'queue': 0,
+        self.cloud_stats = {'queue': len(self._cloud_queue),
+                            'queue_bytes': self._cloud_queue.get_size(),
+                            'dropped': 0,
                             'buffer': self._cloud_buffer_length,
                             'time_ago_send': 0,
-                            'time_ago_try': 0}
+                            'time_ago_try': 0,
+                            'upload_throughput': 0.0}
+
+        Config.subscribe(self._settings_changed)
 
         # Metrics generated by the Metrics_Controller_ are also defined in the collector. Trying to get them in one place.
         for definition in self._metrics_collector.get_definitions():
@@ -113,6 +137,10 @@ class MetricsController(object):
                                                     target=self._distribute_openmotics,
                                                     interval=0, delay=0.1)
         self._distributor_openmotics.start()
+        self._cloud_uploader = DaemonThread(name='metriccloudupload',
+                                            target=self._upload_cloud_metrics,
+                                            interval=60)
+        self._cloud_uploader.start()
 
     def stop(self):
         # type: () -> None
@@ -124,6 +152,10 @@ class MetricsController(object):
             self._distributor_plugins.stop()
         if self._distributor_openmotics is not None:
             self._distributor_openmotics.stop()
+        if self._cloud_uploader is not None:
+            self._cloud_uploader.stop()
+        self._cloud_queue.close()
+        self._metrics_cache_controller.flush()
 
     def set_cloud_interval(self, metric_type, interval, save=True):
         logger.info('Setting cloud interval {0}_{1}'.format(metric_type, interval))
@@ -226,9 +258,13 @@ class MetricsController(object):
                 self._buffer_counters.pop(source, None)
         self._definition_filters['source'] = {}
         self._definition_filters['metric_type'] = {}
+        self.definitions_version += 1
 
     def _load_cloud_buffer(self):
-        oldest_queue_timestamp = min([time.time()] + [metric[0]['timestamp'] for metric in self._cloud_queue])
+        oldest_queue_timestamp = time.time()
+        metrics, _ = self._cloud_queue.peek(1)
+        if metrics:
+            oldest_queue_timestamp = min(oldest_queue_timestamp, json.loads(metrics[0])['timestamp'])
         self._cloud_buffer = [[metric] for metric in self._metrics_cache_controller.load_buffer(before=oldest_queue_timestamp)]
         self._cloud_buffer_length = len(self._cloud_buffer)
 
@@ -254,15 +290,25 @@ class MetricsController(object):
                     settings[policy][metric['name']] = setting
         return settings
 
-    def _needs_upload_to_cloud(self, metric):
-        metric_type = metric['type']
-        metric_source = metric['source']
+    def _settings_changed(self, settings):
+        # type: (Set[str]) -> None
+        self._cloud_filter = {}
 
+    def _needs_upload_to_cloud(self, metric_source, metric_type):
         # get definition for metric source and type, getting the definitions for a metric_source is case sensitive!
         definition = self.definitions.get(metric_source, {}).get(metric_type)
         if definition is None:
             return False
 
+        cloud_filter = self._cloud_filter
+        upload = cloud_filter.get((metric_source, metric_type))
+        if upload is None:
+            upload = self._filter_cloud_upload(metric_source, metric_type)
+            cloud_filter[(metric_source, metric_type)] = upload
+        return upload
+
+    def _filter_cloud_upload(self, metric_source, metric_type):
+        # type: (str, str) -> bool
         if Config.get_entry('cloud_enabled', False) is False:
             return False
 
@@ -286,6 +332,11 @@ class MetricsController(object):
 
     def receiver(self, metric):
         # type: (Dict[str,Any]) -> None
+        """ Receives a single metric dict, see batch_receiver """
+        self.batch_receiver(MetricBatch.from_metric(metric))
+
+    def batch_receiver(self, batch):
+        # type: (MetricBatch) -> None
         """
         Collects all metrics made available by the MetricsCollector and the plugins. These metrics
         are cached locally for configurable (and optional) pushing metrics to the Cloud.
@@ -302,51 +353,46 @@ class MetricsController(object):
         >                            "id": "E7.3"},
         >                   "values": {"power": 1234}}
         """
-        metric_type = metric['type']
-        metric_source = metric['source']
+        metric_type = batch.type
+        metric_source = batch.source
 
-        if not self._needs_upload_to_cloud(metric):
+        if not self._needs_upload_to_cloud(metric_source, metric_type):
             return
 
         if metric_source == 'OpenMotics':
             # round off timestamps for openmotics metrics
             modulo_interval = Config.get_entry('cloud_metrics_interval|{0}'.format(metric_type), 900)
-            timestamp = int(metric['timestamp'] - metric['timestamp'] % modulo_interval)
+            timestamp = int(batch.timestamp - batch.timestamp % modulo_interval)
         else:
-            timestamp = int(metric['timestamp'])
+            timestamp = int(batch.timestamp)
 
         cloud_batch_size = Config.get_entry('cloud_metrics_batch_size', 0)
         cloud_min_interval = Config.get_entry('cloud_metrics_min_interval', None)  # type: Optional[int]
         if cloud_min_interval is not None:
             self._cloud_retry_interval = cloud_min_interval
-        endpoint = Config.get_entry('cloud_endpoint', None)  # type: Optional[str]
-        if endpoint is None:
+        if Config.get_entry('cloud_endpoint', None) is None:
             return
-        metrics_endpoint = '{0}/{1}?uuid={2}'.format(
-            endpoint if endpoint.startswith('http') else 'https://{0}'.format(endpoint),
-            Config.get_entry('cloud_endpoint_metrics', ''),
-            self._gateway_uuid
-        )
 
-        counters_to_buffer = self._buffer_counters.get(metric_source, {}).get(metric_type, {})
         definition = self.definitions.get(metric_source, {}).get(metric_type)
-        identifier = '|'.join(['{0}={1}'.format(tag, metric['tags'][tag]) for tag in sorted(definition['tags'])])
-
-        # Check if the metric needs to be send
-        entry = self._cloud_cache.setdefault(metric_source, {}).setdefault(metric_type, {}).setdefault(identifier, {})
-        include_this_metric = False
-        if 'timestamp' not in entry:
-            include_this_metric = True
-        else:
-            old_timestamp = entry['timestamp']
-            if old_timestamp < timestamp:
+        tag_names = tuple(sorted(definition['tags']))
+        cache = self._cloud_cache.setdefault(metric_source, {}).setdefault(metric_type, {})
+        for row in range(len(batch)):
+            identifier = batch.get_identifier(row, tag_names)
+
+            # Check if the metric needs to be send
+            entry = cache.setdefault(identifier, {})
+            include_this_metric = False
+            if 'timestamp' not in entry:
                 include_this_metric = True
+            else:
+                old_timestamp = entry['timestamp']
+                if old_timestamp < timestamp:
+                    include_this_metric = True
 
-        # Add metrics to the send queue if they need to be send
-        if include_this_metric is True:
-            entry['timestamp'] = timestamp
-            self._cloud_queue.append([metric])
-            self._cloud_queue = self._cloud_queue[-5000:]  # 5k metrics buffer
+            # Add metrics to the send queue if they need to be send
+            if include_this_metric is True:
+                entry['timestamp'] = timestamp
+                self._cloud_queue.put(json.dumps(batch.get_metric(row)))
 
         # Check timings/rates
         now = time.time()
@@ -366,51 +412,112 @@ class MetricsController(object):
                 send |= time_ago_send > time_ago_try > self._cloud_retry_interval
 
         self.cloud_stats['queue'] = len(self._cloud_queue)
+        self.cloud_stats['queue_bytes'] = self._cloud_queue.get_size()
+        self.cloud_stats['dropped'] = self._cloud_queue.dropped
         self.cloud_stats['buffer'] = self._cloud_buffer_length
         self.cloud_stats['time_ago_send'] = time_ago_send
         self.cloud_stats['time_ago_try'] = time_ago_try
 
-        if send is True:
-            self._cloud_last_try = now
-            try:
-                # Try to send the metrics
-                request = requests.post(metrics_endpoint,
-                                        data={'metrics': json.dumps(self._cloud_buffer + self._cloud_queue)},
-                                        timeout=30.0)
-                return_data = json.loads(request.text)
-                if return_data.get('success', False) is False:
-                    raise RuntimeError('{0}'.format(return_data.get('error')))
-                # If successful; clear buffers
-                if self._metrics_cache_controller.clear_buffer(metric['timestamp']) > 0:
-                    self._load_cloud_buffer()
-                self._cloud_queue = []
-                self._cloud_last_send = now
-                self._cloud_retry_interval = cloud_min_interval
-                if self._throttled_down:
-                    self._refresh_cloud_interval()
-            except Exception as ex:
-                logger.error('Error sending metrics to Cloud: {0}'.format(ex))
-                if time_ago_send > 60 * 60:
-                    # Decrease metrics rate, but at least every 2 hours
-                    # Decrease cloud try interval, but at least every hour
-                    if time_ago_send < 6 * 60 * 60:
-                        self._cloud_retry_interval = 15 * 60
-                        new_interval = 30 * 60
-                    elif time_ago_send < 24 * 60 * 60:
-                        self._cloud_retry_interval = 30 * 60
-                        new_interval = 60 * 60
-                    else:
-                        self._cloud_retry_interval = 60 * 60
-                        new_interval = 2 * 60 * 60
-                    self._throttled_down = True
-                    metric_types = Config.get_entry('cloud_metrics_types', [])  # type: List[str]
-                    for mtype in metric_types:
-                        self.set_cloud_interval(mtype, new_interval, save=False)
-
-        # Buffer metrics if appropriate
-        time_ago_send = int(now - self._cloud_last_send)
-        time_ago_try = int(now - self._cloud_last_try)
-        if time_ago_send > time_ago_try and include_this_metric is True and len(counters_to_buffer) > 0:
+        if send is True and not self._cloud_upload_requested:
+            self._cloud_upload_requested = True
+            if self._cloud_uploader is not None:
+                self._cloud_uploader.request_single_run()
+
+    def _upload_cloud_metrics(self):
+        # type: () -> None
+        """ Uploads the queued (and buffered) metrics to the Cloud, if requested by the receiver """
+        if not self._cloud_upload_requested:
+            return
+        self._cloud_upload_requested = False
+        endpoint = Config.get_entry('cloud_endpoint', None)  # type: Optional[str]
+        if endpoint is None:
+            return
+        metrics_endpoint = '{0}/{1}?uuid={2}'.format(
+            endpoint if endpoint.startswith('http') else 'https://{0}'.format(endpoint),
+            Config.get_entry('cloud_endpoint_metrics', ''),
+            self._gateway_uuid
+        )
+        cloud_min_interval = Config.get_entry('cloud_metrics_min_interval', None)  # type: Optional[int]
+
+        now = time.time()
+        self._cloud_last_try = now
+        self._load_cloud_buffer()
+        buffered_metrics = [json.dumps(metric) for metric in self._cloud_buffer]
+        try:
+            while True:
+                metrics, cursor = self._cloud_queue.peek(MetricsController.CLOUD_BATCH_SIZE)
+                if not metrics and not buffered_metrics:
+                    break
+                try:
+                    # Try to send the metrics
+                    start = time.time()
+                    size = self._send_cloud_metrics(metrics_endpoint,
+                                                    '[{0}]'.format(','.join(buffered_metrics + ['[{0}]'.format(metric) for metric in metrics])))
+                    self.cloud_stats['upload_throughput'] = size / max(0.001, time.time() - start)
+                except Exception:
+                    self._buffer_cloud_metrics(metrics)
+                    raise
+                self._cloud_queue.ack(cursor)
+                buffered_metrics = []
+            # If successful; clear buffers
+            if self._metrics_cache_controller.clear_buffer(now) > 0:
+                self._load_cloud_buffer()
+            self._cloud_last_send = now
+            self._cloud_retry_interval = cloud_min_interval
+            if self._throttled_down:
+                self._refresh_cloud_interval()
+        except Exception as ex:
+            logger.error('Error sending metrics to Cloud: {0}'.format(ex))
+            time_ago_send = int(now - self._cloud_last_send)
+            if time_ago_send > 60 * 60:
+                # Decrease metrics rate, but at least every 2 hours
+                # Decrease cloud try interval, but at least every hour
+                if time_ago_send < 6 * 60 * 60:
+                    self._cloud_retry_interval = 15 * 60
+                    new_interval = 30 * 60
+                elif time_ago_send < 24 * 60 * 60:
+                    self._cloud_retry_interval = 30 * 60
+                    new_interval = 60 * 60
+                else:
+                    self._cloud_retry_interval = 60 * 60
+                    new_interval = 2 * 60 * 60
+                self._throttled_down = True
+                metric_types = Config.get_entry('cloud_metrics_types', [])  # type: List[str]
+                for mtype in metric_types:
+                    self.set_cloud_interval(mtype, new_interval, save=False)
+        self.cloud_stats['queue'] = len(self._cloud_queue)
+        self.cloud_stats['queue_bytes'] = self._cloud_queue.get_size()
+        self.cloud_stats['buffer'] = self._cloud_buffer_length
+
+    def _send_cloud_metrics(self, metrics_endpoint, metrics):
+        # type: (str, str) -> int
+        """ Posts the (serialized) metrics, and returns the amount of bytes that were sent """
+        data = urlencode({'metrics': metrics}).encode('utf-8')
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        if self._cloud_compression:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip format
+            data = compressor.compress(data) + compressor.flush()
+            headers['Content-Encoding'] = 'gzip'
+        response = self._cloud_session.post(metrics_endpoint, data=data, headers=headers, timeout=30.0)
+        if response.status_code == 415 and self._cloud_compression:
+            logger.warning('Cloud does not accept compressed metrics, disabling compression')
+            self._cloud_compression = False
+            return self._send_cloud_metrics(metrics_endpoint, metrics)
+        return_data = json.loads(response.text)
+        if return_data.get('success', False) is False:
+            raise RuntimeError('{0}'.format(return_data.get('error')))
+        return len(data)
+
+    def _buffer_cloud_metrics(self, metrics):
+        # type: (List[str]) -> None
+        """ Buffers the counters of metrics that could not be send (one per day), so they survive a long outage """
+        for serialized_metric in metrics:
+            metric = json.loads(serialized_metric)
+            metric_source = metric['source']
+            metric_type = metric['type']
+            counters_to_buffer = self._buffer_counters.get(metric_source, {}).get(metric_type, {})
+            if len(counters_to_buffer) == 0:
+                continue
             cache_data = {}
             for counter, match_setting in six.iteritems(counters_to_buffer):
                 if match_setting is not True:
@@ -419,39 +526,41 @@ class MetricsController(object):
                 cache_data[counter] = metric['values'][counter]
             if self._metrics_cache_controller.buffer_counter(metric_source, metric_type, metric['tags'], cache_data, metric['timestamp']):
                 self._cloud_buffer_length += 1
-            if self._metrics_cache_controller.clear_buffer(time.time() - 365 * 24 * 60 * 60) > 0:
-                self._load_cloud_buffer()
+        if self._metrics_cache_controller.clear_buffer(time.time() - 365 * 24 * 60 * 60) > 0:
+            self._load_cloud_buffer()
 
-    def _put(self, metric):
-        rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
+    def _put(self, batch):
+        # type: (MetricBatch) -> None
+        rate_key = '{0}.{1}'.format(batch.source.lower(), batch.type.lower())
         if rate_key not in self.inbound_rates:
             self.inbound_rates[rate_key] = 0
-        self.inbound_rates[rate_key] += 1
-        self.inbound_rates['total'] += 1
-        self._transform_counters(metric)  # Convert counters to "ever increasing counters"
-        # No need to make a deep copy; openmotics doesn't alter the object, and for the plugins the metric gets (de)serialized
-        self.metrics_queue_plugins.appendleft(metric)
-        self.metrics_queue_openmotics.appendleft(metric)
-
-    def _transform_counters(self, metric):
+        self.inbound_rates[rate_key] += len(batch)
+        self.inbound_rates['total'] += len(batch)
+        self._transform_counters(batch)  # Convert counters to "ever increasing counters"
+        # No need to make a copy; the receivers don't alter the batch, and for the plugins the metrics get (de)serialized
+        self.metrics_queue_plugins.appendleft(batch)
+        self.metrics_queue_openmotics.appendleft(batch)
+
+    def _transform_counters(self, batch):
+        # type: (MetricBatch) -> None
         # TODO: The 'persist' policy should be a part of the PulseCounterController
 
-        source = metric['source']
-        mtype = metric['type']
+        source = batch.source
+        mtype = batch.type
         for counter, match_setting in six.iteritems(self._persist_counters.get(source, {}).get(mtype, {})):
-            if counter not in metric['values']:
-                continue
-            if match_setting is not True:
-                if metric['tags'][match_setting['key']] not in match_setting['matches']:
-                    continue
-            counter_type = type(metric['values'][counter])
-            counter_value = self._metrics_cache_controller.process_counter(source=source,
-                                                                           mtype=mtype,
-                                                                           tags=metric['tags'],
-                                                                           name=counter,
-                                                                           value=metric['values'][counter],
-                                                                           timestamp=metric['timestamp'])
-            metric['values'][counter] = counter_type(counter_value)
+            for row, value in batch.iter_values(counter):
+                tags = batch.get_tags(row)
+                if match_setting is not True:
+                    if tags[match_setting['key']] not in match_setting['matches']:
+                        continue
+                counter_type = type(value)
+                counter_value = self._metrics_cache_controller.process_counter(source=source,
+                                                                               mtype=mtype,
+                                                                               tags=tags,
+                                                                               name=counter,
+                                                                               value=value,
+                                                                               timestamp=batch.timestamp)
+                batch.set_value(row, counter, counter_type(counter_value))
 
     def _collect_plugins(self):
         """
@@ -468,7 +577,7 @@ class MetricsController(object):
         >                            "id": 0},
         >                   "values": {"power": 1234}}
         """
-        start = time.time()
+        batches = OrderedDict()  # type: Dict[Any,MetricBatch]
         for metric in self._plugin_controller.collect_metrics():
             # Validation, part 1
             source = metric['source']
@@ -515,24 +624,35 @@ class MetricsController(object):
                 metric_ok = False
             if metric_ok is False:
                 continue
-            self._put(metric)
+            # The metrics of the same type, timestamp and tag/value names are grouped in a batch
+            tag_names, value_names = MetricBatch.get_schema(metric['tags'], metric['values'])
+            key = (metric['source'], metric['type'], metric['timestamp'], tag_names, value_names)
+            batch = batches.get(key)
+            if batch is None:
+                batch = MetricBatch(metric['source'], metric['type'], metric['timestamp'], tag_names, value_names)
+                batches[key] = batch
+            batch.add(metric['tags'], metric['values'])
+        for batch in batches.values():
+            self._put(batch)
 
     def _collect_openmotics(self):
         # type: () -> None
-        start = time.time()
-        for metric in self._metrics_collector.collect_metrics():
-            self._put(metric)
+        for batch in self._metrics_collector.collect_metrics():
+            self._put(batch)
 
     def _distribute_plugins(self):
         try:
-            metrics = []
+            batches = []
+            amount = 0
             try:
-                while len(metrics) < 250:
-                    metrics.append(self.metrics_queue_plugins.pop())
+                while amount < MetricsController.PLUGIN_BATCH_SIZE:
+                    batch = self.metrics_queue_plugins.pop()
+                    batches.append(batch)
+                    amount += len(batch)
             except IndexError:
                 pass
-            if metrics:
-                rates = self._plugin_controller.distribute_metrics(metrics)
+            if batches:
+                rates = self._plugin_controller.distribute_metric_batches(batches)
                 for key, rate in six.iteritems(rates):
                     if key not in self.outbound_rates:
                         self.outbound_rates[key] = 0
@@ -547,18 +667,18 @@ class MetricsController(object):
     def _distribute_openmotics(self):
         # type: () -> None
         try:
-            metric = self.metrics_queue_openmotics.pop()
+            batch = self.metrics_queue_openmotics.pop()
             for receiver in self._openmotics_receivers:
                 try:
-                    receiver(metric)
+                    receiver(batch)
                 except Exception as ex:
                     logger.exception('error distributing metrics')
                     raise MetricsDistributeFailed('Error distributing metrics to internal receivers: {0}'.format(ex))
-                rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
+                rate_key = '{0}.{1}'.format(batch.source.lower(), batch.type.lower())
                 if rate_key not in self.outbound_rates:
                     self.outbound_rates[rate_key] = 0
-                self.outbound_rates[rate_key] += 1
-                self.outbound_rates['total'] += 1
+                self.outbound_rates[rate_key] += len(batch)
+                self.outbound_rates['total'] += len(batch)
         except IndexError:
             raise DaemonThreadWait()
 
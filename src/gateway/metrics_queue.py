@@ -0,0 +1,221 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Persistent queue of serialized metrics
+"""
+
+from __future__ import absolute_import
+
+import logging
+import os
+from threading import Lock
+
+if False:  # MYPY
+    from typing import Dict, IO, List, Optional, Tuple
+
+logger = logging.getLogger('openmotics')
+
+
+class MetricsQueue(object):
+    """
+    Bounded FIFO queue of serialized metrics (one per line), stored on disk so the metrics survive
+    restarts and long outages. The queue consists of segment files which are only appended to, the
+    consumer reads from the oldest segment and stores its position in a separate head file.
+
+    When the queue exceeds its maximum size, the oldest segment is dropped. A line that was only
+    partially written (e.g. on a power loss) is truncated when the queue is loaded.
+    """
+
+    SEGMENT_SIZE = 256 * 1024
+    MAX_SIZE = 16 * 1024 * 1024
+    SEGMENT_EXTENSION = '.seg'
+    HEAD_FILE = 'head'
+
+    def __init__(self, directory, max_size=None, segment_size=None):
+        # type: (str, Optional[int], Optional[int]) -> None
+        self._directory = directory
+        self._max_size = max_size or MetricsQueue.MAX_SIZE
+        self._segment_size = segment_size or MetricsQueue.SEGMENT_SIZE
+        self._lock = Lock()
+        self._segments = []  # type: List[int]
+        self._sizes = {}  # type: Dict[int, int]
+        self._lengths = {}  # type: Dict[int, int]
+        self._head = (0, 0)  # Segment, offset
+        self._tail = None  # type: Optional[IO[bytes]]
+        self.dropped = 0
+        self._load()
+
+    def _get_filename(self, segment):
+        # type: (int) -> str
+        return os.path.join(self._directory, '{0:010d}{1}'.format(segment, MetricsQueue.SEGMENT_EXTENSION))
+
+    def _load(self):
+        # type: () -> None
+        if not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+        for filename in os.listdir(self._directory):
+            if filename.endswith(MetricsQueue.SEGMENT_EXTENSION):
+                try:
+                    self._segments.append(int(filename[:-len(MetricsQueue.SEGMENT_EXTENSION)]))
+                except ValueError:
+                    pass
+        self._segments.sort()
+        head_segment, head_offset = 0, 0
+        try:
+            with open(os.path.join(self._directory, MetricsQueue.HEAD_FILE), 'r') as head_file:
+                head_segment, head_offset = [int(value) for value in head_file.read().split()]
+        except (IOError, OSError, ValueError):
+            pass
+        for segment in list(self._segments):
+            if segment < head_segment:
+                os.remove(self._get_filename(segment))  # Completely consumed
+                self._segments.remove(segment)
+                continue
+            with open(self._get_filename(segment), 'rb') as segment_file:
+                data = segment_file.read()
+            size = data.rfind(b'\n') + 1
+            if size != len(data):
+                logger.warning('METRICS: Truncating incomplete metric in queue segment {0}'.format(segment))
+                with open(self._get_filename(segment), 'ab') as segment_file:
+                    segment_file.truncate(size)
+            offset = head_offset if segment == head_segment else 0
+            self._sizes[segment] = size
+            self._lengths[segment] = data.count(b'\n', min(offset, size), size)
+        if self._segments:
+            first = self._segments[0]
+            self._head = (first, head_offset if first == head_segment else 0)
+        else:
+            self._head = (head_segment, 0)
+
+    def put(self, metric):
+        # type: (str) -> None
+        """ Appends a serialized metric (which can't contain newlines) """
+        data = metric.encode('utf-8') + b'\n'
+        with self._lock:
+            if not self._segments or self._sizes[self._segments[-1]] >= self._segment_size:
+                self._rotate()
+            elif self._tail is None:
+                self._tail = open(self._get_filename(self._segments[-1]), 'ab')
+            assert self._tail is not None
+            self._tail.write(data)
+            self._tail.flush()
+            segment = self._segments[-1]
+            self._sizes[segment] += len(data)
+            self._lengths[segment] += 1
+            while self.get_size() > self._max_size and len(self._segments) > 1:
+                self._drop()
+
+    def _rotate(self):
+        # type: () -> None
+        if self._tail is not None:
+            os.fsync(self._tail.fileno())
+            self._tail.close()
+        segment = self._segments[-1] + 1 if self._segments else self._head[0]
+        self._segments.append(segment)
+        self._sizes[segment] = 0
+        self._lengths[segment] = 0
+        if len(self._segments) == 1:
+            self._set_head(segment, 0)
+        self._tail = open(self._get_filename(segment), 'ab')
+
+    def _drop(self):
+        # type: () -> None
+        segment = self._segments.pop(0)
+        self.dropped += self._lengths.pop(segment)
+        del self._sizes[segment]
+        os.remove(self._get_filename(segment))
+        logger.warning('METRICS: Queue is full, dropped segment {0}'.format(segment))
+        self._set_head(self._segments[0], 0)
+
+    def _set_head(self, segment, offset):
+        # type: (int, int) -> None
+        self._head = (segment, offset)
+        head_filename = os.path.join(self._directory, MetricsQueue.HEAD_FILE)
+        with open('{0}.tmp'.format(head_filename), 'w') as head_file:
+            head_file.write('{0} {1}'.format(segment, offset))
+        os.rename('{0}.tmp'.format(head_filename), head_filename)
+
+    def peek(self, max_bytes):
+        # type: (int) -> Tuple[List[str], Tuple[int, int, int]]
+        """
+        Returns the oldest metrics, up to `max_bytes` (but at least one metric), and a cursor
+        that can be passed to `ack` once they are processed.
+        """
+        with self._lock:
+            metrics = []  # type: List[str]
+            segment, offset = self._head
+            consumed = 0
+            size = 0
+            for segment in self._segments:
+                offset = self._head[1] if segment == self._head[0] else 0
+                consumed = 0
+                with open(self._get_filename(segment), 'rb') as segment_file:
+                    segment_file.seek(offset)
+                    data = segment_file.read(min(self._sizes[segment] - offset, max(0, max_bytes - size)))
+                end = data.rfind(b'\n') + 1
+                if end == 0 and not metrics and offset < self._sizes[segment]:
+                    # A single metric that is larger than `max_bytes`
+                    with open(self._get_filename(segment), 'rb') as segment_file:
+                        segment_file.seek(offset)
+                        data = segment_file.readline()
+                    end = len(data)
+                lines = data[:end].splitlines()
+                metrics += [line.decode('utf-8') for line in lines]
+                offset += end
+                consumed = len(lines)
+                size += end
+                if offset < self._sizes[segment] or size >= max_bytes:
+                    break
+            return metrics, (segment, offset, consumed)
+
+    def ack(self, cursor):
+        # type: (Tuple[int, int, int]) -> None
+        """ Removes the metrics returned by `peek` """
+        segment, offset, consumed = cursor
+        with self._lock:
+            while self._segments and self._segments[0] < segment:
+                self._remove(self._segments[0])
+            if segment not in self._sizes:
+                return  # Already dropped
+            self._lengths[segment] -= consumed
+            if offset >= self._sizes[segment] and segment != self._segments[-1]:
+                self._remove(segment)
+            else:
+                self._set_head(segment, offset)
+
+    def _remove(self, segment):
+        # type: (int) -> None
+        self._segments.remove(segment)
+        del self._sizes[segment]
+        del self._lengths[segment]
+        os.remove(self._get_filename(segment))
+        if self._segments:
+            self._set_head(self._segments[0], 0)
+
+    def get_size(self):
+        # type: () -> int
+        """ Amount of bytes on disk """
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        # type: () -> int
+        return sum(self._lengths.values())
+
+    def close(self):
+        # type: () -> None
+        with self._lock:
+            if self._tail is not None:
+                self._tail.close()
+                self._tail = None
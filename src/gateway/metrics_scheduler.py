@@ -0,0 +1,165 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Scheduler for the periodic metric collectors
+"""
+
+from __future__ import absolute_import
+
+import heapq
+import logging
+import time
+from threading import Condition
+
+from gateway.daemon_thread import BaseThread
+
+if False:  # MYPY
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('openmotics')
+
+
+class MetricsScheduler(object):
+    """
+    Runs collectors periodically on a small pool of worker threads. The deadlines are kept in a heap,
+    so the workers only wake up when a collector is due (or when a deadline is moved forward).
+
+    A collector never runs concurrently with itself. Its next deadline is calculated (with the interval
+    at that moment) when it has finished, so a slow collector delays itself and not the others, as
+    long as there are free workers.
+    """
+
+    WORKERS = 3
+
+    def __init__(self, workers=None):
+        # type: (Optional[int]) -> None
+        self._workers = workers or MetricsScheduler.WORKERS
+        self._condition = Condition()
+        self._heap = []  # type: List[Tuple[float, str]]
+        self._collectors = {}  # type: Dict[str, Dict[str, Any]]
+        self._threads = []  # type: List[BaseThread]
+        self._running = False
+
+    def add(self, name, target, interval):
+        # type: (str, Callable[[], None], float) -> None
+        """ Adds a collector, which will run as soon as possible and then every `interval` seconds """
+        with self._condition:
+            now = time.time()
+            self._collectors[name] = {'target': target,
+                                      'interval': interval,
+                                      'deadline': now,
+                                      'last_start': now,
+                                      'busy': False,
+                                      'statistics': {'runs': 0,
+                                                     'run_time': 0.0,
+                                                     'max_run_time': 0.0,
+                                                     'lateness': 0.0,
+                                                     'max_lateness': 0.0}}
+            heapq.heappush(self._heap, (now, name))
+            self._condition.notify()
+
+    def set_interval(self, name, interval):
+        # type: (str, float) -> None
+        """
+        Changes the interval of a collector. A shorter interval is applied immediately (the collector
+        can be woken earlier), a longer interval is applied after the next run.
+        """
+        with self._condition:
+            collector = self._collectors.get(name)
+            if collector is None:
+                return
+            collector['interval'] = interval
+            if collector['busy']:
+                return  # The deadline is calculated when the collector is finished
+            deadline = collector['last_start'] + interval
+            if deadline < collector['deadline']:
+                collector['deadline'] = deadline
+                heapq.heappush(self._heap, (deadline, name))
+                self._condition.notify()
+
+    def start(self):
+        # type: () -> None
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._threads = []
+        for i in range(self._workers):
+            thread = BaseThread(name='metricworker{0}'.format(i), target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        # type: () -> None
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def get_statistics(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """ Returns the amount of runs, the (max) run time and the (max) lateness of every collector, in seconds """
+        with self._condition:
+            return dict((name, dict(collector['statistics'])) for name, collector in self._collectors.items())
+
+    def _next(self):
+        # type: () -> Optional[Tuple[str, Dict[str, Any], float]]
+        """ Waits for the next collector that is due, and marks it as busy """
+        with self._condition:
+            while self._running:
+                if self._heap:
+                    deadline, name = self._heap[0]
+                    collector = self._collectors[name]
+                    if collector['busy'] or deadline != collector['deadline']:
+                        heapq.heappop(self._heap)  # Outdated entry
+                        continue
+                    now = time.time()
+                    if deadline <= now:
+                        heapq.heappop(self._heap)
+                        collector['busy'] = True
+                        collector['last_start'] = now
+                        return name, collector, now - deadline
+                    self._condition.wait(deadline - now)
+                else:
+                    self._condition.wait()
+        return None
+
+    def _work(self):
+        # type: () -> None
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            name, collector, lateness = item
+            start = time.time()
+            try:
+                collector['target']()
+            except Exception:
+                logger.exception('Unexpected error in metric collector {0}'.format(name))
+            run_time = time.time() - start
+            with self._condition:
+                statistics = collector['statistics']
+                statistics['runs'] += 1
+                statistics['run_time'] = run_time
+                statistics['max_run_time'] = max(statistics['max_run_time'], run_time)
+                statistics['lateness'] = lateness
+                statistics['max_lateness'] = max(statistics['max_lateness'], lateness)
+                collector['busy'] = False
+                collector['deadline'] = collector['last_start'] + collector['interval']
+                heapq.heappush(self._heap, (collector['deadline'], name))
+                self._condition.notify()
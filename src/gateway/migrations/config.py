@@ -55,6 +55,7 @@ class ConfigMigrator(BaseMigrator):
                     config.data = row[2]
                     config.save()
             os.rename(old_sqlite_db, '{0}.bak'.format(old_sqlite_db))
+            Config.reload()
 
     @staticmethod
     def _insert_defaults():
@@ -19,7 +19,7 @@ import inspect
 import json
 import logging
 import sys
-import time
+from threading import RLock
 
 from peewee import AutoField, BooleanField, CharField, \
     DoesNotExist, FloatField, ForeignKeyField, IntegerField, SqliteDatabase, \
@@ -29,7 +29,7 @@ from playhouse.signals import Model, post_save
 import constants
 
 if False:  # MYPY
-    from typing import Dict, List, Optional, Any
+    from typing import Any, Callable, Dict, List, Optional, Set, Tuple
     T = TypeVar('T')
 
 logger = logging.getLogger('openmotics')
@@ -83,6 +83,27 @@ def db_metrics_handler(sender, instance, created):
     Database.incr_metrics(sender.__name__.lower())
 
 
+_MISSING = object()
+
+
+class _FrozenDict(dict):
+    """ A read-only dict, used to serve the (shared) settings """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Settings are read-only, use Config.set_entry')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly  # type: ignore
+
+
+def _freeze(value):
+    # type: (Any) -> Any
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
 class BaseModel(Model):
     class Meta:
         database = Database.get_db()
@@ -194,25 +215,38 @@ class Config(BaseModel):
     setting = CharField(unique=True)
     data = CharField()
 
-    CACHE_EXPIRY_DURATION = 60
-    CACHE = {}
+    _settings_lock = RLock()
+    _settings = (None, _FrozenDict())  # type: Tuple[Any, _FrozenDict]  # The database and all (frozen) settings
+    _settings_version = 0
+    _subscribers = []  # type: List[Callable[[Set[str]], None]]
+    _broadcaster = None  # type: Optional[Callable[[Set[str]], None]]
 
     @staticmethod
     def get_entry(key, fallback):
         # type: (str, T) -> T
-        """ Retrieves a setting from the DB, returns the argument 'fallback' when non existing """
-        key = key.lower()
-        if key in Config.CACHE:
-            data, expire_at = Config.CACHE[key]
-            if expire_at > time.time():
-                return data
-        raw_data = Config.select(Config.data).where(Config.setting == key).dicts().first()
-        if raw_data is not None:
-            data = json.loads(raw_data['data'])
-        else:
-            data = fallback
-        Config.CACHE[key] = (data, time.time() + Config.CACHE_EXPIRY_DURATION)
-        return data
+        """
+        Retrieves a setting, returns the argument 'fallback' when non existing. All settings are loaded
+        once and served from memory. Lists are returned as tuples and dicts as read-only dicts.
+        """
+        return Config.get_entries().get(key.lower(), fallback)
+
+    @staticmethod
+    def get_entries():
+        # type: () -> _FrozenDict
+        """ Returns a read-only snapshot of all settings """
+        database, settings = Config._settings
+        if database is not Config._meta.database:
+            with Config._settings_lock:
+                if Config._settings[0] is not Config._meta.database:
+                    Config._load_settings()
+                database, settings = Config._settings
+        return settings
+
+    @staticmethod
+    def get_version():
+        # type: () -> int
+        """ Returns the version of the settings, which is increased on every change """
+        return Config._settings_version
 
     @staticmethod
     def set_entry(key, value):
@@ -220,25 +254,122 @@ class Config(BaseModel):
         """ Sets a setting in the DB, does overwrite if already existing """
         key = key.lower()
         data = json.dumps(value)
-        config_orm = Config.get_or_none(Config.setting == key)
-        if config_orm is not None:
-            # if the key already exists, update the value
-            config_orm.data = data
-            config_orm.save()
-        else:
-            # create a new setting if it was non existing
-            config_orm = Config(setting=key, data=data)
-            config_orm.save()
-        Config.CACHE[key] = (value, time.time() + Config.CACHE_EXPIRY_DURATION)
+        with Config._settings_lock:
+            config_orm = Config.get_or_none(Config.setting == key)
+            if config_orm is not None:
+                # if the key already exists, update the value
+                config_orm.data = data
+                config_orm.save()
+            else:
+                # create a new setting if it was non existing
+                config_orm = Config(setting=key, data=data)
+                config_orm.save()
+            changed = Config._update_settings(key, _freeze(json.loads(data)))
+        Config._notify(changed)
+        Config._broadcast(changed)
 
     @staticmethod
     def remove_entry(key):
         # type: (str) -> None
         """ Removes a setting from the DB """
-        Config.delete().where(
-            Config.setting == key.lower()
-        ).execute()
-        Config.CACHE.pop(key, None)
+        key = key.lower()
+        with Config._settings_lock:
+            Config.delete().where(
+                Config.setting == key
+            ).execute()
+            changed = Config._update_settings(key, None, removed=True)
+        Config._notify(changed)
+        Config._broadcast(changed)
+
+    @staticmethod
+    def reload():
+        # type: () -> None
+        """ Reloads all settings from the DB, e.g. after they were changed by another process """
+        with Config._settings_lock:
+            changed = Config._load_settings()
+        Config._notify(changed)
+
+    @staticmethod
+    def handle_config_event(gateway_event):
+        # type: (Any) -> None
+        """ Reloads the settings on a CONFIG_CHANGE event (on the PubSub CONFIG topic) of the settings """
+        if gateway_event.data.get('type') == 'settings':
+            Config.reload()
+
+    @staticmethod
+    def subscribe(callback):
+        # type: (Callable[[Set[str]], None]) -> None
+        """ Calls the callback with the changed setting keys, whenever settings are changed """
+        Config._subscribers.append(callback)
+
+    @staticmethod
+    def unsubscribe(callback):
+        # type: (Callable[[Set[str]], None]) -> None
+        if callback in Config._subscribers:
+            Config._subscribers.remove(callback)
+
+    @staticmethod
+    def set_broadcaster(broadcaster):
+        # type: (Optional[Callable[[Set[str]], None]]) -> None
+        """ Sets the callback that informs other processes (e.g. over the message bus) of the settings changed by this process """
+        Config._broadcaster = broadcaster
+
+    @staticmethod
+    def _load_settings():
+        # type: () -> Set[str]
+        database = Config._meta.database
+        settings = _FrozenDict((setting, _freeze(json.loads(data)))
+                               for setting, data in Config.select(Config.setting, Config.data).tuples())
+        old_settings = Config._settings[1]
+        changed = set(key for key in set(settings) | set(old_settings)
+                      if settings.get(key, _MISSING) != old_settings.get(key, _MISSING))
+        Config._settings = (database, settings)
+        if changed:
+            Config._settings_version += 1
+        return changed
+
+    @staticmethod
+    def _update_settings(key, value, removed=False):
+        # type: (str, Any, bool) -> Set[str]
+        if Config._settings[0] is not Config._meta.database:
+            return Config._load_settings()  # Loads the changed setting as well
+        database, old_settings = Config._settings
+        if removed:
+            if key not in old_settings:
+                return set()
+            settings = dict(old_settings)
+            del settings[key]
+        else:
+            old_value = old_settings.get(key, _MISSING)
+            if type(old_value) is type(value) and old_value == value:
+                return set()
+            settings = dict(old_settings)
+            settings[key] = value
+        Config._settings = (database, _FrozenDict(settings))  # Copy on write, readers don't need to lock
+        Config._settings_version += 1
+        return {key}
+
+    @staticmethod
+    def _notify(changed):
+        # type: (Set[str]) -> None
+        if not changed:
+            return
+        for callback in list(Config._subscribers):
+            try:
+                callback(changed)
+            except Exception:
+                logger.exception('Failed to notify subscriber of changed settings %s', sorted(changed))
+
+    @staticmethod
+    def _broadcast(changed):
+        # type: (Set[str]) -> None
+        broadcaster = Config._broadcaster
+        if not changed or broadcaster is None:
+            return
+        try:
+            broadcaster(changed)
+        except Exception:
+            logger.exception('Failed to broadcast changed settings %s', sorted(changed))
 
 
 class Plugin(BaseModel):
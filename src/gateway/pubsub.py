@@ -14,17 +14,18 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
 
-from collections import defaultdict
+from collections import defaultdict, deque
+import copy
 import logging
+import time
+from threading import Condition
 
-from six.moves.queue import Queue, Empty
-
-from gateway.daemon_thread import DaemonThread
+from gateway.daemon_thread import BaseThread
 
 from ioc import Injectable, Singleton
 
 if False:  # MYPY
-    from typing import Callable, Dict, List, Literal, Tuple
+    from typing import Any, Callable, Deque, Dict, List, Literal, Tuple, Union
     from gateway.events import GatewayEvent
     from gateway.hal.master_event import MasterEvent
     GATEWAY_TOPIC = Literal['config', 'state']
@@ -36,6 +37,17 @@ logger = logging.getLogger('gateway.pubsub')
 @Injectable.named('pubsub')
 @Singleton
 class PubSub(object):
+    """
+    Delivers the published master and gateway events to the subscribers of their topic.
+
+    Every subscriber (callback) has a lane: the events of all topics it subscribed to are delivered to it
+    in publish order, one at a time, by a small pool of workers that wake up as soon as an event is
+    published. A slow subscriber only delays its own lane (as long as there are free workers), so e.g. a
+    slow Cloud or metrics handler doesn't delay the output state changes for the other subscribers. As
+    the lanes run concurrently, every subscriber gets its own copy of an event.
+    """
+
+    WORKERS = 4
 
     class MasterTopics(object):
         EEPROM = 'eeprom'  # type: MASTER_TOPIC
@@ -52,85 +64,162 @@ class PubSub(object):
 
     def __init__(self):
         # type: () -> None
-        self._gateway_topics = defaultdict(list)  # type: Dict[GATEWAY_TOPIC,List[Callable[[GatewayEvent],None]]]
-        self._master_topics = defaultdict(list)  # type: Dict[MASTER_TOPIC,List[Callable[[MasterEvent],None]]]
-        self._master_events = Queue()  # type: Queue  # Queue[Tuple[str, MasterEvent]]
-        self._gateway_events = Queue()  # type: Queue  # Queue[Tuple[str, GatewayEvent]]
-        self._pub_thread = DaemonThread(name='pubsub', target=self._publisher_loop, interval=0.1, delay=0.2)
+        self._gateway_topics = defaultdict(list)  # type: Dict[GATEWAY_TOPIC,List[Dict[str,Any]]]
+        self._master_topics = defaultdict(list)  # type: Dict[MASTER_TOPIC,List[Dict[str,Any]]]
+        self._lanes = {}  # type: Dict[Callable[[Any],None],Dict[str,Any]]
+        self._statistics = {}  # type: Dict[str,Dict[str,Any]]
+        self._condition = Condition()
+        self._ready = deque()  # type: Deque[Dict[str,Any]]  # Lanes with pending events, that are not busy
+        self._threads = []  # type: List[BaseThread]
         self._is_running = False
 
     def start(self):
         # type: () -> None
-        self._is_running = True
-        self._pub_thread.start()
+        with self._condition:
+            if self._is_running:
+                return
+            self._is_running = True
+        self._threads = []
+        for i in range(PubSub.WORKERS):
+            thread = BaseThread(name='pubsub{0}'.format(i), target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
 
     def stop(self):
         # type: () -> None
-        self._is_running = False
-        self._master_events.put(None)
-        self._gateway_events.put(None)
-        self._pub_thread.stop()
-
-    def _publisher_loop(self):
-        while self._is_running:
-            self._publish_all_events()
-
-    def _publish_all_events(self):
+        with self._condition:
+            self._is_running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def get_statistics(self):
+        # type: () -> Dict[str,Dict[str,Any]]
+        """
+        Returns per topic the amount of published and delivered events, the amount of pending deliveries (and its
+        maximum), and the (maximum) latency in seconds between the publication and the delivery of an event.
+        """
+        with self._condition:
+            statistics = {}
+            for topics in [self._master_topics, self._gateway_topics]:
+                for topic, lanes in topics.items():
+                    topic_statistics = dict(self._get_statistics(topic))
+                    topic_statistics['queue_length'] = sum(lane['pending'][topic] for lane in lanes)
+                    statistics[topic] = topic_statistics
+            return statistics
+
+    def _get_statistics(self, topic):
+        # type: (str) -> Dict[str,Any]
+        topic_statistics = self._statistics.get(topic)
+        if topic_statistics is None:
+            topic_statistics = {'published': 0,
+                                'delivered': 0,
+                                'max_queue_length': 0,
+                                'latency': 0.0,
+                                'max_latency': 0.0}
+            self._statistics[topic] = topic_statistics
+        return topic_statistics
+
+    def _work(self):
+        # type: () -> None
         while True:
-            try:
-                event = self._master_events.get(block=True, timeout=0.25)
-                if event is None:
+            with self._condition:
+                while self._is_running and not self._ready:
+                    self._condition.wait()
+                if not self._is_running:
                     return
-                self._publish_master_event(*event)
-            except Empty:
-                break
+                lane, topic, published_at, event = self._take()
+            self._deliver(lane, topic, published_at, event)
+
+    def _publish_all_events(self):
+        # type: () -> None
+        """ Delivers all pending events, including the events that are published meanwhile, in the calling thread """
         while True:
-            try:
-                event = self._gateway_events.get(block=True, timeout=0.25)
-                if event is None:
+            with self._condition:
+                if not self._ready:
                     return
-                self._publish_gateway_event(*event)
-            except Empty:
-                break
+                lane, topic, published_at, event = self._take()
+            self._deliver(lane, topic, published_at, event)
+
+    def _take(self):
+        # type: () -> Tuple[Dict[str,Any], str, float, Any]
+        """ Takes the next event of a ready lane, and marks the lane as busy. The condition should be held. """
+        lane = self._ready.popleft()
+        lane['busy'] = True
+        topic, published_at, event = lane['events'].popleft()
+        lane['pending'][topic] -= 1
+        return lane, topic, published_at, event
+
+    def _deliver(self, lane, topic, published_at, event):
+        # type: (Dict[str,Any], str, float, Union[MasterEvent,GatewayEvent]) -> None
+        latency = time.time() - published_at
+        try:
+            lane['callback'](event)
+        except Exception:
+            logger.exception('Failed to call handle %s for topic %s', lane['callback'], topic)
+        with self._condition:
+            lane['busy'] = False
+            if lane['events']:
+                self._ready.append(lane)
+                self._condition.notify()
+            topic_statistics = self._get_statistics(topic)
+            topic_statistics['delivered'] += 1
+            topic_statistics['latency'] = latency
+            topic_statistics['max_latency'] = max(topic_statistics['max_latency'], latency)
+
+    def _subscribe(self, lanes, callback):
+        # type: (List[Dict[str,Any]], Callable[[Any],None]) -> None
+        with self._condition:
+            lane = self._lanes.get(callback)
+            if lane is None:
+                lane = {'callback': callback,
+                        'events': deque(),
+                        'pending': defaultdict(int),
+                        'busy': False}
+                self._lanes[callback] = lane
+            lanes.append(lane)
+
+    def _publish(self, lanes, topic, event):
+        # type: (List[Dict[str,Any]], str, Union[MasterEvent,GatewayEvent]) -> None
+        published_at = time.time()
+        lanes = list(lanes)
+        # The lanes run concurrently, so every subscriber gets its own copy of the event
+        events = [event] + [copy.deepcopy(event) for _ in lanes[1:]]
+        with self._condition:
+            topic_statistics = self._get_statistics(topic)
+            topic_statistics['published'] += 1
+            for lane, lane_event in zip(lanes, events):
+                lane['events'].append((topic, published_at, lane_event))
+                lane['pending'][topic] += 1
+                topic_statistics['max_queue_length'] = max(topic_statistics['max_queue_length'], lane['pending'][topic])
+                if len(lane['events']) == 1 and not lane['busy']:
+                    self._ready.append(lane)
+            self._condition.notify(len(lanes))
 
     def subscribe_master_events(self, topic, callback):
         # type: (MASTER_TOPIC, Callable[[MasterEvent],None]) -> None
-        self._master_topics[topic].append(callback)
+        self._subscribe(self._master_topics[topic], callback)
 
     def publish_master_event(self, topic, master_event):
         # type: (MASTER_TOPIC, MasterEvent) -> None
-        self._master_events.put((topic, master_event))
-
-    def _publish_master_event(self, topic, master_event):
-        # type: (MASTER_TOPIC, MasterEvent) -> None
-        callbacks = self._master_topics[topic]
-        if callbacks:
+        lanes = self._master_topics[topic]
+        if lanes:
             logger.debug('Received master event %s on topic "%s"', master_event.type, topic)
         else:
             logger.warning('Received master event %s on topic "%s" without subscribers', master_event.type, topic)
-        for callback in callbacks:
-            try:
-                callback(master_event)
-            except Exception:
-                logger.exception('Failed to call handle %s for topic %s', callback, topic)
+        self._publish(lanes, topic, master_event)
 
     def subscribe_gateway_events(self, topic, callback):
         # type: (GATEWAY_TOPIC, Callable[[GatewayEvent],None]) -> None
-        self._gateway_topics[topic].append(callback)
+        self._subscribe(self._gateway_topics[topic], callback)
 
     def publish_gateway_event(self, topic, gateway_event):
         # type: (GATEWAY_TOPIC, GatewayEvent) -> None
-        self._gateway_events.put((topic, gateway_event))
-
-    def _publish_gateway_event(self, topic, gateway_event):
-        # type: (GATEWAY_TOPIC, GatewayEvent) -> None
-        callbacks = self._gateway_topics[topic]
-        if callbacks:
+        lanes = self._gateway_topics[topic]
+        if lanes:
             logger.debug('Received gateway event %s on topic "%s"', gateway_event.type, topic)
         else:
             logger.warning('Received gateway event %s on topic "%s" without subscribers', gateway_event.type, topic)
-        for callback in callbacks:
-            try:
-                callback(gateway_event)
-            except Exception:
-                logger.exception('Failed to call handle %s for topic %s', callback, topic)
+        self._publish(lanes, topic, gateway_event)
@@ -18,12 +18,12 @@ PulseCounter BLL
 from __future__ import absolute_import
 import logging
 import time
-from peewee import fn, DoesNotExist, JOIN
+from peewee import chunked, fn, DoesNotExist, JOIN
 from ioc import Injectable, Inject, INJECTED, Singleton
 from serial_utils import CommunicationTimedOutException
 from gateway.base_controller import BaseController
 from gateway.dto import PulseCounterDTO
-from gateway.models import PulseCounter, Room
+from gateway.models import Database, PulseCounter, Room
 from gateway.mappers import PulseCounterMapper
 
 if False:  # MYPY
@@ -51,15 +51,19 @@ class PulseCounterController(BaseController):
         logger.info('ORM sync (PulseCounter)')
 
         try:
-            for pulse_counter_dto in self._master_controller.load_pulse_counters():
-                pulse_counter_id = pulse_counter_dto.id
-                pulse_counter = PulseCounter.get_or_none(number=pulse_counter_id)
-                if pulse_counter is None:
-                    pulse_counter = PulseCounter(number=pulse_counter_id,
-                                                 name='PulseCounter {0}'.format(pulse_counter_id),
-                                                 source='master',
-                                                 persistent=False)
-                    pulse_counter.save()
+            existing_ids = set(number for (number,) in PulseCounter.select(PulseCounter.number).tuples())
+            pulse_counters = [{'number': pulse_counter_dto.id,
+                               'name': 'PulseCounter {0}'.format(pulse_counter_dto.id),
+                               'source': 'master',
+                               'persistent': False}
+                              for pulse_counter_dto in self._master_controller.load_pulse_counters()
+                              if pulse_counter_dto.id not in existing_ids]
+            if pulse_counters:
+                with PulseCounter._meta.database.atomic():
+                    for batch in chunked(pulse_counters, BaseController.SYNC_BATCH_SIZE):
+                        PulseCounter.insert_many(batch).execute()
+                Database.incr_metrics('pulsecounter', len(pulse_counters))
+                Database.set_dirty()
             duration = time.time() - start
             logger.info('ORM sync (PulseCounter): completed after {0:.1f}s'.format(duration))
         except CommunicationTimedOutException as ex:
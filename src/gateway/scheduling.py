@@ -18,16 +18,18 @@ The scheduling module contains the SchedulingController, this controller is used
 
 from __future__ import absolute_import
 
+import heapq
 import json
 import logging
 import time
 from datetime import datetime
+from threading import Condition, Lock
 
 import pytz
 import six
 from croniter import croniter
 
-from gateway.daemon_thread import BaseThread, DaemonThread
+from gateway.daemon_thread import BaseThread
 from gateway.dto import ScheduleDTO
 from gateway.mappers import ScheduleMapper
 from gateway.models import Schedule
@@ -63,10 +65,19 @@ class SchedulingController(object):
     Supported repeats:
     * None: Single execution at start time
     * String: Cron format, docs at https://github.com/kiorky/croniter
+
+    The next deadline of every schedule is kept in a heap, so the workers sleep until the first schedule
+    is due (or the schedules are reloaded), and execute the due schedules on a bounded pool of threads.
     """
 
     NO_NTP_LOWER_LIMIT = 1546300800.0  # 2019-01-01
     TIMEZONE = None
+    WORKERS = 3
+    MAX_WAIT = 60.0  # Re-evaluate the deadlines at least every minute, e.g. after a system time change
+    CRON_CACHE_SIZE = 256
+
+    _crons = {}  # type: Dict[Tuple[str, Optional[str]], croniter]
+    _crons_lock = Lock()
 
     @Inject
     def __init__(self, gateway_api=INJECTED, group_action_controller=INJECTED):
@@ -74,9 +85,12 @@ class SchedulingController(object):
         self._gateway_api = gateway_api
         self._group_action_controller = group_action_controller
         self._web_interface = None
-        self._stop = False
-        self._processor = None  # type: Optional[DaemonThread]
+        self._condition = Condition()
+        self._running = False
+        self._threads = []  # type: List[BaseThread]
         self._schedules = {}  # type: Dict[int, Tuple[ScheduleDTO, Schedule]]
+        self._heap = []  # type: List[Tuple[float, int]]
+        self._deadlines = {}  # type: Dict[int, float]
 
         SchedulingController.TIMEZONE = gateway_api.get_timezone()
         self.reload_schedules()
@@ -85,15 +99,18 @@ class SchedulingController(object):
         self._web_interface = web_interface
 
     def reload_schedules(self):
-        found_ids = []
+        schedules = {}
         for schedule in Schedule.select():
             schedule_dto = ScheduleMapper.orm_to_dto(schedule)
             schedule_dto.next_execution = SchedulingController._get_next_execution(schedule_dto)
-            self._schedules[schedule_dto.id] = (schedule_dto, schedule)
-            found_ids.append(schedule_dto.id)
-        for schedule_id in list(self._schedules.keys()):
-            if schedule_id not in found_ids:
-                self._schedules.pop(schedule_id, None)
+            schedules[schedule_dto.id] = (schedule_dto, schedule)
+        with self._condition:
+            self._schedules = schedules
+            self._heap = []
+            self._deadlines = {}
+            for schedule_dto, _ in schedules.values():
+                self._push(schedule_dto)
+            self._condition.notify_all()
 
     def load_schedule(self, schedule_id):  # type: (int) -> ScheduleDTO
         schedule = self._schedules.get(schedule_id)
@@ -117,34 +134,99 @@ class SchedulingController(object):
         self.reload_schedules()
 
     def start(self):
-        self._stop = False
-        self._processor = DaemonThread(target=self._process,
-                                       name='schedulingctl',
-                                       interval=60)
-        self._processor.start()
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._threads = []
+        for i in range(SchedulingController.WORKERS):
+            thread = BaseThread(name='schedulingexc{0}'.format(i), target=self._work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
 
     def stop(self):
-        if self._processor is not None:
-            self._processor.stop()
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _push(self, schedule_dto, not_before=None):
+        # type: (ScheduleDTO, Optional[float]) -> None
+        """ Pushes the next deadline of a schedule on the heap. The condition should be held """
+        deadline = SchedulingController._get_deadline(schedule_dto)
+        if deadline is None:
+            self._deadlines.pop(schedule_dto.id, None)
+            return
+        if not_before is not None:
+            deadline = max(deadline, not_before)
+        self._deadlines[schedule_dto.id] = deadline
+        heapq.heappush(self._heap, (deadline, schedule_dto.id))
+
+    @staticmethod
+    def _get_deadline(schedule_dto):
+        # type: (ScheduleDTO) -> Optional[float]
+        if schedule_dto.status != 'ACTIVE':
+            return None
+        if schedule_dto.repeat is None:
+            return schedule_dto.start if schedule_dto.last_executed is None else None
+        deadline = schedule_dto.next_execution
+        if schedule_dto.end is not None and (deadline is None or deadline > schedule_dto.end):
+            deadline = schedule_dto.end  # Completes the schedule
+        return deadline
+
+    def _next(self):
+        # type: () -> Optional[Tuple[ScheduleDTO, Schedule]]
+        """ Waits for the next schedule that has reached its deadline """
+        with self._condition:
+            while self._running:
+                if self._heap:
+                    deadline, schedule_id = self._heap[0]
+                    if self._deadlines.get(schedule_id) != deadline:
+                        heapq.heappop(self._heap)  # Outdated entry
+                        continue
+                    now = time.time()
+                    if deadline <= now:
+                        heapq.heappop(self._heap)
+                        del self._deadlines[schedule_id]
+                        return self._schedules[schedule_id]
+                    self._condition.wait(min(deadline - now, SchedulingController.MAX_WAIT))
+                else:
+                    self._condition.wait(SchedulingController.MAX_WAIT)
+        return None
 
-    def _process(self):
-        for schedule_id in list(self._schedules.keys()):
-            schedule_tuple = self._schedules.get(schedule_id)
+    def _work(self):
+        # type: () -> None
+        while True:
+            schedule_tuple = self._next()
             if schedule_tuple is None:
-                continue
+                return
             schedule_dto, schedule = schedule_tuple
-            if schedule_dto.status != 'ACTIVE':
-                continue
-            if schedule_dto.end is not None and schedule_dto.end < time.time():
-                schedule_dto.status = 'COMPLETED'
-                schedule.status = 'COMPLETED'
-                schedule.save()
-                continue
-            if schedule_dto.is_due:
-                thread = BaseThread(name='schedulingexc',
-                                    target=self._execute_schedule, args=(schedule_dto, schedule))
-                thread.daemon = True
-                thread.start()
+            try:
+                self._process(schedule_dto, schedule)
+            except Exception:
+                logger.exception('Unexpected error while processing schedule {0}'.format(schedule_dto.name))
+            # A schedule that is still due failed (e.g. a communication timeout) and is retried later
+            not_before = time.time() + SchedulingController.MAX_WAIT if schedule_dto.is_due else None
+            with self._condition:
+                if self._schedules.get(schedule_dto.id, (None,))[0] is schedule_dto:  # Not reloaded meanwhile
+                    self._push(schedule_dto, not_before=not_before)
+                    self._condition.notify()
+
+    def _process(self, schedule_dto, schedule):
+        # type: (ScheduleDTO, Schedule) -> None
+        if schedule_dto.end is not None and schedule_dto.end <= time.time():
+            schedule_dto.status = 'COMPLETED'
+            schedule.status = 'COMPLETED'
+            schedule.save()
+            return
+        if schedule_dto.is_due:
+            self._execute_schedule(schedule_dto, schedule)
+        else:
+            # E.g. overdue after a system time change
+            schedule_dto.next_execution = SchedulingController._get_next_execution(schedule_dto)
 
     @staticmethod
     def _get_next_execution(schedule_dto):
@@ -152,10 +234,18 @@ class SchedulingController(object):
         if schedule_dto.repeat is None:
             return None
         base_time = max(SchedulingController.NO_NTP_LOWER_LIMIT, schedule_dto.start, time.time())
-        cron = croniter(schedule_dto.repeat,
-                        datetime.fromtimestamp(base_time,
-                                               pytz.timezone(SchedulingController.TIMEZONE)))
-        return cron.get_next(ret_type=float)
+        start_time = datetime.fromtimestamp(base_time, pytz.timezone(SchedulingController.TIMEZONE))
+        key = (schedule_dto.repeat, SchedulingController.TIMEZONE)
+        with SchedulingController._crons_lock:
+            cron = SchedulingController._crons.get(key)
+            if cron is None:
+                if len(SchedulingController._crons) >= SchedulingController.CRON_CACHE_SIZE:
+                    SchedulingController._crons.clear()
+                cron = croniter(schedule_dto.repeat, start_time)
+                SchedulingController._crons[key] = cron
+            else:
+                cron.set_current(start_time)
+            return cron.get_next(ret_type=float)
 
     def _execute_schedule(self, schedule_dto, schedule):
         # type: (ScheduleDTO, Schedule) -> None
@@ -0,0 +1,194 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Dependency aware startup of the service stages
+"""
+
+from __future__ import absolute_import
+
+import logging
+import sys
+import time
+from collections import OrderedDict
+from threading import Condition
+
+import six
+
+from gateway.daemon_thread import BaseThread
+
+if False:  # MYPY
+    from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger('openmotics')
+
+
+class StartupOrchestrator(object):
+    """
+    Runs the startup stages of the service on a small pool of worker threads. A stage starts as soon
+    as all stages it requires have finished, so independent stages run concurrently. Work that can
+    wait is deferred by requiring the stage that marks the service as ready.
+
+    When a stage fails, the stages that (indirectly) require it are skipped, and the first failure is
+    raised once all other stages have finished.
+    """
+
+    WORKERS = 4
+
+    class States(object):
+        PENDING = 'pending'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+        SKIPPED = 'skipped'
+
+    def __init__(self, workers=None):
+        # type: (Optional[int]) -> None
+        self._workers = workers or StartupOrchestrator.WORKERS
+        self._condition = Condition()
+        self._stages = OrderedDict()  # type: Dict[str, Dict[str, Any]]
+        self._start = None  # type: Optional[float]
+        self._end = None  # type: Optional[float]
+        self._exc_info = None  # type: Any
+
+    def add(self, name, target, requires=None):
+        # type: (str, Callable[[], None], Optional[List[str]]) -> None
+        """ Adds a stage, which will run when all stages it requires are done """
+        if name in self._stages:
+            raise ValueError('Stage {0} was already added'.format(name))
+        self._stages[name] = {'target': target,
+                              'requires': list(requires or []),
+                              'state': StartupOrchestrator.States.PENDING,
+                              'start': None,
+                              'duration': None,
+                              'error': None}
+
+    def run(self):
+        # type: () -> None
+        """ Runs all stages, and blocks until they are finished """
+        self._validate()
+        self._start = time.time()
+        threads = [BaseThread(name='startup{0}'.format(i), target=self._work)
+                   for i in range(min(self._workers, len(self._stages)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._end = time.time()
+        self._log_report()
+        if self._exc_info is not None:
+            exc_info, self._exc_info = self._exc_info, None
+            six.reraise(*exc_info)
+
+    def get_profile(self):
+        # type: () -> Dict[str, Any]
+        """
+        Returns the boot profile: the total duration and per stage its state, requirements, start
+        (relative to the start of the boot) and duration, in seconds, ordered by start
+        """
+        with self._condition:
+            stages = []
+            for name, stage in self._stages.items():
+                start = None
+                if stage['start'] is not None and self._start is not None:
+                    start = round(stage['start'] - self._start, 3)
+                stages.append({'name': name,
+                               'state': stage['state'],
+                               'requires': stage['requires'],
+                               'start': start,
+                               'duration': None if stage['duration'] is None else round(stage['duration'], 3),
+                               'error': stage['error']})
+            stages.sort(key=lambda s: (s['start'] is None, s['start']))
+            duration = None
+            if self._start is not None and self._end is not None:
+                duration = round(self._end - self._start, 3)
+            return {'duration': duration,
+                    'stages': stages}
+
+    def _validate(self):
+        # type: () -> None
+        for name, stage in self._stages.items():
+            for requirement in stage['requires']:
+                if requirement not in self._stages:
+                    raise ValueError('Stage {0} requires unknown stage {1}'.format(name, requirement))
+        resolved = set()  # type: Set[str]
+        while len(resolved) < len(self._stages):
+            resolvable = [name for name, stage in self._stages.items()
+                          if name not in resolved and all(requirement in resolved for requirement in stage['requires'])]
+            if not resolvable:
+                raise ValueError('Circular requirements between stages {0}'.format(
+                    ', '.join(name for name in self._stages if name not in resolved)
+                ))
+            resolved.update(resolvable)
+
+    def _next_stage(self):
+        # type: () -> Optional[str]
+        """ Returns the first stage that can run, skipping the stages of which a requirement failed. Must be called while holding the condition """
+        for name, stage in self._stages.items():
+            if stage['state'] != StartupOrchestrator.States.PENDING:
+                continue
+            states = [self._stages[requirement]['state'] for requirement in stage['requires']]
+            if StartupOrchestrator.States.FAILED in states or StartupOrchestrator.States.SKIPPED in states:
+                stage['state'] = StartupOrchestrator.States.SKIPPED
+                return self._next_stage()  # Skipping might skip earlier stages as well
+            if all(state == StartupOrchestrator.States.DONE for state in states):
+                return name
+        return None
+
+    def _is_finished(self):
+        # type: () -> bool
+        return all(stage['state'] not in [StartupOrchestrator.States.PENDING, StartupOrchestrator.States.RUNNING]
+                   for stage in self._stages.values())
+
+    def _work(self):
+        # type: () -> None
+        while True:
+            with self._condition:
+                name = self._next_stage()
+                while name is None:
+                    if self._is_finished():
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait()
+                    name = self._next_stage()
+                stage = self._stages[name]
+                stage['state'] = StartupOrchestrator.States.RUNNING
+                stage['start'] = time.time()
+            state = StartupOrchestrator.States.DONE
+            error = None
+            try:
+                stage['target']()
+            except BaseException as ex:  # E.g. a SystemExit, which would only stop this worker
+                logger.exception('Startup stage {0} failed'.format(name))
+                state = StartupOrchestrator.States.FAILED
+                error = '{0}: {1}'.format(type(ex).__name__, ex)
+                with self._condition:
+                    if self._exc_info is None:
+                        self._exc_info = sys.exc_info()
+            with self._condition:
+                stage['state'] = state
+                stage['error'] = error
+                stage['duration'] = time.time() - stage['start']
+                self._condition.notify_all()
+
+    def _log_report(self):
+        # type: () -> None
+        profile = self.get_profile()
+        logger.info('Boot profile ({0:.2f}s):'.format(profile['duration']))
+        for stage in profile['stages']:
+            if stage['start'] is None:
+                logger.info('* {0}: {1}'.format(stage['name'], stage['state']))
+            else:
+                logger.info('* {0}: {1} at {2:.2f}s in {3:.2f}s'.format(stage['name'], stage['state'], stage['start'], stage['duration']))
@@ -16,7 +16,9 @@
 import logging
 from threading import Lock
 from ioc import Inject
-from gateway.models import Valve, Pump
+from peewee import JOIN
+
+from gateway.models import Output, Pump, PumpToValve, Valve
 from gateway.thermostat.gateway.valve_driver import ValveDriver
 from gateway.thermostat.gateway.pump_driver import PumpDriver
 
@@ -38,7 +40,7 @@ class PumpValveController(object):
         with self._config_change_lock:
             # Collect valve drivers
             current_ids = []
-            for item in Valve.select():
+            for item in Valve.select(Valve, Output).join_from(Valve, Output):
                 if item.id in self._valve_drivers:
                     self._valve_drivers[item.id].update(item)
                 else:
@@ -49,8 +51,11 @@ class PumpValveController(object):
                     del self._valve_drivers[item_id]
             # Collect pump drivers
             current_ids = []
+            valve_ids_per_pump = {}  # type: Dict[int, List[int]]
+            for pump_id, valve_id in PumpToValve.select(PumpToValve.pump, PumpToValve.valve).tuples():
+                valve_ids_per_pump.setdefault(pump_id, []).append(valve_id)
             pump_drivers_per_valve = {}  # type: Dict[int, Set[PumpDriver]]
-            for item in Pump.select():
+            for item in Pump.select(Pump, Output).join_from(Pump, Output, JOIN.LEFT_OUTER):
                 if item.id in self._pump_drivers:
                     pump_driver = self._pump_drivers[item.id]
                     pump_driver.update(item)
@@ -58,7 +63,7 @@ class PumpValveController(object):
                     pump_driver = PumpDriver(item)
                     self._pump_drivers[item.id] = pump_driver
                 current_ids.append(item.id)
-                for valve_id in pump_driver.valve_ids:
+                for valve_id in valve_ids_per_pump.get(item.id, []):
                     if valve_id not in pump_drivers_per_valve:
                         pump_drivers_per_valve[valve_id] = set()
                     pump_drivers_per_valve[valve_id].add(pump_driver)
@@ -15,6 +15,8 @@
 
 import datetime
 import logging
+import time
+from threading import Lock
 
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -35,11 +37,12 @@ from gateway.pubsub import PubSub
 from gateway.thermostat.gateway.pump_valve_controller import \
     PumpValveController
 from gateway.thermostat.gateway.thermostat_pid import ThermostatPid
+from gateway.thermostat.gateway.thermostat_snapshot import ThermostatConfigSnapshot
 from gateway.thermostat.thermostat_controller import ThermostatController
 from ioc import INJECTED, Inject
 
 if False:  # MYPY
-    from typing import Dict, List, Literal, Tuple, Optional
+    from typing import Any, Dict, List, Literal, Tuple, Optional, Set
     from gateway.gateway_api import GatewayApi
     from gateway.output_controller import OutputController
 
@@ -68,6 +71,13 @@ class ThermostatControllerGateway(ThermostatController):
         self._periodic_sync_thread = None  # type: Optional[DaemonThread]
         self.thermostat_pids = {}  # type: Dict[int, ThermostatPid]
         self._pump_valve_controller = PumpValveController()
+        self._snapshot = ThermostatConfigSnapshot()
+        self._refresh_lock = Lock()
+        self._statistics = {'ticks': 0,
+                            'tick_duration': 0.0,
+                            'max_tick_duration': 0.0,
+                            'refresh_duration': 0.0}  # type: Dict[str, Any]
+        self._pubsub.subscribe_gateway_events(PubSub.GatewayTopics.CONFIG, self._handle_config_event)
 
         timezone = gateway_api.get_timezone()
 
@@ -116,26 +126,69 @@ class ThermostatControllerGateway(ThermostatController):
             self._periodic_sync_thread.stop()
 
     def _pid_tick(self):  # type: () -> None
+        start = time.time()
         for thermostat_number, thermostat_pid in self.thermostat_pids.items():
             try:
                 thermostat_pid.tick()
             except Exception:
                 logger.exception('There was a problem with calculating thermostat PID {}'.format(thermostat_pid))
+        duration = time.time() - start
+        self._statistics['ticks'] += 1
+        self._statistics['tick_duration'] = duration
+        self._statistics['max_tick_duration'] = max(duration, self._statistics['max_tick_duration'])
+
+    def get_statistics(self):  # type: () -> Dict[str, Any]
+        """
+        Returns the amount of PID loop ticks, the duration of the last (and the longest) tick over all
+        thermostats and the duration of the last configuration refresh, in seconds
+        """
+        statistics = dict(self._statistics)
+        statistics['thermostats'] = len(self.thermostat_pids)
+        return statistics
 
     def refresh_config_from_db(self):  # type: () -> None
         self.refresh_thermostats_from_db()
         self._pump_valve_controller.refresh_from_db()
 
     def refresh_thermostats_from_db(self):  # type: () -> None
-        for thermostat in Thermostat.select():
-            thermostat_pid = self.thermostat_pids.get(thermostat.number)
-            if thermostat_pid is None:
-                thermostat_pid = ThermostatPid(thermostat, self._pump_valve_controller)
-                thermostat_pid.subscribe_state_changes(self._thermostat_changed)
-                self.thermostat_pids[thermostat.number] = thermostat_pid
-            thermostat_pid.update_thermostat(thermostat)
-            thermostat_pid.tick()
-            # TODO: Delete stale/removed thermostats
+        """
+        Loads a new configuration snapshot, and updates (and ticks) the PIDs of the changed thermostats.
+        The PIDs of removed thermostats are dropped.
+        """
+        with self._refresh_lock:
+            start = time.time()
+            snapshot = ThermostatConfigSnapshot.load()
+            previous_snapshot, self._snapshot = self._snapshot, snapshot
+            changes = snapshot.get_changes(previous_snapshot)
+            thermostat_pids = {}  # type: Dict[int, ThermostatPid]
+            for thermostat_number, thermostat in snapshot.thermostats.items():
+                thermostat_pid = self.thermostat_pids.get(thermostat_number)
+                if thermostat_pid is None:
+                    thermostat_pid = ThermostatPid(thermostat, self._pump_valve_controller)
+                    thermostat_pid.subscribe_state_changes(self._thermostat_changed)
+                elif thermostat_number in changes:
+                    thermostat_pid.update_thermostat(thermostat)
+                thermostat_pids[thermostat_number] = thermostat_pid
+            self.thermostat_pids = thermostat_pids
+            if any(ThermostatControllerGateway._get_schedule(previous_snapshot, thermostat_number) !=
+                   ThermostatControllerGateway._get_schedule(snapshot, thermostat_number)
+                   for thermostat_number in changes):
+                self._sync_scheduler()
+            self._statistics['refresh_duration'] = time.time() - start
+        for thermostat_number in changes:
+            thermostat_pid = thermostat_pids.get(thermostat_number)
+            if thermostat_pid is not None:
+                thermostat_pid.tick()
+
+    @staticmethod
+    def _get_schedule(snapshot, thermostat_number):  # type: (ThermostatConfigSnapshot, int) -> Optional[Tuple]
+        thermostat = snapshot.thermostats.get(thermostat_number)
+        return None if thermostat is None else (thermostat.start, thermostat.day_schedules)
+
+    def _handle_config_event(self, gateway_event):  # type: (GatewayEvent) -> None
+        # The thermostat changes of this controller are already applied, but the sensor or valve outputs might have changed
+        if self._running and gateway_event.data.get('type') in ['sensor', 'output']:
+            self.refresh_config_from_db()
 
     def _update_pumps(self):  # type: () -> None
         try:
@@ -150,36 +203,44 @@ class ThermostatControllerGateway(ThermostatController):
             logger.exception('Could not get thermostat config.')
 
     def _sync_scheduler(self):  # type: () -> None
-        self._scheduler.remove_all_jobs()  # TODO: This might have to be more efficient, as this generates I/O
-        for thermostat_number, thermostat_pid in self.thermostat_pids.items():
-            start_date = datetime.datetime.utcfromtimestamp(float(thermostat_pid.thermostat.start))
-            day_schedules = thermostat_pid.thermostat.day_schedules
-            schedule_length = len(day_schedules)
-            for schedule in day_schedules:
-                for seconds_of_day, new_setpoint in schedule.schedule_data.items():
+        """ Updates the scheduler jobs to the day schedules of the snapshot, only adding and removing the changed jobs """
+        jobs = {}  # type: Dict[str, Dict[str, Any]]
+        for thermostat_number, thermostat in self._snapshot.thermostats.items():
+            start_date = datetime.datetime.utcfromtimestamp(float(thermostat.start))
+            schedule_length = len(thermostat.day_schedules)
+            for index, mode, schedule_data in thermostat.day_schedules:
+                for seconds_of_day, new_setpoint in schedule_data:
                     m, s = divmod(int(seconds_of_day), 60)
                     h, m = divmod(m, 60)
-                    if schedule.mode == 'heating':
+                    if mode == 'heating':
                         args = [thermostat_number, new_setpoint, None]
                     else:
                         args = [thermostat_number, None, new_setpoint]
+                    # The job id contains all parameters, so a job with the same id doesn't need to be updated
+                    job_id = 'thermostat.{0}.{1}.{2}.{3}.{4}.{5}.{6}'.format(thermostat_number, mode, index, seconds_of_day,
+                                                                            new_setpoint, thermostat.start, schedule_length)
+                    name = 'T{}: {} ({}) {}'.format(thermostat_number, new_setpoint, mode, seconds_of_day)
                     if schedule_length % 7 == 0:
-                        self._scheduler.add_job(ThermostatControllerGateway.set_setpoint_from_scheduler, 'cron',
-                                                start_date=start_date,
-                                                day_of_week=schedule.index,
-                                                hour=h, minute=m, second=s,
-                                                args=args,
-                                                name='T{}: {} ({}) {}'.format(thermostat_number, new_setpoint, schedule.mode, seconds_of_day))
+                        jobs[job_id] = {'trigger': 'cron',
+                                        'start_date': start_date,
+                                        'day_of_week': index,
+                                        'hour': h, 'minute': m, 'second': s,
+                                        'args': args,
+                                        'name': name}
                     else:
                         # calendarinterval trigger is only supported in a future release of apscheduler
                         # https://apscheduler.readthedocs.io/en/latest/modules/triggers/calendarinterval.html#module-apscheduler.triggers.calendarinterval
-                        day_start_date = start_date + datetime.timedelta(days=schedule.index)
-                        self._scheduler.add_job(ThermostatControllerGateway.set_setpoint_from_scheduler, 'calendarinterval',
-                                                start_date=day_start_date,
-                                                days=schedule_length,
-                                                hour=h, minute=m, second=s,
-                                                args=args,
-                                                name='T{}: {} ({}) {}'.format(thermostat_number, new_setpoint, schedule.mode, seconds_of_day))
+                        jobs[job_id] = {'trigger': 'calendarinterval',
+                                        'start_date': start_date + datetime.timedelta(days=index),
+                                        'days': schedule_length,
+                                        'hour': h, 'minute': m, 'second': s,
+                                        'args': args,
+                                        'name': name}
+        current_job_ids = set(job.id for job in self._scheduler.get_jobs())
+        for job_id in current_job_ids - set(jobs):
+            self._scheduler.remove_job(job_id)
+        for job_id in set(jobs) - current_job_ids:
+            self._scheduler.add_job(ThermostatControllerGateway.set_setpoint_from_scheduler, id=job_id, **jobs[job_id])
 
     def set_current_setpoint(self, thermostat_number, temperature=None, heating_temperature=None, cooling_temperature=None):
         # type: (int, Optional[float], Optional[float], Optional[float]) -> None
@@ -205,9 +266,7 @@ class ThermostatControllerGateway(ThermostatController):
             active_preset.cooling_setpoint = float(cooling_temperature)
         active_preset.save()
 
-        thermostat_pid = self.thermostat_pids[thermostat_number]
-        thermostat_pid.update_thermostat(thermostat)
-        thermostat_pid.tick()
+        self.refresh_thermostats_from_db()
 
     def get_current_preset(self, thermostat_number):  # type: (int) -> Preset
         thermostat = Thermostat.get(number=thermostat_number)
@@ -219,9 +278,7 @@ class ThermostatControllerGateway(ThermostatController):
         thermostat.active_preset = preset
         thermostat.save()
 
-        thermostat_pid = self.thermostat_pids[thermostat_number]
-        thermostat_pid.update_thermostat(thermostat)
-        thermostat_pid.tick()
+        self.refresh_thermostats_from_db()
 
     @classmethod
     @Inject
@@ -312,16 +369,13 @@ class ThermostatControllerGateway(ThermostatController):
         global_thermosat.mode = mode
         global_thermosat.save()
 
-        for thermostat_number, thermostat_pid in self.thermostat_pids.items():
-            thermostat = Thermostat.get(number=thermostat_number)
-            if thermostat is not None:
-                if automatic is False and setpoint is not None and 3 <= setpoint <= 5:
-                    preset = thermostat.get_preset(preset_type=Preset.SETPOINT_TO_TYPE.get(setpoint, Preset.Types.SCHEDULE))
-                    thermostat.active_preset = preset
-                else:
-                    thermostat.active_preset = thermostat.get_preset(preset_type=Preset.Types.SCHEDULE)
-                thermostat_pid.update_thermostat(thermostat)
-                thermostat_pid.tick()
+        for thermostat in global_thermosat.thermostats:
+            if automatic is False and setpoint is not None and 3 <= setpoint <= 5:
+                preset = thermostat.get_preset(preset_type=Preset.SETPOINT_TO_TYPE.get(setpoint, Preset.Types.SCHEDULE))
+                thermostat.active_preset = preset
+            else:
+                thermostat.active_preset = thermostat.get_preset(preset_type=Preset.Types.SCHEDULE)
+        self.refresh_thermostats_from_db()
 
     def load_heating_thermostat(self, thermostat_id):  # type: (int) -> ThermostatDTO
         mode = 'heating'  # type: Literal['heating']
@@ -336,8 +390,8 @@ class ThermostatControllerGateway(ThermostatController):
     def save_heating_thermostats(self, thermostats):  # type: (List[Tuple[ThermostatDTO, List[str]]]) -> None
         mode = 'heating'  # type: Literal['heating']
         for thermostat_dto, fields in thermostats:
-            thermostat = ThermostatMapper.dto_to_orm(thermostat_dto, fields, mode)
-            self.refresh_set_configuration(thermostat)
+            ThermostatMapper.dto_to_orm(thermostat_dto, fields, mode)
+        self.refresh_thermostats_from_db()
         self._thermostat_config_changed()
 
     def load_cooling_thermostat(self, thermostat_id):  # type: (int) -> ThermostatDTO
@@ -353,15 +407,14 @@ class ThermostatControllerGateway(ThermostatController):
     def save_cooling_thermostats(self, thermostats):  # type: (List[Tuple[ThermostatDTO, List[str]]]) -> None
         mode = 'cooling'  # type: Literal['cooling']
         for thermostat_dto, fields in thermostats:
-            thermostat = ThermostatMapper.dto_to_orm(thermostat_dto, fields, mode)
-            self.refresh_set_configuration(thermostat)
+            ThermostatMapper.dto_to_orm(thermostat_dto, fields, mode)
+        self.refresh_thermostats_from_db()
         self._thermostat_config_changed()
 
     def set_per_thermostat_mode(self, thermostat_number, automatic, setpoint):
         # type: (int, bool, float) -> None
-        thermostat_pid = self.thermostat_pids.get(thermostat_number)
-        if thermostat_pid is not None:
-            thermostat = thermostat_pid.thermostat
+        if thermostat_number in self.thermostat_pids:
+            thermostat = Thermostat.get(number=thermostat_number)
             thermostat.automatic = automatic
             thermostat.save()
             preset = thermostat.active_preset
@@ -370,8 +423,7 @@ class ThermostatControllerGateway(ThermostatController):
             else:
                 preset.cooling_setpoint = setpoint
             preset.save()
-            thermostat_pid.update_thermostat(thermostat)
-            thermostat_pid.tick()
+            self.refresh_thermostats_from_db()
 
     def load_thermostat_group(self):
         # type: () -> ThermostatGroupDTO
@@ -521,16 +573,6 @@ class ThermostatControllerGateway(ThermostatController):
     def load_global_rtd10(self):  # type: () -> GlobalRTD10DTO
         raise UnsupportedException()
 
-    def refresh_set_configuration(self, thermostat):  # type: (Thermostat) -> None
-        thermostat_pid = self.thermostat_pids.get(thermostat.number)
-        if thermostat_pid is not None:
-            thermostat_pid.update_thermostat(thermostat)
-        else:
-            thermostat_pid = ThermostatPid(thermostat, self._pump_valve_controller)
-            self.thermostat_pids[thermostat.number] = thermostat_pid
-        self._sync_scheduler()
-        thermostat_pid.tick()
-
     def _thermostat_config_changed(self):
         gateway_event = GatewayEvent(GatewayEvent.Types.CONFIG_CHANGE, {'type': 'thermostats'})
         self._pubsub.publish_gateway_event(PubSub.GatewayTopics.CONFIG, gateway_event)
@@ -18,12 +18,13 @@ from threading import Lock
 from simple_pid import PID
 from ioc import Inject, INJECTED
 from serial_utils import CommunicationTimedOutException
-from gateway.models import ThermostatGroup, Thermostat
+from gateway.models import ThermostatGroup
 
 if False:  # MYPY
     from typing import Optional, List, Callable
     from gateway.gateway_api import GatewayApi
     from gateway.thermostat.gateway.pump_valve_controller import PumpValveController
+    from gateway.thermostat.gateway.thermostat_snapshot import ThermostatSnapshot
 
 logger = logging.getLogger('openmotics')
 
@@ -36,7 +37,7 @@ class ThermostatPid(object):
     DEFAULT_KD = 2.0
 
     def __init__(self, thermostat, pump_valve_controller, gateway_api=INJECTED):
-        # type: (Thermostat, PumpValveController, GatewayApi) -> None
+        # type: (ThermostatSnapshot, PumpValveController, GatewayApi) -> None
         self._gateway_api = gateway_api
         self._pump_valve_controller = pump_valve_controller
         self._thermostat_change_lock = Lock()
@@ -44,7 +45,7 @@ class ThermostatPid(object):
         self._cooling_valve_ids = []  # type: List[int]
         self._report_state_callbacks = []  # type: List[Callable[[int, str, float, Optional[float], List[float], int], None]]
         self._thermostat = thermostat
-        self._mode = thermostat.thermostat_group.mode
+        self._mode = thermostat.mode
         self._active_preset = thermostat.active_preset
         self._pid = PID(Kp=ThermostatPid.DEFAULT_KP,
                         Ki=ThermostatPid.DEFAULT_KI,
@@ -62,11 +63,11 @@ class ThermostatPid(object):
         # 1. PID loop is initialized
         # 2. Sensor is valid
         # 3. Outputs configured (heating or cooling)
-        if self._thermostat.sensor is None:
+        if self._thermostat.sensor_number is None:
             return False
         if len(self._heating_valve_ids) == 0 and len(self._cooling_valve_ids) == 0:
             return False
-        if not self._thermostat.thermostat_group.on:
+        if not self._thermostat.group_on:
             return False
         if self._errors > 5:
             return False
@@ -76,17 +77,16 @@ class ThermostatPid(object):
     def valve_ids(self):  # type: () -> List[int]
         return self._heating_valve_ids + self._cooling_valve_ids
 
-    def update_thermostat(self, thermostat):  # type: (Thermostat) -> None
+    def update_thermostat(self, thermostat):  # type: (ThermostatSnapshot) -> None
         with self._thermostat_change_lock:
-            # cache these values to avoid DB lookups on every tick
             self._thermostat = thermostat
-            self._mode = thermostat.thermostat_group.mode
+            self._mode = thermostat.mode
             self._active_preset = thermostat.active_preset
 
-            self._heating_valve_ids = [valve.id for valve in thermostat.heating_valves]
-            self._cooling_valve_ids = [valve.id for valve in thermostat.cooling_valves]
+            self._heating_valve_ids = list(thermostat.heating_valve_ids)
+            self._cooling_valve_ids = list(thermostat.cooling_valve_ids)
 
-            if thermostat.thermostat_group.mode == ThermostatGroup.Modes.HEATING:
+            if thermostat.mode == ThermostatGroup.Modes.HEATING:
                 pid_p = thermostat.pid_heating_p if thermostat.pid_heating_p is not None else self.DEFAULT_KP
                 pid_i = thermostat.pid_heating_i if thermostat.pid_heating_i is not None else self.DEFAULT_KI
                 pid_d = thermostat.pid_heating_d if thermostat.pid_heating_d is not None else self.DEFAULT_KD
@@ -103,7 +103,7 @@ class ThermostatPid(object):
             self._errors = 0
 
     @property
-    def thermostat(self):  # type: () -> Thermostat
+    def thermostat(self):  # type: () -> ThermostatSnapshot
         return self._thermostat
 
     def subscribe_state_changes(self, callback):
@@ -112,7 +112,7 @@ class ThermostatPid(object):
 
     def report_state_change(self):  # type: () -> None
         # TODO: Only invoke callback if change occurred
-        room_number = 255 if self._thermostat.room is None else self._thermostat.room.number
+        room_number = 255 if self._thermostat.room_number is None else self._thermostat.room_number
         for callback in self._report_state_callbacks:
             callback(self.number, self._active_preset.type, self.setpoint, self._current_temperature,
                      self.get_active_valves_percentage(), room_number)
@@ -134,8 +134,8 @@ class ThermostatPid(object):
 
         try:
             current_temperature = None  # type: Optional[float]
-            if self._thermostat.sensor is not None:
-                current_temperature = self._gateway_api.get_sensor_temperature_status(self._thermostat.sensor.number)
+            if self._thermostat.sensor_number is not None:
+                current_temperature = self._gateway_api.get_sensor_temperature_status(self._thermostat.sensor_number)
             if current_temperature is not None:
                 self._current_temperature = current_temperature
             else:
@@ -166,7 +166,8 @@ class ThermostatPid(object):
             return False
 
     def get_active_valves_percentage(self):  # type: () -> List[float]
-        return [self._pump_valve_controller.get_valve_driver(valve.id).percentage for valve in self._thermostat.active_valves]
+        valve_ids = self._heating_valve_ids if self._mode == ThermostatGroup.Modes.HEATING else self._cooling_valve_ids
+        return [self._pump_valve_controller.get_valve_driver(valve_id).percentage for valve_id in valve_ids]
 
     @property
     def number(self):  # type: () -> int
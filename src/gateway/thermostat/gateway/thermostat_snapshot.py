@@ -0,0 +1,124 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Immutable in-memory snapshot of the gateway thermostat configuration
+"""
+
+from __future__ import absolute_import
+
+import json
+from collections import namedtuple
+
+from peewee import JOIN
+
+from gateway.models import DaySchedule, Preset, Room, Sensor, Thermostat, \
+    ThermostatGroup, ValveToThermostat
+
+if False:  # MYPY
+    from typing import Dict, List, Set, Tuple
+
+PresetSnapshot = namedtuple('PresetSnapshot', ('id', 'type', 'heating_setpoint', 'cooling_setpoint'))
+
+ThermostatSnapshot = namedtuple('ThermostatSnapshot', (
+    'id', 'number', 'name', 'sensor_number', 'room_number', 'start', 'valve_config', 'automatic',
+    'group_on', 'mode',
+    'pid_heating_p', 'pid_heating_i', 'pid_heating_d', 'pid_cooling_p', 'pid_cooling_i', 'pid_cooling_d',
+    'active_preset',  # PresetSnapshot
+    'heating_valve_ids', 'cooling_valve_ids',  # Ordered by priority
+    'day_schedules'  # (index, mode, ((seconds_of_day, setpoint), ...)) per DaySchedule
+))
+
+
+class ThermostatConfigSnapshot(object):
+    """
+    The configuration of all thermostats (with their group, active preset, sensor, room, valves and
+    day schedules), loaded with a fixed amount of queries. A snapshot is never modified; a changed
+    configuration is loaded into a new snapshot, which replaces the old one.
+    """
+
+    def __init__(self, thermostats=None):  # type: (Dict[int, ThermostatSnapshot]) -> None
+        self.thermostats = thermostats or {}  # type: Dict[int, ThermostatSnapshot]
+
+    @staticmethod
+    def load():  # type: () -> ThermostatConfigSnapshot
+        thermostats = list(Thermostat.select(Thermostat, ThermostatGroup, Sensor)
+                                     .join_from(Thermostat, ThermostatGroup)
+                                     .join_from(Thermostat, Sensor, JOIN.LEFT_OUTER))
+        if not thermostats:
+            return ThermostatConfigSnapshot()
+        room_numbers = {}  # type: Dict[int, int]
+        room_ids = set(thermostat.room_id for thermostat in thermostats if thermostat.room_id is not None)
+        if room_ids:
+            room_numbers = dict(Room.select(Room.id, Room.number).where(Room.id.in_(list(room_ids))).tuples())
+        presets = {}  # type: Dict[int, PresetSnapshot]
+        for row in Preset.select(Preset.thermostat, Preset.id, Preset.type, Preset.heating_setpoint, Preset.cooling_setpoint) \
+                         .where(Preset.active) \
+                         .tuples():
+            presets[row[0]] = PresetSnapshot(*row[1:])
+        valve_ids = {}  # type: Dict[Tuple[int, str], List[int]]
+        for thermostat_id, valve_id, mode in ValveToThermostat.select(ValveToThermostat.thermostat,
+                                                                      ValveToThermostat.valve,
+                                                                      ValveToThermostat.mode) \
+                                                              .order_by(ValveToThermostat.priority) \
+                                                              .tuples():
+            valve_ids.setdefault((thermostat_id, mode), []).append(valve_id)
+        day_schedules = {}  # type: Dict[int, List[Tuple]]
+        schedule_data = {}  # type: Dict[str, Tuple]  # Most day schedules share their content
+        for thermostat_id, index, mode, content in DaySchedule.select(DaySchedule.thermostat, DaySchedule.index,
+                                                                      DaySchedule.mode, DaySchedule.content) \
+                                                              .order_by(DaySchedule.index) \
+                                                              .tuples():
+            if content not in schedule_data:
+                schedule_data[content] = tuple(sorted(json.loads(content).items()))
+            day_schedules.setdefault(thermostat_id, []).append((index, mode, schedule_data[content]))
+
+        snapshots = {}
+        for thermostat in thermostats:
+            preset = presets.get(thermostat.id)
+            if preset is None:
+                active_preset = thermostat.active_preset  # Activates the schedule preset
+                preset = PresetSnapshot(id=active_preset.id,
+                                        type=active_preset.type,
+                                        heating_setpoint=active_preset.heating_setpoint,
+                                        cooling_setpoint=active_preset.cooling_setpoint)
+            group = thermostat.thermostat_group
+            snapshots[thermostat.number] = ThermostatSnapshot(
+                id=thermostat.id,
+                number=thermostat.number,
+                name=thermostat.name,
+                sensor_number=None if thermostat.sensor is None else thermostat.sensor.number,
+                room_number=room_numbers.get(thermostat.room_id),
+                start=thermostat.start,
+                valve_config=thermostat.valve_config,
+                automatic=thermostat.automatic,
+                group_on=group.on,
+                mode=group.mode,
+                pid_heating_p=thermostat.pid_heating_p,
+                pid_heating_i=thermostat.pid_heating_i,
+                pid_heating_d=thermostat.pid_heating_d,
+                pid_cooling_p=thermostat.pid_cooling_p,
+                pid_cooling_i=thermostat.pid_cooling_i,
+                pid_cooling_d=thermostat.pid_cooling_d,
+                active_preset=preset,
+                heating_valve_ids=tuple(valve_ids.get((thermostat.id, ThermostatGroup.Modes.HEATING), [])),
+                cooling_valve_ids=tuple(valve_ids.get((thermostat.id, ThermostatGroup.Modes.COOLING), [])),
+                day_schedules=tuple(day_schedules.get(thermostat.id, []))
+            )
+        return ThermostatConfigSnapshot(snapshots)
+
+    def get_changes(self, previous):  # type: (ThermostatConfigSnapshot) -> Set[int]
+        """ Returns the numbers of the thermostats that were added, changed or removed since the previous snapshot """
+        return set(number for number in set(self.thermostats) | set(previous.thermostats)
+                   if self.thermostats.get(number) != previous.thermostats.get(number))
@@ -18,7 +18,7 @@ if False:  # MYPY
         ThermostatGroupStatusDTO, ThermostatGroupDTO, PumpGroupDTO, \
         RTD10DTO, GlobalRTD10DTO
     from gateway.output_controller import OutputController
-    from typing import List, Tuple, Optional
+    from typing import Any, Dict, List, Tuple, Optional
 
 
 class ThermostatController(object):
@@ -32,6 +32,9 @@ class ThermostatController(object):
     def stop(self):  # type: () -> None
         raise NotImplementedError()
 
+    def get_statistics(self):  # type: () -> Dict[str, Any]
+        return {}
+
     def set_current_setpoint(self, thermostat_number, temperature=None, heating_temperature=None, cooling_temperature=None):
         # type: (int, Optional[float], Optional[float], Optional[float]) -> None
         raise NotImplementedError()
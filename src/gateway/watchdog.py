@@ -96,9 +96,7 @@ class Watchdog(object):
     def _get_reset_action(self, name, controller):
         # type: (str, Union[MasterController,PowerCommunicator]) -> Optional[str]
         recovery_data_key = 'communication_recovery_{0}'.format(name)
-        recovery_data = Config.get_entry(recovery_data_key, None)  # type: Optional[Dict[str, Any]]
-        if recovery_data is None:  # Make mypy happy
-            recovery_data = {}
+        recovery_data = dict(Config.get_entry(recovery_data_key, {}))  # type: Dict[str, Any]
 
         stats = controller.get_communication_statistics()
         calls_timedout = [call for call in stats['calls_timedout']]
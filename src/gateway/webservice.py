@@ -51,9 +51,11 @@ from gateway.api.serializers import GroupActionSerializer, InputSerializer, \
 from gateway.dto import RoomDTO, ScheduleDTO, UserDTO, ModuleDTO, ThermostatDTO, \
     GlobalRTD10DTO
 from gateway.enums import ShutterEnums, UserEnums
+from gateway.events import GatewayEvent
 from gateway.exceptions import UnsupportedException
 from gateway.hal.master_controller import CommunicationFailure
 from gateway.maintenance_communicator import InMaintenanceModeException
+from gateway.metrics_batch import MetricBatch
 from gateway.models import Database, Feature, Config
 from gateway.websockets import EventsSocket, MaintenanceSocket, \
     MetricsSocket, OMPlugin, OMSocketTool
@@ -63,7 +65,7 @@ from power.power_communicator import InAddressModeException
 from serial_utils import CommunicationTimedOutException
 
 if False:  # MYPY
-    from typing import Dict, Optional, Any, List
+    from typing import Dict, Optional, Any, List, Tuple
     from bus.om_bus_client import MessageClient
     from gateway.gateway_api import GatewayApi
     from gateway.group_action_controller import GroupActionController
@@ -79,6 +81,7 @@ if False:  # MYPY
     from gateway.scheduling import SchedulingController
     from gateway.sensor_controller import SensorController
     from gateway.shutter_controller import ShutterController
+    from gateway.startup import StartupOrchestrator
     from gateway.thermostat.thermostat_controller import ThermostatController
     from gateway.user_controller import UserController
     from gateway.ventilation_controller import VentilationController
@@ -304,6 +307,12 @@ def types(**kwargs):
 class WebInterface(object):
     """ This class defines the web interface served by cherrypy. """
 
+    WEBSOCKET_TOKEN_CHECK_INTERVAL = 60
+    COALESCED_EVENT_TYPES = [GatewayEvent.Types.OUTPUT_CHANGE,
+                             GatewayEvent.Types.SHUTTER_CHANGE,
+                             GatewayEvent.Types.THERMOSTAT_CHANGE,
+                             GatewayEvent.Types.THERMOSTAT_GROUP_CHANGE]
+
     @Inject
     def __init__(self, user_controller=INJECTED, gateway_api=INJECTED, maintenance_controller=INJECTED,
                  message_client=INJECTED, scheduling_controller=INJECTED,
@@ -334,8 +343,10 @@ class WebInterface(object):
         self._plugin_controller = None  # type: Optional[PluginController]
         self._metrics_collector = None  # type: Optional[MetricsCollector]
         self._metrics_controller = None  # type: Optional[MetricsController]
+        self._startup_orchestrator = None  # type: Optional[StartupOrchestrator]
 
         self._ws_metrics_registered = False
+        self._ws_token_checks = {}  # type: Dict[str, float]
         self._power_dirty = False
         self._service_state = False
 
@@ -350,24 +361,35 @@ class WebInterface(object):
         self._service_state = state
 
     def distribute_metric(self, metric):
+        self.distribute_metric_batch(MetricBatch.from_metric(metric))
+
+    def distribute_metric_batch(self, batch):
         try:
             answers = cherrypy.engine.publish('get-metrics-receivers')
             if not answers:
                 return
             receivers = answers.pop()
-            for client_id in receivers.keys():
-                receiver_info = receivers.get(client_id)
-                if receiver_info is None:
-                    continue
+            self._check_websocket_tokens('metrics', receivers)
+            assert self._metrics_controller is not None
+            definitions_version = self._metrics_controller.definitions_version
+            messages = None  # type: Optional[List[Tuple[bytes,Any]]]
+            for client_id, receiver_info in list(receivers.items()):
                 try:
-                    if cherrypy.request.remote.ip != '127.0.0.1' and not self._user_controller.check_token(receiver_info['token']):
-                        raise cherrypy.HTTPError(401, 'invalid_token')
-                    sources = self._metrics_controller.get_filter('source', receiver_info['source'])
-                    metric_types = self._metrics_controller.get_filter('metric_type', receiver_info['metric_type'])
-                    if metric['source'] in sources and metric['type'] in metric_types:
-                        receiver_info['socket'].send(msgpack.dumps(metric), binary=True)
-                except cherrypy.HTTPError as ex:  # As might be caught from the `check_token` function
-                    receiver_info['socket'].close(ex.code, ex.message)
+                    sender = receiver_info['sender']
+                    if not sender.running:
+                        cherrypy.engine.publish('remove-metrics-receiver', client_id)
+                        continue
+                    if receiver_info.get('definitions_version') != definitions_version:
+                        # The filters are only evaluated when the receiver subscribes, or when the definitions change
+                        receiver_info['sources'] = self._metrics_controller.get_filter('source', receiver_info['source'])
+                        receiver_info['metric_types'] = self._metrics_controller.get_filter('metric_type', receiver_info['metric_type'])
+                        receiver_info['definitions_version'] = definitions_version
+                    if batch.source in receiver_info['sources'] and batch.type in receiver_info['metric_types']:
+                        if messages is None:
+                            messages = [(msgpack.dumps(metric), WebInterface._get_metric_key(metric))
+                                        for metric in batch.to_metrics()]
+                        for data, key in messages:
+                            sender.enqueue(data, key=key)
                 except Exception as ex:
                     logger.error('Failed to distribute metrics to WebSocket: %s', ex)
                     cherrypy.engine.publish('remove-metrics-receiver', client_id)
@@ -380,24 +402,57 @@ class WebInterface(object):
             if not answers:
                 return
             receivers = answers.pop()
-            for client_id in receivers.keys():
-                receiver_info = receivers.get(client_id)
-                if receiver_info is None:
-                    continue
+            self._check_websocket_tokens('events', receivers)
+            data = None  # type: Optional[bytes]
+            key = None
+            for client_id, receiver_info in list(receivers.items()):
                 try:
                     if event.type not in receiver_info['subscribed_types']:
                         continue
-                    if cherrypy.request.remote.ip != '127.0.0.1' and not self._user_controller.check_token(receiver_info['token']):
-                        raise cherrypy.HTTPError(401, 'invalid_token')
-                    receiver_info['socket'].send(msgpack.dumps(event.serialize()), binary=True)
-                except cherrypy.HTTPError as ex:  # As might be caught from the `check_token` function
-                    receiver_info['socket'].close(ex.code, ex.message)
+                    sender = receiver_info['sender']
+                    if not sender.running:
+                        cherrypy.engine.publish('remove-events-receiver', client_id)
+                        continue
+                    if data is None:
+                        data = msgpack.dumps(event.serialize())
+                        key = WebInterface._get_event_key(event)
+                    sender.enqueue(data, key=key)
                 except Exception as ex:
                     logger.error('Failed to distribute events to WebSocket: %s', ex)
                     cherrypy.engine.publish('remove-events-receiver', client_id)
         except Exception as ex:
             logger.error('Failed to distribute events to WebSockets: %s', ex)
 
+    def _check_websocket_tokens(self, receiver_type, receivers):
+        """ Closes the (non-local) WebSockets of which the token is no longer valid, at most every WEBSOCKET_TOKEN_CHECK_INTERVAL """
+        now = time.time()
+        if now - self._ws_token_checks.get(receiver_type, 0.0) < WebInterface.WEBSOCKET_TOKEN_CHECK_INTERVAL:
+            return
+        self._ws_token_checks[receiver_type] = now
+        for client_id, receiver_info in list(receivers.items()):
+            if receiver_info.get('remote_ip') == '127.0.0.1' or self._user_controller.check_token(receiver_info['token']):
+                continue
+            cherrypy.engine.publish('remove-{0}-receiver'.format(receiver_type), client_id)
+            try:
+                receiver_info['socket'].close(401, 'invalid_token')
+            except Exception as ex:
+                logger.error('Failed to close WebSocket: %s', ex)
+
+    @staticmethod
+    def _get_metric_key(metric):
+        """ Metrics of the same series replace each other if they're not yet sent """
+        try:
+            return metric['source'], metric['type'], tuple(sorted(metric['tags'].items()))
+        except TypeError:
+            return None
+
+    @staticmethod
+    def _get_event_key(event):
+        """ State changes of the same object replace each other if they're not yet sent """
+        if event.type in WebInterface.COALESCED_EVENT_TYPES and isinstance(event.data, dict) and 'id' in event.data:
+            return event.type, event.data['id']
+        return None
+
     def set_plugin_controller(self, plugin_controller):
         """
         Set the plugin controller.
@@ -414,6 +469,10 @@ class WebInterface(object):
         """ Sets the metrics controller """
         self._metrics_controller = metrics_controller
 
+    def set_startup_orchestrator(self, startup_orchestrator):
+        """ Sets the startup orchestrator, which provides the boot profile """
+        self._startup_orchestrator = startup_orchestrator
+
     @cherrypy.expose
     def index(self):
         """
@@ -2032,6 +2091,20 @@ class WebInterface(object):
                                      'name': str(name)},
                 'platform': str(Platform.get_platform())}
 
+    @openmotics_api(auth=True)
+    def get_boot_profile(self):
+        """
+        Get the timing of the startup stages of the service, e.g. to detect a slower time to the
+        first API response. Stages that are deferred until the service is ready require the 'service' stage.
+
+        :returns: 'duration': total duration of the startup in seconds (None while starting) and 'stages':
+                  list of dicts with name, state, requires, start (seconds since the start), duration and error.
+        :rtype: dict
+        """
+        if self._startup_orchestrator is None:
+            return {'duration': None, 'stages': []}
+        return self._startup_orchestrator.get_profile()
+
     @openmotics_api(auth=True, plugin_exposed=False)
     def update(self, version, md5, update_data=None):
         """
@@ -2366,6 +2439,18 @@ class WebInterface(object):
                         definitions[_source][_metric_type] = definition
         return {'definitions': definitions}
 
+    @openmotics_api(auth=True)
+    def get_websocket_statistics(self):
+        """ Returns the queue length, sent/coalesced/dropped messages and lag of every metrics and events WebSocket """
+        statistics = {}  # type: Dict[str,Dict[str,Any]]
+        for receiver_type in ['metrics', 'events']:
+            answers = cherrypy.engine.publish('get-{0}-receivers'.format(receiver_type))
+            receivers = answers.pop() if answers else {}
+            statistics[receiver_type] = dict((client_id, receiver_info['sender'].get_statistics())
+                                             for client_id, receiver_info in list(receivers.items())
+                                             if 'sender' in receiver_info)
+        return {'statistics': statistics}
+
     @openmotics_api(check=types(confirm=bool), auth=True, plugin_exposed=False)
     def factory_reset(self, username, password, confirm=False):
         user_dto = UserDTO(username=username)
@@ -2408,6 +2493,7 @@ class WebInterface(object):
     def ws_metrics(self, token, source=None, metric_type=None, interval=None):
         cherrypy.request.ws_handler.metadata = {'token': token,
                                                 'client_id': uuid.uuid4().hex,
+                                                'remote_ip': cherrypy.request.remote.ip,
                                                 'source': source,
                                                 'metric_type': metric_type,
                                                 'interval': None if interval is None else int(interval),
@@ -2419,6 +2505,7 @@ class WebInterface(object):
     def ws_events(self, token):
         cherrypy.request.ws_handler.metadata = {'token': token,
                                                 'client_id': uuid.uuid4().hex,
+                                                'remote_ip': cherrypy.request.remote.ip,
                                                 'interface': self}
 
     @cherrypy.expose
@@ -19,11 +19,18 @@ from __future__ import absolute_import
 import msgpack
 import cherrypy
 import logging
+import time
+from collections import OrderedDict
+from threading import Condition
 from ws4py import WS_VERSION
 from ws4py.server.cherrypyserver import WebSocketPlugin, WebSocketTool
 from ws4py.websocket import WebSocket
+from gateway.daemon_thread import BaseThread
 from gateway.events import GatewayEvent
 
+if False:  # MYPY
+    from typing import Any, Dict, Hashable, Optional, Tuple
+
 logger = logging.getLogger('openmotics')
 
 
@@ -79,7 +86,8 @@ class OMPlugin(WebSocketPlugin):
         self.events_receivers.pop(client_id, None)
 
     def update_events_receiver(self, client_id, receiver_info):
-        self.events_receivers[client_id].update(receiver_info)
+        if client_id in self.events_receivers:
+            self.events_receivers[client_id].update(receiver_info)
 
     def add_maintenance_receiver(self, client_id, receiver_info):
         self.maintenance_receivers[client_id] = receiver_info
@@ -91,6 +99,91 @@ class OMPlugin(WebSocketPlugin):
         self.maintenance_receivers.pop(client_id, None)
 
 
+class WebSocketSender(object):
+    """
+    Sends (already encoded) messages to a single WebSocket from a dedicated thread, so a slow client
+    only delays itself and not the distribution to the other clients.
+
+    A message with a key replaces a queued message with the same key (e.g. an older state of the same
+    output). When the queue is full, the oldest message is dropped.
+    """
+
+    MAX_QUEUE_LENGTH = 250
+
+    def __init__(self, socket, name):
+        # type: (WebSocket, str) -> None
+        self._socket = socket
+        self._queue = OrderedDict()  # type: OrderedDict  # Key -> (data, enqueue time)
+        self._sequence = 0
+        self._available = Condition()
+        self.running = True
+        self._statistics = {'sent': 0,
+                            'coalesced': 0,
+                            'dropped': 0,
+                            'lag': 0.0,
+                            'max_lag': 0.0}  # type: Dict[str, Any]
+        self._thread = BaseThread(name=name, target=self._send_messages)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def enqueue(self, data, key=None):
+        # type: (bytes, Optional[Hashable]) -> None
+        with self._available:
+            if not self.running:
+                return
+            if key is None:
+                self._sequence += 1
+                key = self._sequence
+            elif key in self._queue:
+                # Keep the position (and age) of the queued message, but send the latest data
+                self._queue[key] = (data, self._queue[key][1])
+                self._statistics['coalesced'] += 1
+                return
+            if len(self._queue) >= WebSocketSender.MAX_QUEUE_LENGTH:
+                self._queue.popitem(last=False)
+                self._statistics['dropped'] += 1
+            self._queue[key] = (data, time.time())
+            self._available.notify()
+
+    def stop(self):
+        # type: () -> None
+        with self._available:
+            self.running = False
+            self._queue.clear()
+            self._available.notify()
+
+    def get_statistics(self):
+        # type: () -> Dict[str, Any]
+        """ Returns the queue length, the amount of sent/coalesced/dropped messages and the lag (in seconds) """
+        with self._available:
+            statistics = dict(self._statistics)
+            statistics['queue_length'] = len(self._queue)
+            if self._queue:
+                oldest = next(iter(self._queue.values()))
+                statistics['lag'] = max(statistics['lag'], time.time() - oldest[1])
+        return statistics
+
+    def _send_messages(self):
+        # type: () -> None
+        while True:
+            with self._available:
+                while self.running and not self._queue:
+                    self._available.wait()
+                if not self.running:
+                    return
+                _, (data, enqueued) = self._queue.popitem(last=False)
+            try:
+                self._socket.send(data, binary=True)
+            except Exception as ex:
+                logger.error('Failed to send to WebSocket: %s', ex)
+                self.stop()
+                return
+            lag = time.time() - enqueued
+            self._statistics['sent'] += 1
+            self._statistics['lag'] = lag
+            self._statistics['max_lag'] = max(self._statistics['max_lag'], lag)
+
+
 class OMSocketTool(WebSocketTool):
     def upgrade(self, protocols=None, extensions=None, version=WS_VERSION, handler_cls=WebSocket, heartbeat_freq=None):
         _ = protocols  # ws4py doesn't support protocols the way we like (using them for authentication)
@@ -144,12 +237,15 @@ class MetricsSocket(OMSocket):
     def opened(self):
         if not hasattr(self, 'metadata'):
             return
+        self._sender = WebSocketSender(self, name='wsmetrics')
         cherrypy.engine.publish('add-metrics-receiver',
                                 self.metadata['client_id'],
                                 {'source': self.metadata['source'],
                                  'metric_type': self.metadata['metric_type'],
                                  'token': self.metadata['token'],
-                                 'socket': self})
+                                 'remote_ip': self.metadata.get('remote_ip'),
+                                 'socket': self,
+                                 'sender': self._sender})
         self.metadata['interface']._metrics_collector.set_websocket_interval(self.metadata['client_id'],
                                                                              self.metadata['metric_type'],
                                                                              self.metadata['interval'])
@@ -160,6 +256,7 @@ class MetricsSocket(OMSocket):
             return
         client_id = self.metadata['client_id']
         cherrypy.engine.publish('remove-metrics-receiver', client_id)
+        self._sender.stop()
         self.metadata['interface']._metrics_collector.set_websocket_interval(client_id, self.metadata['metric_type'], None)
 
 
@@ -171,11 +268,14 @@ class EventsSocket(OMSocket):
     def opened(self):
         if not hasattr(self, 'metadata'):
             return
+        self._sender = WebSocketSender(self, name='wsevents')
         cherrypy.engine.publish('add-events-receiver',
                                 self.metadata['client_id'],
                                 {'token': self.metadata['token'],
-                                 'subscribed_types': [],
-                                 'socket': self})
+                                 'remote_ip': self.metadata.get('remote_ip'),
+                                 'subscribed_types': set(),
+                                 'socket': self,
+                                 'sender': self._sender})
 
     def closed(self, *args, **kwargs):
         _ = args, kwargs
@@ -183,6 +283,7 @@ class EventsSocket(OMSocket):
             return
         client_id = self.metadata['client_id']
         cherrypy.engine.publish('remove-events-receiver', client_id)
+        self._sender.stop()
 
     def received_message(self, message):
         if not hasattr(self, 'metadata'):
@@ -197,7 +298,7 @@ class EventsSocket(OMSocket):
             event = GatewayEvent.deserialize(data)
             if event.type == GatewayEvent.Types.ACTION:
                 if event.data['action'] == 'set_subscription':
-                    subscribed_types = [stype for stype in event.data['types'] if stype in allowed_types]
+                    subscribed_types = set(stype for stype in event.data['types'] if stype in allowed_types)
                     cherrypy.engine.publish('update-events-receiver',
                                             self.metadata['client_id'],
                                             {'subscribed_types': subscribed_types})
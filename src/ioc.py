@@ -27,6 +27,9 @@ if False:  # MYPY
 
 _IN_TEST_MODE = False
 _TEST_SCOPE = None
+_DEBUG_INJECTIONS = False
+_GENERATION = 0  # Changes when an injectable could resolve to another value
+_MISSING = object()
 
 _MAIN_THREAD_ID = threading.currentThread().ident
 _DATA = threading.local()
@@ -139,6 +142,7 @@ class _Scope(object):
         return ''.join(a)
 
     def __enter__(self):
+        _ResetInjectionCache()
         scopes = _MyScopes()
         if threading.currentThread().ident == _MAIN_THREAD_ID:
             _BASE_SCOPES.append(self)
@@ -167,10 +171,30 @@ def _CurrentScope():
 
 def _ResetInjectionScopeMap():
     """Delete the injection_scope_map to force the recalculate."""
+    _ResetInjectionCache()
     if hasattr(_DATA, 'injection_scope_map'):
         del _DATA.injection_scope_map
 
 
+def _ResetInjectionCache():
+    """Invalidates the resolved injections of all threads."""
+    global _GENERATION
+    _GENERATION += 1
+
+
+def _GetResolvedInjections():
+    """Returns a dict with the resolved values of the cacheable injections.
+
+    Singletons and values always resolve to the same object in the current
+    scope tree, so they are only resolved once (per thread) until an
+    injectable, a scope or the test mode changes.
+    """
+    resolved = getattr(_DATA, 'resolved_injections', None)
+    if resolved is None or resolved[0] != _GENERATION:
+        resolved = _DATA.resolved_injections = (_GENERATION, {})
+    return resolved[1]
+
+
 InjectionScope = collections.namedtuple('InjectionScope',
                                         ['idx', 'scope', 'callable'])
 
@@ -193,22 +217,33 @@ def _GetCurrentInjectionInfo():
 
 
 def _FillInInjections(injections, arguments):
-    injection_scope_map = _GetCurrentInjectionInfo()
+    resolved = _GetResolvedInjections()
 
     for injection in injections:
         if injection in arguments:
             continue
-        try:
-            if _IN_TEST_MODE:
-                if _TEST_SCOPE is None:
-                    raise TestInjectionsNotSetupError(
-                        'Test injections have not been setup.')
-                arguments[injection] = _TEST_SCOPE[injection]()
-            else:
-                arguments[injection] = injection_scope_map[injection].callable()
-        except KeyError:
-            raise InjectionMissingError(
-                'The injectable named %r was not found.' % injection)
+        value = resolved.get(injection, _MISSING)
+        if value is _MISSING:
+            value = _ResolveInjection(injection, resolved)
+        arguments[injection] = value
+
+
+def _ResolveInjection(injection, resolved):
+    try:
+        if _IN_TEST_MODE:
+            if _TEST_SCOPE is None:
+                raise TestInjectionsNotSetupError(
+                    'Test injections have not been setup.')
+            injectable = _TEST_SCOPE[injection]
+        else:
+            injectable = _GetCurrentInjectionInfo()[injection].callable
+    except KeyError:
+        raise InjectionMissingError(
+            'The injectable named %r was not found.' % injection)
+    value = injectable()
+    if getattr(injectable, 'ioc_cacheable', False):
+        resolved[injection] = value
+    return value
 
 
 def _CalculateScopeDep(injections):
@@ -254,7 +289,8 @@ def _CreateInjectWrapper(f, injections):
 
     @functools.wraps(f)
     def _Wrapper(*args, **kwargs):
-        logging.debug('Injecting %r with %r - %r', f.__name__, injections, kwargs)
+        if _DEBUG_INJECTIONS:
+            logging.debug('Injecting %r with %r - %r', f.__name__, injections, kwargs)
         _FillInInjections(injections, kwargs)
         return f(*args, **kwargs)
 
@@ -266,8 +302,9 @@ def _CreateInjectWrapper(f, injections):
 def _CreateSingletonInjectableWrapper(f, injections):
     @functools.wraps(f)
     def _Wrapper(*args, **kwargs):
-        logging.debug(
-            'Injecting singleton %r with %r - %r', f.__name__, injections, kwargs)
+        if _DEBUG_INJECTIONS:
+            logging.debug(
+                'Injecting singleton %r with %r - %r', f.__name__, injections, kwargs)
         for scope in _MyScopes():
             if f.__name__ in scope.singletons:
                 return scope.singletons[f.__name__]
@@ -281,6 +318,7 @@ def _CreateSingletonInjectableWrapper(f, injections):
 
     Wrapper = _Wrapper  # type: Any
     Wrapper.ioc_wrapper = f
+    Wrapper.ioc_cacheable = True
     return Wrapper
 
 
@@ -521,6 +559,20 @@ def SetTestMode(enabled=True):
     """
     global _IN_TEST_MODE
     _IN_TEST_MODE = enabled
+    _ResetInjectionCache()
+
+
+def SetDebugInjections(enabled=True):
+    """Enables or disables the debug logging of every injection.
+
+    This logging is disabled by default, as it adds overhead to every call of
+    an injected callable.
+
+    Args:
+      enabled: True to enable the logging, false to disable it.
+    """
+    global _DEBUG_INJECTIONS
+    _DEBUG_INJECTIONS = enabled
 
 
 def SetUpTestInjections(**kwargs):
@@ -540,6 +592,7 @@ def _CreateCallable(name, value):
         return value
 
     Callable.__name__ = name
+    Callable.ioc_cacheable = True  # type: ignore
     return Callable
 
 
@@ -547,3 +600,4 @@ def TearDownTestInjections():
     """Tears down any injections set up for testing."""
     global _TEST_SCOPE
     _TEST_SCOPE = None
+    _ResetInjectionCache()
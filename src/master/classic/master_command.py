@@ -103,56 +103,54 @@ class MasterCommandSpec(object):
             ret += field.encode(fields.get(field.name))
         return ret
 
-    def consume_output(self, byte_str, partial_result=None):
-        # type: (bytearray, Optional[Result]) -> Tuple[int, Result, bool]
+    def consume_output(self, byte_str, partial_result=None, offset=0):
+        # type: (bytearray, Optional[Result], int) -> Tuple[int, Result, bool]
         """
         When the prefix of a command is matched, consume_output is used to fill in the
         output fields. If a part of the fields was already matched, the parial_result should
         be provided. The output of this method indicates how many bytes were consumed, the
         result and if the consumption was done.
 
+        Only the bytes of a field that could not be decoded yet are kept in the partial result,
+        so a partial read never copies the (possibly large) remainder of the input.
+
         :param byte_str Output from the master
         :param partial_result: In case we already have data for this unfinished communication.
+        :param offset: Index in byte_str where the output starts
         """
         if partial_result is None:
-            from_pending = 0
             partial_result = Result()
-        else:
-            from_pending = len(partial_result.pending_bytes)
-            byte_str = partial_result.pending_bytes + byte_str
-            partial_result.pending_bytes = bytearray()
-
-        def decode_field(index_, byte_str_, field_, num_bytes):
-            """
-            Decode one field, returns index for the next field if successful,
-            returns a tuple with decode information if not successful.
-            """
-            if index_ + num_bytes <= len(byte_str_):
-                try:
-                    decoded = field_.decode(byte_str[index_:index_ + num_bytes])
-                except NeedMoreBytesException as nmbe:
-                    return decode_field(index_, byte_str_, field_, nmbe.bytes_required)
-                else:
-                    partial_result[field_.name] = decoded
-                    partial_result.field_index += 1
-                    partial_result.pending_bytes = bytearray()
-                    index_ += num_bytes
-                    return index_
-            else:
-                partial_result.pending_bytes += byte_str[index:]
-                return len(byte_str) - from_pending, partial_result, False
+        pending = partial_result.pending_bytes
+        index = offset
+        length = len(byte_str)
 
-        # Found beginning, start decoding
-        index = 0
         for field in self.output_fields[partial_result.field_index:]:
-            index = decode_field(index, byte_str, field, field.get_min_decode_bytes())
-            if not isinstance(index, int):
-                # We ran out of bytes
-                return index
+            num_bytes = field.get_min_decode_bytes()
+            while True:
+                missing = max(0, num_bytes - len(pending))
+                if index + missing > length:
+                    # We ran out of bytes
+                    pending += byte_str[index:]
+                    partial_result.actual_bytes += byte_str[offset:]
+                    return length - offset, partial_result, False
+                if pending:
+                    field_bytes = pending + byte_str[index:index + missing]
+                else:
+                    field_bytes = byte_str[index:index + missing]
+                try:
+                    decoded = field.decode(field_bytes)
+                except NeedMoreBytesException as nmbe:
+                    num_bytes = nmbe.bytes_required
+                    continue
+                break
+            partial_result[field.name] = decoded
+            partial_result.field_index += 1
+            pending = partial_result.pending_bytes = bytearray()
+            index += missing
 
         partial_result.complete = True
-        partial_result.actual_bytes = byte_str[:index]
-        return index - from_pending, partial_result, True
+        partial_result.actual_bytes += byte_str[offset:index]
+        return index - offset, partial_result, True
 
     def output_has_crc(self):
         """ Check if the MasterCommandSpec output contains a crc field. """
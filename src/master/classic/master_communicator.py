@@ -76,7 +76,9 @@ class MasterCommunicator(object):
 
         self.__update_mode = False
 
-        self.__consumers = []  # type: List[Union[Consumer, BackgroundConsumer]]
+        self.__consumers_lock = Lock()
+        self.__consumers = {}  # type: Dict[bytes, List[Union[Consumer, BackgroundConsumer]]]
+        self.__start_bytes = Counter()  # type: Counter
 
         self.__passthrough_enabled = False
         self.__passthrough_mode = False
@@ -211,7 +213,7 @@ class MasterCommunicator(object):
 
             threshold = time.time() - self.__debug_buffer_duration
             self.__debug_buffer['write'][time.time()] = data
-            for t in self.__debug_buffer['write'].keys():
+            for t in list(self.__debug_buffer['write'].keys()):
                 if t < threshold:
                     del self.__debug_buffer['write'][t]
 
@@ -226,7 +228,28 @@ class MasterCommunicator(object):
         :param consumer: The consumer to register.
         :type consumer: Consumer or BackgroundConsumer.
         """
-        self.__consumers.append(consumer)
+        prefix = consumer.get_prefix()
+        with self.__consumers_lock:
+            self.__consumers.setdefault(bytes(prefix), []).append(consumer)
+            self.__start_bytes[prefix[0]] += 1
+
+    def unregister_consumer(self, consumer):
+        """ Unregister a consumer, if it's still registered.
+
+        :param consumer: The consumer to unregister.
+        :type consumer: Consumer or BackgroundConsumer.
+        """
+        prefix = consumer.get_prefix()
+        with self.__consumers_lock:
+            consumers = self.__consumers.get(bytes(prefix), [])
+            if consumer not in consumers:
+                return
+            consumers.remove(consumer)
+            if not consumers:
+                del self.__consumers[bytes(prefix)]
+            self.__start_bytes[prefix[0]] -= 1
+            if self.__start_bytes[prefix[0]] == 0:
+                del self.__start_bytes[prefix[0]]
 
     def do_raw_action(self, action, size, output_size=None, data=None, timeout=2):
         # type: (str, int, Optional[int], Optional[bytearray], Union[T_co, int]) -> Union[T_co, Dict[str, Any]]
@@ -276,7 +299,7 @@ class MasterCommunicator(object):
 
         with self.__command_lock:
             self.__command_total_histogram.update({str(cmd.action): 1})
-            self.__consumers.append(consumer)
+            self.register_consumer(consumer)
             self.__write_to_serial(inp)
             try:
                 result = consumer.get(timeout).fields
@@ -289,6 +312,7 @@ class MasterCommunicator(object):
                     self.__command_success_histogram.update({str(cmd.action): 1})
                     return result
             except CommunicationTimedOutException:
+                self.unregister_consumer(consumer)  # Don't let a late answer be taken for the next command with this cid
                 if cmd.action != bytearray(b'FV'):
                     # The FV instruction is a direct call to the Slave module. Older versions did not implement this
                     # call, so this call can timeout while it's expected. We don't take those into account.
@@ -412,26 +436,19 @@ class MasterCommunicator(object):
         """ Returns whether the MasterCommunicator is in maintenance mode. """
         return self.__maintenance_mode
 
-    def __get_start_bytes(self):
-        """ Create a dict that maps the start byte to a list of consumers. """
-        start_bytes = {}  # type: Dict[int, List[Union[Consumer, BackgroundConsumer]]]
-        for consumer in self.__consumers:
-            start_byte = consumer.get_prefix()[0]
-            if start_byte in start_bytes:
-                start_bytes[start_byte].append(consumer)
-            else:
-                start_bytes[start_byte] = [consumer]
-        return start_bytes
-
     def __read(self):
         """
         Code for the background read thread: reads from the serial port, checks if
         consumers for incoming bytes, if not: put in pass through buffer.
+
+        The consumers are looked up by their (3 byte) prefix. The read buffer is only
+        compacted once per read from the serial port, so unmatched bytes are handled
+        in linear time.
         """
         def consumer_done(_consumer):
             """ Callback for when consumer is done. ReadState does not access parent directly. """
             if isinstance(_consumer, Consumer):
-                self.__consumers.remove(_consumer)
+                self.unregister_consumer(_consumer)
             elif isinstance(_consumer, BackgroundConsumer) and _consumer.send_to_passthrough:
                 self.__push_passthrough_data(_consumer.last_cmd_data)
 
@@ -455,21 +472,21 @@ class MasterCommunicator(object):
                 self.current_consumer = _consumer
                 self.partial_result = None
 
-            def consume(self, _data):
-                # type: (bytearray) -> bytearray
+            def consume(self, _data, _offset):
+                # type: (bytearray, int) -> int
                 """
-                Consume the bytes in data using the current_consumer, and return the bytes
-                that were not used.
+                Consume the bytes in data (starting at offset) using the current_consumer, and
+                return the offset of the first byte that was not used.
                 """
                 assert read_state.current_consumer
                 try:
-                    bytes_consumed, result, done = read_state.current_consumer.consume(_data, read_state.partial_result)
+                    bytes_consumed, result, done = read_state.current_consumer.consume(_data, read_state.partial_result, _offset)
                 except ValueError as value_error:
                     logger.error('Could not consume/decode message from the master: {0}'.format(value_error))
                     # Consumer failed, reset.
                     self.current_consumer = None
                     self.partial_result = None
-                    return _data
+                    return _offset
 
                 if done:
                     assert self.current_consumer
@@ -479,9 +496,9 @@ class MasterCommunicator(object):
                     self.current_consumer = None
                     self.partial_result = None
 
-                    return _data[bytes_consumed:]
+                    return _offset + bytes_consumed
                 self.partial_result = result
-                return bytearray()
+                return len(_data)
 
         read_state = ReadState()
         data = bytearray()
@@ -499,57 +516,59 @@ class MasterCommunicator(object):
                 continue
 
             num_bytes = self.__serial.inWaiting()
-            data += self.__serial.read(num_bytes)
-            if len(data) > 0:
-                self.__communication_stats['bytes_read'] += num_bytes
-
-                threshold = time.time() - self.__debug_buffer_duration
-                self.__debug_buffer['read'][time.time()] = data
-                for t in self.__debug_buffer['read'].keys():
-                    if t < threshold:
-                        del self.__debug_buffer['read'][t]
-
-                if self.__verbose:
-                    logger.debug('Reading from Master serial: {0}'.format(printable(data)))
-
-                if read_state.should_resume():
-                    data = read_state.consume(data)
-
-                # No else here: data might not be empty when current_consumer is done
-                if read_state.should_find_consumer():
-                    start_bytes = self.__get_start_bytes()
-                    leftovers = bytearray()  # for unconsumed bytes; these will go to the passthrough.
-
-                    while len(data) > 0:
-                        if data[0] in start_bytes:
-                            # Prefixes are 3 bytes, make sure we have enough data to match
-                            if len(data) >= 3:
-                                match = False
-                                for consumer in start_bytes[data[0]]:
-                                    if data[:3] == consumer.get_prefix():
-                                        # Found matching consumer
-                                        read_state.set_consumer(consumer)
-                                        data = read_state.consume(data[3:])  # Strip off prefix
-                                        # Consumers might have changed, update start_bytes
-                                        start_bytes = self.__get_start_bytes()
-                                        match = True
-                                        break
-                                if match:
-                                    continue
-                            else:
-                                # All commands end with '\r\n', there are no prefixes that start
-                                # with \r\n so the last bytes of a command will not get stuck
-                                # waiting for the next serial.read()
-                                break
-
-                        leftovers.append(data[0])
-                        data = data[1:]
-
-                    if len(leftovers) > 0:
-                        if not self.__maintenance_mode:
-                            self.__push_passthrough_data(leftovers)
-                        else:
-                            self.__maintenance_queue.put(leftovers)
+            chunk = self.__serial.read(num_bytes)
+            if len(chunk) == 0:
+                continue
+            data += chunk
+            self.__communication_stats['bytes_read'] += num_bytes
+
+            threshold = time.time() - self.__debug_buffer_duration
+            self.__debug_buffer['read'][time.time()] = chunk
+            for t in list(self.__debug_buffer['read'].keys()):
+                if t < threshold:
+                    del self.__debug_buffer['read'][t]
+
+            if self.__verbose:
+                logger.debug('Reading from Master serial: {0}'.format(printable(chunk)))
+
+            offset = 0
+            if read_state.should_resume():
+                offset = read_state.consume(data, offset)
+
+            # No else here: data might not be empty when current_consumer is done
+            if read_state.should_find_consumer():
+                leftovers = bytearray()  # for unconsumed bytes; these will go to the passthrough.
+                start_bytes = self.__start_bytes
+                length = len(data)
+                index = offset
+                while index < length:
+                    if data[index] in start_bytes:
+                        # Prefixes are 3 bytes, make sure we have enough data to match
+                        if index + 3 > length:
+                            # All commands end with '\r\n', there are no prefixes that start
+                            # with \r\n so the last bytes of a command will not get stuck
+                            # waiting for the next serial.read()
+                            break
+                        consumers = self.__consumers.get(bytes(data[index:index + 3]))
+                        if consumers:
+                            # Found matching consumer
+                            leftovers += data[offset:index]
+                            read_state.set_consumer(consumers[0])
+                            offset = index = read_state.consume(data, index + 3)  # Strip off prefix
+                            if read_state.should_resume():
+                                break  # Waiting for the remainder of the output
+                            continue
+                    index += 1
+                leftovers += data[offset:index]
+                offset = index
+
+                if len(leftovers) > 0:
+                    if not self.__maintenance_mode:
+                        self.__push_passthrough_data(leftovers)
+                    else:
+                        self.__maintenance_queue.put(leftovers)
+
+            del data[:offset]
 
 
 class CrcCheckFailedException(Exception):
@@ -571,10 +590,10 @@ class Consumer(object):
         """ Get the prefix of the answer from the master. """
         return self.cmd.output_action + bytearray([self.cid])
 
-    def consume(self, data, partial_result):
-        # type: (bytearray, Optional[Result]) -> Tuple[int, Result, bool]
+    def consume(self, data, partial_result, offset=0):
+        # type: (bytearray, Optional[Result], int) -> Tuple[int, Result, bool]
         """ Consume data. """
-        return self.cmd.consume_output(data, partial_result)
+        return self.cmd.consume_output(data, partial_result, offset)
 
     def get(self, timeout):
         """
@@ -644,10 +663,10 @@ class BackgroundConsumer(object):
     def _consume(self):
         self.callback(self._queue.get(block=True, timeout=0.25))
 
-    def consume(self, data, partial_result):
-        # type: (bytearray, Optional[Result]) -> Tuple[int, Result, bool]
+    def consume(self, data, partial_result, offset=0):
+        # type: (bytearray, Optional[Result], int) -> Tuple[int, Result, bool]
         """ Consume data. """
-        (bytes_consumed, last_result, done) = self.cmd.consume_output(data, partial_result)
+        (bytes_consumed, last_result, done) = self.cmd.consume_output(data, partial_result, offset)
         self.last_cmd_data = (self.get_prefix() + last_result.actual_bytes) if done else None
         return bytes_consumed, last_result, done
 
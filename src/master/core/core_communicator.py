@@ -21,23 +21,24 @@ from __future__ import absolute_import
 
 import logging
 import select
-import struct
 import time
 import six
 from threading import Lock
-from collections import Counter
+from collections import Counter, OrderedDict, deque
 from six.moves.queue import Empty, Queue
 from gateway.daemon_thread import BaseThread
 from ioc import INJECTED, Inject
 from master.core.core_api import CoreAPI
 from master.core.core_command import CoreCommandSpec
 from master.core.fields import WordField
+from master.core.frame_decoder import FrameDecoder
 from master.core.toolbox import Toolbox
 from serial_utils import CommunicationTimedOutException, printable
 
 if False:  # MYPY
     from master.core.basic_action import BasicAction
-    from typing import Dict, Any, Optional, TypeVar, Union, Callable, Set, List
+    from master.core.frame_decoder import Frame
+    from typing import Dict, Any, Optional, TypeVar, Union, Callable, Set, List, Tuple, Deque
     from serial import Serial
     T_co = TypeVar('T_co', bound=None, covariant=True)
 
@@ -56,6 +57,9 @@ class CoreCommunicator(object):
     START_OF_REPLY = bytearray(b'RTR')
     END_OF_REPLY = bytearray(b'\r\n')
 
+    MAX_IN_FLIGHT = 8
+    LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]  # Milliseconds
+
     @Inject
     def __init__(self, controller_serial=INJECTED):
         # type: (Serial) -> None
@@ -78,13 +82,14 @@ class CoreCommunicator(object):
         self._command_total_histogram = Counter()  # type: Counter
         self._command_success_histogram = Counter()  # type: Counter
         self._command_timeout_histogram = Counter()  # type: Counter
+        self._command_latency_histogram = {}  # type: Dict[str, Counter]
 
         self._communication_stats = {'calls_succeeded': [],
                                      'calls_timedout': [],
                                      'bytes_written': 0,
                                      'bytes_read': 0}  # type: Dict[str,Any]
-        self._debug_buffer = {'read': {},
-                              'write': {}}  # type: Dict[str, Dict[float, bytearray]]
+        self._debug_buffer = {'read': OrderedDict(),
+                              'write': OrderedDict()}  # type: Dict[str, Dict[float, bytearray]]
         self._debug_buffer_duration = 300
 
     def start(self):
@@ -112,12 +117,14 @@ class CoreCommunicator(object):
     def get_command_histograms(self):
         return {'total': dict(self._command_total_histogram),
                 'success': dict(self._command_success_histogram),
-                'timeout': dict(self._command_timeout_histogram)}
+                'timeout': dict(self._command_timeout_histogram),
+                'latency': {instruction: dict(histogram) for instruction, histogram in six.iteritems(self._command_latency_histogram)}}
 
     def reset_command_histograms(self):
         self._command_total_histogram.clear()
         self._command_success_histogram.clear()
         self._command_timeout_histogram.clear()
+        self._command_latency_histogram.clear()
 
     def get_debug_buffer(self):
         # type: () -> Dict[str,Dict[float,str]]
@@ -173,11 +180,7 @@ class CoreCommunicator(object):
             if self._verbose:
                 logger.debug('Writing to Core serial:   {0}'.format(printable(data)))
 
-            threshold = time.time() - self._debug_buffer_duration
-            self._debug_buffer['write'][time.time()] = data
-            for t in self._debug_buffer['write'].keys():
-                if t < threshold:
-                    del self._debug_buffer['write'][t]
+            self._log_debug_buffer(self._debug_buffer['write'], data)
 
             self._serial.write(data)
             self._serial_bytes_written += len(data)
@@ -229,6 +232,48 @@ class CoreCommunicator(object):
         :param fields: A dictionary with the command input field values
         :param timeout: maximum allowed time before a CommunicationTimedOutException is raised
         """
+        consumer = self.submit(command, fields)
+        return self._wait_for_reply(consumer, timeout)
+
+    def do_commands(self, commands, timeout=2, window=None):
+        # type: (List[Tuple[CoreCommandSpec, Dict[str, Any]]], int, Optional[int]) -> List[Dict[str, Any]]
+        """
+        Send a list of commands back-to-back and block until all answers are received. The answers are
+        matched to the requests by their CID, so the Core doesn't need to be waited for between two commands.
+        If the Core does not respond to one of the commands within the timeout period, a
+        CommunicationTimedOutException is raised
+
+        :param commands: list of (command specification, command input field values) tuples
+        :param timeout: maximum allowed time per command before a CommunicationTimedOutException is raised
+        :param window: maximum amount of commands that are waiting for an answer at the same time
+        :returns: list with the output fields of every command, in the same order as the commands
+        """
+        if window is None:
+            window = CoreCommunicator.MAX_IN_FLIGHT
+        results = []  # type: List[Dict[str, Any]]
+        pending = deque()  # type: Deque[Consumer]
+        try:
+            for command, fields in commands:
+                if len(pending) >= window:
+                    results.append(self._wait_for_reply(pending.popleft(), timeout))
+                pending.append(self.submit(command, fields))
+            while pending:
+                results.append(self._wait_for_reply(pending.popleft(), timeout))
+        except Exception:
+            for consumer in pending:
+                self.unregister_consumer(consumer)
+            raise
+        return results
+
+    def submit(self, command, fields):
+        # type: (CoreCommandSpec, Dict[str, Any]) -> Consumer
+        """
+        Send a command over the serial port without waiting for the answer.
+
+        :param command: specification of the command to execute
+        :param fields: A dictionary with the command input field values
+        :returns: the Consumer that will receive the answer
+        """
         cid = self._get_cid()
         consumer = Consumer(command, cid)
         command = consumer.command
@@ -240,10 +285,14 @@ class CoreCommunicator(object):
         except Exception:
             self.discard_cid(cid)
             raise
+        return consumer
 
+    def _wait_for_reply(self, consumer, timeout):
+        # type: (Consumer, Union[T_co, int]) -> Union[T_co, Dict[str, Any]]
+        command = consumer.command
         try:
             result = None  # type: Any
-            if isinstance(consumer, Consumer) and timeout is not None:
+            if timeout is not None:
                 result = consumer.get(timeout)
             self._last_success = time.time()
             self._communication_stats['calls_succeeded'].append(time.time())
@@ -303,113 +352,71 @@ class CoreCommunicator(object):
         Response format: 'RTR' + {CID, 1 byte} + {command, 2 bytes} + {length, 2 bytes} + {payload, `length` bytes} + 'C' + {checksum, 1 byte} + '\r\n'
 
         """
-        data = bytearray()
-        message_length = None
-        header_fields = None
-        header_length = len(CoreCommunicator.START_OF_REPLY) + 1 + 2 + 2  # RTR + CID (1 byte) + command (2 bytes) + length (2 bytes)
-        footer_length = 1 + 1 + len(CoreCommunicator.END_OF_REPLY)  # 'C' + checksum (1 byte) + \r\n
-        need_more_data = False
-
+        decoder = FrameDecoder()
         while not self._stop:
             try:
-                # Wait for data if more data is expected
-                if need_more_data:
+                # Wait for data
+                num_bytes = self._serial.inWaiting()
+                if num_bytes == 0:
                     readers, _, _ = select.select([self._serial], [], [], 1)
                     if not readers:
                         continue
-                    need_more_data = False
-
-                # Read what's now on the serial port
-                num_bytes = self._serial.inWaiting()
-                if num_bytes > 0:
-                    data += self._serial.read(num_bytes)
-                    # Update counters
-                    self._serial_bytes_read += num_bytes
-                    self._communication_stats['bytes_read'] += num_bytes
-
-                # Wait for the full message, or the header length
-                min_length = message_length or header_length
-                if len(data) < min_length:
-                    need_more_data = True
-                    continue
-
-                if message_length is None:
-                    # Check if the data contains the START_OF_REPLY
-                    if CoreCommunicator.START_OF_REPLY not in data:
-                        need_more_data = True
+                    num_bytes = self._serial.inWaiting()
+                    if num_bytes == 0:
                         continue
 
-                    # Align with START_OF_REPLY
-                    if not data.startswith(CoreCommunicator.START_OF_REPLY):
-                        data = CoreCommunicator.START_OF_REPLY + data.split(CoreCommunicator.START_OF_REPLY, 1)[-1]
-                        if len(data) < header_length:
-                            continue
-
-                    header_fields = CoreCommunicator._parse_header(data)
-                    message_length = header_fields['length'] + header_length + footer_length
-
-                    # If not all data is present, wait for more data
-                    if len(data) < message_length:
-                        continue
-
-                message = data[:message_length]  # type: bytearray
-                data = data[message_length:]
-
-                # A possible message is received, log where appropriate
-                if self._verbose:
-                    logger.debug('Reading from Core serial: {0}'.format(printable(message)))
-                threshold = time.time() - self._debug_buffer_duration
-                self._debug_buffer['read'][time.time()] = message
-                for t in self._debug_buffer['read'].keys():
-                    if t < threshold:
-                        del self._debug_buffer['read'][t]
-
-                # Validate message boundaries
-                correct_boundaries = message.startswith(CoreCommunicator.START_OF_REPLY) and message.endswith(CoreCommunicator.END_OF_REPLY)
-                if not correct_boundaries:
-                    logger.info('Unexpected boundaries: {0}'.format(printable(message)))
-                    # Reset, so we'll wait for the next RTR
-                    message_length = None
-                    data = message[3:] + data  # Strip the START_OF_REPLY, and restore full data
-                    continue
-
-                # Validate message CRC
-                crc = bytearray([message[-3]])
-                payload = message[8:-4]  # type: bytearray
-                checked_payload = message[3:-4]  # type: bytearray
-                expected_crc = CoreCommunicator._calculate_crc(checked_payload)
-                if crc != expected_crc:
-                    logger.info('Unexpected CRC ({0} vs expected {1}): {2}'.format(crc, expected_crc, printable(checked_payload)))
-                    # Reset, so we'll wait for the next RTR
-                    message_length = None
-                    data = message[3:] + data  # Strip the START_OF_REPLY, and restore full data
-                    continue
-
-                # A valid message is received, reliver it to the correct consumer
-                consumers = self._consumers.get(header_fields['hash'], [])
-                for consumer in consumers[:]:
-                    if self._verbose:
-                        logger.debug('Delivering payload to consumer {0}.{1}: {2}'.format(header_fields['command'], header_fields['cid'], printable(payload)))
-                    consumer.consume(payload)
-                    if isinstance(consumer, Consumer):
-                        self.unregister_consumer(consumer)
-
-                self.discard_cid(header_fields['cid'])
-
-                # Message processed, cleaning up
-                message_length = None
+                # Read what's now on the serial port
+                data = self._serial.read(num_bytes)
+                self._serial_bytes_read += num_bytes
+                self._communication_stats['bytes_read'] += num_bytes
+
+                for frame in decoder.feed(data):
+                    try:
+                        self._process_frame(frame)
+                    except Exception:
+                        logger.exception('Unexpected exception processing Core frame {0}'.format(frame))
             except Exception:
                 logger.exception('Unexpected exception at Core read thread')
-                data = bytearray()
-                message_length = None
+                decoder.reset()
 
-    @staticmethod
-    def _parse_header(data):  # type: (bytearray) -> Dict[str, Union[int, bytearray]]
-        base = len(CoreCommunicator.START_OF_REPLY)
-        return {'cid': data[base],
-                'command': data[base + 1:base + 3],
-                'hash': Toolbox.hash(data[:base + 3]),
-                'length': struct.unpack('>H', data[base + 3:base + 5])[0]}
+    def _process_frame(self, frame):  # type: (Frame) -> None
+        """ Delivers a valid frame to the correct consumer(s) """
+        if self._verbose:
+            logger.debug('Reading from Core serial: {0}'.format(printable(frame.message)))
+        self._log_debug_buffer(self._debug_buffer['read'], frame.message)
+
+        consumers = self._consumers.get(frame.hash, [])
+        for consumer in consumers[:]:
+            if self._verbose:
+                logger.debug('Delivering payload to consumer {0}.{1}: {2}'.format(frame.command, frame.cid, printable(frame.payload)))
+            consumer.consume(frame.payload)
+            if isinstance(consumer, Consumer):
+                self.unregister_consumer(consumer)
+                self._record_latency(consumer)
+
+        self.discard_cid(frame.cid)
+
+    def _record_latency(self, consumer):  # type: (Consumer) -> None
+        """ Keeps a per-instruction histogram of the time between sending a command and receiving its answer """
+        latency = (time.time() - consumer.sent_at) * 1000.0
+        label = '>{0}ms'.format(CoreCommunicator.LATENCY_BUCKETS[-1])
+        for bucket in CoreCommunicator.LATENCY_BUCKETS:
+            if latency <= bucket:
+                label = '<={0}ms'.format(bucket)
+                break
+        histogram = self._command_latency_histogram.setdefault(str(consumer.command.instruction), Counter())
+        histogram.update({label: 1})
+
+    def _log_debug_buffer(self, buffer, data):  # type: (Dict[float, bytearray], bytearray) -> None
+        """ Adds data to a debug buffer, dropping the entries that are older than the buffer duration """
+        now = time.time()
+        threshold = now - self._debug_buffer_duration
+        buffer[now] = data
+        while buffer:
+            oldest = next(iter(buffer))
+            if oldest >= threshold:
+                break
+            del buffer[oldest]
 
 
 class Consumer(object):
@@ -421,6 +428,7 @@ class Consumer(object):
     def __init__(self, command, cid):  # type: (CoreCommandSpec, int) -> None
         self.cid = cid
         self.command = command
+        self.sent_at = time.time()
         self._queue = Queue()  # type: Queue[Dict[str, Any]]
 
     def get_hash(self):  # type: () -> int
@@ -0,0 +1,166 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Incremental decoder for the Core serial reply stream.
+"""
+
+from __future__ import absolute_import
+
+import logging
+import struct
+
+from master.core.toolbox import Toolbox
+from serial_utils import printable
+
+if False:  # MYPY
+    from typing import Dict, List, Optional
+
+logger = logging.getLogger('gateway.master.core')
+
+
+class Frame(object):
+    """ A single validated reply frame received from the Core """
+
+    __slots__ = ['cid', 'command', 'hash', 'payload', 'message']
+
+    def __init__(self, cid, command, hash, payload, message):
+        # type: (int, bytearray, int, bytearray, bytearray) -> None
+        self.cid = cid
+        self.command = command
+        self.hash = hash
+        self.payload = payload
+        self.message = message
+
+    def __repr__(self):
+        # type: () -> str
+        return '<Frame {0}.{1}: {2}>'.format(self.command, self.cid, printable(self.payload))
+
+
+class FrameDecoder(object):
+    """
+    Resumable state machine that turns an arbitrary chunked byte stream into Core reply frames.
+
+    Reply format: 'RTR' + {CID, 1 byte} + {command, 2 bytes} + {length, 2 bytes} + {payload, `length` bytes} + 'C' + {checksum, 1 byte} + '\r\n'
+
+    Incoming bytes are appended to a single buffer that is consumed through a read offset. The buffer
+    is only compacted once the consumed part dominates it, so appending and consuming are amortized O(1)
+    and scanning for the next START_OF_REPLY never restarts at the beginning of the buffer. A parsed
+    header is remembered between calls, so partial frames are not parsed twice.
+    """
+
+    START_OF_REPLY = bytearray(b'RTR')
+    END_OF_REPLY = bytearray(b'\r\n')
+    HEADER_LENGTH = 3 + 1 + 2 + 2  # RTR + CID (1 byte) + command (2 bytes) + length (2 bytes)
+    FOOTER_LENGTH = 1 + 1 + 2  # 'C' + checksum (1 byte) + \r\n
+    COMPACT_THRESHOLD = 4096
+
+    def __init__(self):
+        # type: () -> None
+        self._buffer = bytearray()
+        self._offset = 0
+        self._frame_length = None  # type: Optional[int]
+        self.stats = {'frames': 0,
+                      'invalid_boundaries': 0,
+                      'invalid_crc': 0,
+                      'discarded_bytes': 0}  # type: Dict[str, int]
+
+    def reset(self):
+        # type: () -> None
+        """ Drops all buffered data, e.g. after an unexpected error. """
+        self._buffer = bytearray()
+        self._offset = 0
+        self._frame_length = None
+
+    @property
+    def pending(self):
+        # type: () -> int
+        """ Amount of buffered bytes that are not yet consumed """
+        return len(self._buffer) - self._offset
+
+    def feed(self, data):
+        # type: (bytearray) -> List[Frame]
+        """
+        Adds data to the buffer and returns all frames that became complete.
+
+        :param data: bytes as read from the serial port
+        :returns: list of valid frames, in order of arrival
+        """
+        if self._offset == len(self._buffer):
+            del self._buffer[:]
+            self._offset = 0
+        elif self._offset > FrameDecoder.COMPACT_THRESHOLD and self._offset * 2 > len(self._buffer):
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer += data
+        frames = []
+        while True:
+            frame = self._decode()
+            if frame is None:
+                return frames
+            frames.append(frame)
+
+    def _resync(self, start):
+        # type: (int) -> None
+        """ Skips the START_OF_REPLY at `start`, so the next search starts right after it """
+        self._offset = start + len(FrameDecoder.START_OF_REPLY)
+        self._frame_length = None
+
+    def _decode(self):
+        # type: () -> Optional[Frame]
+        """ Returns the next valid frame, or None if more data is needed """
+        buffer = self._buffer
+        while True:
+            start = self._offset
+            if self._frame_length is None:
+                position = buffer.find(FrameDecoder.START_OF_REPLY, start)
+                if position == -1:
+                    # Keep the bytes that could still be the beginning of a START_OF_REPLY
+                    keep_from = max(start, len(buffer) - len(FrameDecoder.START_OF_REPLY) + 1)
+                    self.stats['discarded_bytes'] += keep_from - start
+                    self._offset = keep_from
+                    return None
+                self.stats['discarded_bytes'] += position - start
+                self._offset = start = position
+                if len(buffer) - start < FrameDecoder.HEADER_LENGTH:
+                    return None
+                length = struct.unpack_from('>H', buffer, start + 6)[0]
+                self._frame_length = FrameDecoder.HEADER_LENGTH + length + FrameDecoder.FOOTER_LENGTH
+            end = start + self._frame_length
+            if len(buffer) < end:
+                return None
+
+            if buffer[end - 2] != FrameDecoder.END_OF_REPLY[0] or buffer[end - 1] != FrameDecoder.END_OF_REPLY[1]:
+                self.stats['invalid_boundaries'] += 1
+                logger.info('Unexpected boundaries: {0}'.format(printable(buffer[start:end])))
+                self._resync(start)
+                continue
+
+            payload = buffer[start + FrameDecoder.HEADER_LENGTH:end - FrameDecoder.FOOTER_LENGTH]
+            crc = (sum(buffer[i] for i in range(start + 3, start + FrameDecoder.HEADER_LENGTH)) + sum(payload)) % 256
+            if buffer[end - 3] != crc:
+                self.stats['invalid_crc'] += 1
+                logger.info('Unexpected CRC ({0} vs expected {1}): {2}'.format(buffer[end - 3], crc, printable(buffer[start + 3:end - 4])))
+                self._resync(start)
+                continue
+
+            message = buffer[start:end]
+            self._offset = end
+            self._frame_length = None
+            self.stats['frames'] += 1
+            return Frame(cid=message[3],
+                         command=message[4:6],
+                         hash=Toolbox.hash(message[:6]),
+                         payload=payload,
+                         message=message)
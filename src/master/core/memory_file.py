@@ -19,7 +19,8 @@ from __future__ import absolute_import
 
 import logging
 import time
-from threading import Lock, Event as ThreadingEvent
+from contextlib import contextmanager
+from threading import Lock, RLock, current_thread, Event as ThreadingEvent
 
 from gateway.hal.master_event import MasterEvent
 from gateway.pubsub import PubSub
@@ -31,7 +32,7 @@ from master.core.events import Event
 from master.core.memory_types import MemoryAddress
 
 if False:  # MYPY
-    from typing import List, Dict, Callable, Any, Optional, Tuple, Set
+    from typing import List, Dict, Callable, Any, Iterator, Optional, Tuple, Set
 
 logger = logging.getLogger("openmotics")
 
@@ -43,13 +44,11 @@ class MemoryTypes(object):
 
 class MemoryFile(object):
 
-    # TODO:
-    #  * Create a virtual transaction so that e.g. per API call all data is written consistently
-
     WRITE_TIMEOUT = 5
     READ_TIMEOUT = 5
     ACTIVATE_TIMEOUT = 5
     FRAM_TIMEOUT = 5
+    READ_CHUNK_SIZE = 32
     WRITE_CHUNK_SIZE = 32
     SIZES = {MemoryTypes.EEPROM: (512, 256),
              MemoryTypes.FRAM: (128, 256)}
@@ -70,10 +69,16 @@ class MemoryFile(object):
         self._fram_cache = {}  # type: Dict[int, Tuple[float, bytearray]]
 
         # The write cache is a per-type cache of all changes that need to be written that has the page
-        # as key, and a list of tuples as value, where the tuples holds the start byte and contents
+        # as key, and a DirtyPage as value, holding the page contents and which bytes were changed
         self._write_cache = {MemoryTypes.EEPROM: {},
-                             MemoryTypes.FRAM: {}}  # type: Dict[str, Dict[int, Dict[int, int]]]
+                             MemoryTypes.FRAM: {}}  # type: Dict[str, Dict[int, DirtyPage]]
         self._write_lock = Lock()
+        # Held during a transaction, so writes and activations of other threads wait until it's finished
+        self._transaction_lock = RLock()
+        self._transaction_depth = 0
+        self._transaction_thread = None  # type: Any
+        self._transaction_rollback = None  # type: Optional[Tuple[Dict[str, Dict[int, DirtyPage]], bool]]
+        self._activation_requested = False
 
         self._eeprom_change_callback = None  # type: Optional[Callable[[], None]]
         self._self_activated = False
@@ -110,85 +115,152 @@ class MemoryFile(object):
     def read(self, addresses):  # type: (List[MemoryAddress]) -> Dict[MemoryAddress, bytearray]
         read_map = MemoryFile._create_read_map(addresses)
         raw_data = self._load_data(read_map)
+        self._apply_pending_writes(raw_data)
         data = {}
         for address in addresses:
             # No need to copy, as bytearray.slice doesn't return references
             data[address] = raw_data[address.memory_type][address.page][address.offset:address.offset + address.length]
         return data
 
+    def prefetch(self, addresses):  # type: (List[MemoryAddress]) -> None
+        """
+        Loads all pages of the given addresses that are not yet cached in a single pipelined burst,
+        so e.g. a full configuration load doesn't wait for the Core on every page.
+        """
+        self._load_data(MemoryFile._create_read_map(addresses))
+
     def _load_data(self, read_map):
         # type: (Dict[str, Set[int]]) -> Dict[str, Dict[int, bytearray]]
         raw_data = {MemoryTypes.EEPROM: {},
                     MemoryTypes.FRAM: {}}  # type: Dict[str, Dict[int, bytearray]]
-        for page in read_map.get(MemoryTypes.EEPROM, set()):
-            if page not in self._eeprom_cache:
-                self._eeprom_cache[page] = self._read_data(MemoryTypes.EEPROM, page)
+        eeprom_pages = read_map.get(MemoryTypes.EEPROM, set())
+        missing_pages = [page for page in eeprom_pages if page not in self._eeprom_cache]
+        self._eeprom_cache.update(self._read_pages(MemoryTypes.EEPROM, missing_pages))
+        for page in eeprom_pages:
             raw_data[MemoryTypes.EEPROM][page] = self._eeprom_cache[page]
         time_limit = time.time() - MemoryFile.FRAM_TIMEOUT
-        for page in read_map.get(MemoryTypes.FRAM, set()):
-            if page not in self._fram_cache or self._fram_cache[page][0] < time_limit:
-                self._fram_cache[page] = (time.time(), self._read_data(MemoryTypes.FRAM, page))
+        fram_pages = read_map.get(MemoryTypes.FRAM, set())
+        missing_pages = [page for page in fram_pages if page not in self._fram_cache or self._fram_cache[page][0] < time_limit]
+        now = time.time()
+        for page, page_data in self._read_pages(MemoryTypes.FRAM, missing_pages).items():
+            self._fram_cache[page] = (now, page_data)
+        for page in fram_pages:
             raw_data[MemoryTypes.FRAM][page] = self._fram_cache[page][1]
         return raw_data
 
-    def _read_data(self, memory_type, page):
-        page_data = bytearray()
-        for i in range(MemoryFile.SIZES[memory_type][1] // 32):
-            page_data += self._core_communicator.do_command(
-                command=CoreAPI.memory_read(),
-                fields={'type': memory_type, 'page': page, 'start': i * 32, 'length': 32},
-                timeout=MemoryFile.READ_TIMEOUT
-            )['data']
-        return page_data
+    def _apply_pending_writes(self, raw_data):  # type: (Dict[str, Dict[int, bytearray]]) -> None
+        """
+        Overlays the pending writes on the loaded pages, so e.g. a save that reads data changed earlier in the
+        same transaction sees those changes. Changes of a transaction aren't visible to other threads.
+        """
+        if self._transaction_depth > 0 and self._transaction_thread is not current_thread():
+            return
+        with self._write_lock:
+            for memory_type, pages in raw_data.items():
+                for page in pages:
+                    dirty_page = self._write_cache[memory_type].get(page)
+                    if dirty_page is not None:
+                        pages[page] = dirty_page.apply(pages[page])
+
+    def _read_pages(self, memory_type, pages):  # type: (str, List[int]) -> Dict[int, bytearray]
+        """ Reads complete pages, pipelining the reads of all pages """
+        if not pages:
+            return {}
+        command = CoreAPI.memory_read()
+        reads_per_page = MemoryFile.SIZES[memory_type][1] // MemoryFile.READ_CHUNK_SIZE
+        pages = sorted(pages)
+        results = self._core_communicator.do_commands(
+            commands=[(command, {'type': memory_type, 'page': page, 'start': i * MemoryFile.READ_CHUNK_SIZE, 'length': MemoryFile.READ_CHUNK_SIZE})
+                      for page in pages
+                      for i in range(reads_per_page)],
+            timeout=MemoryFile.READ_TIMEOUT
+        )
+        data = {}  # type: Dict[int, bytearray]
+        for index, page in enumerate(pages):
+            page_data = bytearray()
+            for result in results[index * reads_per_page:(index + 1) * reads_per_page]:
+                page_data += result['data']
+            data[page] = page_data
+        return data
 
     def write(self, data_map):  # type: (Dict[MemoryAddress, bytearray]) -> None
-        with self._write_lock:
+        with self._transaction_lock, self._write_lock:
             for address, data in data_map.items():
-                page_cache = self._write_cache[address.memory_type].setdefault(address.page, {})
-                for index, data_byte in enumerate(data):
-                    page_cache[address.offset + index] = data_byte
+                page_cache = self._write_cache[address.memory_type].get(address.page)
+                if page_cache is None:
+                    page_cache = DirtyPage(MemoryFile.SIZES[address.memory_type][1])
+                    self._write_cache[address.memory_type][address.page] = page_cache
+                page_cache.write(address.offset, data)
+
+    @contextmanager
+    def transaction(self):  # type: () -> Iterator[None]
+        """
+        Groups all writes and activations (e.g. of a batch of saved configurations) so the changes are written
+        and activated once, when the (outermost) transaction is finished. When the transaction fails, the pending
+        changes are discarded. Transactions can be nested.
+        """
+        with self._transaction_lock:
+            if self._transaction_depth == 0:
+                self._transaction_thread = current_thread()
+                with self._write_lock:
+                    self._transaction_rollback = ({memory_type: dict((page, dirty_page.copy()) for page, dirty_page in type_data.items())
+                                                   for memory_type, type_data in self._write_cache.items()},
+                                                  self._activation_requested)
+            self._transaction_depth += 1
+            try:
+                yield
+            except Exception:
+                if self._transaction_depth == 1:
+                    logger.warning('MEMORY: Transaction failed, discarding changes')
+                    self._discard_writes()
+                raise
+            finally:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    self._transaction_thread = None
+                    self._transaction_rollback = None
+            if self._transaction_depth == 0 and self._activation_requested:
+                self.activate()
+
+    def _discard_writes(self):  # type: () -> None
+        """ Discards the writes of the running transaction, keeping the changes that were pending before it started """
+        with self._write_lock:
+            if self._transaction_rollback is None:
+                return
+            self._write_cache, self._activation_requested = self._transaction_rollback
 
     def _store_data(self):  # type: () -> bool
         data_written = False
         for memory_type, type_data in self._write_cache.items():
-            for page, page_data in type_data.items():
-                byte_numbers = list(page_data.keys())
-                while len(byte_numbers) > 0:
-                    # Get contiguous series of bytes
-                    start = min(byte_numbers)
-                    end = max(byte_numbers)
-                    data = bytearray()
-                    for byte_number in range(start, end + 1):
-                        if byte_number in page_data:
-                            data.append(page_data[byte_number])
-                            byte_numbers.remove(byte_number)
-                        else:
-                            break
+            for page in sorted(type_data):
+                cached_page = None
+                if memory_type == MemoryTypes.EEPROM:
+                    cached_page = self._eeprom_cache.get(page)
+                for start, data in type_data[page].get_runs(MemoryFile.WRITE_CHUNK_SIZE):
                     # Compare with cache (is anything changed)
-                    if memory_type == MemoryTypes.EEPROM:
-                        cached_data = None
-                        if page in self._eeprom_cache:
-                            cached_data = self._eeprom_cache[page][start:start + len(data)]
-                        if data == cached_data:
-                            continue
-                    # Write in chuncks
-                    for i in range(0, len(data), MemoryFile.WRITE_CHUNK_SIZE):
-                        chunck = data[i:i + MemoryFile.WRITE_CHUNK_SIZE]
-                        logger.info('MEMORY.{0}: Write P{1} S{2} D[{3}]'.format(memory_type, page, start, ' '.join(str(b) for b in chunck)))
-                        self._core_communicator.do_command(
-                            command=CoreAPI.memory_write(len(chunck)),
-                            fields={'type': memory_type, 'page': page, 'start': start, 'data': chunck},
-                            timeout=MemoryFile.WRITE_TIMEOUT
-                        )
-                        data_written = True
+                    if cached_page is not None and cached_page[start:start + len(data)] == data:
+                        continue
+                    logger.info('MEMORY.{0}: Write P{1} S{2} D[{3}]'.format(memory_type, page, start, ' '.join(str(b) for b in data)))
+                    self._core_communicator.do_command(
+                        command=CoreAPI.memory_write(len(data)),
+                        fields={'type': memory_type, 'page': page, 'start': start, 'data': data},
+                        timeout=MemoryFile.WRITE_TIMEOUT
+                    )
+                    data_written = True
                     # Cache updated values
-                    if memory_type == MemoryTypes.EEPROM:
-                        if page in self._eeprom_cache:
-                            for index, data_byte in enumerate(data):
-                                self._eeprom_cache[page][start + index] = data_byte
+                    if cached_page is not None:
+                        cached_page[start:start + len(data)] = data
         return data_written
 
     def activate(self):  # type: () -> None
+        with self._transaction_lock:
+            if self._transaction_depth > 0:
+                self._activation_requested = True  # Postponed until the end of the transaction
+                return
+            self._activation_requested = False
+            self._activate()
+
+    def _activate(self):  # type: () -> None
         with self._write_lock:
             logger.info('MEMORY: Writing')
             data_written = self._store_data()
@@ -208,3 +280,47 @@ class MemoryFile(object):
             self._eeprom_cache.pop(page, None)
         for page in range(MemoryFile.SIZES[MemoryTypes.FRAM][0]):
             self._fram_cache.pop(page, None)
+
+
+class DirtyPage(object):
+    """
+    Holds the pending changes of a single memory page. A bitmap keeps track of the bytes that
+    were written, so the contiguous runs can be found without sorting or searching byte numbers.
+    """
+
+    __slots__ = ['data', 'bitmap']
+
+    def __init__(self, length):  # type: (int) -> None
+        self.data = bytearray(length)
+        self.bitmap = 0
+
+    def write(self, offset, data):  # type: (int, bytearray) -> None
+        self.data[offset:offset + len(data)] = data
+        self.bitmap |= ((1 << len(data)) - 1) << offset
+
+    def copy(self):  # type: () -> DirtyPage
+        dirty_page = DirtyPage(len(self.data))
+        dirty_page.data[:] = self.data
+        dirty_page.bitmap = self.bitmap
+        return dirty_page
+
+    def apply(self, page_data):  # type: (bytearray) -> bytearray
+        """ Returns a copy of the given page contents, with the written bytes applied """
+        page_data = bytearray(page_data)
+        for offset, data in self.get_runs(len(page_data)):
+            page_data[offset:offset + len(data)] = data
+        return page_data
+
+    def get_runs(self, max_length):  # type: (int) -> List[Tuple[int, bytearray]]
+        """ Splits the written bytes in maximal contiguous runs of at most `max_length` bytes """
+        runs = []
+        bitmap = self.bitmap
+        while bitmap:
+            start = (bitmap & -bitmap).bit_length() - 1  # Lowest set bit
+            shifted = bitmap >> start
+            length = (~shifted & (shifted + 1)).bit_length() - 1  # Amount of consecutive set bits
+            bitmap &= ~(((1 << length) - 1) << start)
+            end = start + length
+            for offset in range(start, end, max_length):
+                runs.append((offset, self.data[offset:min(offset + max_length, end)]))
+        return runs
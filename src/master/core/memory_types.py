@@ -41,56 +41,56 @@ class MemoryModelDefinition(object):
 
     _cache_fields = {}  # type: Dict[str,Any]
     _cache_addresses = {}  # type: Dict[str,Any]
+    _cache_layouts = {}  # type: Dict[type, MemoryModelLayout]
     _cache_lock = Lock()
 
     @Inject
     def __init__(self, id, memory_file=INJECTED, verbose=False):  # type: (Optional[int], MemoryFile, bool) -> None
+        layout = self.__class__._get_layout()
         self._id = id
-        self._id_field = self.__class__._get_id_field()  # TODO: Make sure that an id field is mandatory for id-lookups
+        self._id_field = layout.id_field  # TODO: Make sure that an id field is mandatory for id-lookups
         if self._id_field is not None:
             if id is None:
                 raise RuntimeError('An id is mandatory')
             self._id_field.validate(self.__class__.__name__, id)
-            setattr(self.__class__, 'id', property(lambda s: s._id))
         self._verbose = verbose
         self._memory_file = memory_file
-        self._fields = []  # type: List[str]
+        self._fields = layout.field_names
         self._loaded_fields = set()  # type: Set[str]
-        self._relations = []  # type: List[str]
+        self._relations = layout.relation_names
         self._relations_cache = {}  # type: Dict[str, MemoryModelDefinition]
-        self._compositions = []  # type: List[str]
+        self._compositions = layout.composition_names
+        self._data_loaded = False
         address_cache = self.__class__._get_address_cache(self._id)
-        for field_name, field_type in self.__class__._get_field_dict().items():
+        for field_name, field_type in layout.fields:
             memory_field_container = MemoryFieldContainer(name=field_name,
                                                           memory_field=field_type,
-                                                          memory_address=address_cache[field_name])
+                                                          memory_address=address_cache[field_name],
+                                                          memory_file=memory_file)
             if field_type._checksum is not None:
                 memory_field_container.set_checksum_container(MemoryChecksumContainer(check=field_type._checksum._check,
                                                                                       field_container=MemoryFieldContainer(name=field_name,
                                                                                                                            memory_field=field_type._checksum._field,
-                                                                                                                           memory_address=field_type._checksum._field.get_address(self._id)),
+                                                                                                                           memory_address=field_type._checksum._field.get_address(self._id),
+                                                                                                                           memory_file=memory_file),
                                                                                       default=field_type._checksum._default))
             setattr(self, '_{0}'.format(field_name), memory_field_container)
-            self._add_property(field_name)
-            self._fields.append(field_name)
-        for field_name, relation in self.__class__._get_relational_fields().items():
+        for field_name, relation in layout.relations:
             relation_container = MemoryRelationContainer(instance_type=relation._instance_type,
                                                          id_spec=relation._id_spec)
             if relation._field is not None:
                 relation_container.set_field_container(MemoryFieldContainer(name=field_name,
                                                                             memory_field=relation._field,
-                                                                            memory_address=relation._field.get_address(self._id)))
+                                                                            memory_address=relation._field.get_address(self._id),
+                                                                            memory_file=memory_file))
             setattr(self, '_{0}'.format(field_name), relation_container)
-            self._add_relation(field_name)
-            self._relations.append(field_name)
-        for field_name, composition in self.__class__._get_composite_fields().items():
+        for field_name, composition in layout.compositions:
             setattr(self, '_{0}'.format(field_name), CompositionContainer(composite_definition=composition,
                                                                           composition_width=composition._field.length * 8,
                                                                           field_container=MemoryFieldContainer(name=field_name,
                                                                                                                memory_field=composition._field,
-                                                                                                               memory_address=composition._field.get_address(self._id))))
-            self._add_composition(field_name)
-            self._compositions.append(field_name)
+                                                                                                               memory_address=composition._field.get_address(self._id),
+                                                                                                               memory_file=memory_file)))
 
     def __str__(self):
         return str(json.dumps(self.serialize(), indent=4))
@@ -99,6 +99,7 @@ class MemoryModelDefinition(object):
         return str(self)
 
     def serialize(self):  # type: () -> Dict[str, Any]
+        self._load_data()
         data = {}
         if self._id is not None:
             data['id'] = self._id
@@ -108,12 +109,35 @@ class MemoryModelDefinition(object):
             data[field_name] = getattr(self, field_name).serialize()
         return data
 
-    def _add_property(self, field_name):  # type: (str) -> None
-        setattr(self.__class__, '_{0}'.format(field_name), getattr(self, '_{0}'.format(field_name))._memory_field)
-        setattr(self.__class__, field_name, property(lambda s: s._get_property(field_name),
-                                                     lambda s, v: s._set_property(field_name, v)))
+    def _load_data(self):  # type: () -> None
+        """
+        Reads the data of all fields (including checksums, compositions and relation fields) that is not
+        yet known in a single pass, instead of a memory read for every field.
+        """
+        if self._data_loaded:
+            return
+        self._data_loaded = True
+        containers = []  # type: List[MemoryFieldContainer]
+        for field_name in self._fields:
+            container = getattr(self, '_{0}'.format(field_name))  # type: MemoryFieldContainer
+            containers.append(container)
+            if container._checksum_container is not None:
+                containers.append(container._checksum_container._field_container)
+        for field_name in self._compositions:
+            containers.append(getattr(self, '_{0}'.format(field_name))._field_container)
+        for field_name in self._relations:
+            relation_container = getattr(self, '_{0}'.format(field_name))  # type: MemoryRelationContainer
+            if relation_container._field_container is not None:
+                containers.append(relation_container._field_container)
+        containers = [container for container in containers if container._data is None]
+        if not containers:
+            return
+        data = self._memory_file.read([container._memory_address for container in containers])
+        for container in containers:
+            container._data = data[container._memory_address]
 
     def _get_property(self, field_name):  # type: (str) -> Any
+        self._load_data()
         self._loaded_fields.add(field_name)
         field = getattr(self, '_{0}'.format(field_name))  # type: MemoryFieldContainer
         return field.decode()
@@ -123,19 +147,15 @@ class MemoryModelDefinition(object):
         field = getattr(self, '_{0}'.format(field_name))  # type: MemoryFieldContainer
         field.encode(value)
 
-    def _add_relation(self, field_name):  # type: (str) -> None
-        setattr(self.__class__, field_name, property(lambda s: s._get_relation(field_name)))
-
     def _get_relation(self, field_name):  # type: (str) -> MemoryModelDefinition
         if field_name not in self._relations_cache:
+            self._load_data()
             relation = getattr(self, '_{0}'.format(field_name))
             self._relations_cache[field_name] = relation.yield_instance(self._id)
         return self._relations_cache[field_name]
 
-    def _add_composition(self, field_name):  # type: (str) -> None
-        setattr(self.__class__, field_name, property(lambda s: s._get_composition(field_name)))
-
     def _get_composition(self, field_name):  # type: (str) -> CompositionContainer
+        self._load_data()
         self._loaded_fields.add(field_name)
         return getattr(self, '_{0}'.format(field_name))
 
@@ -171,6 +191,29 @@ class MemoryModelDefinition(object):
                 raise ValueError('Unknown field: {0}', field_name)
         return instance
 
+    @classmethod
+    def get_addresses(cls, ids):  # type: (List[int]) -> List[MemoryAddress]
+        """ Returns the addresses of all fields (including relations) of the given instances, e.g. to prefetch them """
+        relations = cls._get_relational_fields()
+        compositions = cls._get_composite_fields()
+        addresses = []  # type: List[MemoryAddress]
+        checksum_fields = [field_type._checksum._field for field_type in cls._get_field_dict().values()
+                           if field_type._checksum is not None]
+        for id in ids:
+            addresses += cls._get_address_cache(id).values()
+            for checksum_field in checksum_fields:
+                addresses.append(checksum_field.get_address(id))
+            for composition in compositions.values():
+                addresses.append(composition._field.get_address(id))
+            for relation in relations.values():
+                if relation._field is not None:
+                    addresses.append(relation._field.get_address(id))
+                    continue
+                relation_id = relation._id_spec(id)
+                if relation_id is not None:
+                    addresses += relation._instance_type.get_addresses([relation_id])
+        return addresses
+
     @classmethod
     def _get_fields(cls):  # type: () -> Dict[str, Any]
         """ Get the fields defined by an EepromModel child. """
@@ -182,6 +225,47 @@ class MemoryModelDefinition(object):
                                                                  'compositions': inspect.getmembers(cls, lambda f: isinstance(f, CompositeMemoryModelDefinition))}
         return MemoryModelDefinition._cache_fields[cls.__name__]
 
+    @classmethod
+    def _get_layout(cls):  # type: () -> MemoryModelLayout
+        """
+        Gets the compiled layout of the model. The first time, the properties to access the
+        fields are installed on the class, so this doesn't need to happen for every instance.
+        """
+        layout = MemoryModelDefinition._cache_layouts.get(cls)
+        if layout is not None:
+            return layout
+        with MemoryModelDefinition._cache_lock:
+            if cls in MemoryModelDefinition._cache_layouts:
+                return MemoryModelDefinition._cache_layouts[cls]
+            layout = MemoryModelLayout(id_field=cls._get_id_field(),
+                                       fields=sorted(cls._get_field_dict().items()),
+                                       relations=sorted(cls._get_relational_fields().items()),
+                                       compositions=sorted(cls._get_composite_fields().items()))
+            if layout.id_field is not None:
+                setattr(cls, 'id', property(lambda s: s._id))
+            for field_name, field_type in layout.fields:
+                cls._add_property(field_name, field_type)
+            for field_name in layout.relation_names:
+                cls._add_relation(field_name)
+            for field_name in layout.composition_names:
+                cls._add_composition(field_name)
+            MemoryModelDefinition._cache_layouts[cls] = layout
+        return layout
+
+    @classmethod
+    def _add_property(cls, field_name, field_type):  # type: (str, Any) -> None
+        setattr(cls, '_{0}'.format(field_name), field_type)
+        setattr(cls, field_name, property(lambda s: s._get_property(field_name),
+                                          lambda s, v: s._set_property(field_name, v)))
+
+    @classmethod
+    def _add_relation(cls, field_name):  # type: (str) -> None
+        setattr(cls, field_name, property(lambda s: s._get_relation(field_name)))
+
+    @classmethod
+    def _add_composition(cls, field_name):  # type: (str) -> None
+        setattr(cls, field_name, property(lambda s: s._get_composition(field_name)))
+
     @classmethod
     def _get_id_field(cls):  # type: () -> Optional[IdField]
         """ Gets the classes ID field definition """
@@ -238,6 +322,22 @@ class MemoryModelDefinition(object):
         return cache
 
 
+class MemoryModelLayout(object):
+    """ The compiled definition of a model class: its id field and its (sorted) fields, relations and compositions """
+
+    __slots__ = ['id_field', 'fields', 'field_names', 'relations', 'relation_names', 'compositions', 'composition_names']
+
+    def __init__(self, id_field, fields, relations, compositions):
+        # type: (Optional[IdField], List[Tuple[str, Any]], List[Tuple[str, MemoryRelation]], List[Tuple[str, CompositeMemoryModelDefinition]]) -> None
+        self.id_field = id_field
+        self.fields = fields
+        self.field_names = [field_name for field_name, _ in fields]
+        self.relations = relations
+        self.relation_names = [field_name for field_name, _ in relations]
+        self.compositions = compositions
+        self.composition_names = [field_name for field_name, _ in compositions]
+
+
 class MemoryActivator(object):
     """ Holds a static method to activate memory """
     @staticmethod
@@ -260,6 +360,8 @@ class MemoryFieldContainer(object):
     This object holds the MemoryField and the data.
     """
 
+    __slots__ = ['_field_name', '_memory_field', '_memory_address', '_memory_file', '_data', '_checksum_container']
+
     @Inject
     def __init__(self, name, memory_field, memory_address, memory_file=INJECTED):
         # type: (str, MemoryField, MemoryAddress, MemoryFile) -> None
@@ -386,9 +488,7 @@ class MemoryStringField(MemoryField):
         return bytearray(data)
 
     def decode(self, data):  # type: (bytearray) -> str
-        while len(data) >= 1 and data[-1] in [0, 255]:
-            data.pop()
-        return ''.join([str(chr(item)) if 32 <= item <= 126 else ' ' for item in data])
+        return ''.join([str(chr(item)) if 32 <= item <= 126 else ' ' for item in data.rstrip(b'\x00\xff')])
 
 
 class MemoryByteField(MemoryField):
@@ -458,12 +558,14 @@ class MemoryWordField(MemoryField):
                                               checksum=checksum,
                                               length=2)
 
+    WORD = struct.Struct('>H')
+
     def encode(self, value, field_name):  # type: (int, str) -> bytearray
         self._check_limits(value, field_name)
-        return bytearray(struct.pack('>H', value))
+        return bytearray(MemoryWordField.WORD.pack(value))
 
     def decode(self, data):  # type: (bytearray) -> int
-        return struct.unpack('>H', data)[0]
+        return MemoryWordField.WORD.unpack_from(data)[0]
 
 
 class Memory3BytesField(MemoryField):
@@ -486,6 +588,12 @@ class _MemoryArrayField(MemoryField):
     def __init__(self, memory_type, address_spec, length, field, read_only, checksum):
         self._field = field(memory_type, address_spec)
         self._entry_length = length
+        # Arrays of plain bytes or words are decoded at once
+        self._struct = None  # type: Optional[struct.Struct]
+        if field is MemoryByteField:
+            self._struct = struct.Struct('>{0}B'.format(length))
+        elif field is MemoryWordField:
+            self._struct = struct.Struct('>{0}H'.format(length))
         super(_MemoryArrayField, self).__init__(memory_type=memory_type,
                                                 address_spec=address_spec,
                                                 length=self._field.length * self._entry_length,
@@ -503,6 +611,8 @@ class _MemoryArrayField(MemoryField):
         return data
 
     def decode(self, data):  # type: (bytearray) -> Any
+        if self._struct is not None and len(data) == self._struct.size:
+            return list(self._struct.unpack_from(data))
         result = []
         for i in range(0, len(data), self._field.length):
             result.append(self._field.decode(data[i:i + self._field.length]))
@@ -660,6 +770,8 @@ class MemoryRelation(object):
 
 
 class MemoryRelationContainer(object):
+    __slots__ = ['instance_type', '_id_spec', '_field_container']
+
     def __init__(self, instance_type, id_spec):  # type: (type, Callable[[int], int]) -> None
         self.instance_type = instance_type
         self._id_spec = id_spec
@@ -687,6 +799,8 @@ class MemoryRelationContainer(object):
 class MemoryAddress(object):
     """ Represents an address in the EEPROM/FRAM. Has a memory type, page, offset and length """
 
+    __slots__ = ['memory_type', 'page', 'offset', 'length']
+
     def __init__(self, memory_type, page, offset, length):  # type: (str, int, int, int) -> None
         self.memory_type = memory_type
         self.page = page
@@ -719,13 +833,16 @@ class MemoryChecksum(object):
 
 
 class MemoryChecksumContainer(object):
+    __slots__ = ['_check', '_field_container', '_default']
+
     def __init__(self, check, field_container, default):  # type: (str, MemoryFieldContainer, Optional[Any]) -> None
         self._check = check
         self._field_container = field_container
         self._default = default
 
     def is_valid(self, data):  # type: (bytearray) -> bool
-        self._field_container._read_data()
+        if self._field_container._data is None:
+            self._field_container._read_data()
         current_checksum = self._field_container._data
         if current_checksum is None:
             raise RuntimeError('No data was read from memory')
@@ -833,19 +950,25 @@ class CompositionContainer(object):
     This object holds the MemoryField and the data.
     """
 
+    __slots__ = ['_composite_definition', '_composition_width', '_field_container', '_fields']
+
+    _properties = set()  # type: Set[str]
+
     def __init__(self, composite_definition, composition_width, field_container):
         # type: (CompositeMemoryModelDefinition, int, MemoryFieldContainer) -> None
         self._composite_definition = composite_definition
         self._composition_width = composition_width
         self._field_container = field_container
-        self._fields = []
-        for field_name in self._composite_definition.__class__._get_field_names():
-            self._add_property(field_name)
-            self._fields.append(field_name)
-
-    def _add_property(self, field_name):  # type: (str) -> None
-        setattr(self.__class__, field_name, property(lambda s: s._get_property(field_name),
-                                                     lambda s, v: s._set_property(field_name, v)))
+        self._fields = self._composite_definition.__class__._get_field_names()
+        for field_name in self._fields:
+            if field_name not in CompositionContainer._properties:
+                CompositionContainer._add_property(field_name)
+
+    @staticmethod
+    def _add_property(field_name):  # type: (str) -> None
+        setattr(CompositionContainer, field_name, property(lambda s: s._get_property(field_name),
+                                                           lambda s, v: s._set_property(field_name, v)))
+        CompositionContainer._properties.add(field_name)
 
     def _get_property(self, field_name):  # type: (str) -> Any
         field = getattr(self._composite_definition, field_name)
@@ -256,21 +256,31 @@ class UCANPalletCommandSpec(UCANCommandSpec):
         Calculates the CRC of data. The algorithm is designed to make sure flowing statement is True:
         > crc(data + crc(data)) == 0
 
+        This is a non-reflected CRC32 (polynomial 0x04C11DB7) without final XOR, calculated a byte at
+        a time using a lookup table. Note that e.g. `zlib.crc32` uses the reflected variant, which is
+        not compatible.
+
         :param data: Data for which to calculate the CRC
         :param remainder: Optional initial remainder of CRC calculation
         :returns: CRC
         """
-        width = 32
-        topbit = 1 << (width - 1)
-        polynomial = 0x04C11DB7
+        table = _CRC32_TABLE
         for data_item in data:
-            remainder ^= data_item << (width - 8)
-            remainder &= 0xFFFFFFFF
-            for _ in range(7, -1, -1):
-                if remainder & topbit:
-                    remainder = (remainder << 1) ^ polynomial
-                    remainder &= 0xFFFFFFFF
-                else:
-                    remainder = (remainder << 1)
-                    remainder &= 0xFFFFFFFF
+            remainder = ((remainder << 8) & 0xFFFFFFFF) ^ table[(remainder >> 24) ^ data_item]
         return remainder
+
+
+def _build_crc32_table(polynomial):  # type: (int) -> List[int]
+    table = []
+    for index in range(256):
+        remainder = index << 24
+        for _ in range(8):
+            if remainder & 0x80000000:
+                remainder = ((remainder << 1) ^ polynomial) & 0xFFFFFFFF
+            else:
+                remainder = (remainder << 1) & 0xFFFFFFFF
+        table.append(remainder)
+    return table
+
+
+_CRC32_TABLE = _build_crc32_table(0x04C11DB7)
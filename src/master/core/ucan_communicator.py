@@ -40,6 +40,9 @@ class UCANCommunicator(object):
     Uses a CoreCommunicator to communicate with uCANs
     """
 
+    # A uCAN has a buffer of 8 segments, so a complete pallet can be in flight at once
+    TRANSPORT_WINDOW = 8
+
     @Inject
     def __init__(self, master_communicator=INJECTED, verbose=False):  # type: (CoreCommunicator, bool) -> None
         """
@@ -103,21 +106,23 @@ class UCANCommunicator(object):
             consumer = Consumer(cc_address, command)
         self.register_consumer(consumer)
 
-        master_timeout = False
+        transport_commands = []
         for payload in command.create_request_payloads(identity, fields):
             if self._verbose:
                 logger.info('Writing to uCAN transport:   CC {0} - SID {1} - Data: {2}'.format(cc_address, command.sid, printable(payload)))
-            try:
-                self._communicator.do_command(command=CoreAPI.ucan_tx_transport_message(),
-                                              fields={'cc_address': cc_address,
-                                                      'nr_can_bytes': len(payload),
-                                                      'sid': command.sid,
-                                                      'payload': payload + bytearray([0] * (8 - len(payload)))},
-                                              timeout=timeout)
-            except CommunicationTimedOutException as ex:
-                logger.error('Internal timeout during uCAN transport to CC {0}: {1}'.format(cc_address, ex))
-                master_timeout = True
-                break
+            transport_commands.append((CoreAPI.ucan_tx_transport_message(),
+                                       {'cc_address': cc_address,
+                                        'nr_can_bytes': len(payload),
+                                        'sid': command.sid,
+                                        'payload': payload + bytearray([0] * (8 - len(payload)))}))
+
+        master_timeout = False
+        try:
+            # The transport messages are pipelined, the Core matches the answers by their CID
+            self._communicator.do_commands(transport_commands, timeout=timeout, window=UCANCommunicator.TRANSPORT_WINDOW)
+        except CommunicationTimedOutException as ex:
+            logger.error('Internal timeout during uCAN transport to CC {0}: {1}'.format(cc_address, ex))
+            master_timeout = True
 
         try:
             if master_timeout:
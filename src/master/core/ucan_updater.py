@@ -108,13 +108,15 @@ class UCANUpdater(object):
             for i in range(4):
                 intel_hex[UCANUpdater.BOOTLOADER_START - 8 + i] = intel_hex[i]  # Copy reset vector
                 intel_hex[UCANUpdater.BOOTLOADER_START - 4 + i] = 0x0  # Reserve some space for the CRC
+            # Convert the complete application area at once, the blocks are sliced from this image
+            image = bytearray(intel_hex.tobinarray(start=UCANUpdater.APPLICATION_START, end=UCANUpdater.BOOTLOADER_START - 1))
             crc = 0
-            total_payload = bytearray()
             logged_percentage = -1
             for index, start_address in enumerate(address_blocks):
-                end_address = min(UCANUpdater.BOOTLOADER_START, start_address + UCANUpdater.MAX_FLASH_BYTES) - 1
+                end_address = min(UCANUpdater.BOOTLOADER_START, start_address + UCANUpdater.MAX_FLASH_BYTES)
 
-                payload = bytearray(intel_hex.tobinarray(start=start_address, end=end_address))
+                offset = start_address - UCANUpdater.APPLICATION_START
+                payload = image[offset:offset + end_address - start_address]
                 if start_address < address_blocks[-1]:
                     crc = UCANPalletCommandSpec.calculate_crc(payload, crc)
                 else:
@@ -134,17 +136,12 @@ class UCANUpdater(object):
                     if result is None or not result['success']:
                         raise RuntimeError('Failed to flash {0} bytes to address 0x{1:04X}'.format(len(payload), start_address))
 
-                total_payload += payload
-
                 percentage = int(index / total_amount * 100)
                 if percentage > logged_percentage:
                     logger.info('Flashing... {0}%'.format(percentage))
                     logged_percentage = percentage
 
             logger.info('Flashing... Done')
-            crc = UCANPalletCommandSpec.calculate_crc(total_payload)
-            if crc != 0:
-                raise RuntimeError('Unexpected error in CRC calculation (0x{0:08X})'.format(crc))
 
             # Prepare reset to application mode
             logger.info('Reduce bootloader timeout to {0}s'.format(UCANUpdater.BOOTLOADER_TIMEOUT_RUNTIME))
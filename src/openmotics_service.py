@@ -27,7 +27,9 @@ import sys
 from signal import SIGTERM, signal
 
 from bus.om_bus_client import MessageClient
+from bus.om_bus_events import OMBusEvents
 from bus.om_bus_service import MessageService
+from gateway.events import GatewayEvent
 from gateway.initialize import initialize
 from gateway.migrations.rooms import RoomsMigrator
 from gateway.migrations.features_data_migrations import FeatureMigrator
@@ -35,11 +37,14 @@ from gateway.migrations.inputs import InputMigrator
 from gateway.migrations.schedules import ScheduleMigrator
 from gateway.migrations.users import UserMigrator
 from gateway.migrations.config import ConfigMigrator
+from gateway.models import Config
 from gateway.pubsub import PubSub
+from gateway.startup import StartupOrchestrator
 from ioc import INJECTED, Inject
 from logs import Logs
 
 if False:  # MYPY
+    from typing import Any, List, Tuple
     from gateway.output_controller import OutputController
     from gateway.gateway_api import GatewayApi
     from gateway.group_action_controller import GroupActionController
@@ -96,6 +101,16 @@ class OpenmoticsService(object):
 
         # Forward config change events to consumers.
         pubsub.subscribe_gateway_events(PubSub.GatewayTopics.CONFIG, event_sender.enqueue_event)
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.CONFIG, Config.handle_config_event)
+
+        # Inform other services (e.g. the VPN service) of the settings changed by this service
+        Config.set_broadcaster(lambda changed: message_client.send_event(OMBusEvents.CONFIG_CHANGE, sorted(changed)))
+
+        # Publish the settings changed by other services (e.g. the VPN service)
+        def _on_bus_event(event, payload):
+            if event == OMBusEvents.CONFIG_CHANGE:
+                gateway_event = GatewayEvent(GatewayEvent.Types.CONFIG_CHANGE, {'type': 'settings', 'settings': payload})
+                pubsub.publish_gateway_event(PubSub.GatewayTopics.CONFIG, gateway_event)
 
         # Forward state change events to consumers.
         pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, event_sender.enqueue_event)
@@ -104,12 +119,13 @@ class OpenmoticsService(object):
         pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, web_interface.send_event_websocket)
 
         message_client.add_event_handler(metrics_controller.event_receiver)
+        message_client.add_event_handler(_on_bus_event)
         web_interface.set_plugin_controller(plugin_controller)
         web_interface.set_metrics_collector(metrics_collector)
         web_interface.set_metrics_controller(metrics_controller)
         gateway_api.set_plugin_controller(plugin_controller)
-        metrics_controller.add_receiver(metrics_controller.receiver)
-        metrics_controller.add_receiver(web_interface.distribute_metric)
+        metrics_controller.add_receiver(metrics_controller.batch_receiver)
+        metrics_controller.add_receiver(web_interface.distribute_metric_batch)
         scheduling_controller.set_webinterface(web_interface)
         metrics_collector.set_controllers(metrics_controller, plugin_controller)
         plugin_controller.set_webservice(web_service)
@@ -151,53 +167,72 @@ class OpenmoticsService(object):
         """ Main function. """
         logger.info('Starting OM core service...')
 
-        # MasterController should be running
-        master_controller.start()
-
-        # Sync ORM with sources of thruth
-        output_controller.run_sync_orm()
-        input_controller.run_sync_orm()
-        pulse_counter_controller.run_sync_orm()
-        sensor_controller.run_sync_orm()
-        shutter_controller.run_sync_orm()
-
-        # Execute data migration(s)
-        FeatureMigrator.migrate()
-        RoomsMigrator.migrate()
-        InputMigrator.migrate()
-        ScheduleMigrator.migrate()
-        UserMigrator.migrate()
-        ConfigMigrator.migrate()
-
-        # Start rest of the stack
-        maintenance_controller.start()
-        if power_communicator:
+        def _sync_orm():
+            # Sync ORM with sources of thruth
+            output_controller.run_sync_orm()
+            input_controller.run_sync_orm()
+            pulse_counter_controller.run_sync_orm()
+            sensor_controller.run_sync_orm()
+            shutter_controller.run_sync_orm()
+
+        def _migrate_settings():
+            FeatureMigrator.migrate()
+            UserMigrator.migrate()
+            ConfigMigrator.migrate()
+
+        def _migrate_data():
+            RoomsMigrator.migrate()
+            InputMigrator.migrate()
+            ScheduleMigrator.migrate()
+
+        def _start_power():
             power_serial.start()
             power_communicator.start()
-        metrics_controller.start()
+
+        # The stages that are started before the service is marked ready. The ORM sync walks the master,
+        # meanwhile the settings are migrated and the webserver and plugin runtimes are started.
+        startup = StartupOrchestrator()
+        web_interface.set_startup_orchestrator(startup)
+        startup.add('master', master_controller.start)
+        startup.add('migrations.settings', _migrate_settings)
+        startup.add('orm_sync', _sync_orm, requires=['master'])
+        startup.add('migrations.data', _migrate_data, requires=['orm_sync'])
+        startup.add('web_service', web_service.start, requires=['migrations.settings'])
+        startup.add('plugins', plugin_controller.start, requires=['migrations.settings'])
+        startup.add('maintenance', maintenance_controller.start, requires=['master'])
+        startup.add('users', user_controller.start, requires=['migrations.settings'])
+        startup.add('modules', module_controller.start, requires=['master'])
+        ready_requirements = ['web_service', 'maintenance', 'users', 'modules', 'pubsub']
+        if power_communicator:
+            startup.add('power', _start_power)
+            ready_requirements.append('power')
         if passthrough_service:
-            passthrough_service.start()
-        scheduling_controller.start()
-        user_controller.start()
-        module_controller.start()
-        thermostat_controller.start()
-        ventilation_controller.start()
-        metrics_collector.start()
-        web_service.start()
+            startup.add('passthrough', passthrough_service.start, requires=['master'])
+            ready_requirements.append('passthrough')
         if frontpanel_controller:
-            frontpanel_controller.start()
-        event_sender.start()
-        watchdog.start()
-        plugin_controller.start()
-        output_controller.start()
-        input_controller.start()
-        pulse_counter_controller.start()
-        sensor_controller.start()
-        shutter_controller.start()
-        group_action_controller.start()
-        pubsub.start()
-
-        web_interface.set_service_state(True)
+            startup.add('frontpanel', frontpanel_controller.start, requires=['master'])
+            ready_requirements.append('frontpanel')
+        controllers = [('scheduling', scheduling_controller),
+                       ('thermostats', thermostat_controller),
+                       ('ventilation', ventilation_controller),
+                       ('outputs', output_controller),
+                       ('inputs', input_controller),
+                       ('pulse_counters', pulse_counter_controller),
+                       ('sensors', sensor_controller),
+                       ('shutters', shutter_controller),
+                       ('group_actions', group_action_controller)]  # type: List[Tuple[str, Any]]
+        for name, controller in controllers:
+            startup.add(name, controller.start, requires=['migrations.data', 'migrations.settings'])
+        startup.add('pubsub', pubsub.start, requires=[name for name, _ in controllers])
+        startup.add('service', lambda: web_interface.set_service_state(True), requires=ready_requirements)
+
+        # Non-critical work is deferred until the API is serving
+        startup.add('metrics_controller', metrics_controller.start, requires=['service'])
+        startup.add('metrics_collector', metrics_collector.start, requires=['metrics_controller'])
+        startup.add('event_sender', event_sender.start, requires=['service'])
+        startup.add('watchdog', watchdog.start, requires=['service'])
+        startup.run()
+
         signal_request = {'stop': False}
 
         def stop(signum, frame):
@@ -22,6 +22,7 @@ from plugin_runtime.interfaces import has_interface
 from plugin_runtime.utils import get_plugin_class, check_plugin, get_special_methods
 from plugin_runtime.web import WebInterfaceDispatcher
 from six.moves.configparser import ConfigParser, NoSectionError, NoOptionError
+from six.moves.queue import Queue
 from toolbox import PluginIPCReader, PluginIPCWriter, Toolbox
 
 logger = logging.getLogger('openmotics')
@@ -42,6 +43,11 @@ class PluginRuntime(object):
                                     'background_task': [1],
                                     'on_remove': [1]}
 
+    # Actions that can take a while and don't depend on the order of execution are handled by
+    # a pool of workers, so they don't delay e.g. the delivery of events.
+    CONCURRENT_ACTIONS = ['request', 'collect_metrics']
+    CONCURRENT_WORKERS = 4
+
     def __init__(self, path):
         # type: (str) -> None
         self._stopped = False
@@ -66,6 +72,7 @@ class PluginRuntime(object):
         self._metric_receivers = []  # type: List[Any]
 
         self._plugin = None
+        self._concurrent_commands = Queue()  # type: Queue[Dict[str,Any]]
         self._writer = PluginIPCWriter(os.fdopen(sys.stdout.fileno(), 'wb', 0))
         self._reader = PluginIPCReader(os.fdopen(sys.stdin.fileno(), 'rb', 0),
                                        self._writer.log_exception)
@@ -170,64 +177,85 @@ class PluginRuntime(object):
     def process_stdin(self):
         # type: () -> None
         self._reader.start()
+        for i in range(PluginRuntime.CONCURRENT_WORKERS):
+            worker = BaseThread(name='pluginworker{0}'.format(i), target=self._process_concurrent_commands)
+            worker.daemon = True
+            worker.start()
         while not self._stopped:
             command = self._reader.get(block=True)
             if command is None:
                 continue
+            if command['action'] in PluginRuntime.CONCURRENT_ACTIONS:
+                self._concurrent_commands.put(command)
+            else:
+                self._process_command(command)
 
-            action = command['action']
-            action_version = command['action_version']
-            response = {'cid': command['cid'], 'action': action}
-            try:
-                ret = None
-                if action == 'start':
-                    ret = self._handle_start()
-                elif action == 'stop':
-                    ret = self._handle_stop()
-                elif action == 'input_status':
-                    ret = self._handle_input_status(command['event'])
-                elif action == 'output_status':
-                    # v1 = state, v2 = event
-                    if action_version == 1:
-                        ret = self._handle_output_status(command['status'], data_type='status')
-                    else:
-                        ret = self._handle_output_status(command['event'], data_type='event')
-                elif action == 'ventilation_status':
-                    ret = self._handle_ventilation_status(command['event'])
-                elif action == 'thermostat_status':
-                    ret = self._handle_thermostat_status(command['event'])
-                elif action == 'thermostat_group_status':
-                    ret = self._handle_thermostat_group_status(command['event'])
-                elif action == 'shutter_status':
-                    # v1 = state as list, v2 = state as dict, v3 = event
-                    if action_version == 1:
-                        ret = self._handle_shutter_status(command['status'], data_type='status')
-                    elif action_version == 2:
-                        ret = self._handle_shutter_status(command['status'], data_type='status_dict')
-                    else:
-                        ret = self._handle_shutter_status(command['event'], data_type='event')
-                elif action == 'receive_events':
-                    ret = self._handle_receive_events(command['code'])
-                elif action == 'get_metric_definitions':
-                    ret = self._handle_get_metric_definitions()
-                elif action == 'collect_metrics':
-                    ret = self._handle_collect_metrics(command['name'])
-                elif action == 'distribute_metrics':
-                    ret = self._handle_distribute_metrics(command['name'], command['metrics'])
-                elif action == 'request':
-                    ret = self._handle_request(command['method'], command['args'], command['kwargs'])
-                elif action == 'remove_callback':
-                    ret = self._handle_remove_callback()
-                elif action == 'ping':
-                    pass  # noop
-                else:
-                    raise RuntimeError('Unknown action: {0}'.format(action))
+    def _process_concurrent_commands(self):
+        # type: () -> None
+        while not self._stopped:
+            self._process_command(self._concurrent_commands.get())
 
-                if ret is not None:
-                    response.update(ret)
-            except Exception as exception:
-                response['_exception'] = str(exception)
-            self._writer.write(response)
+    def _process_command(self, command):
+        # type: (Dict[str,Any]) -> None
+        response = {'cid': command['cid'], 'action': command['action']}
+        try:
+            ret = self._handle_command(command)
+            if ret is not None:
+                response.update(ret)
+        except Exception as exception:
+            response['_exception'] = str(exception)
+        self._writer.write(response)
+
+    def _handle_command(self, command):
+        # type: (Dict[str,Any]) -> Optional[Dict[str,Any]]
+        action = command['action']
+        action_version = command['action_version']
+        ret = None
+        if action == 'start':
+            ret = self._handle_start()
+        elif action == 'stop':
+            ret = self._handle_stop()
+        elif action == 'input_status':
+            ret = self._handle_input_status(command['event'])
+        elif action == 'output_status':
+            # v1 = state, v2 = event
+            if action_version == 1:
+                ret = self._handle_output_status(command['status'], data_type='status')
+            else:
+                ret = self._handle_output_status(command['event'], data_type='event')
+        elif action == 'ventilation_status':
+            ret = self._handle_ventilation_status(command['event'])
+        elif action == 'thermostat_status':
+            ret = self._handle_thermostat_status(command['event'])
+        elif action == 'thermostat_group_status':
+            ret = self._handle_thermostat_group_status(command['event'])
+        elif action == 'shutter_status':
+            # v1 = state as list, v2 = state as dict, v3 = event
+            if action_version == 1:
+                ret = self._handle_shutter_status(command['status'], data_type='status')
+            elif action_version == 2:
+                ret = self._handle_shutter_status(command['status'], data_type='status_dict')
+            else:
+                ret = self._handle_shutter_status(command['event'], data_type='event')
+        elif action == 'receive_events':
+            ret = self._handle_receive_events(command['code'])
+        elif action == 'get_metric_definitions':
+            ret = self._handle_get_metric_definitions()
+        elif action == 'collect_metrics':
+            ret = self._handle_collect_metrics(command['name'])
+        elif action == 'distribute_metrics':
+            ret = self._handle_distribute_metrics(command['name'], command['metrics'])
+        elif action == 'request':
+            ret = self._handle_request(command['method'], command['args'], command['kwargs'])
+        elif action == 'remove_callback':
+            ret = self._handle_remove_callback()
+        elif action == 'batch':
+            ret = self._handle_batch(command['commands'])
+        elif action == 'ping':
+            pass  # noop
+        else:
+            raise RuntimeError('Unknown action: {0}'.format(action))
+        return ret
 
     def _handle_start(self):
         # type: () -> Dict[str,Any]
@@ -244,7 +272,8 @@ class PluginRuntime(object):
                      'exposes': self._exposes,
                      'interfaces': self._interfaces,
                      'metric_collectors': self._metric_collectors,
-                     'metric_receivers': self._metric_receivers})
+                     'metric_receivers': self._metric_receivers,
+                     'supports_batch': True})
         return data
 
     def _handle_stop(self):
@@ -259,6 +288,15 @@ class PluginRuntime(object):
 
         self._stopped = True
 
+    def _handle_batch(self, commands):
+        # type: (List[Dict[str,Any]]) -> None
+        """ Handles multiple (async) commands that were sent as a single message, in order """
+        for command in commands:
+            try:
+                self._handle_command(command)
+            except Exception as exception:
+                self._writer.log_exception('batch {0}'.format(command.get('action')), exception)
+
     def _handle_input_status(self, data):
         event = GatewayEvent.deserialize(data)
         # get relevant event details
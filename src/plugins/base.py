@@ -27,9 +27,11 @@ import six
 
 import constants
 from gateway.events import GatewayEvent
+from gateway.metrics_batch import MetricBatch
 from gateway.models import Config, Plugin
 from ioc import INJECTED, Inject, Injectable, Singleton
 from plugins.runner import PluginRunner, RunnerWatchdog
+from toolbox import PluginIPCMultiplexer
 
 if False:  # MYPY
     from typing import Dict, List, Optional
@@ -68,6 +70,7 @@ class PluginController(object):
         self._runner_watchdogs = {}  # type: Dict[str, RunnerWatchdog]
         self._dependencies_timer = None  # type: Optional[Timer]
         self._dependencies_lock = Lock()
+        self._ipc_multiplexer = PluginIPCMultiplexer(logger=lambda message, ex: logger.error('{0}: {1}'.format(message, ex)))
 
         self._metrics_controller = None
         self._metrics_collector = None
@@ -98,6 +101,7 @@ class PluginController(object):
         # type: () -> None
         for runner_name in list(self._runners.keys()):
             self._destroy_plugin_runner(runner_name)
+        self._ipc_multiplexer.stop()
         self._stopped = True
 
     def set_metrics_controller(self, metrics_controller):
@@ -135,7 +139,8 @@ class PluginController(object):
                                   runtime_path=self._runtime_path,
                                   plugin_path=plugin_path,
                                   logger=self.get_logger(plugin_name),
-                                  state_callback=self._runner_state_changed)
+                                  state_callback=self._runner_state_changed,
+                                  ipc_multiplexer=self._ipc_multiplexer)
             self._runners[runner.name] = runner
             self._runner_watchdogs[runner.name] = RunnerWatchdog(runner)
             return runner
@@ -398,9 +403,12 @@ class PluginController(object):
                 runner.process_input_status(event)
         if event.type == GatewayEvent.Types.OUTPUT_CHANGE:
             # TODO: deprecate old versions that use state and move to events
-            states = [(state.id, state.dimmer) for state in self._output_controller.get_output_statuses() if state.status]
+            states = None
             for runner in self._iter_running_runners():
-                runner.process_output_status(data=states, action_version=1)  # send states as action version 1
+                if runner.has_receiver('output_status', action_version=1):
+                    if states is None:  # Only collected when there is a plugin interested in them
+                        states = [(state.id, state.dimmer) for state in self._output_controller.get_output_statuses() if state.status]
+                    runner.process_output_status(data=states, action_version=1)  # send states as action version 1
                 runner.process_output_status(data=event, action_version=2)   # send event as action version 2
         if event.type == GatewayEvent.Types.SHUTTER_CHANGE:
             # TODO: deprecate old versions that use state and move to events
@@ -443,26 +451,34 @@ class PluginController(object):
 
     def distribute_metrics(self, metrics):
         """ Enqueues all metrics in a separate queue per plugin """
+        return self.distribute_metric_batches([MetricBatch.from_metric(metric) for metric in metrics])
+
+    def distribute_metric_batches(self, batches):
+        # type: (List[MetricBatch]) -> Dict[str,int]
+        """
+        Enqueues all metrics in a separate queue per plugin. The metric dicts are only
+        created for batches that are received by a plugin.
+        """
         rates = {'total': 0}
         rate_keys = []
         # Preprocess rate keys
-        for metric in metrics:
-            rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
+        for batch in batches:
+            rate_key = '{0}.{1}'.format(batch.source.lower(), batch.type.lower())
             if rate_key not in rates:
                 rates[rate_key] = 0
             rate_keys.append(rate_key)
         # Distribute
         for runner in self._iter_running_runners():
             for receiver in runner.get_metric_receivers():
-                receiver_metrics = []
+                receiver_metrics = []  # type: List[Dict]
                 try:
                     sources = self._metrics_controller.get_filter('source', receiver['source'])
                     metric_types = self._metrics_controller.get_filter('metric_type', receiver['metric_type'])
-                    for index, metric in enumerate(metrics):
-                        if metric['source'] in sources and metric['type'] in metric_types:
-                            receiver_metrics.append(metric)
-                            rates[rate_keys[index]] += 1
-                            rates['total'] += 1
+                    for index, batch in enumerate(batches):
+                        if batch.source in sources and batch.type in metric_types:
+                            receiver_metrics += batch.to_metrics()
+                            rates[rate_keys[index]] += len(batch)
+                            rates['total'] += len(batch)
                     runner.distribute_metrics(receiver['name'], receiver_metrics)
                 except Exception as ex:
                     self.log(runner.name, 'Exception while distributing metrics', ex, traceback.format_exc())
@@ -6,7 +6,7 @@ import subprocess
 import sys
 import time
 import traceback
-from threading import Lock, Thread
+from threading import Condition, Event, Lock, Thread
 
 import cherrypy
 import six
@@ -17,11 +17,11 @@ import constants
 
 from gateway.daemon_thread import BaseThread
 from platform_utils import System
-from toolbox import PluginIPCReader, PluginIPCWriter
+from toolbox import PluginIPCMultiplexer, PluginIPCReader, PluginIPCWriter
 from plugin_runtime.base import PluginWebRequest, PluginWebResponse
 
 if False:  # MYPY
-    from typing import Any, Dict, Callable, List, Optional, AnyStr
+    from typing import Any, Dict, Callable, List, Optional, AnyStr, Tuple
     from gateway.webservice import WebInterface
 
 logger_ = logging.getLogger('openmotics')
@@ -108,7 +108,22 @@ class PluginRunner(object):
         RUNNING = 'RUNNING'
         STOPPED = 'STOPPED'
 
-    def __init__(self, name, runtime_path, plugin_path, logger, command_timeout=5.0, state_callback=None):
+    class PendingCommand(object):
+        """ A command that was sent to the plugin, waiting for the response with the same cid """
+        __slots__ = ['cid', 'action', 'event', 'response']
+
+        def __init__(self, cid, action):
+            # type: (int, str) -> None
+            self.cid = cid
+            self.action = action
+            self.event = Event()
+            self.response = None  # type: Optional[Dict[str,Any]]
+
+    MAX_IN_FLIGHT = 8
+    MAX_BATCH_SIZE = 100
+    ACTION_TIMEOUTS = {'start': 180.0}  # type: Dict[str,float]
+
+    def __init__(self, name, runtime_path, plugin_path, logger, command_timeout=5.0, state_callback=None, ipc_multiplexer=None):
         self.runtime_path = runtime_path
         self.plugin_path = plugin_path
         self.command_timeout = command_timeout
@@ -119,9 +134,11 @@ class PluginRunner(object):
         self._running = False
         self._process_running = False
         self._command_lock = Lock()
-        self._response_queue = Queue()  # type: Queue[Dict[str,Any]]
+        self._command_window = Condition(self._command_lock)
+        self._pending_commands = {}  # type: Dict[int, PluginRunner.PendingCommand]
         self._writer = None  # type: Optional[PluginIPCWriter]
         self._reader = None  # type: Optional[PluginIPCReader]
+        self._ipc_multiplexer = ipc_multiplexer  # type: Optional[PluginIPCMultiplexer]
         self._state_callback = state_callback  # type: Optional[Callable[[str, str], None]]
 
         self.name = name
@@ -135,6 +152,12 @@ class PluginRunner(object):
 
         self._async_command_thread = None
         self._async_command_queue = None  # type: Optional[Queue[Optional[Dict[str, Any]]]]
+        self._queued_states = {}  # type: Dict[Tuple[str,int,Any], Dict[str,Any]]
+        self._queued_states_lock = Lock()
+        self._supports_batch = False
+        self._event_stats = {'coalesced': 0,
+                             'dropped': 0,
+                             'batches': 0}
 
         self._commands_executed = 0
         self._commands_failed = 0
@@ -166,10 +189,11 @@ class PluginRunner(object):
         self._reader = PluginIPCReader(stream=self._proc.stdout,
                                        logger=lambda message, ex: self.logger('{0}: {1}'.format(message, ex)),
                                        command_receiver=self._process_command,
-                                       name=self.name)
+                                       name=self.name,
+                                       multiplexer=self._ipc_multiplexer)
         self._reader.start()
 
-        start_out = self._do_command('start', timeout=180)
+        start_out = self._do_command('start')
         self.name = start_out['name']
         self.version = start_out['version']
         self.interfaces = start_out['interfaces']
@@ -178,12 +202,14 @@ class PluginRunner(object):
         self._exposes = start_out['exposes']
         self._metric_collectors = start_out['metric_collectors']
         self._metric_receivers = start_out['metric_receivers']
+        self._supports_batch = start_out.get('supports_batch', False)
 
         exception = start_out.get('exception')
         if exception is not None:
             raise RuntimeError(exception)
 
         self._async_command_queue = Queue(1000)
+        self._queued_states = {}
         self._async_command_thread = BaseThread(name='plugincmd{0}'.format(self.plugin_path),
                                                 target=self._perform_async_commands)
         self._async_command_thread.daemon = True
@@ -222,6 +248,7 @@ class PluginRunner(object):
             if self._reader:
                 self._reader.stop()
             self._process_running = False
+            self._abort_pending_commands()
             if self._async_command_queue is not None:
                 self._async_command_queue.put(None)  # Triggers an abort on the read thread
 
@@ -252,15 +279,18 @@ class PluginRunner(object):
         if action_version in [1, 2]:
             if action_version == 1:
                 payload = {'status': data}
+                state_key = 'all'  # type: Any
             else:
                 event_json = data.serialize()
                 payload = {'event': event_json}
-            self._do_async(action='output_status', payload=payload, should_filter=True, action_version=action_version)
+                state_key = data.data.get('id')
+            self._do_async(action='output_status', payload=payload, should_filter=True, action_version=action_version, state_key=state_key)
         else:
             self.logger('Output status version {} not supported.'.format(action_version))
 
     def process_shutter_status(self, data, action_version=1):
         if action_version in [1, 2, 3]:
+            state_key = 'all'  # type: Any
             if action_version == 1:
                 payload = {'status': data}
             elif action_version == 2:
@@ -269,7 +299,8 @@ class PluginRunner(object):
             else:
                 event_json = data.serialize()
                 payload = {'event': event_json}
-            self._do_async(action='shutter_status', payload=payload, should_filter=True, action_version=action_version)
+                state_key = data.data.get('id')
+            self._do_async(action='shutter_status', payload=payload, should_filter=True, action_version=action_version, state_key=state_key)
         else:
             self.logger('Shutter status version {} not supported.'.format(action_version))
 
@@ -277,7 +308,7 @@ class PluginRunner(object):
         if action_version in [1]:
             event_json = data.serialize()
             payload = {'event': event_json}
-            self._do_async(action='ventilation_status', payload=payload, should_filter=True, action_version=action_version)
+            self._do_async(action='ventilation_status', payload=payload, should_filter=True, action_version=action_version, state_key=data.data.get('id'))
         else:
             self.logger('Ventilation status version {} not supported.'.format(action_version))
 
@@ -285,7 +316,7 @@ class PluginRunner(object):
         if action_version in [1]:
             event_json = data.serialize()
             payload = {'event': event_json}
-            self._do_async(action='thermostat_status', payload=payload, should_filter=True, action_version=action_version)
+            self._do_async(action='thermostat_status', payload=payload, should_filter=True, action_version=action_version, state_key=data.data.get('id'))
         else:
             self.logger('Thermostat status version {} not supported.'.format(action_version))
 
@@ -293,7 +324,7 @@ class PluginRunner(object):
         if action_version in [1]:
             event_json = data.serialize()
             payload = {'event': event_json}
-            self._do_async(action='thermostat_group_status', payload=payload, should_filter=True, action_version=action_version)
+            self._do_async(action='thermostat_group_status', payload=payload, should_filter=True, action_version=action_version, state_key=data.data.get('id'))
         else:
             self.logger('Thermostat group status version {} not supported.'.format(action_version))
 
@@ -358,10 +389,14 @@ class PluginRunner(object):
 
         if response['cid'] == 0:
             self._handle_async_response(response)
-        elif response['cid'] == self._cid:
-            self._response_queue.put(response)
         else:
-            self.logger('[Runner] Received message with unknown cid: {0}'.format(response))
+            with self._command_lock:
+                pending = self._pending_commands.get(response['cid'])
+            if pending is None:
+                self.logger('[Runner] Received message with unknown cid: {0}'.format(response))
+                return
+            pending.response = response
+            pending.event.set()
 
     def _handle_async_response(self, response):
         # type: (Dict[str,Any]) -> None
@@ -370,19 +405,41 @@ class PluginRunner(object):
         else:
             self.logger('[Runner] Unkown async message: {0}'.format(response))
 
-    def _do_async(self, action, payload, should_filter=False, action_version=1):
-        # type: (str, Dict[str,Any], bool, int) -> None
-        has_receiver = False
-        for decorator_name, decorator_versions in six.iteritems(self._decorators_in_use):
-            # the action version is linked to a specific decorator version
-            has_receiver |= (action == decorator_name and action_version in decorator_versions)
-        if not self._process_running or (should_filter and not has_receiver):
+    def has_receiver(self, action, action_version=1):
+        # type: (str, int) -> bool
+        """ Checks whether the plugin has a decorated method for the given action version """
+        # the action version is linked to a specific decorator version
+        return action_version in self._decorators_in_use.get(action, [])
+
+    def _do_async(self, action, payload, should_filter=False, action_version=1, state_key=None):
+        # type: (str, Dict[str,Any], bool, int, Any) -> None
+        """
+        Queues a command for the plugin. Commands with a `state_key` are state updates: as long as an
+        update for the same action, version and key is queued, it is replaced by the newer state (latest wins),
+        so a burst of changes doesn't flood the plugin with outdated states.
+        """
+        if not self._process_running or (should_filter and not self.has_receiver(action, action_version)):
             return
-        try:
-            assert self._async_command_queue, 'Command Queue not defined'
-            self._async_command_queue.put({'action': action, 'payload': payload, 'action_version': action_version}, block=False)
-        except Full:
-            self.logger('Async action cannot be queued, queue is full')
+        command = {'action': action, 'payload': payload, 'action_version': action_version}
+        with self._queued_states_lock:
+            key = None
+            if state_key is not None:
+                key = (action, action_version, state_key)
+                queued_command = self._queued_states.get(key)
+                if queued_command is not None:
+                    queued_command['payload'] = payload
+                    self._event_stats['coalesced'] += 1
+                    return
+                command['state_key'] = key
+            try:
+                assert self._async_command_queue, 'Command Queue not defined'
+                self._async_command_queue.put(command, block=False)
+            except Full:
+                self._event_stats['dropped'] += 1
+                self.logger('Async action cannot be queued, queue is full')
+                return
+            if key is not None:
+                self._queued_states[key] = command
 
     def _perform_async_commands(self):
         # type: () -> None
@@ -393,7 +450,30 @@ class PluginRunner(object):
                 command = self._async_command_queue.get(block=True, timeout=10)
                 if command is None:
                     continue  # Used to exit this thread
-                self._do_command(command['action'], payload=command['payload'], action_version=command['action_version'])
+                commands = [command]
+                while self._supports_batch and len(commands) < PluginRunner.MAX_BATCH_SIZE:
+                    try:
+                        command = self._async_command_queue.get(block=False)
+                    except Empty:
+                        break
+                    if command is None:
+                        break
+                    commands.append(command)
+                with self._queued_states_lock:
+                    for command in commands:
+                        key = command.get('state_key')
+                        if key is not None and self._queued_states.get(key) is command:
+                            del self._queued_states[key]  # From now on, a new state will be queued again
+                if len(commands) == 1:
+                    self._do_command(command['action'], payload=command['payload'], action_version=command['action_version'])
+                else:
+                    self._event_stats['batches'] += 1
+                    batch = []
+                    for command in commands:
+                        batch_command = {'action': command['action'], 'action_version': command['action_version']}
+                        batch_command.update(command['payload'])
+                        batch.append(batch_command)
+                    self._do_command('batch', payload={'commands': batch})
             except Empty:
                 self._do_async('ping', {})
             except Exception as exception:
@@ -401,33 +481,40 @@ class PluginRunner(object):
 
     def _do_command(self, action, payload=None, timeout=None, action_version=1):
         # type: (str, Dict[str,Any], Optional[float], int) -> Dict[str,Any]
+        """
+        Sends a command to the plugin and waits for its response. Up to MAX_IN_FLIGHT commands can
+        be outstanding at the same time, their responses are correlated by cid.
+        """
         if payload is None:
             payload = {}
         self._commands_executed += 1
         if timeout is None:
-            timeout = self.command_timeout
+            timeout = PluginRunner.ACTION_TIMEOUTS.get(action, self.command_timeout)
 
         if not self._process_running:
             raise Exception('Plugin was stopped')
 
+        end = time.time() + timeout
         with self._command_lock:
+            while len(self._pending_commands) >= PluginRunner.MAX_IN_FLIGHT:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    self._commands_failed += 1
+                    raise Exception('Plugin did not accept the command, too many commands in flight')
+                self._command_window.wait(remaining)
+            command = self._create_command(action, payload, action_version)
+            pending = PluginRunner.PendingCommand(command['cid'], action)
+            self._pending_commands[pending.cid] = pending
+
+        try:
             try:
-                command = self._create_command(action, payload, action_version)
                 assert self._writer, 'Plugin stdin not defined'
                 self._writer.write(command)
             except Exception:
                 self._commands_failed += 1
                 raise
 
-            try:
-                response = self._response_queue.get(block=True, timeout=timeout)
-                while response['cid'] != self._cid:
-                    response = self._response_queue.get(block=False)
-                exception = response.get('_exception')
-                if exception is not None:
-                    raise RuntimeError(exception)
-                return response
-            except Empty:
+            if not pending.event.wait(max(0.0, end - time.time())):
                 metadata = ''
                 if action == 'request':
                     metadata = ' {0}'.format(payload['method'])
@@ -435,6 +522,25 @@ class PluginRunner(object):
                     self.logger('[Runner] No response within {0}s ({1}{2})'.format(timeout, action, metadata))
                 self._commands_failed += 1
                 raise Exception('Plugin did not respond')
+            response = pending.response
+            if response is None:
+                raise Exception('Plugin was stopped')
+            exception = response.get('_exception')
+            if exception is not None:
+                raise RuntimeError(exception)
+            return response
+        finally:
+            with self._command_lock:
+                self._pending_commands.pop(pending.cid, None)
+                self._command_window.notify()
+
+    def _abort_pending_commands(self):
+        # type: () -> None
+        """ Releases all commands that are still waiting for a response """
+        with self._command_lock:
+            pending_commands = list(self._pending_commands.values())
+        for pending in pending_commands:
+            pending.event.set()
 
     def _create_command(self, action, payload=None, action_version=1):
         # type: (str, Dict[str,Any], int) -> Dict[str,Any]
@@ -463,6 +569,11 @@ class PluginRunner(object):
             return 0
         return self._async_command_queue.qsize()
 
+    def get_event_statistics(self):
+        # type: () -> Dict[str,int]
+        """ Amount of state updates that were coalesced or dropped, and the amount of batches that were sent """
+        return dict(self._event_stats)
+
 
 class RunnerWatchdog(object):
     def __init__(self, plugin_runner, threshold=0.25, check_interval=60):
@@ -19,9 +19,10 @@ from __future__ import absolute_import
 
 import logging
 import time
+from collections import OrderedDict
 from threading import RLock, Thread
 
-from six.moves.queue import Empty
+import six
 
 from gateway.daemon_thread import BaseThread
 from gateway.hal.master_controller import CommunicationFailure
@@ -29,7 +30,7 @@ from gateway.hal.master_event import MasterEvent
 from gateway.pubsub import PubSub
 from ioc import INJECTED, Inject
 from power import power_api
-from power.power_command import PowerCommand
+from power.power_command import PowerCommand, PowerModuleType
 from power.time_keeper import TimeKeeper
 from serial_utils import CommunicationStatus, CommunicationTimedOutException, \
     printable
@@ -48,6 +49,11 @@ logger = logging.getLogger('gateway.power')
 class PowerCommunicator(object):
     """ Uses a serial port to communicate with the power modules. """
 
+    START_OF_REPLY = bytearray(b'RTR')
+    END_OF_REPLY = bytearray(b'\r\n')
+    MODULE_TYPES = [PowerModuleType.E, PowerModuleType.C]
+    READ_TIMEOUT = 0.25  # Maximum time between two received chunks
+
     @Inject
     def __init__(self, power_serial=INJECTED, power_store=INJECTED, pubsub=INJECTED, time_keeper_period=60,
                  address_mode_timeout=300):
@@ -83,8 +89,8 @@ class PowerCommunicator(object):
         self.__communication_stats_bytes = {'bytes_written': 0,
                                             'bytes_read': 0}  # type: Dict[str, int]
 
-        self.__debug_buffer = {'read': {},
-                               'write': {}}  # type: Dict[str,Dict[float,str]]
+        self.__debug_buffer = {'read': OrderedDict(),
+                               'write': OrderedDict()}  # type: Dict[str,Dict[float,bytearray]]
         self.__debug_buffer_duration = 300
 
     def start(self):
@@ -149,7 +155,11 @@ class PowerCommunicator(object):
 
     def get_debug_buffer(self):
         # type: () -> Dict[str, Dict[Any, Any]]
-        return self.__debug_buffer
+        def process(buffer):
+            return {k: printable(v) for k, v in six.iteritems(buffer)}
+
+        return {'read': process(self.__debug_buffer['read']),
+                'write': process(self.__debug_buffer['write'])}
 
     def get_seconds_since_last_success(self):
         # type: () -> float
@@ -179,11 +189,19 @@ class PowerCommunicator(object):
         self.__debug('writing to', data)
         self.__serial.write(data)
         self.__communication_stats_bytes['bytes_written'] += len(data)
-        threshold = time.time() - self.__debug_buffer_duration
-        self.__debug_buffer['write'][time.time()] = printable(data)
-        for t in self.__debug_buffer['write'].keys():
-            if t < threshold:
-                del self.__debug_buffer['write'][t]
+        self.__log_debug_buffer(self.__debug_buffer['write'], data)
+
+    def __log_debug_buffer(self, buffer, data):
+        # type: (Dict[float, bytearray], bytearray) -> None
+        """ Adds data to a debug buffer, dropping the entries that are older than the buffer duration """
+        now = time.time()
+        threshold = now - self.__debug_buffer_duration
+        buffer[now] = data
+        while buffer:
+            oldest = next(iter(buffer))
+            if oldest >= threshold:
+                break
+            del buffer[oldest]
 
     def do_command(self, address, cmd, *data):
         # type: (int, PowerCommand, DataType) -> Tuple[Any, ...]
@@ -376,84 +394,54 @@ class PowerCommunicator(object):
 
     def __read_from_serial(self):
         # type: () -> Tuple[bytearray, bytearray]
-        """ Read a PowerCommand from the serial port. """
-        phase = 0
-        index = 0
-
-        header = bytearray()
-        length = 0
-        data = bytearray()
-        crc = 0
+        """
+        Read a PowerCommand from the serial port. Bytes before the start of the frame are skipped, and
+        when a frame turns out to be invalid, the parser resynchronizes on the next 'RTR'.
 
+        Frame format: 'RTR' + {header, 7 bytes} + {length, 1 byte} + {data, `length` bytes} + {crc, 1 byte} + '\r\n'
+        """
+        buffer = self.__serial.read_buffer
         command = bytearray()
-
         try:
-            while phase < 8:
-                byte = self.__serial.read_queue.get(True, 0.25)
-                command += byte
-                self.__communication_stats_bytes['bytes_read'] += 1
-
-                if phase == 0:  # Skip non 'R' bytes
-                    if byte == bytearray(b'R'):
-                        phase = 1
-                    else:
-                        phase = 0
-                elif phase == 1:  # Expect 'T'
-                    if byte == bytearray(b'T'):
-                        phase = 2
-                    else:
-                        raise Exception("Unexpected character")
-                elif phase == 2:  # Expect 'R'
-                    if byte == bytearray(b'R'):
-                        phase = 3
-                        index = 0
-                    else:
-                        raise Exception("Unexpected character")
-                elif phase == 3:  # Read the header fields
-                    header += byte
-                    index += 1
-                    if index == 8:
-                        length = ord(byte)
-                        if length > 0:
-                            phase = 4
-                            index = 0
-                        else:
-                            phase = 5
-                elif phase == 4:  # Read the data
-                    data += byte
-                    index += 1
-                    if index == length:
-                        phase = 5
-                elif phase == 5:  # Read the CRC code
-                    crc = ord(byte)
-                    phase = 6
-                elif phase == 6:  # Expect '\r'
-                    if byte == bytearray(b'\r'):
-                        phase = 7
-                    else:
-                        raise Exception("Unexpected character")
-                elif phase == 7:  # Expect '\n'
-                    if byte == bytearray(b'\n'):
-                        phase = 8
-                    else:
-                        raise Exception("Unexpected character")
-            if PowerCommand.get_crc(header, data) != crc:
-                raise Exception('CRC doesn\'t match')
-        except Empty:
-            raise CommunicationTimedOutException('Communication timed out')
-        except Exception:
-            self.__debug('reading from', command)
-            raise
+            while True:
+                data = buffer.peek()
+                start = data.find(PowerCommunicator.START_OF_REPLY)
+                if start == -1:
+                    start = max(0, len(data) - 2)  # Keep a possibly incomplete 'RTR'
+                if start > 0:
+                    command += data[:start]
+                    buffer.discard(start)
+                    self.__communication_stats_bytes['bytes_read'] += start
+                    data = data[start:]
+                valid = len(data) < 4 or data[3:4] in PowerCommunicator.MODULE_TYPES
+                if valid and len(data) >= 11:
+                    frame_length = 11 + data[10] + 3
+                    if len(data) >= frame_length:
+                        frame = data[:frame_length]
+                        header, payload = frame[3:11], frame[11:-3]
+                        if frame[-2:] == PowerCommunicator.END_OF_REPLY and PowerCommand.get_crc(header, payload) == frame[-3]:
+                            break
+                        valid = False
+                    size = frame_length
+                else:
+                    size = max(11, len(data) + 1)
+                if not valid:
+                    # Not a valid frame (e.g. an 'RTR' in corrupted data), skip the 'R'
+                    command += data[:1]
+                    buffer.discard(1)
+                    self.__communication_stats_bytes['bytes_read'] += 1
+                    continue
+                if not buffer.wait(size, PowerCommunicator.READ_TIMEOUT):
+                    raise CommunicationTimedOutException('Communication timed out')
+
+            command += frame
+            buffer.discard(frame_length)
+            self.__communication_stats_bytes['bytes_read'] += frame_length
         finally:
             self.__debug('reading from', command)
 
-        threshold = time.time() - self.__debug_buffer_duration
-        self.__debug_buffer['read'][time.time()] = printable(command)
-        for t in self.__debug_buffer['read'].keys():
-            if t < threshold:
-                del self.__debug_buffer['read'][t]
-
-        return header, data
+        self.__log_debug_buffer(self.__debug_buffer['read'], command)
+        return header, payload
 
 
 class InAddressModeException(CommunicationFailure):
@@ -31,7 +31,7 @@ from power.power_api import NUM_PORTS, P1_CONCENTRATOR
 from serial_utils import CommunicationTimedOutException
 
 if False:  # MYPY
-    from typing import Any, Dict, List, Optional, Tuple
+    from typing import Any, Callable, Dict, List, Optional, Tuple
     from power.power_communicator import PowerCommunicator
     from power.power_store import PowerStore
 
@@ -157,36 +157,47 @@ class P1Controller(object):
         values = []
         for module_id, module in sorted(modules.items()):
             if module['version'] == power_api.P1_CONCENTRATOR:
-                statuses = self.get_module_status(modules[module_id])
-                timestamps = self.get_module_timestamp(modules[module_id])
-                eans1 = self.get_module_meter(modules[module_id], type=1)
-                eans2 = self.get_module_meter(modules[module_id], type=2)
-                currents = self.get_module_current(modules[module_id])
-                voltages = self.get_module_voltage(modules[module_id])
-                consumptions1 = self.get_module_consumption_tariff(modules[module_id], type=1)
-                consumptions2 = self.get_module_consumption_tariff(modules[module_id], type=2)
-                injections1 = self.get_module_injection_tariff(modules[module_id], type=1)
-                injections2 = self.get_module_injection_tariff(modules[module_id], type=2)
-                tariff_indicators = self.get_module_tariff_indicator(modules[module_id])
-                gas_consumptions = self.get_module_gas_consumption(modules[module_id])
-
-                for port_id, status in enumerate(statuses):
-                    if status:
-                        values.append({'device_id': '{}.{}'.format(module['address'], port_id),
-                                       'module_id': module_id,
-                                       'port_id': port_id,
-                                       'timestamp': timestamps[port_id],
-                                       'gas': {'ean': eans2[port_id].strip(),
-                                               'consumption': gas_consumptions[port_id]},
-                                       'electricity': {'ean': eans1[port_id].strip(),
-                                                       'current': currents[port_id],
-                                                       'voltage': voltages[port_id],
-                                                       'consumption_tariff1': consumptions1[port_id],
-                                                       'consumption_tariff2': consumptions2[port_id],
-                                                       'injection_tariff1': injections1[port_id],
-                                                       'injection_tariff2': injections2[port_id],
-                                                       'tariff_indicator': tariff_indicators[port_id]}})
+                values += self.get_module_realtime(module_id, module)
+        return values
 
+    def get_module_realtime(self, module_id, module, read=None):
+        # type: (Any, Dict[str,Any], Optional[Callable[...,Any]]) -> List[Dict[str,Any]]
+        """
+        Get the realtime p1 measurement values of a single module. The values are read by calling
+        `read(method, **kwargs)` if given, so a caller can share them with its other reads.
+        """
+        if read is None:
+            read = lambda method, **kwargs: getattr(self, method)(module, **kwargs)
+        statuses = read('get_module_status')
+        timestamps = read('get_module_timestamp')
+        eans1 = read('get_module_meter', type=1)
+        eans2 = read('get_module_meter', type=2)
+        currents = read('get_module_current')
+        voltages = read('get_module_voltage')
+        consumptions1 = read('get_module_consumption_tariff', type=1)
+        consumptions2 = read('get_module_consumption_tariff', type=2)
+        injections1 = read('get_module_injection_tariff', type=1)
+        injections2 = read('get_module_injection_tariff', type=2)
+        tariff_indicators = read('get_module_tariff_indicator')
+        gas_consumptions = read('get_module_gas_consumption')
+
+        values = []
+        for port_id, status in enumerate(statuses):
+            if status:
+                values.append({'device_id': '{}.{}'.format(module['address'], port_id),
+                               'module_id': module_id,
+                               'port_id': port_id,
+                               'timestamp': timestamps[port_id],
+                               'gas': {'ean': eans2[port_id].strip(),
+                                       'consumption': gas_consumptions[port_id]},
+                               'electricity': {'ean': eans1[port_id].strip(),
+                                               'current': currents[port_id],
+                                               'voltage': voltages[port_id],
+                                               'consumption_tariff1': consumptions1[port_id],
+                                               'consumption_tariff2': consumptions2[port_id],
+                                               'injection_tariff1': injections1[port_id],
+                                               'injection_tariff2': injections2[port_id],
+                                               'tariff_indicator': tariff_indicators[port_id]}})
         return values
 
     def get_module_status(self, module):
@@ -54,6 +54,7 @@ class PowerStore(object):
                                             isolation_level=None)
         self.__cursor = self.__connection.cursor()
         self.__lock = Lock()
+        self.__modules = None  # type: Optional[Dict[int,Dict[str,Any]]]
 
         self.__update_schema_if_needed()  # Table creations and/or migrations
 
@@ -96,32 +97,46 @@ class PowerStore(object):
         'times7'. For the 8-port power it also contains 'sensor0', 'sensor1', 'sensor2', 'sensor3',
         'sensor4', 'sensor5', 'sensor6', 'sensor7'. For the 12-port power module also contains
         'input8', 'input9', 'input10', 'input11', 'times8', 'times9', 'times10', 'times11'.
+
+        The modules are cached until they are changed, and copies are returned so the callers can
+        modify them.
         """
+        with self.__lock:
+            return dict((module_id, dict(module)) for module_id, module in self.__get_cached_modules().items())
+
+    def __get_cached_modules(self):
+        # type: () -> Dict[int,Dict[str,Any]]
+        """ Returns the cached modules, loading them if needed. The lock should be held. """
+        if self.__modules is None:
+            self.__modules = self.__load_power_modules()
+        return self.__modules
+
+    def __load_power_modules(self):
+        # type: () -> Dict[int,Dict[str,Any]]
         power_modules = {}
         fields = {}
         for version in [POWER_MODULE, ENERGY_MODULE, P1_CONCENTRATOR]:
             amount = NUM_PORTS[version]
             fields[version] = ['id', 'name', 'address', 'version'] + PowerStore._power_setting_fields(amount)
-        with self.__lock:
-            for row in self.__cursor.execute('SELECT {0} FROM power_modules;'.format(', '.join(fields[LARGEST_MODULE_TYPE]))):
-                version = row[3]
-                if version not in [POWER_MODULE, ENERGY_MODULE, P1_CONCENTRATOR]:
-                    raise ValueError('Unknown power api version')
-                power_modules[row[0]] = dict([(field, row[fields[version].index(field)])
-                                              for field in fields[version]])
-            return power_modules
+        for row in self.__cursor.execute('SELECT {0} FROM power_modules;'.format(', '.join(fields[LARGEST_MODULE_TYPE]))):
+            version = row[3]
+            if version not in [POWER_MODULE, ENERGY_MODULE, P1_CONCENTRATOR]:
+                raise ValueError('Unknown power api version')
+            power_modules[row[0]] = dict([(field, row[fields[version].index(field)])
+                                          for field in fields[version]])
+        return power_modules
 
     def get_address(self, id):
         """ Get the address of a module when the module id is provided. """
         with self.__lock:
-            for row in self.__cursor.execute('SELECT address FROM power_modules WHERE id=?;', (id,)):
-                return row[0]
+            module = self.__get_cached_modules().get(id)
+            return None if module is None else module['address']
 
     def get_version(self, id):
         """ Get the version of a module when the module id is provided. """
         with self.__lock:
-            for row in self.__cursor.execute('SELECT version FROM power_modules WHERE id=?;', (id,)):
-                return row[0]
+            module = self.__get_cached_modules().get(id)
+            return None if module is None else module['version']
 
     def module_exists(self, address):
         """ Check if a module with a certain address exists. """
@@ -146,6 +161,7 @@ class PowerStore(object):
         amount = NUM_PORTS[version]
         fields = ['name'] + PowerStore._power_setting_fields(amount)
         with self.__lock:
+            self.__modules = None
             self.__cursor.execute('UPDATE power_modules SET {0} WHERE id=?'.format(
                 ', '.join(['{0}=?'.format(field) for field in fields])
             ), tuple([module[field] for field in fields] + [module['id']]))
@@ -153,11 +169,13 @@ class PowerStore(object):
     def register_power_module(self, address, version):
         """ Register a new power module using an address. """
         with self.__lock:
+            self.__modules = None
             self.__cursor.execute('INSERT INTO power_modules(address, version) VALUES (?, ?);', (address, version))
 
     def readdress_power_module(self, old_address, new_address):
         """ Change the address of a power module. """
         with self.__lock:
+            self.__modules = None
             self.__cursor.execute('UPDATE power_modules SET address=? WHERE address=?;', (new_address, old_address))
 
     def get_free_address(self):
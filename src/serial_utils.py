@@ -13,21 +13,21 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-Serial tools contains the RS485 wrapper, printable and CommunicationTimedOutException.
+Serial tools contains the RS485 wrapper, RingBuffer, printable and CommunicationTimedOutException.
 """
 
 from __future__ import absolute_import
 
 import fcntl
 import struct
-
-from six.moves.queue import Queue
+import time
+from threading import Condition
 
 from gateway.daemon_thread import BaseThread
 from gateway.hal.master_controller import CommunicationFailure
 
 if False:  # MYPY
-    from typing import Literal
+    from typing import Literal, Optional
     from serial import Serial
 
 
@@ -57,13 +57,92 @@ def printable(data):
     return '{0}    {1}'.format(byte_notation, string_notation)
 
 
+class RingBuffer(object):
+    """
+    Fixed size byte buffer, filled by a reader thread and consumed by another thread. When
+    the buffer is full, the oldest bytes are dropped.
+    """
+
+    def __init__(self, capacity):
+        # type: (int) -> None
+        self._data = bytearray(capacity)
+        self._capacity = capacity
+        self._start = 0
+        self._size = 0
+        self._condition = Condition()
+        self.dropped = 0
+
+    def __len__(self):
+        # type: () -> int
+        return self._size
+
+    def write(self, data):
+        # type: (bytearray) -> None
+        """ Appends data and wakes up the threads waiting for it """
+        with self._condition:
+            length = len(data)
+            if length >= self._capacity:
+                self.dropped += self._size + length - self._capacity
+                data = data[-self._capacity:]
+                length = self._capacity
+                self._start, self._size = 0, 0
+            overflow = self._size + length - self._capacity
+            if overflow > 0:
+                self.dropped += overflow
+                self._start = (self._start + overflow) % self._capacity
+                self._size -= overflow
+            end = (self._start + self._size) % self._capacity
+            first = min(length, self._capacity - end)
+            self._data[end:end + first] = data[:first]
+            if first < length:
+                self._data[:length - first] = data[first:]
+            self._size += length
+            self._condition.notify_all()
+
+    def peek(self, size=None):
+        # type: (Optional[int]) -> bytearray
+        """ Returns (a copy of) the first `size` bytes, or all bytes, without consuming them """
+        with self._condition:
+            size = self._size if size is None else min(size, self._size)
+            end = self._start + size
+            if end <= self._capacity:
+                return self._data[self._start:end]
+            return self._data[self._start:] + self._data[:end - self._capacity]
+
+    def discard(self, size):
+        # type: (int) -> None
+        """ Consumes the first `size` bytes """
+        with self._condition:
+            size = min(size, self._size)
+            self._size -= size
+            self._start = (self._start + size) % self._capacity if self._size > 0 else 0
+
+    def clear(self):
+        # type: () -> None
+        self.discard(self._capacity)
+
+    def wait(self, size, timeout):
+        # type: (int, float) -> bool
+        """ Waits until at least `size` bytes are available, returns False on timeout """
+        with self._condition:
+            end = time.time() + timeout
+            while self._size < size:
+                remaining = end - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+
 TIOCSRS485 = 0x542F
 SER_RS485_ENABLED = 0b00000001
 SER_RS485_RTS_ON_SEND = 0b00000010
 
 
 class RS485(object):
-    """ Replicates the pyserial interface. """
+    """ Replicates the pyserial interface, the received data is available in `read_buffer`. """
+
+    BUFFER_SIZE = 64 * 1024
 
     def __init__(self, serial):
         # type: (Serial) -> None
@@ -79,8 +158,7 @@ class RS485(object):
         self._running = False
         self._thread = BaseThread(name='rS485read', target=self._reader)
         self._thread.daemon = True
-        # TODO why does this stream byte by byte?
-        self.read_queue = Queue()  # type: Queue[bytearray]
+        self.read_buffer = RingBuffer(RS485.BUFFER_SIZE)
 
     def start(self):
         # type: () -> None
@@ -101,13 +179,12 @@ class RS485(object):
         # type: () -> None
         try:
             while self._running:
+                # Block until data arrives, then read everything that's waiting as a single chunk
                 data = bytearray(self._serial.read(1))
-                if len(data) == 1:
-                    self.read_queue.put(data[:1])
                 size = self._serial.inWaiting()
                 if size > 0:
-                    data = bytearray(self._serial.read(size))
-                    for i in range(size):
-                        self.read_queue.put(data[i:i + 1])
+                    data += bytearray(self._serial.read(size))
+                if data:
+                    self.read_buffer.write(data)
         except Exception as ex:
             print('Error in reader: {0}'.format(ex))
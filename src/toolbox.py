@@ -20,10 +20,12 @@ from __future__ import absolute_import
 
 import inspect
 import logging
+import os
+import select
 import time
 import traceback
 from collections import deque
-from threading import Thread
+from threading import Condition, Lock, Thread
 
 import msgpack
 import six
@@ -48,55 +50,65 @@ class Queue(object):
     def __init__(self, size=None):
         self._queue = deque()  # type: deque
         self._size = size  # Not used
+        self._available = Condition(Lock())
 
     def put(self, value, block=False):
         _ = block
-        self._queue.appendleft(value)
+        with self._available:
+            self._queue.appendleft(value)
+            self._available.notify()
 
     def get(self, block=True, timeout=None):
-        if not block:
+        with self._available:
+            if block:
+                end = None if timeout is None else time.time() + timeout
+                while not self._queue:
+                    remaining = None if end is None else end - time.time()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._available.wait(remaining)
             try:
                 return self._queue.pop()
             except IndexError:
                 raise Empty()
-        start = time.time()
-        while timeout is None or time.time() - start < timeout:
-            try:
-                return self._queue.pop()
-            except IndexError:
-                sleep = 0.025
-                if timeout is None or timeout > 1:
-                    sleep = 0.1
-                time.sleep(sleep)
-        raise Empty()
 
     def qsize(self):
         return len(self._queue)
 
     def clear(self):
-        return self._queue.clear()
+        with self._available:
+            return self._queue.clear()
 
 
 class PluginIPCReader(object):
     """
     This class handles IPC communications.
 
-    It uses a stream of msgpack encoded dict values.
+    It uses a stream of msgpack encoded dict values. The stream is read in large chunks which are
+    fed into the unpacker, instead of reading it byte per byte. The chunks are either read by an
+    own thread, or by a (shared) PluginIPCMultiplexer.
     """
 
-    def __init__(self, stream, logger, command_receiver=None, name=None):
-        # type: (IO[bytes], Callable[[str,Exception],None], Callable[[Dict[str,Any]],None],Optional[str]) -> None
+    READ_SIZE = 65536
+
+    def __init__(self, stream, logger, command_receiver=None, name=None, multiplexer=None):
+        # type: (IO[bytes], Callable[[str,Exception],None], Callable[[Dict[str,Any]],None],Optional[str], Optional[PluginIPCMultiplexer]) -> None
         self._command_queue = Queue()
-        self._unpacker = msgpack.Unpacker(stream, read_size=1, raw=False)  # type: msgpack.Unpacker[Dict[str,Any]]
+        self._stream = stream
+        self._unpacker = msgpack.Unpacker(raw=False)  # type: msgpack.Unpacker[Dict[str,Any]]
         self._read_thread = None  # type: Optional[Thread]
         self._logger = logger
         self._running = False
         self._command_receiver = command_receiver
         self._name = name
+        self._multiplexer = multiplexer
 
     def start(self):
         # type: () -> None
         self._running = True
+        if self._multiplexer is not None:
+            self._multiplexer.register(self)
+            return
         self._read_thread = BaseThread(name='ipcread', target=self._read)
         self._read_thread.daemon = True
         self._read_thread.start()
@@ -104,35 +116,162 @@ class PluginIPCReader(object):
     def stop(self):
         # type: () -> None
         self._running = False
+        if self._multiplexer is not None:
+            self._multiplexer.unregister(self)
         if self._read_thread is not None:
             self._read_thread.join()
 
+    def fileno(self):
+        # type: () -> int
+        return self._stream.fileno()
+
+    def read_chunk(self):
+        # type: () -> bytes
+        """ Reads the data that is available (blocks until at least one byte is available) """
+        try:
+            fileno = self._stream.fileno()
+        except (AttributeError, IOError, ValueError):
+            read = getattr(self._stream, 'read1', self._stream.read)
+            return read(PluginIPCReader.READ_SIZE)
+        return os.read(fileno, PluginIPCReader.READ_SIZE)
+
     def _read(self):
         # type: () -> None
         while self._running:
+            try:
+                data = self.read_chunk()
+            except Exception as ex:
+                self._logger('Unexpected read exception', ex)
+                data = b''
+            if not data:
+                self.close()
+                break
+            self.feed(data)
+
+    def feed(self, data):
+        # type: (bytes) -> None
+        """ Processes all commands that are completed by the given data """
+        self._unpacker.feed(data)
+        while True:
             try:
                 command = next(self._unpacker)
+            except StopIteration:
+                return  # More data is needed
+            except Exception as ex:
+                self._logger('Unexpected read exception', ex)
+                self._unpacker = msgpack.Unpacker(raw=False)  # Corrupt stream, restart with the next chunk
+                return
+            try:
                 if not isinstance(command, dict):
                     raise ValueError('invalid value %s' % command)
                 if self._command_receiver is not None:
                     self._command_receiver(command)
                 else:
                     self._command_queue.put(command)
-            except StopIteration as ex:
-                self._logger('PluginIPCReader %s stopped' % self._name, ex)
-                self._running = False
             except Exception as ex:
                 self._logger('Unexpected read exception', ex)
 
+    def close(self):
+        # type: () -> None
+        """ Called when the end of the stream is reached """
+        if self._running:
+            self._logger('PluginIPCReader %s stopped' % self._name, EOFError('End of stream'))
+        self._running = False
+
     def get(self, block=True, timeout=None):
         return self._command_queue.get(block, timeout)
 
 
+class PluginIPCMultiplexer(object):
+    """
+    Reads the streams of multiple PluginIPCReaders with a single thread, instead of a thread per reader.
+
+    The command receivers of the readers are executed on this thread, so they should not block.
+    """
+
+    def __init__(self, logger):
+        # type: (Callable[[str,Exception],None]) -> None
+        self._logger = logger
+        self._readers = {}  # type: Dict[int, PluginIPCReader]
+        self._lock = Lock()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        self._thread = None  # type: Optional[Thread]
+        self._running = False
+
+    def start(self):
+        # type: () -> None
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = BaseThread(name='ipcmux', target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        # type: () -> None
+        self._running = False
+        self._wakeup()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def register(self, reader):
+        # type: (PluginIPCReader) -> None
+        with self._lock:
+            self._readers[reader.fileno()] = reader
+        self.start()
+        self._wakeup()
+
+    def unregister(self, reader):
+        # type: (PluginIPCReader) -> None
+        with self._lock:
+            for fileno, registered_reader in list(self._readers.items()):
+                if registered_reader is reader:
+                    del self._readers[fileno]
+        self._wakeup()
+
+    def _wakeup(self):
+        # type: () -> None
+        os.write(self._wakeup_write, b'\x00')
+
+    def _run(self):
+        # type: () -> None
+        while self._running:
+            with self._lock:
+                filenos = list(self._readers.keys())
+            try:
+                readable, _, _ = select.select(filenos + [self._wakeup_read], [], [])
+            except Exception as ex:
+                self._logger('Unexpected select exception', ex)
+                time.sleep(1)
+                continue
+            for fileno in readable:
+                if fileno == self._wakeup_read:
+                    os.read(self._wakeup_read, PluginIPCReader.READ_SIZE)
+                    continue
+                with self._lock:
+                    reader = self._readers.get(fileno)
+                if reader is None:
+                    continue
+                try:
+                    data = reader.read_chunk()
+                except Exception as ex:
+                    self._logger('Unexpected read exception', ex)
+                    data = b''
+                if not data:
+                    with self._lock:
+                        self._readers.pop(fileno, None)
+                    reader.close()
+                    continue
+                reader.feed(data)
+
+
 class PluginIPCWriter(object):
     def __init__(self, stream):
         # type: (IO[bytes]) -> None
         self._packer = msgpack.Packer()  # type: msgpack.Packer[Dict[str,Any]]
         self._stream = stream
+        self._lock = Lock()
 
     def log(self, msg):
         # type: (str) -> None
@@ -152,11 +291,17 @@ class PluginIPCWriter(object):
 
     def write(self, response):
         # type: (Dict[str,Any]) -> None
-        try:
-            self._stream.write(self._packer.pack(response))
-            self._stream.flush()
-        except IOError:
-            pass  # Ignore exceptions if the stream is not available (nothing that can be done anyway)
+        self.write_many([response])
+
+    def write_many(self, responses):
+        # type: (List[Dict[str,Any]]) -> None
+        """ Writes multiple messages with a single write, and makes sure messages of different threads don't interleave """
+        with self._lock:
+            try:
+                self._stream.write(b''.join(self._packer.pack(response) for response in responses))
+                self._stream.flush()
+            except IOError:
+                pass  # Ignore exceptions if the stream is not available (nothing that can be done anyway)
 
 
 class Toolbox(object):
@@ -313,6 +313,8 @@ class TaskExecutor(object):
             if configuration_changed:
                 for setting, value in configuration.items():
                     Config.set_entry(setting, value)
+                if self._message_client is not None:
+                    self._message_client.send_event(OMBusEvents.CONFIG_CHANGE, list(configuration))
                 logger.info('Configuration changed: {0}'.format(configuration))
             self._configuration = configuration
         except Exception:
@@ -439,6 +441,7 @@ class HeartbeatService(object):
         self._message_client = message_client
         if self._message_client is not None:
             self._message_client.set_state_handler(self._check_state)
+            self._message_client.add_event_handler(self._handle_event)
 
         self._last_successful_heartbeat = None  # type: Optional[float]
         self._last_cycle = 0.0
@@ -455,6 +458,12 @@ class HeartbeatService(object):
                             'local_ip': DataCollector('ip address', System.get_ip_address, 1800)}
         self._debug_collector = DebugDumpDataCollector()
 
+    @staticmethod
+    def _handle_event(event, payload):  # type: (str, Any) -> None
+        _ = payload
+        if event == OMBusEvents.CONFIG_CHANGE:
+            Config.reload()  # E.g. `cloud_enabled` was changed by the gateway service
+
     def _check_state(self):
         return {'cloud_disabled': not self._cloud_enabled,
                 'cloud_last_connect': None if not self._cloud_enabled else self._last_successful_heartbeat,
@@ -0,0 +1,155 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Replays classic master serial traffic through the MasterCommunicator read thread.
+
+The traffic is either a raw capture of the master serial port (e.g. taken with `cat /dev/ttyO5 > capture.bin`)
+or, when no capture is given, a generated stream of output, input and event messages mixed with CLI/passthrough
+output. The classic master background consumers are registered, like the classic master controller does.
+Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import fcntl
+import os
+import random
+import struct
+import termios
+import threading
+import time
+
+from ioc import SetTestMode, SetUpTestInjections
+from master.classic import master_api
+from master.classic.master_communicator import BackgroundConsumer, MasterCommunicator
+
+MASTER_VERSION = (3, 143, 103)
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    process_time = time.clock  # Python 2
+
+
+class PipeSerial(object):
+    """ Serial port replacement, reading the replayed traffic from a pipe. """
+
+    def __init__(self):
+        self._read_fd, self._write_fd = os.pipe()
+        self.timeout = None
+
+    def fileno(self):
+        return self._read_fd
+
+    def inWaiting(self):
+        return struct.unpack('I', fcntl.ioctl(self._read_fd, termios.FIONREAD, b'\x00' * 4))[0]
+
+    def read(self, size):
+        return bytearray(os.read(self._read_fd, size)) if size > 0 else bytearray()
+
+    def write(self, data):
+        pass
+
+    def replay(self, data, chunk_size):
+        for i in range(0, len(data), chunk_size):
+            os.write(self._write_fd, bytes(data[i:i + chunk_size]))
+
+
+def generate_traffic(frames, noise):
+    rng = random.Random(0)
+    output_list = master_api.output_list()
+    input_list = master_api.input_list(MASTER_VERSION)
+    event_triggered = master_api.event_triggered(MASTER_VERSION)
+    data = bytearray()
+    for i in range(frames):
+        if i % 3 == 0:
+            outputs = sorted(rng.sample(range(240), rng.randint(0, 16)))
+            data += output_list.output_action + bytearray([0, len(outputs)])  # The outputs field can't be encoded
+            for output_id in outputs:
+                data += bytearray([output_id, rng.randint(0, 63)])
+            data += bytearray(b'\r\n')
+        elif i % 3 == 1:
+            data += input_list.create_output(0, {'input': rng.randint(0, 239), 'output': 255, 'status': rng.randint(0, 1)})
+        else:
+            data += event_triggered.create_output(0, {'event_type': 0, 'bytes': bytearray(rng.getrandbits(8) for _ in range(12))})
+        if noise and rng.random() < noise:
+            # CLI output (e.g. from a maintenance session), which ends up in the passthrough
+            data += bytearray(b'\r\nOK\r\n' + b''.join(rng.choice([b'io ', b'value ', b'255 ', b'error ']) for _ in range(rng.randint(1, 64))))
+    return data
+
+
+def run(data, chunk_size, frames):
+    SetTestMode()
+    serial = PipeSerial()
+    SetUpTestInjections(controller_serial=serial)
+    communicator = MasterCommunicator(init_master=False)
+    received = [0]
+    last_delivery = [time.time()]
+    done = threading.Event()
+
+    def _callback(_):
+        received[0] += 1
+        last_delivery[0] = time.time()
+        if received[0] == frames:
+            done.set()
+
+    consumers = [BackgroundConsumer(master_api.output_list(), 0, _callback, True),
+                 BackgroundConsumer(master_api.input_list(MASTER_VERSION), 0, _callback),
+                 BackgroundConsumer(master_api.event_triggered(MASTER_VERSION), 0, _callback)]
+    for consumer in consumers:
+        communicator.register_consumer(consumer)
+    communicator.start()
+    start, start_cpu = time.time(), process_time()
+    serial.replay(data, chunk_size)
+    if frames:
+        done.wait(600)
+    else:
+        # Unknown amount of frames in a capture, wait until everything is read and delivered
+        while serial.inWaiting() > 0:
+            time.sleep(0.01)
+        time.sleep(0.5)
+    duration, cpu = last_delivery[0] - start, process_time() - start_cpu
+    for consumer in consumers:
+        consumer.stop()
+    return received[0], duration, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classic MasterCommunicator benchmark')
+    parser.add_argument('--capture', help='raw classic master serial capture to replay')
+    parser.add_argument('--frames', type=int, default=50000, help='amount of frames to generate')
+    parser.add_argument('--noise', type=float, default=0.05, help='chance of CLI output after each generated frame')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='amount of bytes written to the serial port at once')
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, 'rb') as capture:
+            data = bytearray(capture.read())
+        frames = 0
+    else:
+        data = generate_traffic(args.frames, args.noise)
+        frames = args.frames
+
+    received, duration, cpu = run(data, args.chunk_size, frames)
+    print('Replayed {0} bytes in chunks of {1} bytes, {2} frames consumed'.format(len(data), args.chunk_size, received))
+    print('Throughput: {0:.0f} bytes/s, {1:.0f} frames/s, {2:.1f} us CPU/frame'.format(len(data) / duration,
+                                                                                    received / duration,
+                                                                                    cpu / max(1, received) * 1e6))
+    os._exit(0)  # The read thread blocks on the (idle) serial port
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Looks up settings through `Config.get_entry` on an on-disk SQLite database, and pushes energy
+metrics through the cloud receiver of the MetricsController. Reports the lookups/sec, and the
+metrics/sec and DB queries per metric of the receiver. The (simulated) clock advances `--period`
+seconds per metric, and a setting is changed every `--change-interval` metrics, like the Cloud
+does. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from timeit import default_timer
+
+import mock
+from peewee import SqliteDatabase
+
+from gateway.metrics_batch import MetricBatch
+from gateway.metrics_controller import MetricsController
+from gateway.migrations.config import ConfigMigrator
+from gateway.models import Config
+from ioc import SetTestMode, SetUpTestInjections
+
+
+class CountingDatabase(SqliteDatabase):
+    queries = 0
+
+    def execute_sql(self, sql, params=None, commit=object()):
+        CountingDatabase.queries += 1
+        return super(CountingDatabase, self).execute_sql(sql, params, commit)
+
+
+def build_controller(directory):
+    database = CountingDatabase(os.path.join(directory, 'gateway.db'))
+    database.bind([Config], bind_refs=False, bind_backrefs=False)
+    database.connect()
+    database.create_tables([Config])
+    ConfigMigrator._insert_defaults()
+    Config.set_entry('cloud_metrics_types', ['energy'])
+    Config.set_entry('cloud_metrics_batch_size', 1000000)  # Don't upload
+
+    SetTestMode()
+    metrics_collector = mock.Mock()
+    metrics_collector.intervals = []
+    metrics_collector.get_definitions.return_value = [{'type': 'energy', 'tags': ['type', 'id'], 'metrics': []}]
+    metrics_cache_controller = mock.Mock()
+    metrics_cache_controller.load_buffer.return_value = []
+    SetUpTestInjections(plugin_controller=mock.Mock(),
+                        metrics_collector=metrics_collector,
+                        metrics_cache_controller=metrics_cache_controller,
+                        gateway_uuid='uuid',
+                        metrics_queue_dir=os.path.join(directory, 'queue'))
+    return MetricsController()
+
+
+def lookups(amount):
+    keys = ['cloud_enabled', 'cloud_metrics_types', 'cloud_metrics_enabled|energy', 'cloud_endpoint', 'unknown']
+    start = default_timer()
+    for _ in range(amount // len(keys)):
+        for key in keys:
+            Config.get_entry(key, None)
+    return amount / (default_timer() - start)
+
+
+def receive(controller, metrics, period, change_interval):
+    receiver = getattr(controller, 'batch_receiver', None)
+    clock = [time.time()]
+    CountingDatabase.queries = 0
+    start = default_timer()
+    with mock.patch('time.time', side_effect=lambda: clock[0]):
+        for i in range(metrics):
+            clock[0] += period
+            if change_interval and i % change_interval == 0:
+                Config.set_entry('cloud_metrics_min_interval', 300 + (i // change_interval) % 2)
+            metric = {'source': 'OpenMotics', 'type': 'energy', 'timestamp': clock[0],
+                      'tags': {'type': 'openmotics', 'id': '{0}.{1}'.format(i % 8, i % 8)},
+                      'values': {'power': float(i)}}
+            if receiver is not None:
+                receiver(MetricBatch.from_metric(metric))
+            else:
+                controller.receiver(metric)
+    return metrics / (default_timer() - start), CountingDatabase.queries / float(metrics)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Config settings benchmark')
+    parser.add_argument('--lookups', type=int, default=500000, help='amount of setting lookups')
+    parser.add_argument('--metrics', type=int, default=10000, help='amount of received metrics')
+    parser.add_argument('--period', type=float, default=0.2, help='simulated seconds between metrics')
+    parser.add_argument('--change-interval', type=int, default=1000, help='change a setting every X metrics, 0 to disable')
+    args = parser.parse_args()
+    logging.getLogger('openmotics').setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        controller = build_controller(directory)
+        print('Lookups: {0:.0f}/s'.format(lookups(args.lookups)))
+        rate, queries = receive(controller, args.metrics, args.period, args.change_interval)
+        print('Receiver: {0:.0f} metrics/s, {1:.3f} DB queries/metric'.format(rate, queries))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Saves a bulk output configuration (e.g. renaming all outputs from the portal) through the
+MasterCoreController on a simulated Core, and reports the memory writes, EEPROM activations and
+wall-clock time. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import time
+
+import mock
+
+from gateway.dto import OutputDTO
+from gateway.hal.master_controller_core import MasterCoreController
+from ioc import SetTestMode, SetUpTestInjections
+from master.core.core_communicator import CoreCommunicator
+from master.core.memory_file import MemoryFile, MemoryTypes
+from master.core.slave_communicator import SlaveCommunicator
+from master.core.ucan_communicator import UCANCommunicator
+
+
+class SimulatedCore(object):
+    """
+    Answers memory reads and writes from an in-memory EEPROM, sleeping `latency` seconds per round-trip,
+    and sends the EEPROM_ACTIVATE event `activation` seconds after an activation was requested
+    """
+
+    def __init__(self, latency, activation, output_modules):
+        self.latency = latency
+        self.activation = activation
+        self.writes = 0
+        self.activations = 0
+        self.memory = {MemoryTypes.EEPROM: {page: bytearray([255] * 256) for page in range(512)},
+                       MemoryTypes.FRAM: {page: bytearray([255] * 256) for page in range(128)}}
+        self.output_modules = output_modules
+        self.memory_file = None  # type: MemoryFile
+        self.communicator = mock.Mock(CoreCommunicator)
+        self.communicator.do_command = self._do_command
+        self.communicator.do_commands = self._do_commands
+        self.communicator.do_basic_action = self._do_basic_action
+
+    def _answer(self, command, fields):
+        if command.instruction == bytearray(b'GC'):
+            return {'output': self.output_modules}
+        page_data = self.memory[fields['type']][fields['page']]
+        start = fields['start']
+        if command.instruction == bytearray(b'MW'):
+            self.writes += 1
+            page_data[start:start + len(fields['data'])] = fields['data']
+            return {}
+        return {'data': page_data[start:start + fields['length']]}
+
+    def _do_command(self, command, fields, timeout=None):
+        time.sleep(self.latency)
+        return self._answer(command, fields)
+
+    def _do_commands(self, commands, timeout=None, window=None):
+        time.sleep(self.latency)
+        return [self._answer(command, fields) for command, fields in commands]
+
+    def _do_basic_action(self, basic_action, timeout=2, log=True):
+        time.sleep(self.latency)
+        if basic_action.action_type == 200 and basic_action.action == 1:
+            self.activations += 1
+            time.sleep(self.activation)
+            self.memory_file._handle_event({'type': 254, 'action': 0, 'device_nr': 0, 'data': 0})
+
+
+def save_outputs(core, outputs):
+    SetTestMode()
+    SetUpTestInjections(master_communicator=core.communicator, pubsub=mock.Mock())
+    core.memory_file = MemoryFile()
+    SetUpTestInjections(memory_file=core.memory_file,
+                        ucan_communicator=UCANCommunicator(),
+                        slave_communicator=SlaveCommunicator())
+    controller = MasterCoreController()
+    controller.load_outputs()  # Warm EEPROM cache, like after the first portal load
+    start = time.time()
+    controller.save_outputs([(OutputDTO(id=i, name='Output {0}'.format(i)), ['name']) for i in range(outputs)])
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Core bulk configuration save benchmark')
+    parser.add_argument('--outputs', type=int, default=100, help='amount of saved outputs')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated round-trip latency in seconds')
+    parser.add_argument('--activation', type=float, default=0.1, help='simulated EEPROM activation time in seconds')
+    args = parser.parse_args()
+    logging.getLogger('openmotics').setLevel(logging.WARNING)
+
+    core = SimulatedCore(args.latency, args.activation, (args.outputs + 7) // 8)
+    duration = save_outputs(core, args.outputs)
+    print('Saved {0} outputs: {1} memory writes, {2} activations, {3:.2f}s'.format(args.outputs, core.writes, core.activations, duration))
+
+
+if __name__ == '__main__':
+    main()
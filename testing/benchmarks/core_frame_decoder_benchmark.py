@@ -0,0 +1,99 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Replays Core serial traffic through the FrameDecoder.
+
+The traffic is either a raw capture of the Core serial port (e.g. taken with `cat /dev/ttyO5 > capture.bin`)
+or, when no capture is given, a generated stream of events and memory read replies with some line noise.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import random
+import time
+
+from master.core.frame_decoder import FrameDecoder
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2
+
+
+def build_frame(cid, command, payload):
+    checked_payload = bytearray([cid]) + bytearray(command) + bytearray([len(payload) // 256, len(payload) % 256]) + bytearray(payload)
+    return bytearray(b'RTR') + checked_payload + bytearray(b'C') + bytearray([sum(checked_payload) % 256]) + bytearray(b'\r\n')
+
+
+def generate_traffic(frames, noise):
+    rng = random.Random(0)
+    data = bytearray()
+    for i in range(frames):
+        if i % 4 == 0:
+            data += build_frame(3 + i % 250, b'MR', bytearray(b'E') + bytearray([0, i % 256, 0]) + bytearray(rng.getrandbits(8) for _ in range(32)))
+        else:
+            data += build_frame(0, b'EV', bytearray(rng.getrandbits(8) for _ in range(8)))
+        if noise and rng.random() < noise:
+            data += bytearray(rng.getrandbits(8) for _ in range(rng.randint(1, 16)))
+    return data
+
+
+def run(data, chunk_size):
+    decoder = FrameDecoder()
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    start = time.time()
+    frames = 0
+    for chunk in chunks:
+        frames += len(decoder.feed(chunk))
+    return frames, time.time() - start, decoder.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FrameDecoder benchmark')
+    parser.add_argument('--capture', help='raw Core serial capture to replay')
+    parser.add_argument('--frames', type=int, default=100000, help='amount of frames to generate')
+    parser.add_argument('--noise', type=float, default=0.01, help='chance of line noise after each generated frame')
+    parser.add_argument('--chunk-size', type=int, default=64, help='amount of bytes per serial read')
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, 'rb') as capture:
+            data = bytearray(capture.read())
+    else:
+        data = generate_traffic(args.frames, args.noise)
+
+    frames, duration, stats = run(data, args.chunk_size)
+    print('Replayed {0} bytes in chunks of {1} bytes'.format(len(data), args.chunk_size))
+    print('Decoder stats: {0}'.format(stats))
+    print('Throughput: {0:.0f} frames/s, {1:.2f} us/frame'.format(frames / duration, duration / frames * 1e6))
+
+    if tracemalloc is not None:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        decoder = FrameDecoder()
+        delivered = []
+        for i in range(0, len(data), args.chunk_size):
+            delivered.extend(decoder.feed(data[i:i + args.chunk_size]))
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+        print('Allocations: {0:.1f} live blocks/frame (frames retained), peak {1:.0f} bytes/frame'.format(blocks / float(len(delivered)),
+                                                                                                        peak / float(len(delivered))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Constructs memory model instances (e.g. while loading the Core configuration) with the memory file
+injected like on a gateway, and reports the instances/sec and the overhead of a call to an injected
+function. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+from timeit import default_timer
+
+import mock
+
+from ioc import INJECTED, Inject, Injectable, Scope, SetTestMode, SetUpTestInjections
+from master.core.core_communicator import CoreCommunicator
+from master.core.memory_file import MemoryFile
+from master.core.memory_models import OutputConfiguration
+
+
+@Inject
+def injected(memory_file=INJECTED):
+    return memory_file
+
+
+def construct(instances):
+    start = default_timer()
+    for i in range(instances):
+        OutputConfiguration(i % 240)
+    return instances / (default_timer() - start)
+
+
+def call(calls):
+    start = default_timer()
+    for _ in range(calls):
+        injected()
+    return (default_timer() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Dependency injection benchmark')
+    parser.add_argument('--instances', type=int, default=10000, help='amount of constructed memory model instances')
+    parser.add_argument('--calls', type=int, default=100000, help='amount of calls to an injected function')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)  # Debug logging disabled, like on a gateway
+
+    SetTestMode()
+    SetUpTestInjections(master_communicator=mock.Mock(CoreCommunicator), pubsub=mock.Mock())
+    memory_file = MemoryFile()
+    memory_file._eeprom_cache = {page: bytearray([255] * 256) for page in range(512)}
+    memory_file._eeprom_cache[0][1] = 30  # Output modules
+    SetTestMode(False)
+
+    @Scope
+    def _run():
+        Injectable.value(memory_file=memory_file)
+        construct(args.instances)  # Warm up the class level caches
+        print('OutputConfiguration: {0:.0f} instances/s'.format(construct(args.instances)))
+        print('Injected call:       {0:.2f} us/call'.format(call(args.calls) * 1e6))
+
+    _run()
+
+
+if __name__ == '__main__':
+    main()
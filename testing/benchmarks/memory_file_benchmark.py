@@ -0,0 +1,101 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Counts the serial commands and round-trips needed to load the full output and input configuration
+from a simulated Core, with and without pipelining the memory reads.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import math
+import time
+
+import mock
+
+from ioc import SetTestMode, SetUpTestInjections
+from master.core.core_api import CoreAPI
+from master.core.core_communicator import CoreCommunicator
+from master.core.memory_file import MemoryFile, MemoryTypes
+from master.core.memory_models import InputConfiguration, OutputConfiguration
+
+
+class SimulatedCore(object):
+    """ Answers memory reads from an in-memory EEPROM, sleeping `latency` seconds per round-trip """
+
+    def __init__(self, window, latency, output_modules, input_modules):
+        self.window = window
+        self.latency = latency
+        self.commands = 0
+        self.round_trips = 0
+        self.memory = {MemoryTypes.EEPROM: {page: bytearray([255] * 256) for page in range(512)},
+                       MemoryTypes.FRAM: {page: bytearray([255] * 256) for page in range(128)}}
+        self.memory[MemoryTypes.EEPROM][0][1] = output_modules
+        self.memory[MemoryTypes.EEPROM][0][2] = input_modules
+        self.communicator = mock.Mock(CoreCommunicator)
+        self.communicator.do_command = self._do_command
+        self.communicator.do_commands = self._do_commands
+
+    def _answer(self, fields):
+        self.commands += 1
+        start = fields['start']
+        return {'data': self.memory[fields['type']][fields['page']][start:start + fields['length']]}
+
+    def _do_command(self, command, fields, timeout=None):
+        self.round_trips += 1
+        time.sleep(self.latency)
+        return self._answer(fields)
+
+    def _do_commands(self, commands, timeout=None, window=None):
+        window = self.window if window is None else window
+        self.round_trips += int(math.ceil(len(commands) / float(window)))
+        time.sleep(self.latency * math.ceil(len(commands) / float(window)))
+        return [self._answer(fields) for _, fields in commands]
+
+
+def load_configuration(window, latency, output_modules, input_modules, prefetch):
+    SetTestMode()
+    core = SimulatedCore(window, latency, output_modules, input_modules)
+    SetUpTestInjections(master_communicator=core.communicator, pubsub=mock.Mock())
+    memory_file = MemoryFile()
+    SetUpTestInjections(memory_file=memory_file)
+    start = time.time()
+    output_ids = list(range(output_modules * 8))
+    input_ids = list(range(input_modules * 8))
+    if prefetch:
+        memory_file.prefetch(OutputConfiguration.get_addresses(output_ids) + InputConfiguration.get_addresses(input_ids))
+    for output_id in output_ids:
+        OutputConfiguration(output_id).serialize()
+    for input_id in input_ids:
+        InputConfiguration(input_id).serialize()
+    return core, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MemoryFile configuration load benchmark')
+    parser.add_argument('--outputs', type=int, default=30, help='amount of output modules')
+    parser.add_argument('--inputs', type=int, default=30, help='amount of input modules')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated round-trip latency in seconds')
+    args = parser.parse_args()
+
+    for label, window, prefetch in [('sequential', 1, False),
+                                    ('pipelined per page', CoreCommunicator.MAX_IN_FLIGHT, False),
+                                    ('pipelined with prefetch', CoreCommunicator.MAX_IN_FLIGHT, True)]:
+        core, duration = load_configuration(window, args.latency, args.outputs, args.inputs, prefetch)
+        print('{0: <24} {1: >5} commands, {2: >5} round-trips, {3: >7.3f}s'.format(label, core.commands, core.round_trips, duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measures the decode throughput of memory models (construct + serialize) on a fully cached EEPROM,
+so only the model/field overhead is measured. Run it on two revisions to compare implementations.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import time
+
+import mock
+
+from ioc import SetTestMode, SetUpTestInjections
+from master.core.core_communicator import CoreCommunicator
+from master.core.memory_file import MemoryFile, MemoryTypes
+from master.core.memory_models import InputConfiguration, OutputConfiguration
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Not available on python 2
+
+
+def setup_memory(modules):
+    SetTestMode()
+    communicator = mock.Mock(CoreCommunicator)
+    SetUpTestInjections(master_communicator=communicator, pubsub=mock.Mock())
+    memory_file = MemoryFile()
+    memory_file._eeprom_cache = {page: bytearray([255] * 256) for page in range(512)}
+    memory_file._eeprom_cache[0][1] = modules  # Output modules
+    memory_file._eeprom_cache[0][2] = modules  # Input modules
+    SetUpTestInjections(memory_file=memory_file)
+
+
+def decode(model, ids):
+    instances = [model(model_id) for model_id in ids]
+    for instance in instances:
+        instance.serialize()
+    return instances
+
+
+def measure(model, ids, rounds):
+    decode(model, ids)  # Warm up the class level caches
+    start = time.time()
+    for _ in range(rounds):
+        decode(model, ids)
+    duration = time.time() - start
+    allocations = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        instances = decode(model, ids)  # Keep the instances alive, to measure their footprint
+        _, peak = tracemalloc.get_traced_memory()
+        del instances
+        tracemalloc.stop()
+        allocations = peak / float(len(ids))
+    return len(ids) * rounds / duration, allocations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Memory model decode benchmark')
+    parser.add_argument('--modules', type=int, default=30, help='amount of output and input modules (8 instances per module)')
+    parser.add_argument('--rounds', type=int, default=20, help='amount of times all instances are decoded')
+    args = parser.parse_args()
+
+    setup_memory(args.modules)
+    ids = list(range(args.modules * 8))
+    for model in [OutputConfiguration, InputConfiguration]:
+        rate, allocations = measure(model, ids, args.rounds)
+        print('{0: <20} {1: >9.0f} instances/s{2}'.format(
+            model.__name__, rate,
+            '' if allocations is None else ', {0: >7.0f} peak bytes/instance'.format(allocations)
+        ))
+
+
+if __name__ == '__main__':
+    main()
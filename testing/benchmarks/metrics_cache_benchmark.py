@@ -0,0 +1,64 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measures the amount of counters the MetricsCacheController processes per second, on an on-disk
+database (place it on the SD card to get representative numbers). Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from threading import Lock
+
+from ioc import SetTestMode, SetUpTestInjections
+from gateway.metrics_caching import MetricsCacheController
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metrics counter cache benchmark')
+    parser.add_argument('--counters', type=int, default=200, help='amount of distinct counters (e.g. pulse counters and energy channels)')
+    parser.add_argument('--rounds', type=int, default=20, help='amount of times every counter is processed')
+    parser.add_argument('--directory', default=None, help='directory for the database (defaults to a temporary directory)')
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp()
+    metrics_db = os.path.join(directory, 'metrics_benchmark.db')
+    try:
+        SetTestMode()
+        SetUpTestInjections(metrics_db=metrics_db, metrics_db_lock=Lock())
+        controller = MetricsCacheController()
+        tags = [{'name': 'counter {0}'.format(i), 'id': i} for i in range(args.counters)]
+        start = time.time()
+        for value in range(args.rounds):
+            timestamp = int(time.time())
+            for counter_tags in tags:
+                controller.process_counter('OpenMotics', 'energy', counter_tags, 'counter', value, timestamp)
+        controller.close()  # Includes writing the pending counters
+        duration = time.time() - start
+        print('{0: >9.0f} counters/s ({1} counters, {2} rounds, {3:.2f}s)'.format(args.counters * args.rounds / duration,
+                                                                             args.counters, args.rounds, duration))
+    finally:
+        if args.directory is None:
+            shutil.rmtree(directory)
+        elif os.path.exists(metrics_db):
+            os.remove(metrics_db)
+
+
+if __name__ == '__main__':
+    main()
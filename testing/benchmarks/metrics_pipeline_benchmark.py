@@ -0,0 +1,163 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Pushes energy metric runs from the MetricsCollector through the MetricsController to its receivers
+and the plugins, and reports the time and the memory allocations per metric. Use `--plugins` to
+simulate a plugin that receives the metrics. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import mock
+from peewee import SqliteDatabase
+
+from gateway.daemon_thread import DaemonThreadWait
+from gateway.metrics_collector import MetricsCollector
+from gateway.metrics_controller import MetricsController
+from gateway.migrations.config import ConfigMigrator
+from gateway.models import Config
+from ioc import SetTestMode, SetUpTestInjections
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2
+
+
+class PluginController(object):
+    """ Receives the metrics for the plugins, optionally converting them to dicts like the real PluginController """
+
+    def __init__(self, receivers):
+        self.receivers = receivers
+        self.received = 0
+
+    def collect_metrics(self):
+        return []
+
+    def distribute_metrics(self, metrics):
+        if self.receivers:
+            self.received += len(list(metrics))
+        return {}
+
+    def distribute_metric_batches(self, batches):
+        if self.receivers:
+            self.received += sum(len(batch.to_metrics()) for batch in batches)
+        return {}
+
+
+def build_pipeline(queue_dir, plugins):
+    database = SqliteDatabase(':memory:')
+    database.bind([Config], bind_refs=False, bind_backrefs=False)
+    database.connect()
+    database.create_tables([Config])
+    ConfigMigrator._insert_defaults()
+    Config.set_entry('cloud_enabled', False)
+
+    SetTestMode()
+    pulse_counter_controller = mock.Mock()
+    pulse_counter_controller.get_persistence.return_value = {}
+    SetUpTestInjections(gateway_api=mock.Mock(),
+                        pulse_counter_controller=pulse_counter_controller,
+                        thermostat_controller=mock.Mock(),
+                        output_controller=mock.Mock(),
+                        input_controller=mock.Mock(),
+                        sensor_controller=mock.Mock(),
+                        pubsub=mock.Mock())
+    collector = MetricsCollector()
+    plugin_controller = PluginController(plugins)
+    metrics_cache_controller = mock.Mock()
+    metrics_cache_controller.load_buffer.return_value = []
+    SetUpTestInjections(plugin_controller=plugin_controller,
+                        metrics_collector=collector,
+                        metrics_cache_controller=metrics_cache_controller,
+                        gateway_uuid='uuid',
+                        metrics_queue_dir=queue_dir)
+    controller = MetricsController()
+    controller.add_receiver(getattr(controller, 'batch_receiver', controller.receiver))
+    controller.add_receiver(lambda metric: None)  # E.g. the WebSockets, without subscribers
+    return collector, controller, plugin_controller
+
+
+def collect(collector, controller, channels):
+    def _run_energy(metric_type):
+        now = time.time()
+        for i in range(channels):
+            collector._enqueue_metrics(metric_type=metric_type,
+                                       values={'voltage': 230.0, 'frequency': 50.0, 'current': 1.0 + i, 'power': 230.0 * i,
+                                               'counter': 1000.0 + i, 'counter_day': 600.0 + i, 'counter_night': 400.0},
+                                       tags={'type': 'openmotics', 'id': '{0}.{1}'.format(i // 8, i % 8), 'name': 'channel {0}'.format(i)},
+                                       timestamp=now)
+
+    if hasattr(collector, '_collect'):
+        collector._collect(_run_energy, 'energy')
+    else:
+        _run_energy('energy')
+    controller._collect_openmotics()
+
+
+def distribute(controller):
+    for distribute in [controller._distribute_openmotics, controller._distribute_plugins]:
+        try:
+            while True:
+                distribute()
+        except DaemonThreadWait:
+            pass
+
+
+def run(collector, controller, channels):
+    collect(collector, controller, channels)
+    distribute(controller)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Metrics pipeline benchmark')
+    parser.add_argument('--channels', type=int, default=48, help='amount of energy channels per collector run')
+    parser.add_argument('--runs', type=int, default=500, help='amount of collector runs')
+    parser.add_argument('--plugins', action='store_true', help='simulate a plugin that receives the metrics')
+    args = parser.parse_args()
+
+    queue_dir = tempfile.mkdtemp()
+    try:
+        collector, controller, plugin_controller = build_pipeline(queue_dir, args.plugins)
+        run(collector, controller, args.channels)  # Warm up
+
+        start = time.time()
+        for _ in range(args.runs):
+            run(collector, controller, args.channels)
+        duration = time.time() - start
+
+        metrics = args.runs * args.channels
+        print('Pushed {0} runs of {1} metrics, {2} received by plugins'.format(args.runs, args.channels, plugin_controller.received))
+        print('Time: {0:.1f} us/metric'.format(duration / metrics * 1e6))
+        if tracemalloc is not None:
+            tracemalloc.start()
+            collect(collector, controller, args.channels)
+            queued, _ = tracemalloc.get_traced_memory()
+            distribute(controller)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print('Memory: {0:.0f} bytes/metric while queued, {1:.0f} bytes/metric peak'.format(queued / float(args.channels),
+                                                                                             peak / float(args.channels)))
+    finally:
+        shutil.rmtree(queue_dir)
+
+
+if __name__ == '__main__':
+    main()
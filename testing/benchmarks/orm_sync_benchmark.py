@@ -0,0 +1,85 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Runs the output ORM sync against an on-disk SQLite database, and reports the duration of the
+initial sync (empty database), a periodic sync (unchanged master configuration) and a sync after
+an EEPROM change that added outputs. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+from peewee import SqliteDatabase
+
+from gateway.dto import OutputDTO
+from gateway.hal.master_controller import MasterController
+from gateway.models import Output, Room
+from gateway.output_controller import OutputController
+from ioc import SetTestMode, SetUpTestInjections
+
+
+def build_controller(directory):
+    database = SqliteDatabase(os.path.join(directory, 'gateway.db'), pragmas={'foreign_keys': 1})
+    database.bind([Output, Room], bind_refs=False, bind_backrefs=False)
+    database.connect()
+    database.create_tables([Output, Room])
+
+    SetTestMode()
+    master_controller = mock.Mock(MasterController)
+    SetUpTestInjections(maintenance_controller=mock.Mock(),
+                        master_controller=master_controller,
+                        message_client=mock.Mock(),
+                        pubsub=mock.Mock())
+    return OutputController(), master_controller
+
+
+def timed_sync(controller):
+    start = time.time()
+    controller.run_sync_orm()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ORM sync benchmark')
+    parser.add_argument('--outputs', type=int, default=240, help='amount of outputs on the master')
+    parser.add_argument('--added', type=int, default=8, help='amount of outputs added by the EEPROM change')
+    parser.add_argument('--runs', type=int, default=5, help='amount of periodic syncs')
+    args = parser.parse_args()
+    logging.getLogger('openmotics').setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        controller, master_controller = build_controller(directory)
+        initial = args.outputs - args.added
+        master_controller.load_outputs.return_value = [OutputDTO(id=i) for i in range(initial)]
+        print('Initial sync ({0} outputs): {1:.1f} ms'.format(initial, timed_sync(controller) * 1e3))
+        periodic = sum(timed_sync(controller) for _ in range(args.runs)) / args.runs
+        print('Periodic sync (unchanged): {0:.1f} ms'.format(periodic * 1e3))
+        master_controller.load_outputs.return_value = [OutputDTO(id=i) for i in range(args.outputs)]
+        print('EEPROM change sync ({0} outputs added): {1:.1f} ms'.format(args.added, timed_sync(controller) * 1e3))
+        assert Output.select().count() == args.outputs
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Measures the plugin IPC throughput:
+* decoding a stream of messages from a pipe, byte per byte (legacy) versus buffered
+* command round-trips between a PluginRunner and a real plugin runtime (runtime.py)
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import msgpack
+
+import plugin_runtime
+from plugins.runner import PluginRunner
+from toolbox import PluginIPCReader, PluginIPCWriter
+
+PLUGIN_CODE = """
+from plugins.base import *
+
+class Benchmark(OMPluginBase):
+    name = 'Benchmark'
+    version = '1.0.0'
+    interfaces = []
+"""
+
+
+def _produce(write_stream, messages):
+    writer = PluginIPCWriter(stream=write_stream)
+    for cid in range(messages):
+        writer.write({'cid': cid, 'action': 'output_status', 'event': {'type': 'OUTPUT_CHANGE', 'data': {'id': cid % 240, 'status': {'on': True, 'value': 100}}}})
+    write_stream.close()
+
+
+def measure_legacy(messages):
+    read_fd, write_fd = os.pipe()
+    read_stream, write_stream = os.fdopen(read_fd, 'rb', 0), os.fdopen(write_fd, 'wb', 0)
+    producer = threading.Thread(target=_produce, args=(write_stream, messages))
+    start = time.time()
+    producer.start()
+    received = sum(1 for _ in msgpack.Unpacker(read_stream, read_size=1, raw=False))
+    duration = time.time() - start
+    producer.join()
+    read_stream.close()
+    return received / duration
+
+
+def measure_buffered(messages):
+    read_fd, write_fd = os.pipe()
+    read_stream, write_stream = os.fdopen(read_fd, 'rb', 0), os.fdopen(write_fd, 'wb', 0)
+    done = threading.Event()
+    reader = PluginIPCReader(stream=read_stream,
+                             logger=lambda message, ex: done.set(),  # Called on end-of-stream
+                             command_receiver=lambda command: None)
+    producer = threading.Thread(target=_produce, args=(write_stream, messages))
+    start = time.time()
+    reader.start()
+    producer.start()
+    done.wait()
+    duration = time.time() - start
+    producer.join()
+    reader.stop()
+    read_stream.close()
+    return messages / duration
+
+
+def measure_runner(commands):
+    plugins_path = tempfile.mkdtemp()
+    try:
+        plugin_path = os.path.join(plugins_path, 'Benchmark')
+        os.makedirs(plugin_path)
+        with open(os.path.join(plugin_path, 'main.py'), 'w') as code_file:
+            code_file.write(PLUGIN_CODE)
+        with open(os.path.join(plugin_path, '__init__.py'), 'w'):
+            pass
+        runner = PluginRunner(name='Benchmark',
+                              runtime_path=os.path.dirname(plugin_runtime.__file__),
+                              plugin_path=plugin_path,
+                              logger=lambda message: None)
+        runner.start()
+        try:
+            start = time.time()
+            for _ in range(commands):
+                runner._do_command('ping')
+            return commands / (time.time() - start)
+        finally:
+            runner.stop()
+    finally:
+        shutil.rmtree(plugins_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plugin IPC benchmark')
+    parser.add_argument('--messages', type=int, default=20000, help='amount of messages decoded from a pipe')
+    parser.add_argument('--commands', type=int, default=2000, help='amount of round-trips to a plugin runtime')
+    parser.add_argument('--skip-runner', action='store_true', help='skip the round-trips to a plugin runtime')
+    args = parser.parse_args()
+
+    print('Pipe decode, byte per byte  {0: >9.0f} messages/s'.format(measure_legacy(args.messages)))
+    print('Pipe decode, buffered       {0: >9.0f} messages/s'.format(measure_buffered(args.messages)))
+    if not args.skip_runner:
+        print('Runner round-trips          {0: >9.0f} commands/s'.format(measure_runner(args.commands)))
+
+
+if __name__ == '__main__':
+    main()
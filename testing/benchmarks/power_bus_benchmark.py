@@ -0,0 +1,111 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Polls energy modules on a simulated power bus through the RS485 reader and the PowerCommunicator,
+and reports the frames/sec and the CPU time per poll cycle. The replies are written to the bus in
+small chunks, like they are received from the UART. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import fcntl
+import os
+import random
+import struct
+import termios
+import time
+
+import mock
+
+from power import power_api
+from power.power_communicator import PowerCommunicator
+from serial_utils import RS485
+
+try:
+    process_time = time.process_time
+except AttributeError:
+    process_time = time.clock  # Python 2
+
+POLL_COMMANDS = [power_api.get_voltage(power_api.ENERGY_MODULE),
+                 power_api.get_frequency(power_api.ENERGY_MODULE),
+                 power_api.get_current(power_api.ENERGY_MODULE),
+                 power_api.get_power(power_api.ENERGY_MODULE),
+                 power_api.get_day_energy(power_api.ENERGY_MODULE),
+                 power_api.get_night_energy(power_api.ENERGY_MODULE)]
+
+
+class SimulatedPowerBus(object):
+    """ Serial port replacement, the energy modules reply on a pipe """
+
+    def __init__(self, chunk_size, noise):
+        self._read_fd, self._write_fd = os.pipe()
+        self._commands = dict((bytes(command.type), command) for command in POLL_COMMANDS)
+        self._chunk_size = chunk_size
+        self._noise = noise
+        self._random = random.Random(0)
+        self.timeout = None
+
+    def fileno(self):
+        return None  # Not an RS485 device
+
+    def inWaiting(self):
+        return struct.unpack('I', fcntl.ioctl(self._read_fd, termios.FIONREAD, b'\x00' * 4))[0]
+
+    def read(self, size):
+        return os.read(self._read_fd, size) if size > 0 else b''
+
+    def write(self, data):
+        # 'STR' + 'E' + address + cid + mode + type + length + data + crc + '\r\n'
+        address, cid = data[4], data[5]
+        command = self._commands[bytes(data[7:10])]
+        output_format = command.output_format
+        values = struct.unpack(output_format, struct.pack(output_format, *[self._random.randint(0, 1000) for _ in range(len(struct.unpack(output_format, b'\x00' * struct.calcsize(output_format))))]))
+        reply = command.create_output(address, cid, *values)
+        if self._noise and self._random.random() < self._noise:
+            reply = bytearray(b'\x00\xff') + reply
+        for i in range(0, len(reply), self._chunk_size):
+            os.write(self._write_fd, bytes(reply[i:i + self._chunk_size]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RS485 power bus benchmark')
+    parser.add_argument('--modules', type=int, default=10, help='amount of energy modules on the bus')
+    parser.add_argument('--cycles', type=int, default=200, help='amount of poll cycles')
+    parser.add_argument('--chunk-size', type=int, default=16, help='amount of bytes the UART delivers at once')
+    parser.add_argument('--noise', type=float, default=0.0, help='chance of unexpected bytes before a reply')
+    args = parser.parse_args()
+
+    bus = SimulatedPowerBus(args.chunk_size, args.noise)
+    serial = RS485(bus)
+    communicator = PowerCommunicator(power_serial=serial, power_store=mock.Mock(), pubsub=mock.Mock(), time_keeper_period=0)
+    serial.start()
+
+    frames = 0
+    start, start_cpu = time.time(), process_time()
+    for _ in range(args.cycles):
+        for address in range(1, args.modules + 1):
+            for command in POLL_COMMANDS:
+                communicator.do_command(address, command)
+                frames += 1
+    duration, cpu = time.time() - start, process_time() - start_cpu
+
+    print('Polled {0} modules for {1} cycles, {2} frames'.format(args.modules, args.cycles, frames))
+    print('Throughput: {0:.0f} frames/s, {1:.2f} ms CPU/poll cycle'.format(frames / duration, cpu / args.cycles * 1e3))
+    os._exit(0)  # The read thread blocks on the (idle) bus
+
+
+if __name__ == '__main__':
+    main()
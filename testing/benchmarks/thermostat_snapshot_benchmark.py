@@ -0,0 +1,119 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Runs the PID loop of the ThermostatControllerGateway for a configuration with many zones against
+an on-disk SQLite database, and reports the DB queries and the duration of a PID tick, an
+(unchanged) configuration refresh and a setpoint change. Run it on two revisions to compare.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+from timeit import default_timer
+
+import mock
+from peewee import SqliteDatabase
+
+from gateway.dto import OutputStateDTO
+from gateway.gateway_api import GatewayApi
+from gateway.models import DaySchedule, Floor, Output, OutputToThermostatGroup, Preset, \
+    Pump, PumpToValve, Room, Sensor, Thermostat, ThermostatGroup, Valve, ValveToThermostat
+from gateway.output_controller import OutputController
+from gateway.thermostat.gateway.thermostat_controller_gateway import ThermostatControllerGateway
+from ioc import SetTestMode, SetUpTestInjections
+
+MODELS = [DaySchedule, Floor, Output, OutputToThermostatGroup, Preset, Pump, PumpToValve, Room,
+          Sensor, Thermostat, ThermostatGroup, Valve, ValveToThermostat]
+
+
+class CountingDatabase(SqliteDatabase):
+    queries = 0
+
+    def execute_sql(self, sql, params=None, commit=object()):
+        CountingDatabase.queries += 1
+        return super(CountingDatabase, self).execute_sql(sql, params, commit)
+
+
+def build_controller(directory, zones):
+    database = CountingDatabase(os.path.join(directory, 'gateway.db'), pragmas={'foreign_keys': 1})
+    database.bind(MODELS)
+    database.connect()
+    database.create_tables(MODELS)
+
+    SetTestMode()
+    gateway_api = mock.Mock(GatewayApi)
+    gateway_api.get_timezone.return_value = 'UTC'
+    gateway_api.get_sensor_temperature_status.return_value = 19.5
+    output_controller = mock.Mock(OutputController)
+    output_controller.get_output_status.return_value = OutputStateDTO(id=0, status=False)
+    SetUpTestInjections(gateway_api=gateway_api,
+                        output_controller=output_controller,
+                        pubsub=mock.Mock())
+    controller = ThermostatControllerGateway()
+    SetUpTestInjections(thermostat_controller=controller)
+    with database.atomic():
+        group = ThermostatGroup.create(number=0, name='group', on=True, mode='heating')
+        for number in range(zones):
+            thermostat = Thermostat.create(number=number, name='zone {0}'.format(number), start=0,
+                                           sensor=Sensor.create(number=number), room=Room.create(number=number),
+                                           thermostat_group=group)
+            valve = Valve.create(number=number, name='valve {0}'.format(number), output=Output.create(number=number))
+            ValveToThermostat.create(thermostat=thermostat, valve=valve, mode='heating', priority=0)
+            Preset.create(type=Preset.Types.SCHEDULE, heating_setpoint=20.0, cooling_setpoint=25.0, active=True, thermostat=thermostat)
+            for index in range(7):
+                DaySchedule.create(index=index, content='{"0": 16.0, "25200": 21.0, "79200": 16.0}', mode='heating', thermostat=thermostat)
+    scheduler = mock.Mock()
+    scheduler.get_jobs.return_value = []
+    controller._scheduler = scheduler
+    controller.refresh_config_from_db()
+    controller._sync_scheduler()
+    return controller
+
+
+def measure(label, runs, function):
+    queries = CountingDatabase.queries
+    start = default_timer()
+    for run in range(runs):
+        function(run)
+    duration = (default_timer() - start) / runs
+    print('{0}: {1:.1f} queries, {2:.2f} ms'.format(label, (CountingDatabase.queries - queries) / float(runs), duration * 1e3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Thermostat PID loop benchmark')
+    parser.add_argument('--zones', type=int, default=32, help='amount of thermostats')
+    parser.add_argument('--runs', type=int, default=20, help='amount of runs per measurement')
+    args = parser.parse_args()
+    logging.getLogger('openmotics').setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        controller = build_controller(directory, args.zones)
+        measure('PID tick ({0} zones)'.format(args.zones), args.runs,
+                lambda run: controller._pid_tick())
+        measure('Configuration refresh (unchanged)', args.runs,
+                lambda run: controller.refresh_config_from_db())
+        measure('Setpoint change', args.runs,
+                lambda run: controller.set_current_setpoint(thermostat_number=run % args.zones, heating_temperature=20.0 + run % 3))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Flashes uCANs with a generated firmware through a simulated Core, and reports the seconds per flashed
+uCAN, with the uCAN transport messages sent one by one and pipelined. It also compares the pallet
+CRC calculation with a bitwise reference implementation.
+
+Note that every update includes a bootloader detection (a ping that times out after 2s), like on
+a real uCAN.
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import logging
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import mock
+from intelhex import IntelHex
+
+from master.core.core_communicator import CoreCommunicator
+from master.core.fields import UInt32Field
+from master.core.ucan_command import SID, UCANCommandSpec, UCANPalletCommandSpec
+from master.core.ucan_communicator import UCANCommunicator
+from master.core.ucan_updater import UCANUpdater
+
+CC_ADDRESS = '000.000.000.000'
+UCAN_ADDRESS = '001.002.003'
+
+
+def reference_crc(data, remainder=0):
+    """ Bitwise pallet CRC calculation """
+    for data_item in data:
+        remainder ^= data_item << 24
+        remainder &= 0xFFFFFFFF
+        for _ in range(8):
+            if remainder & 0x80000000:
+                remainder = ((remainder << 1) ^ 0x04C11DB7) & 0xFFFFFFFF
+            else:
+                remainder = (remainder << 1) & 0xFFFFFFFF
+    return remainder
+
+
+class SimulatedUCAN(object):
+    """ Answers the uCAN commands used by the UCANUpdater """
+
+    def __init__(self):
+        self.application_mode = True
+        self.pallet = bytearray()
+        self._uint32_helper = UInt32Field('')
+
+    def handle(self, sid, payload):
+        if sid == SID.BOOTLOADER_PALLET:
+            return self._handle_pallet(payload)
+        if (sid == SID.NORMAL_COMMAND) != self.application_mode:
+            return []  # Not answering, e.g. a normal ping while in bootloader
+        instruction, address, data = payload[1], payload[2:5], payload[5]
+        if instruction == 96:
+            replies = [bytearray([1, 96]) + address + bytearray([data])]
+        elif instruction == 198:
+            replies = [bytearray([data, 199]) + address + bytearray([0, 1] if data == 5 else [0, 0])]
+        elif instruction == 94:
+            self.application_mode = sid == SID.BOOTLOADER_COMMAND
+            replies = [bytearray([94, 94]) + address + bytearray([1 if self.application_mode else 0])]
+        else:
+            replies = [bytearray([instruction, instruction]) + address + bytearray([data])]
+        return [reply + bytearray([UCANCommandSpec.calculate_crc(reply)]) for reply in replies]
+
+    def _handle_pallet(self, payload):
+        header = payload[0]
+        if header >> 7:
+            self.pallet = bytearray()
+        self.pallet += payload[1:]
+        if header & 127:
+            return []
+        pallet_type = self.pallet[6]
+        reply = self.pallet[3:6] + self.pallet[0:3] + bytearray([pallet_type + 1, 1])
+        reply += self._uint32_helper.encode(UCANPalletCommandSpec.calculate_crc(reply))
+        segments = []
+        remaining = int(math.ceil(len(reply) / 7.0))
+        first = True
+        while reply:
+            segments.append(bytearray([(128 if first else 0) + remaining - 1]) + reply[:7])
+            reply = reply[7:]
+            remaining -= 1
+            first = False
+        return segments
+
+
+class SimulatedCore(object):
+    """ Forwards uCAN transport messages to a simulated uCAN, sleeping `latency` seconds per round-trip """
+
+    def __init__(self, window, latency):
+        self.window = window
+        self.latency = latency
+        self.round_trips = 0
+        self.ucan = SimulatedUCAN()
+        self.ucan_communicator = None  # type: UCANCommunicator
+        self.communicator = mock.Mock(CoreCommunicator)
+        self.communicator.do_command = self._do_command
+        self.communicator.do_commands = self._do_commands
+
+    def _do_command(self, command, fields, timeout=None):
+        return self._do_commands([(command, fields)], timeout=timeout)[0]
+
+    def _do_commands(self, commands, timeout=None, window=None):
+        window = self.window if window is None else min(window, self.window)
+        round_trips = int(math.ceil(len(commands) / float(window)))
+        self.round_trips += round_trips
+        time.sleep(self.latency * round_trips)
+        replies = []
+        for _, fields in commands:
+            replies += [(fields['sid'], reply) for reply in self.ucan.handle(fields['sid'], fields['payload'][:fields['nr_can_bytes']])]
+        for sid, reply in replies:
+            self.ucan_communicator._process_transport_message({'cc_address': CC_ADDRESS,
+                                                               'nr_can_bytes': len(reply),
+                                                               'sid': sid,
+                                                               'payload': reply + bytearray([0] * (8 - len(reply)))})
+        return [{'cc_address': CC_ADDRESS} for _ in commands]
+
+
+def generate_firmware(directory, size):
+    rng = random.Random(0)
+    intel_hex = IntelHex()
+    for address in range(UCANUpdater.APPLICATION_START, UCANUpdater.APPLICATION_START + size):
+        intel_hex[address] = rng.getrandbits(8)
+    filename = os.path.join(directory, 'ucan.hex')
+    intel_hex.write_hex_file(filename)
+    return filename
+
+
+def flash(hex_filename, window, latency, amount):
+    core = SimulatedCore(window, latency)
+    ucan_communicator = UCANCommunicator(master_communicator=core.communicator)
+    core.ucan_communicator = ucan_communicator
+    start = time.time()
+    for _ in range(amount):
+        if not UCANUpdater.update(CC_ADDRESS, UCAN_ADDRESS, ucan_communicator, hex_filename, '1.0.2'):
+            raise RuntimeError('Update failed')
+    return core, (time.time() - start) / amount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='uCAN firmware update benchmark')
+    parser.add_argument('--size', type=int, default=UCANUpdater.BOOTLOADER_START - UCANUpdater.APPLICATION_START - 8,
+                        help='firmware size in bytes')
+    parser.add_argument('--latency', type=float, default=0.005, help='simulated Core round-trip latency in seconds')
+    parser.add_argument('--ucans', type=int, default=1, help='amount of uCANs to flash')
+    args = parser.parse_args()
+    logging.getLogger('openmotics').setLevel(logging.WARNING)
+
+    directory = tempfile.mkdtemp()
+    try:
+        hex_filename = generate_firmware(directory, args.size)
+        data = bytearray(IntelHex(hex_filename).tobinarray())
+        start = time.time()
+        reference = reference_crc(data)
+        reference_duration = time.time() - start
+        start = time.time()
+        crc = UCANPalletCommandSpec.calculate_crc(data)
+        duration = time.time() - start
+        assert crc == reference
+        print('CRC of {0} bytes: bitwise {1:.3f}s, calculate_crc {2:.3f}s'.format(len(data), reference_duration, duration))
+
+        for label, window in [('sequential', 1),
+                              ('pipelined', getattr(UCANCommunicator, 'TRANSPORT_WINDOW', 8))]:
+            core, duration = flash(hex_filename, window, args.latency, args.ucans)
+            print('{0: <12} {1: >6} round-trips/uCAN, {2: >7.2f}s/uCAN'.format(label, core.round_trips // args.ucans, duration))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
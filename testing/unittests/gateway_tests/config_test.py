@@ -18,14 +18,17 @@ Tests for the config module.
 
 from __future__ import absolute_import
 
+import json
 import os
 import tempfile
 import unittest
+import mock
 import xmlrunner
 from peewee import SqliteDatabase
 
 from ioc import SetTestMode
 
+from gateway.events import GatewayEvent
 from gateway.models import Config
 
 MODELS = [Config]
@@ -51,6 +54,7 @@ class ConfigControllerTest(unittest.TestCase):
         self.test_db.bind(MODELS, bind_refs=False, bind_backrefs=False)
         self.test_db.connect()
         self.test_db.create_tables(MODELS)
+        Config.reload()
 
     def tearDown(self):
         self.test_db.drop_tables(MODELS)
@@ -123,6 +127,72 @@ class ConfigControllerTest(unittest.TestCase):
         res = Config.get_entry('bool', None)
         self.assertEqual(res, True)
 
+    def test_read_only(self):
+        """ Test that the (shared) values can't be modified """
+        Config.set_entry('list', ['a', 'b'])
+        Config.set_entry('dict', {'a': [1]})
+
+        res = Config.get_entry('list', None)
+        self.assertEqual(res, ('a', 'b'))
+        res = Config.get_entry('dict', None)
+        self.assertEqual(res, {'a': (1,)})
+        with self.assertRaises(TypeError):
+            res['a'] = 2
+        self.assertEqual(json.dumps(res), '{"a": [1]}')
+
+        res = dict(res)
+        res['a'] = 2
+        Config.set_entry('dict', res)
+        self.assertEqual(Config.get_entry('dict', None), {'a': 2})
+
+    def test_memory(self):
+        """ Test that the settings are served from memory """
+        Config.set_entry('int', 37)
+        with mock.patch.object(Config, 'select', side_effect=AssertionError('queried')):
+            for _ in range(10):
+                self.assertEqual(Config.get_entry('int', None), 37)
+                self.assertEqual(Config.get_entry('Missing', 'fallback'), 'fallback')
+
+    def test_changes(self):
+        """ Test versions, subscriptions and changes by other processes """
+        changes = []
+        Config.subscribe(changes.append)
+        self.addCleanup(Config.unsubscribe, changes.append)
+        version = Config.get_version()
+
+        Config.set_entry('Test', 'test')
+        Config.set_entry('test', 'test')  # Unchanged
+        Config.remove_entry('test')
+        Config.remove_entry('test')  # Unchanged
+        self.assertEqual([{'test'}, {'test'}], changes)
+        self.assertEqual(version + 2, Config.get_version())
+
+        # Changed by another process
+        del changes[:]
+        Config.set_entry('int', 37)
+        Config.update(data=json.dumps(38)).where(Config.setting == 'int').execute()
+        Config.insert(setting='str', data=json.dumps('test')).execute()
+        self.assertEqual(Config.get_entry('int', None), 37)
+        Config.handle_config_event(GatewayEvent(GatewayEvent.Types.CONFIG_CHANGE, {'type': 'output'}))
+        self.assertEqual(Config.get_entry('int', None), 37)
+        Config.handle_config_event(GatewayEvent(GatewayEvent.Types.CONFIG_CHANGE, {'type': 'settings'}))
+        self.assertEqual(Config.get_entry('int', None), 38)
+        self.assertEqual(Config.get_entry('str', None), 'test')
+        self.assertEqual([{'int'}, {'int', 'str'}], changes)
+
+    def test_broadcast(self):
+        """ Test that only the changes made by this process are broadcasted """
+        broadcasts = []
+        Config.set_broadcaster(broadcasts.append)
+        self.addCleanup(Config.set_broadcaster, None)
+
+        Config.set_entry('test', 'test')
+        Config.set_entry('test', 'test')  # Unchanged
+        Config.remove_entry('test')
+        Config.insert(setting='str', data=json.dumps('test')).execute()
+        Config.reload()
+        self.assertEqual([{'test'}, {'test'}], broadcasts)
+
 
 if __name__ == '__main__':
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
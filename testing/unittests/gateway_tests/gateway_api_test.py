@@ -14,6 +14,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
 
+import threading
+import time
 import unittest
 
 import mock
@@ -209,3 +211,76 @@ class GatewayApiTest(unittest.TestCase):
                   [None, None],
                   [None, None]]
         }
+
+    def test_power_snapshot(self):
+        self.power_store.get_power_modules.return_value = {10: {'address': 11, 'version': ENERGY_MODULE},
+                                                           20: {'address': 21, 'version': P1_CONCENTRATOR}}
+        for method in ['get_module_current', 'get_module_frequency', 'get_module_power', 'get_module_voltage',
+                       'get_module_day_energy', 'get_module_night_energy']:
+            getattr(self.power_controller, method).return_value = [1.0] * 12
+        self.p1_controller.get_module_status.return_value = [True] + [False] * 7
+        self.p1_controller.get_module_current.return_value = [{'phase1': 1.0, 'phase2': 1.0, 'phase3': 1.0}] * 8
+        self.p1_controller.get_module_voltage.return_value = [{'phase1': 230.0, 'phase2': 230.0, 'phase3': 230.0}] * 8
+        for method in ['get_module_delivered_power', 'get_module_received_power',
+                       'get_module_day_energy', 'get_module_night_energy']:
+            getattr(self.p1_controller, method).return_value = [0.0] * 8
+        for method in ['get_module_timestamp', 'get_module_consumption_tariff', 'get_module_injection_tariff',
+                       'get_module_tariff_indicator', 'get_module_gas_consumption']:
+            getattr(self.p1_controller, method).return_value = [1.0] * 8
+        self.p1_controller.get_module_meter.return_value = ['ean'] * 8
+        self.p1_controller.get_module_realtime.side_effect = lambda *args: P1Controller.get_module_realtime(self.p1_controller, *args)
+
+        snapshot = self.api.get_power_snapshot()
+        assert sorted(snapshot.keys()) == ['realtime_p1', 'realtime_power', 'timestamp', 'total_energy']
+        assert sorted(snapshot['realtime_power'].keys()) == ['10', '20']
+        assert sorted(snapshot['total_energy'].keys()) == ['10', '20']
+        assert [(p1['device_id'], p1['module_id']) for p1 in snapshot['realtime_p1']] == [('21.0', 20)]
+        assert snapshot['realtime_p1'][0]['electricity']['voltage'] == {'phase1': 230.0, 'phase2': 230.0, 'phase3': 230.0}
+        # Values that are used by multiple sections are only read once per cycle
+        for method in ['get_module_status', 'get_module_voltage', 'get_module_current']:
+            assert getattr(self.p1_controller, method).call_count == 1
+        assert self.p1_controller.get_module_meter.call_count == 2  # Both meter types
+
+        # Other consumers share the same cycle
+        assert self.api.get_realtime_power() is snapshot['realtime_power']
+        assert self.api.get_total_energy() is snapshot['total_energy']
+        assert self.api.get_realtime_p1() is snapshot['realtime_p1']
+        assert self.power_controller.get_module_voltage.call_count == 1
+        assert self.power_store.get_power_modules.call_count == 1
+
+        with mock.patch.object(GatewayApi, 'POWER_SNAPSHOT_MAX_AGE', 0.0):
+            self.api.get_realtime_power()
+        assert self.power_controller.get_module_voltage.call_count == 2
+        assert self.power_controller.get_module_day_energy.call_count == 1
+
+    def test_power_snapshot_concurrent(self):
+        self.power_store.get_power_modules.return_value = {10: {'address': 11, 'version': ENERGY_MODULE}}
+
+        def _slow_read(module):
+            _ = module
+            time.sleep(0.2)
+            return [1.0] * 12
+
+        for method in ['get_module_current', 'get_module_frequency', 'get_module_power',
+                       'get_module_day_energy', 'get_module_night_energy']:
+            getattr(self.power_controller, method).return_value = [1.0] * 12
+        self.power_controller.get_module_voltage.side_effect = _slow_read
+
+        results = []
+        with mock.patch.object(GatewayApi, 'POWER_SNAPSHOT_MAX_AGE', 0.1):
+            threads = [threading.Thread(target=lambda: results.append(self.api.get_power_snapshot([GatewayApi.REALTIME_POWER])))
+                       for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # The waiting consumers use the cycle they waited for, which is stamped when it ended
+            assert self.power_controller.get_module_voltage.call_count == 1
+            assert len(set(snapshot['timestamp'] for snapshot in results)) == 1
+
+            # Other sections are merged, so they don't replace the realtime power
+            total_energy = self.api.get_total_energy()
+            assert self.api.get_realtime_power() is results[0]['realtime_power']
+            assert self.api.get_total_energy() is total_energy
+            assert self.power_controller.get_module_voltage.call_count == 1
+            assert self.power_controller.get_module_day_energy.call_count == 1
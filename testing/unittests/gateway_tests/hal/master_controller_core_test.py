@@ -8,14 +8,15 @@ from six.moves import map
 from six.moves.queue import Queue
 
 import gateway.hal.master_controller_core
-from gateway.dto import InputDTO, OutputStateDTO
+from gateway.dto import GroupActionDTO, InputDTO, OutputDTO, OutputStateDTO, \
+    ShutterDTO
 from gateway.hal.master_controller_core import MasterCoreController
 from gateway.hal.master_event import MasterEvent
 from gateway.pubsub import PubSub
 from ioc import SetTestMode
 from master.core.core_api import CoreAPI
 from master.core.core_communicator import BackgroundConsumer
-from master.core.memory_models import InputConfiguration, \
+from master.core.memory_models import GroupActionAddressConfiguration, InputConfiguration, \
     InputModuleConfiguration, OutputConfiguration, OutputModuleConfiguration, \
     SensorModuleConfiguration, ShutterConfiguration
 from mocked_core_helper import MockedCore
@@ -173,6 +174,29 @@ class MasterCoreControllerTest(unittest.TestCase):
             self.assertIn(mock.call({'id': 2, 'name': 'bar'}), deserialize.call_args_list)
             save.assert_called_with()
 
+    def test_save_outputs_single_activation(self):
+        data = [(OutputDTO(id=i, name='output {0}'.format(i)), ['name']) for i in range(10)]
+        with mock.patch.object(self.mocked_core.communicator, 'do_basic_action', wraps=self.mocked_core._do_basic_action) as do_basic_action:
+            self.controller.save_outputs(data)
+            self.assertEqual(1, do_basic_action.call_count)
+        self.assertEqual(['output {0}'.format(i) for i in range(10)],
+                         [self.controller.load_output(i).name for i in range(10)])
+
+    def test_save_group_actions_transaction(self):
+        self.controller.save_group_actions([(GroupActionDTO(id=0, actions=[2, 1, 2, 2]), ['actions']),
+                                            (GroupActionDTO(id=1, actions=[2, 3, 2, 4]), ['actions'])])
+        self.assertEqual([(0, 1), (2, 3)], [(GroupActionAddressConfiguration(i).start, GroupActionAddressConfiguration(i).end)
+                                            for i in range(2)])
+        self.assertEqual([2, 1, 2, 2], self.controller.load_group_action(0).actions)
+        self.assertEqual([2, 3, 2, 4], self.controller.load_group_action(1).actions)
+
+    def test_save_shutters_transaction(self):
+        self.controller.save_shutters([(ShutterDTO(id=i, timer_up=100, timer_down=100, up_down_config=1),
+                                        ['timer_up', 'timer_down', 'up_down_config']) for i in range(2)])
+        shutter_config = OutputModuleConfiguration(0).shutter_config
+        self.assertFalse(shutter_config.are_01_outputs)
+        self.assertFalse(shutter_config.are_23_outputs)
+
     def test_inputs_with_status(self):
         from gateway.hal.master_controller_core import MasterInputState
         with mock.patch.object(MasterInputState, 'get_inputs', return_value=[]) as get:
@@ -0,0 +1,64 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the metric batches
+"""
+from __future__ import absolute_import
+
+import unittest
+
+import xmlrunner
+
+from gateway.metrics_batch import MetricBatch
+
+
+class MetricBatchTest(unittest.TestCase):
+
+    def test_batch(self):
+        batch = MetricBatch('OpenMotics', 'energy', 1234, ('id', 'name'), ('power', 'counter'))
+        batch.add({'id': 'E1.0', 'name': 'foo'}, {'power': 1.0, 'counter': 5})
+        batch.add({'id': 'E1.1', 'name': 'bar'}, {'power': 2.0, 'counter': 6})
+        batch.add({'id': 'E1.0', 'name': 'foo'}, {'power': 3.0, 'counter': 7})
+        self.assertEqual(3, len(batch))
+        self.assertEqual([('E1.0', 'foo'), ('E1.1', 'bar')], batch.series)  # Every series is stored once
+        self.assertEqual([0, 1, 0], batch.rows)
+        self.assertEqual([{'source': 'OpenMotics', 'type': 'energy', 'timestamp': 1234,
+                           'tags': {'id': 'E1.0', 'name': 'foo'}, 'values': {'power': 1.0, 'counter': 5}},
+                          {'source': 'OpenMotics', 'type': 'energy', 'timestamp': 1234,
+                           'tags': {'id': 'E1.1', 'name': 'bar'}, 'values': {'power': 2.0, 'counter': 6}},
+                          {'source': 'OpenMotics', 'type': 'energy', 'timestamp': 1234,
+                           'tags': {'id': 'E1.0', 'name': 'foo'}, 'values': {'power': 3.0, 'counter': 7}}],
+                         batch.to_metrics())
+        self.assertIs(batch.to_metrics(), batch.to_metrics())
+        self.assertEqual([(0, 5), (1, 6), (2, 7)], list(batch.iter_values('counter')))
+        self.assertEqual([], list(batch.iter_values('unknown')))
+
+        batch.set_value(2, 'counter', 8)
+        self.assertEqual({'power': 3.0, 'counter': 8}, batch.to_metrics()[2]['values'])
+
+        self.assertEqual('id=E1.1|name=bar', batch.get_identifier(1, ('id', 'name')))
+        self.assertEqual('name=foo', batch.get_identifier(2, ('name',)))
+
+    def test_from_metric(self):
+        metric = {'source': 'Plugin', 'type': 'foo', 'timestamp': 1,
+                  'tags': {'name': 'bar', 'list': [1, 2]}, 'values': {'value': None}}
+        batch = MetricBatch.from_metric(metric)
+        self.assertEqual((('name', 'list'), ('value',)), (batch.tag_names, batch.value_names))
+        self.assertEqual([metric], batch.to_metrics())
+        self.assertEqual((('name', 'list'), ('value',)), MetricBatch.get_schema(metric['tags'], metric['values']))
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
@@ -37,19 +37,19 @@ class MetricsCollectorTest(unittest.TestCase):
              'input3': '', 'input4': '', 'input5': '', 'input6': '',
              'input7': ''}
         ]
-        self.gateway_api.get_realtime_power.return_value = {}
-        self.gateway_api.get_realtime_p1.return_value = {}
-        self.gateway_api.get_total_energy.return_value = {}
+        self.power_snapshot = {'timestamp': 1.0, 'realtime_power': {}, 'realtime_p1': [], 'total_energy': {}}
+        self.gateway_api.get_power_snapshot.return_value = self.power_snapshot
         SetUpTestInjections(gateway_api=self.gateway_api,
                             pulse_counter_controller=mock.Mock(),
                             thermostat_controller=mock.Mock(),
                             output_controller=mock.Mock(),
                             input_controller=mock.Mock(),
-                            sensor_controller=mock.Mock())
+                            sensor_controller=mock.Mock(),
+                            pubsub=mock.Mock())
         self.controller = MetricsCollector()
 
     def test_realtime_power_metrics(self):
-        self.gateway_api.get_realtime_power.return_value = {'10': [RealtimePower(10.0, 2.1, 5.0, 3.6)]}
+        self.power_snapshot['realtime_power'] = {'10': [RealtimePower(10.0, 2.1, 5.0, 3.6)]}
         with mock.patch.object(self.controller, '_enqueue_metrics') as enqueue:
             self.controller._run_power_metrics('energy')
             expected_call = mock.call(timestamp=mock.ANY,
@@ -59,7 +59,7 @@ class MetricsCollectorTest(unittest.TestCase):
             assert enqueue.call_args_list == [expected_call]
 
     def test_realtime_p1_electricity_metrics(self):
-        self.gateway_api.get_realtime_p1.return_value = [
+        self.power_snapshot['realtime_p1'] = [
             {'electricity': {'current': {'phase1': 1.1, 'phase2': 1.2, 'phase3': 1.3},
                              'ean': '1111111111111111111111111111',
                              'tariff_indicator': 2.0,
@@ -94,7 +94,7 @@ class MetricsCollectorTest(unittest.TestCase):
             assert enqueue.call_args_list == [expected_call]
 
     def test_realtime_p1_electricity_partial_metrics(self):
-        self.gateway_api.get_realtime_p1.return_value = [
+        self.power_snapshot['realtime_p1'] = [
             {'electricity': {'current': {'phase1': 1.1, 'phase2': None, 'phase3': None},
                              'ean': '1111111111111111111111111111',
                              'tariff_indicator': None,
@@ -122,7 +122,7 @@ class MetricsCollectorTest(unittest.TestCase):
             assert enqueue.call_args_list == [expected_call]
 
     def test_realtime_p1_electricity_no_metrics(self):
-        self.gateway_api.get_realtime_p1.return_value = [
+        self.power_snapshot['realtime_p1'] = [
             {'electricity': {'current': {'phase1': None, 'phase2': None, 'phase3': None},
                              'ean': '1111111111111111111111111111',
                              'tariff_indicator': None,
@@ -142,7 +142,7 @@ class MetricsCollectorTest(unittest.TestCase):
             assert enqueue.call_args_list == []
 
     def test_realtime_p1_gas_metrics(self):
-        self.gateway_api.get_realtime_p1.return_value = [
+        self.power_snapshot['realtime_p1'] = [
             {'electricity': {'ean': ''},
              'gas': {'ean': '2222222222222222222222222222',
                      'consumption': 2.3},
@@ -161,7 +161,7 @@ class MetricsCollectorTest(unittest.TestCase):
             assert enqueue.call_args_list == [expected_call]
 
     def test_realtime_p1_gas_no_metrics(self):
-        self.gateway_api.get_realtime_p1.return_value = [
+        self.power_snapshot['realtime_p1'] = [
             {'electricity': {'ean': ''},
              'gas': {'ean': '2222222222222222222222222222',
                      'consumption': None},
@@ -175,7 +175,7 @@ class MetricsCollectorTest(unittest.TestCase):
             assert enqueue.call_args_list == []
 
     def test_total_power_metrics(self):
-        self.gateway_api.get_total_energy.return_value = {'10': [[10.0, 2.1]]}
+        self.power_snapshot['total_energy'] = {'10': [[10.0, 2.1]]}
         with mock.patch.object(self.controller, '_enqueue_metrics') as enqueue:
             self.controller._run_power_metrics('energy')
             expected_call = mock.call(timestamp=mock.ANY,
@@ -183,3 +183,20 @@ class MetricsCollectorTest(unittest.TestCase):
                                       tags={'type': 'openmotics', 'id': '11.0', 'name': 'foo'},
                                       values={'counter_day': 10.0, 'counter_night': 2.1, 'counter': 12.1})
             assert enqueue.call_args_list == [expected_call]
+
+    def test_batches(self):
+        def _run(metric_type):
+            for i in range(3):
+                self.controller._enqueue_metrics(metric_type=metric_type, values={'value': i},
+                                                 tags={'id': i, 'name': 'foo'}, timestamp=1)
+            self.controller._enqueue_metrics(metric_type=metric_type, values={'value': 3},
+                                             tags={'id': 3}, timestamp=1)
+
+        self.controller._collect(_run, 'foo')  # The metrics of a collector run are batched
+        self.controller._enqueue_metrics(metric_type='event', values={'value': True}, tags={'id': 1}, timestamp=2)
+        batches = list(self.controller.collect_metrics())
+        assert [(batch.type, batch.tag_names, len(batch)) for batch in batches] == [('foo', ('id', 'name'), 3),
+                                                                                     ('foo', ('id',), 1),
+                                                                                     ('event', ('id',), 1)]
+        assert batches[0].to_metrics()[2] == {'source': 'OpenMotics', 'type': 'foo', 'timestamp': 1,
+                                              'tags': {'id': 2, 'name': 'foo'}, 'values': {'value': 2}}
@@ -0,0 +1,107 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the persistent metrics queue.
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import xmlrunner
+
+from gateway.metrics_queue import MetricsQueue
+
+
+class MetricsQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _segments(self):
+        return sorted(filename for filename in os.listdir(self.directory) if filename.endswith('.seg'))
+
+    def test_fifo(self):
+        queue = MetricsQueue(self.directory, segment_size=20)
+        for i in range(10):
+            queue.put('metric {0}'.format(i))  # 9 bytes
+        self.assertEqual(10, len(queue))
+        self.assertEqual(90, queue.get_size())
+        self.assertEqual(4, len(self._segments()))  # 3 metrics per segment
+
+        metrics, cursor = queue.peek(40)
+        self.assertEqual(['metric 0', 'metric 1', 'metric 2', 'metric 3'], metrics)
+        metrics, _ = queue.peek(40)
+        self.assertEqual(['metric 0', 'metric 1', 'metric 2', 'metric 3'], metrics)  # Not yet acknowledged
+        queue.ack(cursor)
+        self.assertEqual(6, len(queue))
+        self.assertEqual(3, len(self._segments()))
+
+        metrics, _ = queue.peek(1)
+        self.assertEqual(['metric 4'], metrics)  # At least one metric
+        metrics, cursor = queue.peek(1000)
+        self.assertEqual(['metric {0}'.format(i) for i in range(4, 10)], metrics)
+        queue.ack(cursor)
+        self.assertEqual(0, len(queue))
+        self.assertEqual([], queue.peek(1000)[0])
+        self.assertEqual(1, len(self._segments()))  # The tail segment is kept
+
+        queue.put('metric 10')
+        self.assertEqual(['metric 10'], queue.peek(1000)[0])
+        queue.close()
+
+    def test_restart(self):
+        queue = MetricsQueue(self.directory, segment_size=20)
+        for i in range(5):
+            queue.put('metric {0}'.format(i))
+        metrics, cursor = queue.peek(20)
+        self.assertEqual(['metric 0', 'metric 1'], metrics)
+        queue.ack(cursor)
+        queue.close()
+
+        # A partially written metric is removed when the queue is loaded
+        with open(os.path.join(self.directory, self._segments()[-1]), 'ab') as segment_file:
+            segment_file.write(b'metr')
+        queue = MetricsQueue(self.directory, segment_size=20)
+        self.assertEqual(3, len(queue))
+        queue.put('metric 5')
+        metrics, _ = queue.peek(1000)
+        self.assertEqual(['metric 2', 'metric 3', 'metric 4', 'metric 5'], metrics)
+        queue.close()
+
+    def test_bounded(self):
+        queue = MetricsQueue(self.directory, max_size=50, segment_size=20)
+        for i in range(10):
+            queue.put('metric {0}'.format(i))
+        self.assertLessEqual(queue.get_size(), 50)
+        self.assertEqual(6, queue.dropped)  # The two oldest segments
+        metrics, _ = queue.peek(1000)
+        self.assertEqual(['metric {0}'.format(i) for i in range(6, 10)], metrics)
+
+        # Acknowledging metrics that were dropped in the meantime
+        _, old_cursor = queue.peek(10)
+        for i in range(10, 16):
+            queue.put('metric {0}'.format(i))
+        queue.ack(old_cursor)
+        metrics, _ = queue.peek(1000)
+        self.assertEqual('metric 12', metrics[0])
+        queue.close()
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
@@ -0,0 +1,98 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the metrics scheduler
+"""
+from __future__ import absolute_import
+
+import time
+import unittest
+from threading import Event, Lock
+
+import xmlrunner
+
+from gateway.metrics_scheduler import MetricsScheduler
+
+
+class MetricsSchedulerTest(unittest.TestCase):
+
+    def _wait_for(self, condition, timeout=2.0):
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_periodic(self):
+        runs = {'fast': 0, 'slow': 0}
+
+        def _run(name):
+            runs[name] += 1
+
+        scheduler = MetricsScheduler()
+        scheduler.add('fast', lambda: _run('fast'), 0.05)
+        scheduler.add('slow', lambda: _run('slow'), 60)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        self._wait_for(lambda: runs['fast'] >= 5)
+        self.assertEqual(1, runs['slow'])
+        statistics = scheduler.get_statistics()
+        self.assertEqual(1, statistics['slow']['runs'])
+        self.assertGreaterEqual(statistics['fast']['runs'], 5)
+
+    def test_wake_earlier(self):
+        ran = Event()
+        scheduler = MetricsScheduler()
+        scheduler.add('foo', ran.set, 60)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        self._wait_for(ran.is_set)
+        ran.clear()
+        scheduler.set_interval('foo', 120)  # Longer intervals don't change the deadline
+        scheduler.set_interval('foo', 0.1)
+        self.assertTrue(ran.wait(2))
+        scheduler.set_interval('unknown', 0.1)
+
+    def test_no_concurrent_runs(self):
+        lock = Lock()
+        overlaps = []
+        blocked = Event()
+
+        def _run():
+            if not lock.acquire(False):
+                overlaps.append(True)
+                return
+            try:
+                blocked.wait(0.2)
+            finally:
+                lock.release()
+
+        def _fail():
+            raise RuntimeError('collector failure')
+
+        scheduler = MetricsScheduler()
+        scheduler.add('slow', _run, 0.01)
+        scheduler.add('failing', _fail, 0.01)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+        self._wait_for(lambda: scheduler.get_statistics()['slow']['runs'] >= 2)
+        self.assertEqual([], overlaps)
+        statistics = scheduler.get_statistics()
+        self.assertGreaterEqual(statistics['slow']['max_run_time'], 0.2)
+        self.assertGreaterEqual(statistics['slow']['max_lateness'], 0.1)  # Delayed by its own run time
+        self.assertGreater(statistics['failing']['runs'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
@@ -18,21 +18,24 @@ Tests for metrics.
 from __future__ import absolute_import
 import logging
 import os
+import shutil
 import unittest
-import requests
 import copy
+import zlib
 import ujson as json
 import fakesleep
 import xmlrunner
 import time
 import tempfile
 from peewee import SqliteDatabase
+from six.moves.urllib.parse import parse_qs
 from threading import Lock
 from mock import Mock
 from ioc import SetTestMode, SetUpTestInjections
 from gateway.migrations.config import ConfigMigrator
 from gateway.metrics_controller import MetricsController
 from gateway.metrics_caching import MetricsCacheController
+from gateway.metrics_queue import MetricsQueue
 from gateway.models import Config
 
 logger = logging.getLogger('test')
@@ -48,6 +51,8 @@ class MetricsTest(unittest.TestCase):
         self.test_db.connect()
         self.test_db.create_tables(MODELS)
         ConfigMigrator._insert_defaults()
+        self.queue_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.queue_dir)
 
     def tearDown(self):
         self.test_db.drop_tables(MODELS)
@@ -70,7 +75,7 @@ class MetricsTest(unittest.TestCase):
         MetricsTest.intervals[metric_type] = interval
 
     @staticmethod
-    def _get_controller(intervals):
+    def _get_controller(intervals, queue_dir):
         metrics_collector = type('MetricsCollector', (), {'intervals': intervals,
                                                           'get_metric_definitions': lambda: [],
                                                           'get_definitions': lambda *args, **kwargs: {},
@@ -80,19 +85,20 @@ class MetricsTest(unittest.TestCase):
         SetUpTestInjections(plugin_controller=plugin_controller,
                             metrics_collector=metrics_collector,
                             metrics_cache_controller=metrics_cache_controller,
-                            gateway_uuid='none')
+                            gateway_uuid='none',
+                            metrics_queue_dir=queue_dir)
         metrics_controller = MetricsController()
         return metrics_controller
 
     def test_base_validation(self):
         MetricsTest.intervals = {}
-        controller = MetricsTest._get_controller(intervals=['energy'])
+        controller = MetricsTest._get_controller(intervals=['energy'], queue_dir=self.queue_dir)
         controller._refresh_cloud_interval()
         self.assertEqual(MetricsTest.intervals.get('energy'), 300)
 
     def test_set_cloud_interval(self):
         MetricsTest.intervals = {}
-        metrics_controller = MetricsTest._get_controller(intervals=['energy'])
+        metrics_controller = MetricsTest._get_controller(intervals=['energy'], queue_dir=self.queue_dir)
         metrics_controller._refresh_cloud_interval()
         self.assertEqual(MetricsTest.intervals.get('energy'), 300)
         metrics_controller.set_cloud_interval('energy', 900)
@@ -122,7 +128,8 @@ class MetricsTest(unittest.TestCase):
         SetUpTestInjections(plugin_controller=Mock(),
                             metrics_collector=metrics_collector_mock,
                             metrics_cache_controller=metrics_cache_mock,
-                            gateway_uuid=Mock())
+                            gateway_uuid=Mock(),
+                            metrics_queue_dir=self.queue_dir)
 
         metrics_controller = MetricsController()
         metrics_controller.definitions = definitions
@@ -134,18 +141,18 @@ class MetricsTest(unittest.TestCase):
                   'tags': {'device': 'OpenMotics energy ID1', 'id': 'E7.3'},
                   'values': {'counter': 5678, 'power': 9012}}
 
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertTrue(needs_upload)
 
         # 3. disable energy metric type, now test again
         Config.set_entry('cloud_metrics_enabled|energy', False)
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertFalse(needs_upload)
         Config.set_entry('cloud_metrics_enabled|energy', True)
 
         # 3. disable energy metric type, now test again
         Config.set_entry('cloud_metrics_types', ['counter'])
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertFalse(needs_upload)
         Config.set_entry('cloud_metrics_types', ['counter', 'energy'])
 
@@ -156,24 +163,23 @@ class MetricsTest(unittest.TestCase):
                   'tags': {'device': 'OpenMotics energy ID1', 'id': 'E7.3'},
                   'values': {'counter': 5678, 'power': 9012}}
 
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertFalse(needs_upload)
 
         # 5. configure definition, now test again
         definitions['MBus'] = {'counter': Mock(), 'energy': Mock()}
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertFalse(needs_upload)
 
         # 5. configure source, now test again
         cnf = Config.get_entry('cloud_metrics_sources', [])
-        cnf.append('mbus')
-        Config.set_entry('cloud_metrics_sources', cnf)
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        Config.set_entry('cloud_metrics_sources', list(cnf) + ['mbus'])
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertTrue(needs_upload)
 
         # 7. disable cloud, now test again
         Config.set_entry('cloud_enabled', False)
-        needs_upload = metrics_controller._needs_upload_to_cloud(metric)
+        needs_upload = metrics_controller._needs_upload_to_cloud(metric['source'], metric['type'])
         self.assertFalse(needs_upload)
 
     def test_metrics_receiver(self):
@@ -187,12 +193,15 @@ class MetricsTest(unittest.TestCase):
         send_metrics = []
         response_data = {}
 
-        def post(url, data, timeout):
+        def post(url, data, headers, timeout):
             _ = url, timeout
             # Extract metrics, parse assumed data format
             time.sleep(1)
-            send_metrics.append([m[0] for m in json.loads(data['metrics'])])
+            self.assertEqual('gzip', headers['Content-Encoding'])
+            data = parse_qs(zlib.decompress(data, 16 + zlib.MAX_WBITS).decode('utf-8'))
+            send_metrics.append([m[0] for m in json.loads(data['metrics'][0])])
             response = type('response', (), {})()
+            response.status_code = 200
             response.text = json.dumps(copy.deepcopy(response_data))
             return response
 
@@ -204,8 +213,6 @@ class MetricsTest(unittest.TestCase):
                        'tags': {'name': 'name', 'id': 0},
                        'values': {'counter': 0}}
 
-        requests.post = post
-
         SetUpTestInjections(metrics_db=':memory:', metrics_db_lock=Lock())
 
         metrics_cache = MetricsCacheController()
@@ -224,10 +231,12 @@ class MetricsTest(unittest.TestCase):
         SetUpTestInjections(plugin_controller=Mock(),
                             metrics_collector=metrics_collector_mock,
                             metrics_cache_controller=metrics_cache,
-                            gateway_uuid='uuid')
+                            gateway_uuid='uuid',
+                            metrics_queue_dir=self.queue_dir)
 
         metrics_controller = MetricsController()
         metrics_controller._needs_upload_to_cloud = lambda *args, **kwargs: True
+        metrics_controller._cloud_session.post = post
         self.assertEqual(metrics_controller._buffer_counters, {'OpenMotics': {'foobar': {'counter': True}}})
 
         # Add some helper methods
@@ -241,12 +250,15 @@ class MetricsTest(unittest.TestCase):
             metric['timestamp'] = time.time()
             metric['values']['counter'] = counter
             metrics_controller.receiver(metric)
+            if metrics_controller._cloud_upload_requested:
+                metrics_controller._upload_cloud_metrics()  # Normally executed by the uploader thread
             return metric
 
         def assert_fields(controller, cache, queue, stats, buffer, last_send, last_try, retry_interval):
             self.assertDictEqual(controller._cloud_cache, cache)
-            self.assertListEqual(controller._cloud_queue, queue)
-            self.assertDictEqual(controller.cloud_stats, stats)
+            queued_metrics, _ = controller._cloud_queue.peek(MetricsController.CLOUD_BATCH_SIZE)
+            self.assertListEqual([[json.loads(metric)] for metric in queued_metrics], queue)
+            self.assertDictEqual({key: controller.cloud_stats[key] for key in stats}, stats)
             self.assertListEqual(controller._cloud_buffer, buffer)
             self.assertEqual(controller._cloud_last_send, last_send)
             self.assertEqual(controller._cloud_last_try, last_try)
@@ -281,7 +293,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 10}}}},
                       queue=[[metric_1]],
-                      stats={'queue': 1, 'buffer': 0, 'time_ago_send': 10, 'time_ago_try': 10},  # Nothing buffered yet
+                      stats={'queue': 1, 'buffer': 1, 'time_ago_send': 10, 'time_ago_try': 10},
                       buffer=[],
                       last_send=0,
                       last_try=10,
@@ -303,7 +315,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 20}}}},
                       queue=[[metric_1], [metric_2]],
-                      stats={'queue': 2, 'buffer': 1, 'time_ago_send': 21, 'time_ago_try': 11},
+                      stats={'queue': 2, 'buffer': 0, 'time_ago_send': 21, 'time_ago_try': 11},  # Buffered counter is still queued
                       buffer=[],
                       last_send=0,
                       last_try=21,
@@ -326,7 +338,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 30}}}},
                       queue=[],
-                      stats={'queue': 3, 'buffer': 1, 'time_ago_send': 32, 'time_ago_try': 11},  # Buffer stats not cleared yet
+                      stats={'queue': 0, 'buffer': 0, 'time_ago_send': 32, 'time_ago_try': 11},
                       buffer=[],
                       last_send=32,
                       last_try=32,
@@ -374,7 +386,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 60}}}},
                       queue=[],
-                      stats={'queue': 3, 'buffer': 0, 'time_ago_send': 31, 'time_ago_try': 31},
+                      stats={'queue': 0, 'buffer': 0, 'time_ago_send': 31, 'time_ago_try': 31},
                       buffer=[],
                       last_send=63,
                       last_try=63,
@@ -394,7 +406,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 360}}}},
                       queue=[],
-                      stats={'queue': 1, 'buffer': 0, 'time_ago_send': 301, 'time_ago_try': 301},
+                      stats={'queue': 0, 'buffer': 0, 'time_ago_send': 301, 'time_ago_try': 301},
                       buffer=[],
                       last_send=364,
                       last_try=364,
@@ -419,7 +431,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 375}}}},
                       queue=[[metric_1]],
-                      stats={'queue': 1, 'buffer': 0, 'time_ago_send': 11, 'time_ago_try': 11},  # Nothing buffered yet
+                      stats={'queue': 1, 'buffer': 1, 'time_ago_send': 11, 'time_ago_try': 11},
                       buffer=[],
                       last_send=364,
                       last_try=375,
@@ -431,14 +443,15 @@ class MetricsTest(unittest.TestCase):
 
         metrics_controller = MetricsController()
         metrics_controller._needs_upload_to_cloud = lambda *args, **kwargs: True
+        metrics_controller._cloud_session.post = post
 
-        # Validate startup state
+        # Validate startup state, the queue survived the restart (so the buffered counter isn't loaded)
 
         assert_fields(metrics_controller,
                       cache={},
-                      queue=[],
-                      stats={'queue': 0, 'buffer': 1, 'time_ago_send': 0, 'time_ago_try': 0},
-                      buffer=[[metric_1]],
+                      queue=[[metric_1]],
+                      stats={'queue': 1, 'buffer': 0, 'time_ago_send': 0, 'time_ago_try': 0},
+                      buffer=[],
                       last_send=376,
                       last_try=376,
                       retry_interval=None)
@@ -459,7 +472,7 @@ class MetricsTest(unittest.TestCase):
         assert_fields(metrics_controller,
                       cache={'OpenMotics': {'foobar': {'id=0|name=name': {'timestamp': 385}}}},
                       queue=[],
-                      stats={'queue': 1, 'buffer': 1, 'time_ago_send': 10, 'time_ago_try': 10},
+                      stats={'queue': 0, 'buffer': 0, 'time_ago_send': 10, 'time_ago_try': 10},
                       buffer=[],
                       last_send=386,
                       last_try=386,
@@ -491,6 +504,44 @@ class MetricsTest(unittest.TestCase):
         self.assertEqual(3, len(buffered_metrics))
         self.assertEqual(expected_metrics[2:], buffered_metrics)
 
+    def test_counters(self):
+        _, metrics_db = tempfile.mkstemp()
+        self.addCleanup(os.remove, metrics_db)
+        SetUpTestInjections(metrics_db=metrics_db,
+                            metrics_db_lock=Lock())
+        controller = MetricsCacheController()
+        tags = {'name': 'name', 'id': 0}
+
+        def _process(value):
+            return controller.process_counter('OpenMotics', 'foobar', tags, 'counter', value, 300)
+
+        self.assertEqual(10, _process(10))
+        self.assertEqual(15, _process(15))
+        self.assertEqual(15, _process(15))
+        self.assertEqual(20, _process(5))  # Counter was reset
+        # Write-behind: nothing is written until the counters are flushed
+        self.assertEqual([], controller._execute("SELECT last_value, counter FROM counters;").fetchall())
+        controller.flush()
+        self.assertEqual([(5, 20)], controller._execute("SELECT last_value, counter FROM counters;").fetchall())
+        self.assertEqual(25, _process(10))
+        controller._last_flush -= MetricsCacheController.FLUSH_INTERVAL + 1
+        self.assertEqual(26, _process(11))  # Flushed after the interval
+        self.assertEqual([(11, 26)], controller._execute("SELECT last_value, counter FROM counters;").fetchall())
+        self.assertEqual(28, _process(13))
+        controller.close()
+
+        # After a restart, the counters are loaded from the database
+        controller = MetricsCacheController()
+        self.assertEqual(30, _process(15))
+        controller.close()
+
+        # A crash loses the changes since the last flush, but the counter recovers on the next value
+        controller = MetricsCacheController()
+        self.assertEqual(35, _process(20))
+        controller = MetricsCacheController()
+        self.assertEqual(35, _process(20))
+        controller.close()
+
     @staticmethod
     def _load_buffered_metrics(controller):
         buffered_metrics = []
@@ -71,6 +71,20 @@ class OutputControllerTest(unittest.TestCase):
             assert GatewayEvent(GatewayEvent.Types.CONFIG_CHANGE, {'type': 'output'}) in events
             assert len(events) == 1
 
+    def test_orm_sync_bulk(self):
+        for number in [1, 2, 300]:
+            Output.create(number=number)
+        output_dtos = [OutputDTO(id=i) for i in range(240)]
+        with mock.patch.object(self.master_controller, 'load_outputs', return_value=output_dtos):
+            self.controller.run_sync_orm()
+            self.assertEqual(list(range(240)), [output.number for output in Output.select().order_by(Output.number)])
+            with mock.patch.object(Output, 'select') as select:
+                self.controller.run_sync_orm()  # Unchanged master configuration
+                select.assert_not_called()
+        with mock.patch.object(self.master_controller, 'load_outputs', return_value=output_dtos[:10]):
+            self.controller.run_sync_orm()
+            self.assertEqual(list(range(10)), [output.number for output in Output.select().order_by(Output.number)])
+
     def test_output_sync_change(self):
         events = []
 
@@ -0,0 +1,170 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the PubSub
+"""
+from __future__ import absolute_import
+
+import time
+import unittest
+from threading import Event
+
+import xmlrunner
+
+from gateway.events import GatewayEvent
+from gateway.hal.master_event import MasterEvent
+from gateway.pubsub import PubSub
+from ioc import SetTestMode
+
+
+class PubSubTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        SetTestMode()
+
+    def _wait_for(self, condition, timeout=2.0):
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_publish_synchronous(self):
+        pubsub = PubSub()
+        events = []
+
+        def _on_output(master_event):
+            events.append(master_event)
+            pubsub.publish_gateway_event(PubSub.GatewayTopics.STATE,
+                                         GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': master_event.data['id']}))
+
+        def _fail(gateway_event):
+            raise RuntimeError('subscriber failure')
+
+        pubsub.subscribe_master_events(PubSub.MasterTopics.OUTPUT, _on_output)
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, _fail)
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, events.append)
+        for i in range(3):
+            pubsub.publish_master_event(PubSub.MasterTopics.OUTPUT, MasterEvent(MasterEvent.Types.OUTPUT_STATUS, {'id': i}))
+        pubsub.publish_gateway_event(PubSub.GatewayTopics.CONFIG, GatewayEvent(GatewayEvent.Types.CONFIG_CHANGE, {}))  # No subscribers
+        pubsub._publish_all_events()
+
+        self.assertEqual([0, 1, 2], [event.data['id'] for event in events if isinstance(event, MasterEvent)])
+        self.assertEqual([0, 1, 2], [event.data['id'] for event in events if isinstance(event, GatewayEvent)])
+        statistics = pubsub.get_statistics()
+        self.assertEqual({'published': 3, 'delivered': 3, 'queue_length': 0, 'max_queue_length': 3},
+                         dict((key, statistics['output'][key]) for key in ['published', 'delivered', 'queue_length', 'max_queue_length']))
+        self.assertEqual(6, statistics['state']['delivered'])
+        self.assertEqual(0, statistics['config']['delivered'])
+
+    def test_immediate_delivery(self):
+        pubsub = PubSub()
+        received = Event()
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, lambda gateway_event: received.set())
+        pubsub.start()
+        self.addCleanup(pubsub.stop)
+        time.sleep(0.1)  # Idle workers
+        start = time.time()
+        pubsub.publish_gateway_event(PubSub.GatewayTopics.STATE, GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': 1}))
+        self.assertTrue(received.wait(2))
+        self.assertLess(time.time() - start, 0.05)
+
+    def test_slow_subscriber_burst(self):
+        """ A slow subscriber (e.g. the Cloud) doesn't delay the output changes for the other subscribers """
+        pubsub = PubSub()
+        latencies = []
+
+        def _on_output(master_event):
+            pubsub.publish_gateway_event(PubSub.GatewayTopics.STATE,
+                                         GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': master_event.data['id'],
+                                                                                         'published_at': master_event.data['published_at']}))
+
+        def _on_state(gateway_event):
+            latencies.append(time.time() - gateway_event.data['published_at'])
+
+        pubsub.subscribe_master_events(PubSub.MasterTopics.OUTPUT, _on_output)
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, lambda gateway_event: time.sleep(0.05))
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, _on_state)
+        pubsub.start()
+        self.addCleanup(pubsub.stop)
+
+        for i in range(100):
+            pubsub.publish_master_event(PubSub.MasterTopics.OUTPUT, MasterEvent(MasterEvent.Types.OUTPUT_STATUS, {'id': i,
+                                                                                                                  'published_at': time.time()}))
+        self._wait_for(lambda: len(latencies) == 100)
+        self.assertLess(max(latencies), 0.5)  # The slow subscriber needs 5 seconds for the burst
+        statistics = pubsub.get_statistics()
+        self.assertEqual(100, statistics['output']['delivered'])
+        self.assertGreater(statistics['state']['queue_length'], 50)
+        self.assertGreater(statistics['state']['max_queue_length'], 50)
+
+    def test_subscriber_on_multiple_topics(self):
+        """ A subscriber receives the events of all its topics in publish order, one at a time """
+        pubsub = PubSub()
+        received = []
+        active = []
+
+        def _handle(master_event):
+            active.append(master_event)
+            self.assertEqual(1, len(active))
+            time.sleep(0.01)
+            received.append(master_event.data['id'])
+            active.remove(master_event)
+
+        pubsub.subscribe_master_events(PubSub.MasterTopics.EEPROM, _handle)
+        pubsub.subscribe_master_events(PubSub.MasterTopics.MODULE, _handle)
+        pubsub.start()
+        self.addCleanup(pubsub.stop)
+
+        for i in range(10):
+            topic = PubSub.MasterTopics.EEPROM if i % 2 else PubSub.MasterTopics.MODULE
+            pubsub.publish_master_event(topic, MasterEvent(MasterEvent.Types.EEPROM_CHANGE, {'id': i}))
+        self._wait_for(lambda: len(received) == 10)
+        self.assertEqual(list(range(10)), received)
+        statistics = pubsub.get_statistics()
+        self.assertEqual(5, statistics['eeprom']['delivered'])
+        self.assertEqual(5, statistics['module']['delivered'])
+        self.assertEqual(0, statistics['module']['queue_length'])
+
+    def test_copy_per_subscriber(self):
+        pubsub = PubSub()
+        events = []
+
+        def _stamp(gateway_event):
+            gateway_event.data['timestamp'] = 1.0
+            events.append(gateway_event)
+
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, _stamp)
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, events.append)
+        pubsub.publish_gateway_event(PubSub.GatewayTopics.STATE, GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': 1}))
+        pubsub._publish_all_events()
+
+        self.assertEqual(2, len(events))
+        self.assertIsNot(events[0], events[1])
+        self.assertEqual({'id': 1, 'timestamp': 1.0}, events[0].data)
+        self.assertEqual({'id': 1}, events[1].data)
+
+    def test_stop(self):
+        pubsub = PubSub()
+        pubsub.start()
+        pubsub.stop()
+        received = []
+        pubsub.subscribe_gateway_events(PubSub.GatewayTopics.STATE, received.append)
+        pubsub.publish_gateway_event(PubSub.GatewayTopics.STATE, GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': 1}))
+        time.sleep(0.1)
+        self.assertEqual([], received)
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
@@ -89,6 +89,20 @@ class PulseCounterControllerTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             controller.set_amount_of_pulse_counters(23)
 
+    def test_orm_sync(self):
+        master_controller = Mock()
+        master_controller.load_pulse_counters.return_value = [PulseCounterDTO(id=i) for i in range(24)]
+        SetUpTestInjections(master_controller=master_controller,
+                            maintenance_controller=Mock())
+        controller = PulseCounterController()
+
+        PulseCounter(number=1, name='Water', source='master', persistent=True).save()
+        controller.run_sync_orm()
+        self.assertEqual(24, PulseCounter.select().count())
+        self.assertEqual('Water', PulseCounter.get(number=1).name)
+        pulse_counter = PulseCounter.get(number=2)
+        self.assertEqual(('PulseCounter 2', 'master', False), (pulse_counter.name, pulse_counter.source, pulse_counter.persistent))
+
     def test_pulse_counter_status(self):
         data = {'pv0': 0, 'pv1': 1, 'pv2': 2, 'pv3': 3, 'pv4': 4, 'pv5': 5, 'pv6': 6, 'pv7': 7,
                 'pv8': 8, 'pv9': 9, 'pv10': 10, 'pv11': 11, 'pv12': 12, 'pv13': 13, 'pv14': 14,
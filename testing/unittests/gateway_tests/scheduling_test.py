@@ -19,10 +19,14 @@ from __future__ import absolute_import
 
 import os
 import tempfile
+import threading
 import time
 import unittest
+from datetime import datetime
 
+import pytz
 import xmlrunner
+from croniter import croniter
 from mock import Mock
 from peewee import SqliteDatabase
 
@@ -33,6 +37,7 @@ from gateway.scheduling import SchedulingController
 from gateway.ventilation_controller import VentilationController
 from gateway.webservice import WebInterface
 from ioc import SetTestMode, SetUpTestInjections
+from serial_utils import CommunicationTimedOutException
 
 MODELS = [Schedule]
 
@@ -342,6 +347,18 @@ class SchedulingControllerTest(unittest.TestCase):
         schedule.next_execution = SchedulingController._get_next_execution(schedule)
         self.assertEqual(now_offset + 3 * minute, schedule.next_execution)
 
+    def test_cached_cron(self):
+        SchedulingController.TIMEZONE = 'Europe/Brussels'
+        schedules = [ScheduleDTO(id=1, name='hourly', start=0, repeat='0 * * * *', action='GROUP_ACTION'),
+                     ScheduleDTO(id=2, name='daily', start=0, repeat='30 2 * * *', action='GROUP_ACTION')]
+        now_offset = 1585350000  # 2020-03-27 23:00 UTC, before the DST change
+        for hours in range(0, 72, 3):
+            fakesleep.reset(seconds=now_offset + hours * 3600)
+            for schedule in schedules:
+                expected = croniter(schedule.repeat,
+                                    datetime.fromtimestamp(time.time(), pytz.timezone('Europe/Brussels'))).get_next(ret_type=float)
+                self.assertEqual(expected, SchedulingController._get_next_execution(schedule))
+
     def _wait_for_completed(self, schedule, timeout=1):
         def _is_completed():
             return schedule.last_executed is not None and schedule.status == 'COMPLETED'
@@ -359,5 +376,95 @@ class SchedulingControllerTest(unittest.TestCase):
         controller.save_schedules([(dto, list(kwargs.keys()))])
 
 
+class SchedulingControllerTimingTest(unittest.TestCase):
+    """
+    Tests the timing of the executions, in real time. The bounds are loose on purpose (a busy test machine easily
+    delays a thread for 100ms), but still well below `MAX_WAIT`, which is the delay of a missed wake-up.
+    """
+    _db_filename = None
+
+    @classmethod
+    def setUpClass(cls):
+        SetTestMode()
+        cls._db_filename = tempfile.mktemp()
+        cls.test_db = SqliteDatabase(cls._db_filename)
+
+    @classmethod
+    def tearDownClass(cls):
+        if os.path.exists(cls._db_filename):
+            os.remove(cls._db_filename)
+
+    def setUp(self):
+        self.test_db.bind(MODELS, bind_refs=False, bind_backrefs=False)
+        self.test_db.connect()
+        self.test_db.create_tables(MODELS)
+        self.executions = []  # type: list
+        gateway_api = Mock()
+        gateway_api.get_timezone = lambda: 'UTC'
+        group_action_controller = Mock()
+        group_action_controller.do_group_action = lambda group_action_id: self.executions.append((time.time(), group_action_id,
+                                                                                                  threading.active_count()))
+        SetUpTestInjections(gateway_api=gateway_api,
+                            group_action_controller=group_action_controller)
+        self.controller = SchedulingController()
+
+    def tearDown(self):
+        self.controller.stop()
+        self.test_db.drop_tables(MODELS)
+        self.test_db.close()
+
+    def _wait_for(self, condition, timeout=10.0):
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_many_schedules(self):
+        start = time.time() + 1.0
+        Schedule.insert_many([{'name': 'yearly {0}'.format(i),
+                               'start': 0,
+                               'repeat': '0 0 1 1 *',
+                               'action': 'GROUP_ACTION',
+                               'arguments': '100',
+                               'status': 'ACTIVE'} for i in range(2000)]).execute()
+        Schedule.insert_many([{'name': 'once {0}'.format(i),
+                               'start': start + i * 0.05,
+                               'action': 'GROUP_ACTION',
+                               'arguments': str(i),
+                               'status': 'ACTIVE'} for i in range(20)]).execute()
+        threads = threading.active_count()
+        self.controller.reload_schedules()
+        self.controller.start()
+        self._wait_for(lambda: len(self.executions) == 20)
+        self.assertEqual(list(range(20)), sorted(group_action_id for _, group_action_id, _ in self.executions))
+        lateness = [executed - (start + group_action_id * 0.05) for executed, group_action_id, _ in self.executions]
+        self.assertGreaterEqual(min(lateness), 0)
+        self.assertLess(max(lateness), 2.0)
+        self.assertLessEqual(max(active for _, _, active in self.executions), threads + SchedulingController.WORKERS)
+
+    def test_reload_wakes_workers(self):
+        self.controller.start()
+        time.sleep(0.1)  # Idle workers, waiting for `MAX_WAIT`
+        start = time.time() + 0.2
+        self.controller.save_schedules([(ScheduleDTO(id=None, name='schedule', start=start, action='GROUP_ACTION', arguments=1),
+                                         ['name', 'start', 'action', 'arguments'])])
+        self._wait_for(lambda: len(self.executions) == 1)
+        self.assertLess(self.executions[0][0] - start, 2.0)
+
+    def test_retry_after_timeout(self):
+        def _do_group_action(group_action_id):
+            self.executions.append((time.time(), group_action_id, threading.active_count()))
+            raise CommunicationTimedOutException()
+
+        self.controller._group_action_controller.do_group_action = _do_group_action
+        self.controller.save_schedules([(ScheduleDTO(id=None, name='schedule', start=time.time(), action='GROUP_ACTION', arguments=1),
+                                         ['name', 'start', 'action', 'arguments'])])
+        schedule_id = self.controller.load_schedules()[0].id
+        self.controller.start()
+        self._wait_for(lambda: self.controller._deadlines.get(schedule_id, 0) > time.time() + SchedulingController.MAX_WAIT - 10)
+        self.assertEqual(1, len(self.executions))
+        self.assertIsNone(self.controller.load_schedules()[0].last_executed)
+
+
 if __name__ == "__main__":
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
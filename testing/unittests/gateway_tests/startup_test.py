@@ -0,0 +1,117 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the startup orchestrator
+"""
+from __future__ import absolute_import
+
+import unittest
+from threading import Event, Lock
+
+import xmlrunner
+
+from gateway.startup import StartupOrchestrator
+
+
+class StartupOrchestratorTest(unittest.TestCase):
+
+    def test_requirements(self):
+        order = []
+        lock = Lock()
+        sync_started = Event()
+
+        def _run(name, wait_for=None):
+            if wait_for is not None:
+                self.assertTrue(wait_for.wait(2))  # Runs concurrently with the stage that sets the event
+            with lock:
+                order.append(name)
+
+        def _sync():
+            sync_started.set()
+            _run('sync')
+
+        startup = StartupOrchestrator()
+        startup.add('master', lambda: _run('master'))
+        startup.add('sync', _sync, requires=['master'])
+        startup.add('web', lambda: _run('web', wait_for=sync_started))
+        startup.add('controllers', lambda: _run('controllers'), requires=['sync'])
+        startup.add('service', lambda: _run('service'), requires=['web', 'controllers'])
+        startup.add('deferred', lambda: _run('deferred'), requires=['service'])
+        startup.run()
+
+        self.assertEqual(['controllers', 'deferred', 'master', 'service', 'sync', 'web'], sorted(order))
+        self.assertLess(order.index('master'), order.index('sync'))
+        self.assertLess(order.index('sync'), order.index('controllers'))
+        self.assertEqual(['service', 'deferred'], order[-2:])
+        profile = startup.get_profile()
+        self.assertIsNotNone(profile['duration'])
+        stages = dict((stage['name'], stage) for stage in profile['stages'])
+        self.assertLessEqual(stages['web']['start'], stages['sync']['start'] + stages['sync']['duration'])
+        self.assertLessEqual(stages['service']['start'], stages['deferred']['start'])
+        for stage in profile['stages']:
+            self.assertEqual(StartupOrchestrator.States.DONE, stage['state'])
+            self.assertIsNotNone(stage['duration'])
+
+    def test_failure(self):
+        ran = []
+
+        def _fail():
+            raise RuntimeError('no master')
+
+        startup = StartupOrchestrator(workers=2)
+        startup.add('master', _fail)
+        startup.add('settings', lambda: ran.append('settings'))
+        startup.add('sync', lambda: ran.append('sync'), requires=['master'])
+        startup.add('service', lambda: ran.append('service'), requires=['settings', 'sync'])
+        with self.assertRaises(RuntimeError):
+            startup.run()
+
+        self.assertEqual(['settings'], ran)
+        stages = dict((stage['name'], stage) for stage in startup.get_profile()['stages'])
+        self.assertEqual('RuntimeError: no master', stages['master']['error'])
+        self.assertEqual({'master': StartupOrchestrator.States.FAILED,
+                          'settings': StartupOrchestrator.States.DONE,
+                          'sync': StartupOrchestrator.States.SKIPPED,
+                          'service': StartupOrchestrator.States.SKIPPED},
+                         dict((name, stage['state']) for name, stage in stages.items()))
+        self.assertIsNone(stages['service']['start'])
+
+    def test_system_exit(self):
+        def _exit():
+            raise SystemExit(1)
+
+        startup = StartupOrchestrator()
+        startup.add('web_service', _exit)
+        with self.assertRaises(SystemExit):
+            startup.run()
+
+    def test_validation(self):
+        startup = StartupOrchestrator()
+        startup.add('sync', lambda: None, requires=['master'])
+        with self.assertRaises(ValueError):
+            startup.run()
+        with self.assertRaises(ValueError):
+            startup.add('sync', lambda: None)
+
+        startup = StartupOrchestrator()
+        startup.add('a', lambda: None, requires=['b'])
+        startup.add('b', lambda: None, requires=['a'])
+        startup.add('c', lambda: None)
+        with self.assertRaises(ValueError):
+            startup.run()
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
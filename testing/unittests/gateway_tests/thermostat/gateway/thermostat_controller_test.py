@@ -21,7 +21,8 @@ import logging
 from peewee import SqliteDatabase
 
 from gateway.models import Pump, Output, Valve, PumpToValve, Thermostat, \
-    ThermostatGroup, ValveToThermostat, Sensor, Preset, OutputToThermostatGroup
+    ThermostatGroup, ValveToThermostat, Sensor, Preset, OutputToThermostatGroup, \
+    DaySchedule
 from gateway.thermostat.gateway.thermostat_controller_gateway import ThermostatControllerGateway
 from gateway.dto import PumpGroupDTO, ThermostatGroupDTO, OutputStateDTO, \
     ThermostatGroupStatusDTO, ThermostatStatusDTO
@@ -32,7 +33,7 @@ from logs import Logs
 
 MODELS = [Pump, Output, Valve, PumpToValve, Thermostat,
           ThermostatGroup, ValveToThermostat, Sensor, Preset,
-          OutputToThermostatGroup]
+          OutputToThermostatGroup, DaySchedule]
 
 
 class ThermostatControllerTest(unittest.TestCase):
@@ -308,3 +309,56 @@ class ThermostatControllerTest(unittest.TestCase):
         expected.statusses[0].automatic = expected.automatic = True
         expected.cooling = False
         self.assertEqual(expected, self._thermostat_controller.get_thermostat_status())
+
+    def test_snapshot_refresh(self):
+        scheduler = mock.Mock()
+        scheduler.get_jobs.return_value = []
+        self._thermostat_controller._scheduler = scheduler
+        for number in [1, 2]:
+            thermostat = Thermostat.create(number=number,
+                                           name='thermostat {0}'.format(number),
+                                           sensor=Sensor.create(number=10 + number),
+                                           start=0,
+                                           thermostat_group=self._thermostat_group)
+            for index in range(7):
+                DaySchedule.create(index=index, content='{"0": 16.0, "25200": 21.0}', mode='heating', thermostat=thermostat)
+        self._thermostat_controller.refresh_config_from_db()
+        thermostat_pids = dict(self._thermostat_controller.thermostat_pids)
+        self.assertEqual([1, 2], sorted(thermostat_pids))
+        self.assertEqual(28, scheduler.add_job.call_count)
+        self.assertIn('thermostat.1.heating.0.25200.21.0.0.7', [call[1]['id'] for call in scheduler.add_job.call_args_list])
+
+        # Unchanged
+        scheduler.reset_mock()
+        with mock.patch.object(thermostat_pids[1], 'update_thermostat') as update_thermostat:
+            self._thermostat_controller.refresh_config_from_db()
+            update_thermostat.assert_not_called()
+        scheduler.add_job.assert_not_called()
+        scheduler.remove_job.assert_not_called()
+
+        # Changed setpoint and day schedule
+        scheduler.get_jobs.return_value = [mock.Mock(id='thermostat.{0}.heating.{1}.{2}.{3}.0.7'.format(number, index, seconds, setpoint))
+                                           for number in [1, 2] for index in range(7) for seconds, setpoint in [(0, 16.0), (25200, 21.0)]]
+        self._thermostat_controller.set_current_setpoint(thermostat_number=2, heating_temperature=18.0)
+        self.assertEqual(18.0, self._thermostat_controller.thermostat_pids[2].setpoint)
+        scheduler.get_jobs.assert_not_called()
+        DaySchedule.update(content='{"0": 16.0, "25200": 20.0}').where(DaySchedule.index == 3).execute()
+        self._thermostat_controller.refresh_config_from_db()
+        self.assertEqual(sorted([mock.call('thermostat.1.heating.3.25200.21.0.0.7'),
+                                 mock.call('thermostat.2.heating.3.25200.21.0.0.7')]),
+                         sorted(scheduler.remove_job.call_args_list))
+        self.assertEqual(['thermostat.1.heating.3.25200.20.0.0.7', 'thermostat.2.heating.3.25200.20.0.0.7'],
+                         sorted(call[1]['id'] for call in scheduler.add_job.call_args_list))
+
+        # Removed thermostat
+        Thermostat.delete().where(Thermostat.number == 1).execute()
+        self._thermostat_controller.refresh_config_from_db()
+        self.assertEqual([2], list(self._thermostat_controller.thermostat_pids))
+        self.assertIs(thermostat_pids[2], self._thermostat_controller.thermostat_pids[2])
+
+        self._thermostat_controller._pid_tick()
+        statistics = self._thermostat_controller.get_statistics()
+        self.assertEqual(1, statistics['ticks'])
+        self.assertEqual(1, statistics['thermostats'])
+        self.assertGreaterEqual(statistics['max_tick_duration'], statistics['tick_duration'])
+
@@ -20,14 +20,15 @@ import mock
 import logging
 from peewee import SqliteDatabase
 
-from gateway.models import Output, Valve, Thermostat, ThermostatGroup, Sensor, Preset, ValveToThermostat
+from gateway.models import Output, Valve, Thermostat, ThermostatGroup, Sensor, Preset, ValveToThermostat, DaySchedule
 from gateway.gateway_api import GatewayApi
 from gateway.thermostat.gateway.pump_valve_controller import PumpValveController
 from gateway.thermostat.gateway.thermostat_pid import ThermostatPid, PID
+from gateway.thermostat.gateway.thermostat_snapshot import ThermostatConfigSnapshot
 from ioc import SetTestMode, SetUpTestInjections
 from logs import Logs
 
-MODELS = [Thermostat, ThermostatGroup, Sensor, Preset, ValveToThermostat, Valve, Output]
+MODELS = [Thermostat, ThermostatGroup, Sensor, Preset, ValveToThermostat, Valve, Output, DaySchedule]
 
 
 class PumpValveControllerTest(unittest.TestCase):
@@ -93,7 +94,7 @@ class PumpValveControllerTest(unittest.TestCase):
                       cooling_setpoint=25.0,
                       active=True,
                       thermostat=thermostat)
-        return ThermostatPid(thermostat=thermostat,
+        return ThermostatPid(thermostat=ThermostatConfigSnapshot.load().thermostats[1],
                              pump_valve_controller=self._pump_valve_controller)
 
     def test_basic(self):
@@ -109,10 +110,10 @@ class PumpValveControllerTest(unittest.TestCase):
         thermostat_pid = self._get_thermostat_pid()
         self.assertTrue(thermostat_pid.enabled)
         # No sensor configured
-        sensor = thermostat_pid._thermostat.sensor
-        thermostat_pid._thermostat.sensor = None
+        thermostat = thermostat_pid.thermostat
+        thermostat_pid.update_thermostat(thermostat._replace(sensor_number=None))
         self.assertFalse(thermostat_pid.enabled)
-        thermostat_pid._thermostat.sensor = sensor
+        thermostat_pid.update_thermostat(thermostat)
         self.assertTrue(thermostat_pid.enabled)
         # No valves
         heating_valve_ids = thermostat_pid._heating_valve_ids
@@ -122,9 +123,9 @@ class PumpValveControllerTest(unittest.TestCase):
         thermostat_pid._heating_valve_ids = heating_valve_ids
         self.assertTrue(thermostat_pid.enabled)
         # The group is turned off
-        self._thermostat_group.on = False
+        thermostat_pid.update_thermostat(thermostat._replace(group_on=False))
         self.assertFalse(thermostat_pid.enabled)
-        self._thermostat_group.on = True
+        thermostat_pid.update_thermostat(thermostat)
         self.assertTrue(thermostat_pid.enabled)
         # A high amount of errors
         thermostat_pid._errors = 10
@@ -138,7 +139,8 @@ class PumpValveControllerTest(unittest.TestCase):
         thermostat_pid._pid.setpoint = 0.0
         self.assertTrue(thermostat_pid.enabled)
 
-        self._thermostat_group.on = False
+        thermostat = thermostat_pid.thermostat
+        thermostat_pid.update_thermostat(thermostat._replace(group_on=False))
         self._pump_valve_controller.set_valves.call_count = 0
         self._pump_valve_controller.set_valves.mock_calls = []
         self.assertFalse(thermostat_pid.tick())
@@ -147,7 +149,7 @@ class PumpValveControllerTest(unittest.TestCase):
                                  mock.call(0, [2], mode='equal')]),
                          sorted(self._pump_valve_controller.set_valves.mock_calls))
         self.assertEqual(2, self._pump_valve_controller.set_valves.call_count)
-        self._thermostat_group.on = True
+        thermostat_pid.update_thermostat(thermostat)
 
         for mode, output_power, heating_power, cooling_power in [(ThermostatGroup.Modes.HEATING, 100, 100, 0),
                                                                  (ThermostatGroup.Modes.HEATING, 50, 50, 0),
@@ -17,9 +17,13 @@ from __future__ import absolute_import
 import json
 import unittest
 
+import cherrypy
 import mock
+import msgpack
 
 from bus.om_bus_client import MessageClient
+from gateway.events import GatewayEvent
+from gateway.metrics_controller import MetricsController
 from gateway.dto import OutputStateDTO, ScheduleDTO, VentilationDTO, \
     VentilationSourceDTO, VentilationStatusDTO
 from gateway.gateway_api import GatewayApi
@@ -48,6 +52,7 @@ class WebInterfaceTest(unittest.TestCase):
 
     def setUp(self):
         self.output_controller = mock.Mock(OutputController)
+        self.user_controller = mock.Mock(UserController)
         self.scheduling_controller = mock.Mock(SchedulingController)
         self.ventilation_controller = mock.Mock(VentilationController)
         self.gateway_api = mock.Mock(GatewayApi)
@@ -64,7 +69,7 @@ class WebInterfaceTest(unittest.TestCase):
                             sensor_controller=mock.Mock(SensorController),
                             shutter_controller=mock.Mock(ShutterController),
                             thermostat_controller=mock.Mock(ThermostatController),
-                            user_controller=mock.Mock(UserController),
+                            user_controller=self.user_controller,
                             ventilation_controller=self.ventilation_controller,
                             module_controller=mock.Mock(ModuleController))
         self.web = WebInterface()
@@ -148,3 +153,53 @@ class WebInterfaceTest(unittest.TestCase):
                 'remaining_time': 60.0
             }, json.loads(response)['status'])
             set_status.assert_called()
+
+    def _subscribe_receivers(self, receiver_type, receivers):
+        channel = 'get-{0}-receivers'.format(receiver_type)
+        listener = lambda: receivers
+        cherrypy.engine.subscribe(channel, listener)
+        self.addCleanup(cherrypy.engine.unsubscribe, channel, listener)
+
+    def test_distribute_metric(self):
+        metrics_controller = mock.Mock(MetricsController)
+        metrics_controller.definitions_version = 1
+        metrics_controller.get_filter.side_effect = lambda filter_type, metric_filter: {'source': {'OpenMotics'},
+                                                                                        'metric_type': {'energy', 'system'}}[filter_type]
+        self.web.set_metrics_controller(metrics_controller)
+        receivers = {}
+        for client_id in ['a', 'b']:
+            receivers[client_id] = {'source': None, 'metric_type': None, 'token': 'token', 'remote_ip': '127.0.0.1',
+                                    'socket': mock.Mock(), 'sender': mock.Mock(running=True)}
+        self._subscribe_receivers('metrics', receivers)
+
+        metric = {'source': 'OpenMotics', 'type': 'energy', 'timestamp': 0, 'tags': {'id': 1}, 'values': {'power': 5.0}}
+        with mock.patch.object(msgpack, 'dumps', wraps=msgpack.dumps) as dumps:
+            for _ in range(3):
+                self.web.distribute_metric(metric)
+            self.web.distribute_metric({'source': 'Plugin', 'type': 'energy', 'timestamp': 0, 'tags': {}, 'values': {}})
+        self.assertEqual(3, dumps.call_count)  # Once per metric, not per receiver
+        self.assertEqual(4, metrics_controller.get_filter.call_count)  # Only once per receiver
+        for receiver_info in receivers.values():
+            receiver_info['sender'].enqueue.assert_called_with(msgpack.dumps(metric), key=('OpenMotics', 'energy', (('id', 1),)))
+            self.assertEqual(3, receiver_info['sender'].enqueue.call_count)
+
+        # The token of remote receivers is validated periodically
+        self.user_controller.check_token.return_value = False
+        receivers['b']['remote_ip'] = '10.0.0.2'
+        self.web.distribute_metric(metric)
+        receivers['b']['socket'].close.assert_not_called()
+        self.web._ws_token_checks['metrics'] -= WebInterface.WEBSOCKET_TOKEN_CHECK_INTERVAL
+        with mock.patch.object(cherrypy.engine, 'publish', wraps=cherrypy.engine.publish) as publish:
+            self.web.distribute_metric(metric)
+            publish.assert_any_call('remove-metrics-receiver', 'b')
+        receivers['b']['socket'].close.assert_called_with(401, 'invalid_token')
+        receivers['a']['socket'].close.assert_not_called()
+
+    def test_send_event_websocket(self):
+        sender = mock.Mock(running=True)
+        self._subscribe_receivers('events', {'a': {'token': 'token', 'remote_ip': '127.0.0.1', 'socket': mock.Mock(),
+                                                   'subscribed_types': {GatewayEvent.Types.OUTPUT_CHANGE}, 'sender': sender}})
+        event = GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': 5, 'status': {'on': True}})
+        self.web.send_event_websocket(event)
+        self.web.send_event_websocket(GatewayEvent(GatewayEvent.Types.INPUT_CHANGE, {'id': 5, 'status': True}))
+        sender.enqueue.assert_called_once_with(msgpack.dumps(event.serialize()), key=(GatewayEvent.Types.OUTPUT_CHANGE, 5))
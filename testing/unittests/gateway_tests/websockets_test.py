@@ -0,0 +1,96 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the WebSocket helpers
+"""
+from __future__ import absolute_import
+
+import time
+import unittest
+from threading import Event
+
+import xmlrunner
+
+from gateway.websockets import WebSocketSender
+
+
+class FakeSocket(object):
+    def __init__(self):
+        self.sent = []
+        self.unblocked = Event()
+        self.unblocked.set()
+        self.fail = False
+
+    def send(self, data, binary=False):
+        assert binary
+        self.unblocked.wait(2)
+        if self.fail:
+            raise RuntimeError('connection lost')
+        self.sent.append(data)
+
+
+class WebSocketSenderTest(unittest.TestCase):
+
+    def _wait_for(self, condition, timeout=2.0):
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_send(self):
+        socket = FakeSocket()
+        sender = WebSocketSender(socket, name='test')
+        self.addCleanup(sender.stop)
+        for i in range(10):
+            sender.enqueue(bytearray([i]))
+        self._wait_for(lambda: len(socket.sent) == 10)
+        self.assertEqual([bytearray([i]) for i in range(10)], socket.sent)
+        self.assertEqual(10, sender.get_statistics()['sent'])
+
+    def test_slow_socket(self):
+        socket = FakeSocket()
+        socket.unblocked.clear()
+        sender = WebSocketSender(socket, name='test')
+        self.addCleanup(sender.stop)
+        sender.enqueue(b'first')
+        self._wait_for(lambda: sender.get_statistics()['queue_length'] == 0)  # Being sent
+        for i in range(WebSocketSender.MAX_QUEUE_LENGTH + 5):
+            sender.enqueue(b'metric', key=('foo', i))
+        sender.enqueue(b'old state', key=('OUTPUT_CHANGE', 1))
+        sender.enqueue(b'new state', key=('OUTPUT_CHANGE', 1))
+        statistics = sender.get_statistics()
+        self.assertEqual(WebSocketSender.MAX_QUEUE_LENGTH, statistics['queue_length'])
+        self.assertEqual(6, statistics['dropped'])
+        self.assertEqual(1, statistics['coalesced'])
+
+        socket.unblocked.set()
+        self._wait_for(lambda: sender.get_statistics()['queue_length'] == 0)
+        self.assertEqual(b'first', socket.sent[0])
+        self.assertEqual(b'new state', socket.sent[-1])
+        self.assertNotIn(b'old state', socket.sent)
+        self.assertEqual(WebSocketSender.MAX_QUEUE_LENGTH + 1, sender.get_statistics()['sent'])
+
+    def test_failure(self):
+        socket = FakeSocket()
+        socket.fail = True
+        sender = WebSocketSender(socket, name='test')
+        sender.enqueue(b'foo')
+        self._wait_for(lambda: not sender.running)
+        sender.enqueue(b'bar')
+        self.assertEqual(0, sender.get_statistics()['queue_length'])
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
@@ -0,0 +1,85 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the dependency injection
+"""
+from __future__ import absolute_import
+
+import unittest
+from threading import Thread
+
+import xmlrunner
+
+from ioc import INJECTED, Inject, Injectable, InjectionMissingError, Scope, \
+    SetTestMode, SetUpTestInjections, Singleton
+
+
+@Inject
+def _injected(ioc_test_value=INJECTED):
+    return ioc_test_value
+
+
+class IocTest(unittest.TestCase):
+    def tearDown(self):
+        SetTestMode()
+
+    def test_resolved_once(self):
+        SetTestMode(False)
+        created = []
+
+        @Scope
+        def _run():
+            @Injectable.named('ioc_test_singleton')
+            @Singleton
+            class IocTestSingleton(object):
+                def __init__(self):
+                    created.append(self)
+
+            @Injectable.named('ioc_test_factory')
+            def _factory():
+                return object()
+
+            @Inject
+            def _use(ioc_test_singleton=INJECTED, ioc_test_factory=INJECTED):
+                return ioc_test_singleton, ioc_test_factory
+
+            first, second = _use(), _use()
+            results = []
+            thread = Thread(target=lambda: results.append(_use()))
+            thread.start()
+            thread.join()
+            return first, second, results[0]
+
+        first, second, other_thread = _run()
+        self.assertEqual(1, len(created))
+        self.assertIs(first[0], second[0])
+        self.assertIs(first[0], other_thread[0])
+        self.assertIsNot(first[1], second[1])  # Not a singleton, so a new instance for every injection
+
+    def test_test_injections(self):
+        SetTestMode()
+        SetUpTestInjections(ioc_test_value=1)
+        self.assertEqual(1, _injected())
+        self.assertEqual(3, _injected(ioc_test_value=3))
+        SetUpTestInjections(ioc_test_value=2)
+        self.assertEqual(2, _injected())
+
+        SetTestMode(False)
+        with self.assertRaises(InjectionMissingError):
+            _injected()
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
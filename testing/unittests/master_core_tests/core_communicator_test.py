@@ -14,13 +14,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from __future__ import absolute_import
 import unittest
+from threading import Timer
 
 import mock
 import xmlrunner
 
 import master.core.core_communicator
 from ioc import SetTestMode, SetUpTestInjections
+from master.core.core_api import CoreAPI
 from master.core.core_communicator import Consumer, CoreCommunicator
+from master.core.frame_decoder import FrameDecoder
+from serial_utils import CommunicationTimedOutException
 
 
 class CoreCommunicatorTest(unittest.TestCase):
@@ -34,6 +38,65 @@ class CoreCommunicatorTest(unittest.TestCase):
             self.assertRaises(AttributeError, communicator.do_command, None, {})
             discard.assert_called_with(3)
 
+    def test_read_delivers_frames(self):
+        serial = mock.Mock()
+        communicator = CoreCommunicator(controller_serial=serial)
+        cid = communicator._get_cid()
+        consumer = Consumer(CoreAPI.memory_read(), cid)
+        communicator.register_consumer(consumer)
+
+        checked_payload = bytearray([cid]) + bytearray(b'MR') + bytearray([0, 8]) + bytearray(b'E') + bytearray([0, 1, 0, 1, 2, 3, 4])
+        data = (bytearray(b'garbageR') +
+                bytearray(b'RTR') + checked_payload + bytearray(b'C') + bytearray([sum(checked_payload) % 256]) + bytearray(b'\r\n'))
+
+        def _read(size):
+            communicator._stop = True
+            return data[:size]
+
+        serial.inWaiting.return_value = len(data)
+        serial.read.side_effect = _read
+        communicator._read()
+
+        self.assertEqual({'type': 'E', 'page': 1, 'start': 0, 'data': bytearray([1, 2, 3, 4])}, consumer.get(0.1))
+        self.assertNotIn(cid, communicator._cids_in_use)
+        self.assertEqual(len(data), communicator.get_communication_statistics()['bytes_read'])
+
+    def test_do_commands_pipelined(self):
+        serial = mock.Mock()
+        communicator = CoreCommunicator(controller_serial=serial)
+        in_flight = {'current': 0, 'max': 0}
+
+        def _reply(request):
+            cid, start = request[3], request[11]
+            checked_payload = bytearray([cid]) + bytearray(b'MR') + bytearray([0, 6]) + bytearray(b'E') + bytearray([0, 1, start, start, start])
+            frame = bytearray(b'RTR') + checked_payload + bytearray(b'C') + bytearray([sum(checked_payload) % 256]) + bytearray(b'\r\n')
+            in_flight['current'] -= 1
+            for decoded_frame in FrameDecoder().feed(frame):
+                communicator._process_frame(decoded_frame)
+
+        def _write(request):
+            in_flight['current'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['current'])
+            # Answer out of order
+            Timer(0.01 * (1 + request[11] % 3), _reply, args=[request]).start()
+
+        serial.write.side_effect = _write
+        commands = [(CoreAPI.memory_read(), {'type': 'E', 'page': 1, 'start': i, 'length': 2}) for i in range(20)]
+        results = communicator.do_commands(commands, window=4)
+
+        self.assertEqual([bytearray([i, i]) for i in range(20)], [result['data'] for result in results])
+        self.assertTrue(1 < in_flight['max'] <= 4)
+        self.assertEqual(set(), communicator._cids_in_use)
+        latency = communicator.get_command_histograms()['latency']
+        self.assertEqual(20, sum(latency[str(bytearray(b'MR'))].values()))
+
+    def test_do_commands_timeout(self):
+        communicator = CoreCommunicator(controller_serial=mock.Mock())
+        commands = [(CoreAPI.memory_read(), {'type': 'E', 'page': 1, 'start': i, 'length': 2}) for i in range(4)]
+        self.assertRaises(CommunicationTimedOutException, communicator.do_commands, commands, timeout=0.01, window=2)
+        self.assertEqual(set(), communicator._cids_in_use)
+        self.assertEqual([], [consumer for consumers in communicator._consumers.values() for consumer in consumers])
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
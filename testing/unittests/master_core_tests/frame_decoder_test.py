@@ -0,0 +1,83 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from __future__ import absolute_import
+import unittest
+
+import xmlrunner
+
+from master.core.frame_decoder import FrameDecoder
+from master.core.toolbox import Toolbox
+
+
+def _frame(cid, command, payload):
+    checked_payload = bytearray([cid]) + bytearray(command) + bytearray([len(payload) // 256, len(payload) % 256]) + bytearray(payload)
+    return bytearray(b'RTR') + checked_payload + bytearray(b'C') + bytearray([sum(checked_payload) % 256]) + bytearray(b'\r\n')
+
+
+class FrameDecoderTest(unittest.TestCase):
+    def test_single_frame(self):
+        decoder = FrameDecoder()
+        frames = decoder.feed(_frame(5, b'MR', [1, 2, 3]))
+        self.assertEqual(1, len(frames))
+        frame = frames[0]
+        self.assertEqual(5, frame.cid)
+        self.assertEqual(bytearray(b'MR'), frame.command)
+        self.assertEqual(bytearray([1, 2, 3]), frame.payload)
+        self.assertEqual(Toolbox.hash(bytearray(b'RTR') + bytearray([5]) + bytearray(b'MR')), frame.hash)
+        self.assertEqual(0, decoder.pending)
+
+    def test_byte_by_byte(self):
+        decoder = FrameDecoder()
+        data = _frame(3, b'EV', [0] * 8) + _frame(4, b'MR', range(32))
+        frames = []
+        for i in range(len(data)):
+            frames += decoder.feed(data[i:i + 1])
+        self.assertEqual([3, 4], [frame.cid for frame in frames])
+        self.assertEqual(bytearray(range(32)), frames[1].payload)
+
+    def test_garbage_and_resync(self):
+        decoder = FrameDecoder()
+        corrupt = _frame(6, b'MR', [1, 2, 3])
+        corrupt[-3] = (corrupt[-3] + 1) % 256
+        truncated = _frame(7, b'MR', [1, 2, 3])[:-2]
+        data = bytearray(b'xxR') + corrupt + _frame(8, b'MW', []) + truncated + bytearray(b'R') + _frame(9, b'EV', [4, 5])
+        frames = decoder.feed(data)
+        self.assertEqual([8, 9], [frame.cid for frame in frames])
+        self.assertEqual(1, decoder.stats['invalid_crc'])
+        self.assertEqual(1, decoder.stats['invalid_boundaries'])
+        self.assertEqual(2, decoder.stats['frames'])
+
+    def test_partial_start_of_reply(self):
+        decoder = FrameDecoder()
+        data = _frame(10, b'MR', [1])
+        self.assertEqual([], decoder.feed(bytearray(b'garbageRT')))
+        self.assertEqual(2, decoder.pending)
+        frames = decoder.feed(data[2:])
+        self.assertEqual([10], [frame.cid for frame in frames])
+
+    def test_compaction(self):
+        decoder = FrameDecoder()
+        data = bytearray()
+        for i in range(500):
+            data += _frame(3 + i % 250, b'EV', [i % 256] * 8)
+        frames = []
+        for i in range(0, len(data), 7):
+            frames += decoder.feed(data[i:i + 7])
+        self.assertEqual(500, len(frames))
+        self.assertTrue(len(decoder._buffer) <= 2 * FrameDecoder.COMPACT_THRESHOLD)
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
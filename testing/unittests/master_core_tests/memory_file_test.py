@@ -20,6 +20,7 @@ from __future__ import absolute_import
 import unittest
 import xmlrunner
 import logging
+import mock
 from ioc import SetTestMode
 from master.core.memory_file import MemoryTypes
 from master.core.memory_types import MemoryAddress
@@ -52,6 +53,112 @@ class MemoryFileTest(unittest.TestCase):
         mocked_core.memory_file.activate()  # Only save on activate
         self.assertEqual(bytearray([6, 7, 8]), memory[5][10:13])
 
+    def test_prefetch(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        for page in range(10, 15):
+            memory[page] = bytearray([page] * 256)
+        with mock.patch.object(mocked_core.communicator, 'do_commands', wraps=mocked_core._do_commands) as do_commands:
+            addresses = [MemoryAddress(memory_type=MemoryTypes.EEPROM, page=page, offset=0, length=2) for page in range(10, 15)]
+            mocked_core.memory_file.prefetch(addresses)
+            self.assertEqual(1, do_commands.call_count)
+            self.assertEqual(5 * 8, len(do_commands.call_args[1]['commands']))
+            data = mocked_core.memory_file.read(addresses)
+            self.assertEqual(1, do_commands.call_count)
+            self.assertEqual(bytearray([12, 12]), data[addresses[2]])
+
+    def test_write_runs(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        memory_file = mocked_core.memory_file
+        memory_file.write({MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=0, length=40): bytearray(range(40)),
+                           MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=40, length=2): bytearray([1, 2]),
+                           MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=100, length=1): bytearray([3])})
+        dirty_page = memory_file._write_cache[MemoryTypes.EEPROM][3]
+        self.assertEqual([(0, bytearray(range(32))),
+                          (32, bytearray(range(32, 40)) + bytearray([1, 2])),
+                          (100, bytearray([3]))], dirty_page.get_runs(32))
+        with mock.patch.object(mocked_core.communicator, 'do_command', wraps=mocked_core._do_command) as do_command:
+            memory_file.activate()
+            self.assertEqual(3, len([call for call in do_command.call_args_list if call[1]['fields'].get('data') is not None]))
+        self.assertEqual(bytearray(range(40)) + bytearray([1, 2]), memory[3][0:42])
+        self.assertEqual(3, memory[3][100])
+
+    def test_unchanged_data_not_written(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        memory[7] = bytearray([255] * 256)
+        memory_file = mocked_core.memory_file
+        address = MemoryAddress(memory_type=MemoryTypes.EEPROM, page=7, offset=0, length=64)
+        memory_file.read([address])
+        memory_file.write({address: bytearray([255] * 32) + bytearray([1] * 32)})
+        with mock.patch.object(mocked_core.communicator, 'do_command', wraps=mocked_core._do_command) as do_command:
+            memory_file.activate()
+            writes = [call[1]['fields'] for call in do_command.call_args_list if call[1]['fields'].get('data') is not None]
+        self.assertEqual([32], [fields['start'] for fields in writes])
+        self.assertEqual(bytearray([1] * 32), memory[7][32:64])
+
+    def test_transaction(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        memory_file = mocked_core.memory_file
+        addresses = [MemoryAddress(memory_type=MemoryTypes.EEPROM, page=page, offset=0, length=2) for page in range(3)]
+        with mock.patch.object(mocked_core.communicator, 'do_basic_action', wraps=mocked_core._do_basic_action) as do_basic_action:
+            with memory_file.transaction():
+                for address in addresses:
+                    with memory_file.transaction():
+                        memory_file.write({address: bytearray([1, 2])})
+                        memory_file.activate()
+                self.assertEqual({}, memory)
+            self.assertEqual(1, do_basic_action.call_count)
+        for page in range(3):
+            self.assertEqual(bytearray([1, 2]), memory[page][0:2])
+
+    def test_failed_transaction(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        memory_file = mocked_core.memory_file
+        address = MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=0, length=2)
+        with mock.patch.object(mocked_core.communicator, 'do_basic_action', wraps=mocked_core._do_basic_action) as do_basic_action:
+            with self.assertRaises(ValueError):
+                with memory_file.transaction():
+                    memory_file.write({address: bytearray([1, 2])})
+                    memory_file.activate()
+                    raise ValueError('Invalid configuration')
+            memory_file.activate()
+            do_basic_action.assert_not_called()
+        self.assertEqual({}, memory)
+
+    def test_transaction_read(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        memory_file = mocked_core.memory_file
+        address = MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=0, length=4)
+        with memory_file.transaction():
+            memory_file.write({MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=1, length=2): bytearray([1, 2])})
+            self.assertEqual(bytearray([255, 1, 2, 255]), memory_file.read([address])[address])
+            memory_file.activate()
+        self.assertEqual(bytearray([255, 1, 2, 255]), memory[3][0:4])
+        self.assertEqual(bytearray([255, 1, 2, 255]), memory_file.read([address])[address])
+
+    def test_failed_transaction_keeps_pending_writes(self):
+        mocked_core = MockedCore()
+        memory = mocked_core.memory[MemoryTypes.EEPROM]
+        memory_file = mocked_core.memory_file
+        address_1 = MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=0, length=2)
+        address_2 = MemoryAddress(memory_type=MemoryTypes.EEPROM, page=3, offset=2, length=2)
+        memory_file.write({address_1: bytearray([1, 2])})
+        with self.assertRaises(ValueError):
+            with memory_file.transaction():
+                memory_file.write({address_1: bytearray([5, 6]),
+                                   address_2: bytearray([3, 4])})
+                raise ValueError('Invalid configuration')
+        data = memory_file.read([address_1, address_2])
+        self.assertEqual(bytearray([1, 2]), data[address_1])
+        self.assertEqual(bytearray([255, 255]), data[address_2])
+        memory_file.activate()
+        self.assertEqual(bytearray([1, 2, 255, 255]), memory[3][0:4])
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
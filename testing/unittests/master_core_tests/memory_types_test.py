@@ -19,6 +19,7 @@ Tests for the types module
 from __future__ import absolute_import
 import unittest
 import xmlrunner
+import mock
 from mock import Mock
 from ioc import SetTestMode
 from master.core.basic_action import BasicAction  # Must be imported
@@ -231,6 +232,32 @@ class MemoryTypesTest(unittest.TestCase):
         child.save()
         self.assertEqual(bytearray([20, 0b0110]), self.memory[4])
 
+    def test_single_pass_load(self):
+        self.memory[0] = bytearray([1, 0, 2, 3, 4, 5, 6, 255, 255])
+
+        class Loaded(MemoryModelDefinition):
+            class _LoadedComposed(CompositeMemoryModelDefinition):
+                bit = CompositeBitField(bit=0)
+
+            byte = MemoryByteField(MemoryTypes.EEPROM, address_spec=lambda id: (id, 0))
+            word = MemoryWordField(MemoryTypes.EEPROM, address_spec=lambda id: (id, 1))
+            words = MemoryWordArrayField(MemoryTypes.EEPROM, address_spec=lambda id: (id, 3), length=2)
+            text = MemoryStringField(MemoryTypes.EEPROM, address_spec=lambda id: (id, 7), length=2)
+            composed = _LoadedComposed(field=MemoryByteField(MemoryTypes.EEPROM, address_spec=lambda id: (id, 0)))
+
+        instance = Loaded(0)
+        with mock.patch.object(self.mocked_core.memory_file, 'read', wraps=self.mocked_core.memory_file.read) as read:
+            self.assertEqual({'id': 0,
+                              'byte': 1,
+                              'word': 2,
+                              'words': [3 * 256 + 4, 5 * 256 + 6],
+                              'text': '',
+                              'composed': {'bit': True}}, instance.serialize())
+            self.assertEqual(1, read.call_count)
+            self.assertEqual(2, instance.word)
+            self.assertEqual(1, read.call_count)
+        self.assertEqual(bytearray([255, 255]), instance._text._data)  # Decoding doesn't alter the data
+
     def test_fk_relation(self):
         self.memory[0] = bytearray([10])
         self.memory[1] = bytearray([0, 20])
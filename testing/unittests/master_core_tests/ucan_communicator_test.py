@@ -17,6 +17,7 @@ Tests for uCAN communicator module.
 """
 
 from __future__ import absolute_import
+import random
 import unittest
 import xmlrunner
 import logging
@@ -170,6 +171,39 @@ class UCANCommunicatorTest(unittest.TestCase):
         total_payload = payload + self._uint32_helper.encode(crc)
         self.assertEqual(0, UCANPalletCommandSpec.calculate_crc(total_payload))
 
+    def test_crc_reference(self):
+        def _reference_crc(data, remainder=0):
+            for data_item in data:
+                remainder ^= data_item << 24
+                remainder &= 0xFFFFFFFF
+                for _ in range(8):
+                    if remainder & 0x80000000:
+                        remainder = ((remainder << 1) ^ 0x04C11DB7) & 0xFFFFFFFF
+                    else:
+                        remainder = (remainder << 1) & 0xFFFFFFFF
+            return remainder
+
+        rng = random.Random(0)
+        for length in [0, 1, 4, 41, 256]:
+            payload = bytearray(rng.getrandbits(8) for _ in range(length))
+            for remainder in [0, 0xFFFFFFFF, rng.getrandbits(32)]:
+                self.assertEqual(_reference_crc(payload, remainder), UCANPalletCommandSpec.calculate_crc(payload, remainder))
+        self.assertEqual(0x89A1897F, UCANPalletCommandSpec.calculate_crc(bytearray(b'123456789')))
+
+    def test_pipelined_transport(self):
+        core_communicator = Mock()
+        ucan_communicator = UCANCommunicator(master_communicator=core_communicator)
+        command = UCANPalletCommandSpec(identifier=AddressField('ucan_address', 3),
+                                        pallet_type=PalletType.FLASH_WRITE_REQUEST,
+                                        request_fields=[ByteArrayField('data', 20)])
+        ucan_communicator.do_command('000.000.000.000', command, '000.000.000', {'data': [1] * 20}, timeout=None)
+        core_communicator.do_command.assert_not_called()
+        self.assertEqual(1, core_communicator.do_commands.call_count)
+        transport_commands = core_communicator.do_commands.call_args[0][0]
+        self.assertEqual(5, len(transport_commands))  # 7 header bytes, 20 data bytes and 4 CRC bytes
+        self.assertEqual([0x84, 3, 2, 1, 0], [fields['payload'][0] for _, fields in transport_commands])
+        self.assertEqual(UCANCommunicator.TRANSPORT_WINDOW, core_communicator.do_commands.call_args[1]['window'])
+
     def test_multi_messages(self):
         core_communicator = Mock()
         ucan_communicator = UCANCommunicator(master_communicator=core_communicator)
@@ -221,6 +221,32 @@ class MasterCommandSpecTest(unittest.TestCase):
         self.assertEqual((2, True), (bytes_consumed, done))
         self.assertEqual('OK', result["response"])
 
+    def test_consume_output_offset(self):
+        """ Test for MasterCommandSpec.consume_output, starting at an offset in the read buffer """
+        basic_action = MasterCommandSpec('BA',
+                                         [],
+                                         [Field.string('response', 2),
+                                          Field.padding(11),
+                                          Field.lit('\r\n')])
+        data = bytearray(b'BA\x01OK' + (b'\x00' * 11) + b'\r\nJunk')
+
+        (bytes_consumed, result, done) = basic_action.consume_output(data, None, 3)
+
+        self.assertEqual((15, True), (bytes_consumed, done))
+        self.assertEqual('OK', result["response"])
+        self.assertEqual(data[3:18], result.actual_bytes)
+
+        # In pieces, the complete output is kept
+        (bytes_consumed, result, done) = basic_action.consume_output(data[:8], None, 3)
+
+        self.assertEqual((5, False), (bytes_consumed, done))
+
+        (bytes_consumed, result, done) = basic_action.consume_output(data[8:], result)
+
+        self.assertEqual((10, True), (bytes_consumed, done))
+        self.assertEqual('OK', result["response"])
+        self.assertEqual(data[3:18], result.actual_bytes)
+
     def test_consume_output_varlength(self):
         """ Test for MasterCommandSpec.consume_output with a variable length output field. """
         def dim(byte_value):
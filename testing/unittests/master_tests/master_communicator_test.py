@@ -86,6 +86,28 @@ class MasterCommunicatorTest(unittest.TestCase):
         output = comm.do_command(action, fields)
         self.assertEqual('OK', output['resp'])
 
+    def test_late_reply(self):
+        action = master_api.basic_action()
+        fields = {'action_type': 1, 'action_number': 2}
+
+        pty = DummyPty([action.create_input(1, fields),
+                        action.create_input(2, fields)])
+        SetUpTestInjections(controller_serial=pty)
+
+        comm = MasterCommunicator(init_master=False)
+        comm.enable_passthrough()
+        comm.start()
+
+        self.assertRaises(CommunicationTimedOutException, comm.do_command, action, fields,
+                          timeout=0.1)
+
+        # The consumer of the timed out command is no longer registered
+        late_reply = action.create_output(1, {'resp': 'OK'})
+        pty.master_reply(late_reply + action.create_output(2, {'resp': 'OK'}))
+        output = comm.do_command(action, fields)
+        self.assertEqual('OK', output['resp'])
+        self.assertEqual(late_reply, comm.get_passthrough_data())
+
     @mark.slow
     def test_split_data(self):
         action = master_api.basic_action()
@@ -35,6 +35,7 @@ class MockedCore(object):
 
         self.communicator = mock.Mock(CoreCommunicator)
         self.communicator.do_command = self._do_command
+        self.communicator.do_commands = self._do_commands
         self.communicator.do_basic_action = self._do_basic_action
         self.pubsub = PubSub()
         SetUpTestInjections(master_communicator=self.communicator,
@@ -69,6 +70,10 @@ class MockedCore(object):
         else:
             raise AssertionError('unexpected instruction: {0}'.format(instruction))
 
+    def _do_commands(self, commands, timeout=None, window=None):
+        _ = window
+        return [self._do_command(command, fields, timeout) for command, fields in commands]
+
     def _do_basic_action(self, basic_action, timeout=2, log=True):
         _ = timeout, log
         if basic_action.action_type == 200 and basic_action.action == 1:
@@ -21,8 +21,15 @@ import os
 import plugin_runtime
 import shutil
 import tempfile
+import time
 import unittest
 import xmlrunner
+from threading import Thread
+from mock import Mock
+from pytest import mark
+from six.moves.queue import Queue
+from gateway.events import GatewayEvent
+from plugin_runtime.base import PluginWebRequest
 from plugins.runner import PluginRunner
 
 
@@ -51,6 +58,176 @@ class PluginRunnerTest(unittest.TestCase):
         runner = PluginRunner('foo', self.RUNTIME_PATH, self.PLUGIN_PATH, self._log)
         self.assertEqual(runner.get_queue_length(), 0)
 
+    def _get_mocked_runner(self):
+        runner = PluginRunner('foo', self.RUNTIME_PATH, self.PLUGIN_PATH, self._log, command_timeout=1.0)
+        runner._proc = Mock(poll=Mock(return_value=None))
+        runner._writer = Mock()
+        runner._process_running = True
+        return runner
+
+    @staticmethod
+    def _wait_for(condition):
+        end = time.time() + 2
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+
+    def test_concurrent_commands(self):
+        runner = self._get_mocked_runner()
+        responses = {}
+
+        def _command(action):
+            responses[action] = runner._do_command(action)
+
+        threads = [Thread(target=_command, args=(action,)) for action in ['slow', 'fast']]
+        for thread in threads:
+            thread.start()
+        self._wait_for(lambda: runner._writer.write.call_count == 2)
+        commands = {call[0][0]['action']: call[0][0] for call in runner._writer.write.call_args_list}
+        # Responses arrive out of order, and are correlated by cid
+        runner._process_command({'cid': commands['fast']['cid'], 'action': 'fast', 'value': 2})
+        self._wait_for(lambda: 'fast' in responses)
+        self.assertNotIn('slow', responses)
+        runner._process_command({'cid': commands['slow']['cid'], 'action': 'slow', 'value': 1})
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, responses['slow']['value'])
+        self.assertEqual(2, responses['fast']['value'])
+        self.assertEqual({}, runner._pending_commands)
+
+    def test_command_window(self):
+        runner = self._get_mocked_runner()
+        errors = []
+
+        def _command(timeout):
+            try:
+                runner._do_command('ping', timeout=timeout)
+            except Exception as ex:
+                errors.append(str(ex))
+
+        threads = [Thread(target=_command, args=(1.0,)) for _ in range(PluginRunner.MAX_IN_FLIGHT)]
+        for thread in threads:
+            thread.start()
+        self._wait_for(lambda: runner._writer.write.call_count == PluginRunner.MAX_IN_FLIGHT)
+        _command(0.2)
+        for thread in threads:
+            thread.join()
+        # All commands time out, but the last one could not even be sent
+        self.assertEqual(PluginRunner.MAX_IN_FLIGHT, runner._writer.write.call_count)
+        self.assertEqual(PluginRunner.MAX_IN_FLIGHT + 1, len(errors))
+        self.assertEqual(1, len([error for error in errors if 'too many commands' in error]))
+
+    @mark.slow
+    def test_concurrent_runtime(self):
+        plugins_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, plugins_path)
+        plugin_path = os.path.join(plugins_path, 'Slow')
+        os.makedirs(plugin_path)
+        with open(os.path.join(plugin_path, 'main.py'), 'w') as code_file:
+            code_file.write("""
+import time
+from plugins.base import *
+
+class Slow(OMPluginBase):
+    name = 'Slow'
+    version = '1.0.0'
+    interfaces = []
+
+    @om_expose
+    def slow(self):
+        time.sleep(1)
+        return 'done'
+""")
+        with open(os.path.join(plugin_path, '__init__.py'), 'w'):
+            pass
+        runner = PluginRunner('Slow', os.path.dirname(plugin_runtime.__file__), plugin_path, self._log)
+        runner.start()
+        try:
+            responses = []
+            request = PluginWebRequest(method='GET', path='/slow')
+            thread = Thread(target=lambda: responses.append(runner.request('slow', kwargs={'plugin_web_request': request.serialize()})))
+            thread.start()
+            time.sleep(0.2)
+            start = time.time()
+            runner._do_command('ping')
+            self.assertLess(time.time() - start, 0.5)  # Not blocked by the slow request
+            thread.join()
+            self.assertEqual(1, len(responses))
+        finally:
+            runner.stop()
+
+
+    def test_coalescing(self):
+        runner = self._get_mocked_runner()
+        runner._async_command_queue = Queue(1000)
+        runner._decorators_in_use = {'output_status': [2], 'input_status': [1]}
+        for value in range(10):
+            for output_id in range(3):
+                event = GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': output_id, 'status': {'on': True, 'value': value}})
+                runner.process_output_status(event, action_version=2)
+                runner.process_output_status([], action_version=1)  # No receiver
+            runner.process_input_status(GatewayEvent(GatewayEvent.Types.INPUT_CHANGE, {'id': 1, 'status': True}))
+        # Input events are never coalesced, only the latest output state is queued
+        self.assertEqual(13, runner.get_queue_length())
+        self.assertEqual({'coalesced': 27, 'dropped': 0, 'batches': 0}, runner.get_event_statistics())
+
+        runner._supports_batch = True
+        runner._do_command = Mock()
+        runner._process_running = True
+        thread = Thread(target=runner._perform_async_commands)
+        thread.start()
+        self._wait_for(lambda: runner._do_command.call_count == 1)
+        runner._process_running = False
+        runner._async_command_queue.put(None)
+        thread.join()
+        action, = runner._do_command.call_args[0]
+        commands = runner._do_command.call_args[1]['payload']['commands']
+        self.assertEqual('batch', action)
+        self.assertEqual(['output_status'] * 3 + ['input_status'] * 10, [command['action'] for command in commands])
+        self.assertEqual([9, 9, 9], [command['event']['data']['status']['value'] for command in commands[:3]])
+        self.assertEqual(1, runner.get_event_statistics()['batches'])
+
+        # Once delivered, a new state is queued again
+        runner._process_running = True
+        runner.process_output_status(GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': 0, 'status': {'on': False}}), action_version=2)
+        self.assertEqual(1, runner.get_queue_length())
+
+    @mark.slow
+    def test_batched_runtime(self):
+        plugins_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, plugins_path)
+        plugin_path = os.path.join(plugins_path, 'Batch')
+        os.makedirs(plugin_path)
+        with open(os.path.join(plugin_path, 'main.py'), 'w') as code_file:
+            code_file.write("""
+from plugins.base import *
+
+class Batch(OMPluginBase):
+    name = 'Batch'
+    version = '1.0.0'
+    interfaces = []
+
+    @output_status(version=2)
+    def output(self, data):
+        self.logger('output {0} {1}'.format(data['id'], data['status']['value']))
+""")
+        with open(os.path.join(plugin_path, '__init__.py'), 'w'):
+            pass
+        logs = []
+        runner = PluginRunner('Batch', os.path.dirname(plugin_runtime.__file__), plugin_path, logs.append)
+        runner.start()
+        try:
+            for value in range(50):
+                for output_id in range(10):
+                    event = GatewayEvent(GatewayEvent.Types.OUTPUT_CHANGE, {'id': output_id, 'status': {'on': True, 'value': value}})
+                    runner.process_output_status(event, action_version=2)
+            self._wait_for(lambda: len([log for log in logs if log.endswith(' 49')]) == 10)
+        finally:
+            runner.stop()
+        self.assertEqual(10, len([log for log in logs if log.endswith(' 49')]))
+        statistics = runner.get_event_statistics()
+        self.assertGreater(statistics['coalesced'], 0)
+        self.assertEqual(0, statistics['dropped'])
+
 
 if __name__ == "__main__":
     unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
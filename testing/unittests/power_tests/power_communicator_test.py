@@ -119,6 +119,23 @@ class PowerCommunicatorTest(unittest.TestCase):
         output = self.communicator.do_command(1, action)
         self.assertEqual((49.5, ), output)
 
+    def test_do_command_noise(self):
+        """ Test PowerCommunicator.do_command when there are unexpected bytes before the reply. """
+        action = power_api.get_voltage(power_api.POWER_MODULE)
+        out = action.create_output(1, 1, 49.5)
+
+        self.power_data.extend([
+            sin(action.create_input(1, 1)),
+            sout(bytearray(b'\x00RTRT') + out[:2]), sout(out[2:12]), sout(out[12:])
+        ])
+        self.serial.start()
+        self.communicator.start()
+
+        output = self.communicator.do_command(1, action)
+        self.assertEqual((49.5, ), output)
+        self.assertEqual(23, self.communicator.get_communication_statistics()['bytes_read'])
+        self.assertEqual(0, len(self.serial.read_buffer))
+
     def test_wrong_response(self):
         """ Test PowerCommunicator.do_command when the power module returns a wrong response. """
         action_1 = power_api.get_voltage(power_api.POWER_MODULE)
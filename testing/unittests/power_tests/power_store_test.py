@@ -158,3 +158,20 @@ class PowerControllerTest(unittest.TestCase):
         self.store.readdress_power_module(1, 3)
 
         self.assertEqual(3, self.store.get_address(1))
+
+    def test_cached_modules(self):
+        """ Test that the modules are cached and invalidated on changes. """
+        self.store.register_power_module(1, POWER_MODULE)
+        modules = self.store.get_power_modules()
+        modules[1]['address'] = 'E1'  # Callers can modify the returned modules
+        self.assertEqual(1, self.store.get_power_modules()[1]['address'])
+
+        self.store.readdress_power_module(1, 3)
+        self.assertEqual(3, self.store.get_power_modules()[1]['address'])
+
+        module = self.store.get_power_modules()[1]
+        module['name'] = 'foo'
+        self.store.update_power_module(module)
+        self.assertEqual('foo', self.store.get_power_modules()[1]['name'])
+        self.assertEqual(POWER_MODULE, self.store.get_version(1))
+        self.assertIsNone(self.store.get_address(2))
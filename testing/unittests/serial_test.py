@@ -27,7 +27,7 @@ import unittest
 
 from serial import Serial
 
-from serial_utils import printable
+from serial_utils import RingBuffer, printable
 
 if False:  # MYPY
     from typing import List, Optional, Tuple
@@ -224,3 +224,35 @@ class SerialMockTest(unittest.TestCase):
 
         serial_mock.read(1)
         self.assertEqual(1, phase['phase'])
+
+
+class RingBufferTest(unittest.TestCase):
+    """ Tests for RingBuffer class """
+
+    def test_read_write(self):
+        buffer = RingBuffer(8)
+        buffer.write(bytearray(b'abcde'))
+        self.assertEqual(bytearray(b'abc'), buffer.peek(3))
+        buffer.discard(3)
+        buffer.write(bytearray(b'fghij'))  # Wraps around
+        self.assertEqual(7, len(buffer))
+        self.assertEqual(bytearray(b'defghij'), buffer.peek())
+        buffer.write(bytearray(b'klm'))  # Drops the oldest bytes
+        self.assertEqual(2, buffer.dropped)
+        self.assertEqual(bytearray(b'fghijklm'), buffer.peek())
+        buffer.write(bytearray(b'0123456789'))
+        self.assertEqual(bytearray(b'23456789'), buffer.peek())
+        self.assertEqual(12, buffer.dropped)
+        buffer.clear()
+        self.assertEqual(bytearray(), buffer.peek())
+
+    def test_wait(self):
+        buffer = RingBuffer(8)
+        self.assertFalse(buffer.wait(1, 0.01))
+
+        def _write():
+            time.sleep(0.05)
+            buffer.write(bytearray(b'ab'))
+
+        threading.Thread(target=_write).start()
+        self.assertTrue(buffer.wait(2, 2))
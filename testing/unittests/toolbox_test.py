@@ -0,0 +1,110 @@
+# Copyright (C) 2021 OpenMotics BV
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the plugin IPC helpers
+"""
+
+from __future__ import absolute_import
+
+import os
+import time
+import unittest
+
+import msgpack
+import xmlrunner
+
+from toolbox import PluginIPCMultiplexer, PluginIPCReader, PluginIPCWriter
+
+
+class PluginIPCTest(unittest.TestCase):
+    """ Tests for the PluginIPCReader, PluginIPCWriter and PluginIPCMultiplexer """
+
+    def setUp(self):
+        self.errors = []
+
+    def _log(self, message, exception):
+        self.errors.append((message, exception))
+
+    def _pipe(self):
+        read_fd, write_fd = os.pipe()
+        read_stream = os.fdopen(read_fd, 'rb', 0)
+        write_stream = os.fdopen(write_fd, 'wb', 0)
+        self.addCleanup(read_stream.close)
+        return read_stream, write_stream
+
+    def _wait_for(self, condition, timeout=2.0):
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_feed(self):
+        received = []
+        reader = PluginIPCReader(stream=None, logger=self._log, command_receiver=received.append)
+        packer = msgpack.Packer()
+        data = b''.join(packer.pack({'cid': cid, 'action': 'foo'}) for cid in range(1, 4))
+        reader.feed(data[:5])
+        self.assertEqual([], received)
+        reader.feed(data[5:-1])
+        self.assertEqual([1, 2], [command['cid'] for command in received])
+        reader.feed(data[-1:])
+        self.assertEqual([1, 2, 3], [command['cid'] for command in received])
+        reader.feed(packer.pack('foo'))
+        self.assertEqual(3, len(received))
+        self.assertEqual(1, len(self.errors))
+
+    def test_read_write(self):
+        read_stream, write_stream = self._pipe()
+        writer = PluginIPCWriter(stream=write_stream)
+        reader = PluginIPCReader(stream=read_stream, logger=self._log)
+        reader.start()
+        writer.write({'cid': 1, 'action': 'foo'})
+        writer.write_many([{'cid': cid, 'action': 'bar'} for cid in range(2, 100)])
+        for cid in range(1, 100):
+            self.assertEqual(cid, reader.get(timeout=2)['cid'])
+        write_stream.close()
+        self._wait_for(lambda: len(self.errors) == 1)
+        self.assertEqual('PluginIPCReader None stopped', self.errors[0][0])
+        reader.stop()
+
+    def test_multiplexer(self):
+        multiplexer = PluginIPCMultiplexer(logger=self._log)
+        self.addCleanup(multiplexer.stop)
+        received = {'a': [], 'b': []}
+        streams = {}
+        for name in received:
+            read_stream, write_stream = self._pipe()
+            reader = PluginIPCReader(stream=read_stream, logger=self._log, name=name,
+                                     command_receiver=received[name].append, multiplexer=multiplexer)
+            reader.start()
+            streams[name] = (reader, PluginIPCWriter(stream=write_stream), write_stream)
+        for cid in range(1, 11):
+            for name in received:
+                streams[name][1].write({'cid': cid, 'action': name})
+        self._wait_for(lambda: len(received['a']) == 10 and len(received['b']) == 10)
+        self.assertEqual(list(range(1, 11)), [command['cid'] for command in received['a']])
+        self.assertEqual(['b'] * 10, [command['action'] for command in received['b']])
+
+        streams['a'][2].close()
+        self._wait_for(lambda: len(self.errors) == 1)
+        self.assertEqual('PluginIPCReader a stopped', self.errors[0][0])
+        streams['b'][1].write({'cid': 11, 'action': 'b'})
+        self._wait_for(lambda: len(received['b']) == 11)
+        streams['b'][0].stop()
+        streams['b'][2].close()
+
+
+if __name__ == "__main__":
+    unittest.main(testRunner=xmlrunner.XMLTestRunner(output='../gw-unit-reports'))
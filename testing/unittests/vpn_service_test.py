@@ -259,11 +259,14 @@ class VPNServiceTest(TestCase):
             executor._process_configuration_data(payload)
             config_set.assert_called_with('foo', 0)
             self.assertEqual(payload, executor._configuration)
+            self.assertEqual([(OMBusEvents.CONFIG_CHANGE, ['foo'])], events)
 
+        events.pop(0)
         with mock.patch.object(Config, 'set_entry') as config_set:
             executor._process_configuration_data(payload)
             config_set.assert_not_called()
             self.assertEqual(payload, executor._configuration)
+            self.assertEqual([], events)
 
         with mock.patch.object(Config, 'set_entry') as config_set:
             payload = {'foo': 1}
@@ -364,6 +367,17 @@ class VPNServiceTest(TestCase):
             finally:
                 fakesleep.monkey_restore()
 
+    def test_heartbeat_config_change(self):
+        message_client = mock.Mock(MessageClient)
+        SetUpTestInjections(message_client=message_client)
+        HeartbeatService(url='https://foobar')
+        handler = message_client.add_event_handler.call_args[0][0]
+        with mock.patch.object(Config, 'reload') as reload:
+            handler(OMBusEvents.VPN_OPEN, True)
+            reload.assert_not_called()
+            handler(OMBusEvents.CONFIG_CHANGE, ['cloud_enabled'])
+            reload.assert_called_once_with()
+
     @staticmethod
     def _fake_response(response):
         return type('Response', (), {'text': json.dumps(response)})